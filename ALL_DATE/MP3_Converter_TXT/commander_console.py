@@ -26,11 +26,17 @@ from src.core import get_config
 from src.transcriber_worker import transcriber_worker_process
 from src.mock_worker import mock_worker_process
 from src.core import get_logger, log_writer_process
+from src.core.hardware import get_best_hardware_config
+from src.supervisor import WorkerSupervisor, estimate_max_workers, worker_memory_gb
 
-def start_api_server(log_queue: mp.Queue, task_queue: mp.Queue, result_queue: mp.Queue, config):
+def start_api_server(log_queue: mp.Queue, task_queue: mp.Queue, result_queue: mp.Queue, config,
+                     notify_workers: bool = True):
     """
     啟動 FastAPI (Uvicorn) 伺服器。
     此函數在一個獨立的子行程中執行。
+
+    :param notify_workers: 是否在新任務加入時透過 task_queue 喚醒工人。
+        模擬工人不讀取資料庫，會把每則通知當成一個模擬任務並寫入沒有讀取者的 result_queue，因此不通知。
     """
     logger = get_logger("API伺服器", log_queue)
     logger.info("準備啟動 API 伺服器...")
@@ -39,6 +45,11 @@ def start_api_server(log_queue: mp.Queue, task_queue: mp.Queue, result_queue: mp
     main.log_queue = log_queue
     main.task_queue = task_queue
     main.result_queue = result_queue
+    main.config = config
+    # add_task_to_queue 透過 task_queue 通知工人有新任務
+    if notify_workers:
+        from src.queues import set_task_notifier
+        set_task_notifier(task_queue)
 
     logger.info(f"API 伺服器即將在 http://{config.WEBSOCKET_HOST}:{config.WEBSOCKET_PORT} 上運行")
     try:
@@ -54,9 +65,16 @@ def start_api_server(log_queue: mp.Queue, task_queue: mp.Queue, result_queue: mp
     logger.info("API 伺服器已關閉。")
 
 
-def launcher_main(profile: str, num_workers: int):
+def launcher_main(profile: str, num_workers: int, min_workers: int = 0, max_workers: int = 0):
     """
     這是從 src/launcher.py 移植過來的主函式，負責啟動並管理所有子行程。
+
+    工人由 WorkerSupervisor 管理：依佇列負載在 min_workers 與 max_workers 之間調整數量，
+    並以退避時間重新啟動意外終止的工人。'testing' 環境的模擬工人固定為 num_workers 個。
+
+    :param num_workers: 啟動時的工人數量。
+    :param min_workers: 閒置時最少保留的工人數量。
+    :param max_workers: 工人數量上限；0 代表依 CPU、記憶體與裝置自動決定。
     """
     log_queue = mp.Queue()
     logger = get_logger("智慧啟動器", log_queue)
@@ -72,6 +90,7 @@ def launcher_main(profile: str, num_workers: int):
     logger.info("核心作戰準則：擁抱韌性設計、建立可觀測性。")
 
     processes = []
+    supervisor = None
     try:
         task_queue = mp.Queue()
         result_queue = mp.Queue()
@@ -82,32 +101,44 @@ def launcher_main(profile: str, num_workers: int):
 
         api_process = mp.Process(
             target=start_api_server,
-            args=(log_queue, task_queue, result_queue, config),
+            args=(log_queue, task_queue, result_queue, config, profile != "testing"),
             name="APIServerProcess"
         )
         processes.append(api_process)
 
         if profile == "testing":
             logger.info("偵測到 'testing' 環境，將啟動模擬工人。")
-            worker_target = mock_worker_process
-            worker_name = "MockWorkerProcess"
+            supervisor = WorkerSupervisor(
+                mock_worker_process,
+                (log_queue, task_queue, result_queue, config),
+                "MockWorkerProcess",
+                logger,
+                min_workers=num_workers,
+                max_workers=num_workers,
+                initial_workers=num_workers,
+                autoscale=False,
+            )
         else:
-            logger.info("將啟動真實的轉錄工人。")
-            worker_target = transcriber_worker_process
-            worker_name = "IntelligentWorkerProcess"
-
-        for i in range(num_workers):
-            worker_process_instance = mp.Process(
-                target=worker_target,
-                args=(log_queue, task_queue, result_queue, config),
-                name=f"{worker_name}-{i+1}"
+            logger.info("將啟動真實的轉錄工人，並依佇列負載自動調整數量。")
+            hardware_config = get_best_hardware_config()
+            max_workers = max_workers or estimate_max_workers(config, hardware_config)
+            logger.info(f"裝置: {hardware_config['device']}，工人數量範圍: {min_workers} - {max_workers}")
+            supervisor = WorkerSupervisor(
+                transcriber_worker_process,
+                (log_queue, task_queue, result_queue, config),
+                "IntelligentWorkerProcess",
+                logger,
+                min_workers=min_workers,
+                max_workers=max_workers,
+                initial_workers=num_workers,
+                worker_memory=worker_memory_gb(config.MODEL_SIZE),
             )
-            processes.append(worker_process_instance)
 
         for p in processes:
             p.daemon = True
             logger.info(f"正在啟動 {p.name} 行程...")
             p.start()
+        supervisor.start()
 
         logger.info("所有核心服務已啟動。主行程將保持運行以監控子行程。")
         logger.info("按 Ctrl+C 以終止所有服務。")
@@ -119,6 +150,8 @@ def launcher_main(profile: str, num_workers: int):
                     logger.warning(f"行程 {p.name} (PID: {p.pid}) 已意外終止！")
                     logger.warning(f"行程 {p.name} 的 exitcode 是: {p.exitcode}")
                     raise RuntimeError(f"{p.name} 已終止")
+            # 工人意外終止時由調度器重新啟動，不會關閉整個服務
+            supervisor.poll()
 
     except (KeyboardInterrupt, RuntimeError) as e:
         if isinstance(e, KeyboardInterrupt):
@@ -128,12 +161,13 @@ def launcher_main(profile: str, num_workers: int):
 
     finally:
         logger.info("開始執行關閉程序...")
-        if 'worker_process_instance' in locals() and worker_process_instance.is_alive():
+        if supervisor is not None and supervisor.workers:
             try:
                 logger.info("正在發送關閉信號至工人行程...")
                 task_queue.put(None, timeout=1)
             except Exception as e:
                 logger.warning(f"發送關閉信號至工人失敗: {e}，可能將強制終止。")
+            supervisor.shutdown(timeout=5)
 
         for p in reversed(processes):
             if p.name == "LogWriterProcess": continue
@@ -164,11 +198,24 @@ def launcher_main(profile: str, num_workers: int):
     "--num-workers",
     type=int,
     default=1,
-    help="要啟動的轉寫工人數量 (預設: 1)"
+    help="啟動時的轉寫工人數量 (預設: 1)"
+)
+@click.option(
+    "--min-workers",
+    type=int,
+    default=0,
+    help="佇列閒置時最少保留的轉寫工人數量 (預設: 0)"
+)
+@click.option(
+    "--max-workers",
+    type=int,
+    default=0,
+    help="轉寫工人數量上限 (預設: 0，依 CPU、記憶體與裝置自動決定)"
 )
-def run_server(profile, num_workers):
+def run_server(profile, num_workers, min_workers, max_workers):
     """
     啟動 API 伺服器以及對應的背景工人行程。
+    真實工人的數量會依佇列負載在 --min-workers 與 --max-workers 之間自動調整。
     """
     click.echo(f"==> 準備以 '{profile}' 配置啟動服務...")
     click.echo(f"==> 將啟動 {num_workers} 個轉寫工人...")
@@ -179,7 +226,7 @@ def run_server(profile, num_workers):
     else:
          mp.set_start_method("spawn")
 
-    launcher_main(profile, num_workers)
+    launcher_main(profile, num_workers, min_workers, max_workers)
 
 
 @cli.command(name="install-deps")
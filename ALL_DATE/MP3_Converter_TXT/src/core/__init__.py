@@ -5,14 +5,17 @@
 此檔案整合了專案的通用功能, 例如配置、日誌和資料庫管理.
 透過將這些功能集中在此, 我們旨在簡化導入路徑並提高程式碼的內聚性.
 """
+import asyncio
 import logging
 import logging.handlers
 import multiprocessing as mp
+import os
 import aiosqlite
 import sys
 import traceback
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Type
+from typing import AsyncIterator, Optional, Type
 
 
 class BaseConfig:
@@ -94,6 +97,170 @@ DATABASE_FILE = "transcription_tasks.db"
 UPLOAD_DIR = Path("uploads")
 logger = logging.getLogger(__name__)
 
+# 後來加入 transcription_tasks 的欄位; 舊版資料庫在初始化時補上
+_ADDED_TASK_COLUMNS = (
+    ("cache_key", "TEXT"),  # 內容雜湊值 + 模型設定, 見 transcript_cache_key
+    ("duplicate_of", "TEXT"),  # 內容相同的來源任務 ID
+    ("worker_id", "TEXT"),  # 領取此任務的工人
+    ("lease_expires_at", "REAL"),  # 租約到期時間 (Unix 秒); 過期未完成的任務會被重新領取
+    ("attempts", "INTEGER NOT NULL DEFAULT 0"),  # 被領取的次數
+)
+
+
+# API 行程中連線池的連線數量
+DB_POOL_SIZE = int(os.environ.get("PHOENIX_DB_POOL_SIZE", 4))
+# 每個連線開啟時套用的 PRAGMA (journal_mode=WAL 在初始化時設定, 會保存在資料庫檔案中)
+_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",  # WAL 模式下仍然安全, 提交時不必每次 fsync
+    "PRAGMA busy_timeout = 5000",  # 寫入鎖被佔用時最多等待 5 秒, 而不是立即失敗
+    "PRAGMA cache_size = -8192",  # 每個連線 8 MiB 的頁面快取
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+async def open_connection(path: str = DATABASE_FILE) -> aiosqlite.Connection:
+    """
+    開啟一個套用了標準 PRAGMA 設定的資料庫連線.
+
+    Args:
+        path (str): 資料庫檔案路徑.
+
+    Returns:
+        aiosqlite.Connection: 以 aiosqlite.Row 返回資料列的連線.
+    """
+    db = await aiosqlite.connect(path)
+    db.row_factory = aiosqlite.Row
+    for pragma in _CONNECTION_PRAGMAS:
+        await db.execute(pragma)
+    return db
+
+
+class ConnectionPool:
+    """
+    固定大小的 aiosqlite 連線池, 由 FastAPI 的 lifespan 建立與關閉.
+
+    連線在整個應用程式生命週期內重複使用, 請求不必每次建立連線.
+    另外保留一個只用於讀取 `PRAGMA data_version` 的連線: 只要有其他連線
+    (包括其他行程中的工人) 提交了變更, 它的值就會改變, 可用來判斷快取是否過期.
+    """
+
+    def __init__(self, path: str = DATABASE_FILE, size: int = DB_POOL_SIZE) -> None:
+        """
+        初始化連線池.
+
+        Args:
+            path (str): 資料庫檔案路徑.
+            size (int): 連線數量.
+        """
+        self.path = path
+        self.size = max(1, size)
+        self._idle: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._connections: list[aiosqlite.Connection] = []
+        self._watcher: Optional[aiosqlite.Connection] = None
+
+    async def open(self) -> None:
+        """開啟所有連線."""
+        for _ in range(self.size):
+            db = await open_connection(self.path)
+            self._connections.append(db)
+            self._idle.put_nowait(db)
+        self._watcher = await open_connection(self.path)
+        logger.info("資料庫連線池已開啟 (%d 個連線).", self.size)
+
+    async def close(self) -> None:
+        """關閉所有連線."""
+        for db in [*self._connections, *([self._watcher] if self._watcher else [])]:
+            await db.close()
+        self._connections.clear()
+        self._watcher = None
+        self._idle = asyncio.Queue()
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        借用一個連線; 所有連線都在使用中時等待其他請求歸還.
+
+        Yields:
+            aiosqlite.Connection: 借用的連線. 歸還時未提交的交易會被回滾.
+        """
+        db = await self._idle.get()
+        try:
+            yield db
+        finally:
+            if db.in_transaction:
+                await db.rollback()
+            self._idle.put_nowait(db)
+
+    async def data_version(self) -> int:
+        """
+        返回資料庫的變更計數.
+
+        Returns:
+            int: 其他連線提交變更後就會改變的值.
+        """
+        async with self._watcher.execute("PRAGMA data_version") as cursor:
+            return (await cursor.fetchone())[0]
+
+
+# 目前行程使用的連線池; 只有 API 行程在 lifespan 中設定, 其他行程每次開啟新連線
+_connection_pool: Optional[ConnectionPool] = None
+
+
+def set_connection_pool(pool: Optional[ConnectionPool]) -> None:
+    """
+    設定目前行程使用的連線池.
+
+    Args:
+        pool (Optional[ConnectionPool]): 連線池; None 代表不使用連線池.
+    """
+    global _connection_pool
+    _connection_pool = pool
+
+
+def get_connection_pool() -> Optional[ConnectionPool]:
+    """返回目前行程使用的連線池 (未設定時為 None)."""
+    return _connection_pool
+
+
+@asynccontextmanager
+async def connect() -> AsyncIterator[aiosqlite.Connection]:
+    """
+    取得一個資料庫連線.
+
+    已設定連線池時從池中借用, 否則開啟一個新連線並在使用後關閉.
+
+    Yields:
+        aiosqlite.Connection: 資料庫連線.
+    """
+    if _connection_pool is not None:
+        async with _connection_pool.acquire() as db:
+            yield db
+        return
+    db = await open_connection(DATABASE_FILE)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+def transcript_cache_key(content_hash: str, config: BaseConfig, compute_type: str) -> str:
+    """
+    組合轉錄快取的鍵.
+
+    相同的音訊內容在不同的模型、束搜尋設定或計算類型 (例如 GPU 的 float16 與 CPU 的 int8)
+    下會得到不同的結果, 因此一併納入鍵中.
+
+    Args:
+        content_hash (str): 上傳內容的 SHA-256 雜湊值.
+        config (BaseConfig): 轉錄所使用的設定.
+        compute_type (str): 工人使用的計算類型, 即 `get_best_hardware_config` 的結果;
+            呼叫端應在啟動時偵測一次, 而不是每次組合鍵時都探測硬體.
+
+    Returns:
+        str: 快取鍵.
+    """
+    return f"{content_hash}:{config.MODEL_SIZE}:{config.BEAM_SIZE}:{compute_type}"
+
 
 async def initialize_database() -> None:
     """初始化資料庫和上傳目錄, 如果資料表不存在, 則建立它."""
@@ -102,16 +269,57 @@ async def initialize_database() -> None:
         UPLOAD_DIR.mkdir(exist_ok=True)
 
         async with aiosqlite.connect(DATABASE_FILE) as db:
+            # WAL 模式讓讀取不會被寫入阻塞; 設定會保存在資料庫檔案中
+            await db.execute("PRAGMA journal_mode = WAL")
             await db.execute(
                 """
             CREATE TABLE IF NOT EXISTS transcription_tasks (
                 id TEXT PRIMARY KEY,
                 original_filepath TEXT NOT NULL,
-                status TEXT NOT NULL DEFAULT 'pending', -- 'pending', 'processing', 'completed', 'failed'
+                status TEXT NOT NULL DEFAULT 'pending', -- 'pending', 'processing', 'completed', 'failed', 'duplicate'
                 result_text TEXT,
                 error_message TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                cache_key TEXT,
+                duplicate_of TEXT,
+                worker_id TEXT,
+                lease_expires_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+            """
+            )
+
+            async with db.execute("PRAGMA table_info(transcription_tasks)") as cursor:
+                columns = {row[1] for row in await cursor.fetchall()}
+            for name, column_type in _ADDED_TASK_COLUMNS:
+                if name not in columns:
+                    await db.execute(f"ALTER TABLE transcription_tasks ADD COLUMN {name} {column_type}")
+
+            # 領取任務時依狀態篩選、依建立時間排序
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transcription_tasks_status_created "
+                "ON transcription_tasks (status, created_at)"
+            )
+            # 啟動器依狀態與更新時間統計最近的吞吐量
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transcription_tasks_status_updated "
+                "ON transcription_tasks (status, updated_at)"
+            )
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transcription_tasks_cache_key "
+                "ON transcription_tasks (cache_key, status)"
+            )
+
+            # 轉錄快取: 相同內容 (與模型設定) 的轉錄結果, 跨服務重啟保存
+            await db.execute(
+                """
+            CREATE TABLE IF NOT EXISTS transcript_cache (
+                cache_key TEXT PRIMARY KEY,
+                result_text TEXT NOT NULL,
+                source_task_id TEXT,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
             """
             )
@@ -1,16 +1,28 @@
 """主應用程式檔案."""
+import hashlib
 import uuid
 from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Any, AsyncGenerator
 
 import aiofiles
+import aiofiles.os
 import aiosqlite
 from fastapi import FastAPI, File, HTTPException, UploadFile
 from fastapi.staticfiles import StaticFiles
 
-from src.core import DATABASE_FILE, UPLOAD_DIR, get_logger, initialize_database
-from src.queues import add_task_to_queue
+from src.core import (
+    UPLOAD_DIR,
+    BaseConfig,
+    ConnectionPool,
+    get_config,
+    get_logger,
+    initialize_database,
+    set_connection_pool,
+    transcript_cache_key,
+)
+from src.core.hardware import get_best_hardware_config
+from src.queues import add_task_to_queue, fetch_task_status, status_cache, submit_task
 
 # --- Pre-emptive directory creation ---
 static_dir = Path("static")
@@ -18,15 +30,34 @@ static_dir.mkdir(exist_ok=True)
 
 # --- Constants & Settings ---
 logger = get_logger(__name__)
+# 決定轉錄快取鍵中的模型設定; 由 commander_console 啟動時替換為所選的 profile
+config: BaseConfig = get_config()
+# 工人載入模型時使用的計算類型, 也是轉錄快取鍵的一部分; 啟動時偵測一次, 不在每次上傳時探測硬體
+compute_type: str = ""
 
 
 # --- Lifespan Management ---
 @asynccontextmanager
 async def lifespan(_app: FastAPI) -> AsyncGenerator[None, None]:
-    """Handle application startup and shutdown events."""
+    """
+    Handle application startup and shutdown events.
+
+    Database connections are pooled for the lifetime of the application, and
+    the hardware is probed once for the compute type used in transcript cache keys.
+    """
+    global compute_type
     logger.info("FastAPI application startup...")
+    compute_type = get_best_hardware_config()["compute_type"]
     await initialize_database()
-    yield
+    pool = ConnectionPool()
+    await pool.open()
+    set_connection_pool(pool)
+    try:
+        yield
+    finally:
+        set_connection_pool(None)
+        status_cache.clear()
+        await pool.close()
     logger.info("FastAPI application shutdown...")
 
 
@@ -45,25 +76,33 @@ async def health_check() -> dict[str, str]:
 async def upload_file(
     file: UploadFile = File(...),
 ) -> dict[str, str]:
-    """Accept a file upload, save it, and create a new transcription task."""
+    """
+    Accept a file upload, save it, and create a new transcription task.
+
+    The upload is hashed while it streams to disk. Content that was already
+    transcribed with the same model settings is answered from the transcript
+    cache, and content identical to an in-flight task is attached to that task.
+    """
     task_id = str(uuid.uuid4())
     filepath = UPLOAD_DIR / f"{task_id}_{file.filename}"
+    hasher = hashlib.sha256()
 
     try:
         async with aiofiles.open(filepath, "wb") as out_file:
             while content := await file.read(1024 * 1024):  # Read in 1MB chunks
+                hasher.update(content)
                 await out_file.write(content)
         logger.info("File '%s' uploaded to '%s'", file.filename, filepath)
 
-        async with aiosqlite.connect(DATABASE_FILE) as db:
-            await db.execute(
-                "INSERT INTO transcription_tasks (id, original_filepath) VALUES (?, ?)",
-                (task_id, str(filepath)),
-            )
-            await db.commit()
-
-        await add_task_to_queue(task_id)
-        logger.info("Task created in database with ID: %s", task_id)
+        cache_key = transcript_cache_key(hasher.hexdigest(), config, compute_type)
+        outcome, source_task_id = await submit_task(task_id, str(filepath), cache_key)
+        if outcome == "queued":
+            await add_task_to_queue(task_id)
+            logger.info("Task created in database with ID: %s", task_id)
+        else:
+            # The transcript comes from the cache or another task; the copy is not needed
+            await aiofiles.os.remove(filepath)
+            logger.info("Task %s deduplicated (%s) from task %s", task_id, outcome, source_task_id)
 
     except IOError as e:
         logger.exception("File operation failed: %s", e)
@@ -79,24 +118,21 @@ async def upload_file(
 async def get_task_status(
     task_id: str,
 ) -> dict[str, Any]:
-    """Query and return the status and result of a task based on its ID."""
-    try:
-        async with aiosqlite.connect(DATABASE_FILE) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                "SELECT * FROM transcription_tasks WHERE id = ?", (task_id,)
-            ) as cursor:
-                task = await cursor.fetchone()
-
-        if task is None:
-            raise HTTPException(status_code=404, detail="Task ID not found")
-
-        return dict(task)
+    """
+    Query and return the status and result of a task based on its ID.
 
+    Repeated polling is answered from the in-memory status cache.
+    """
+    try:
+        task = await fetch_task_status(task_id)
     except aiosqlite.Error as e:
         logger.exception("Error querying task status for ID %s: %s", task_id, e)
         raise HTTPException(status_code=500, detail="Error querying status.") from e
 
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task ID not found")
+    return task
+
 
 # --- Mount Static Files ---
 app.mount("/", StaticFiles(directory=str(static_dir), html=True), name="static")
@@ -2,7 +2,8 @@
 import logging
 import multiprocessing as mp
 import time
-from typing import Any
+from multiprocessing.synchronize import Event
+from typing import Any, Optional
 
 from src.core import get_logger, get_null_logger
 
@@ -32,34 +33,38 @@ def process_task_from_queue(
             task_queue.put(None)
             return
 
-        job_id = job.get("job_id")
-        logger.info("收到新任務: Job ID %s", job_id)
+        handle_job(job, result_queue, logger)
+    except Exception:
+        logger.exception("處理任務時發生錯誤")
+
 
-        # 模擬處理延遲
-        time.sleep(0.01)  # 進一步縮短延遲以加速測試
-        result_queue.put(
-            {
-                "status": "processing",
-                "job_id": job_id,
-                "progress": 50,
-                "message": "模擬處理中...",
-            },
-        )
-        logger.info("任務 %s: 正在模擬處理.", job_id)
+def handle_job(job: dict[str, Any], result_queue: mp.Queue, logger: logging.Logger) -> None:
+    """模擬處理一個任務, 並把進度與結果放入結果佇列."""
+    job_id = job.get("job_id")
+    logger.info("收到新任務: Job ID %s", job_id)
 
-        time.sleep(0.01)
-        result = {
-            "status": "completed",
+    # 模擬處理延遲
+    time.sleep(0.01)  # 進一步縮短延遲以加速測試
+    result_queue.put(
+        {
+            "status": "processing",
             "job_id": job_id,
-            "transcript": "這是一個模擬的轉錄結果.",
-            "language": "zh",
-            "duration": 10.0,
-        }
-        result_queue.put(result)
-        logger.info("任務 %s: 模擬處理完成.", job_id)
+            "progress": 50,
+            "message": "模擬處理中...",
+        },
+    )
+    logger.info("任務 %s: 正在模擬處理.", job_id)
 
-    except Exception:
-        logger.exception("處理任務時發生錯誤")
+    time.sleep(0.01)
+    result = {
+        "status": "completed",
+        "job_id": job_id,
+        "transcript": "這是一個模擬的轉錄結果.",
+        "language": "zh",
+        "duration": 10.0,
+    }
+    result_queue.put(result)
+    logger.info("任務 %s: 模擬處理完成.", job_id)
 
 
 def mock_worker_process(
@@ -67,27 +72,25 @@ def mock_worker_process(
     task_queue: mp.Queue,
     result_queue: mp.Queue,
     _config: dict[str, Any],
+    stop_event: Optional[Event] = None,
 ) -> None:
     """
     模擬工人行程, 用於測試.
 
-    現在這個行程只是 `process_task_from_queue` 函數的一個循環包裝器.
+    行程阻塞在任務佇列上等待, 任務一到立即處理, 閒置時不消耗 CPU.
+    設定 stop_event 後, 工人在處理完目前的任務 (或收到結束信號) 時結束.
     """
     logger = get_logger("模擬工人", log_queue)
     logger.info("模擬工人行程已啟動.")
 
-    while True:
+    while stop_event is None or not stop_event.is_set():
         try:
-            # 檢查是否有停止信號
-            if not task_queue.empty():
-                job = task_queue.get()
-                if job is None:
-                    logger.info("收到結束信號, 模擬工人行程即將關閉.")
-                    break
-                # 如果不是停止信號, 把任務放回去
-                task_queue.put(job)
-
-            process_task_from_queue(task_queue, result_queue, logger)
-            time.sleep(0.1)  # 避免在沒有任務時過度消耗 CPU
+            job = task_queue.get()
+            if job is None:
+                logger.info("收到結束信號, 模擬工人行程即將關閉.")
+                # 將 None 放回佇列, 讓其他工人也能收到
+                task_queue.put(None)
+                break
+            handle_job(job, result_queue, logger)
         except Exception:
             logger.exception("模擬工人在主循環中發生錯誤")
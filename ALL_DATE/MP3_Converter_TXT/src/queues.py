@@ -5,16 +5,77 @@
 這個模組提供了一個簡單、輕量級且持久化的任務佇列.
 它利用 SQLite 資料庫作為後端, 確保即使在應用程式重新啟動後,
 任務也不會遺失.
+
+相同內容的上傳只會轉錄一次: 已有結果的直接從轉錄快取完成,
+與處理中任務相同的則以 'duplicate' 狀態附加在該任務上, 來源任務結束時一併更新.
+
+API 行程中的狀態查詢由記憶體中的 `status_cache` 回應, 不必每次讀取資料庫.
 """
 import asyncio
-from typing import Optional
+import os
+import socket
+import time
+from collections import OrderedDict
+from typing import Any, Optional
 
 import aiosqlite
 
-from src.core import DATABASE_FILE, get_logger
+from src.core import connect, get_connection_pool, get_logger
 
 logger = get_logger(__name__)
 
+# 任務租約的預設長度 (秒); 工人必須在租約到期前完成或延長租約
+DEFAULT_LEASE_SECONDS = float(os.environ.get("PHOENIX_TASK_LEASE_SECONDS", 300))
+# 一個任務最多被領取幾次 (租約過期後會被重新領取)
+MAX_ATTEMPTS = 3
+
+
+# 通知工人有新任務的通道; 由啟動器在 API 行程中設定, 未設定時工人只靠備援輪詢
+_task_notifier: Optional[Any] = None
+
+
+def default_worker_id(pid: Optional[int] = None) -> str:
+    """
+    返回工人 ID (主機名稱-行程 ID).
+
+    Args:
+        pid (Optional[int]): 工人行程的 ID; 預設為目前的行程.
+
+    Returns:
+        str: 工人 ID.
+    """
+    return f"{socket.gethostname()}-{pid or os.getpid()}"
+
+
+def set_task_notifier(notifier: Optional[Any]) -> None:
+    """
+    設定通知工人的通道.
+
+    Args:
+        notifier (Optional[Any]): 工人正在等待的佇列 (例如啟動器建立的 task_queue);
+            None 代表停用通知.
+    """
+    global _task_notifier
+    _task_notifier = notifier
+
+
+def notify_workers(task_id: str) -> None:
+    """
+    通知一個等待中的工人有新任務.
+
+    訊息只是喚醒信號, 工人仍以 `claim_tasks` 從資料庫領取任務,
+    所以訊息遺失時任務也不會遺失, 只會等到工人的備援輪詢.
+
+    Args:
+        task_id (str): 新任務的 ID.
+    """
+    if _task_notifier is None:
+        return
+    try:
+        _task_notifier.put_nowait({"job_id": task_id})
+    except Exception as e:
+        logger.warning("通知工人新任務 %s 失敗, 將由備援輪詢處理: %s", task_id, e)
+
 
 async def add_task_to_queue(task_id: str) -> None:
     """
@@ -24,7 +85,7 @@ async def add_task_to_queue(task_id: str) -> None:
         task_id (str): 要加入佇列的任務 ID.
     """
     try:
-        async with aiosqlite.connect(DATABASE_FILE) as db:
+        async with connect() as db:
             await db.execute(
                 "UPDATE transcription_tasks SET status = 'pending' WHERE id = ?",
                 (task_id,),
@@ -34,64 +95,467 @@ async def add_task_to_queue(task_id: str) -> None:
     except aiosqlite.Error as e:
         logger.exception("將任務 %s 加入佇列時發生資料庫錯誤: %s", task_id, e)
         raise
+    status_cache.invalidate(task_id)
+    notify_workers(task_id)
+
 
+# 尚未結束的任務狀態; 相同內容的新上傳會附加在這些任務上
+ACTIVE_STATUSES = ("pending", "processing", "retry_pending")
+# 不會再改變的任務狀態
+FINAL_STATUSES = ("completed", "failed")
 
-async def get_task_from_queue() -> Optional[str]:
+
+class TaskStatusCache:
     """
-    從佇列中獲取一個待處理的任務.
+    任務狀態的記憶體快取.
+
+    已結束的任務 (FINAL_STATUSES) 不會再改變, 快取後一直有效;
+    其他狀態在資料庫有任何新的提交 (`PRAGMA data_version` 改變) 時全部失效,
+    因此工人在其他行程中更新的狀態也能即時反映. `update_task_status`
+    另外會直接清除同一行程中受影響的項目.
+    """
+
+    def __init__(self, max_entries: int = 10000) -> None:
+        """
+        初始化快取.
+
+        Args:
+            max_entries (int): 最多保存的任務數量, 超過時淘汰最久未使用的項目.
+        """
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._data_version: Optional[int] = None
+
+    def sync(self, data_version: int) -> None:
+        """
+        資料庫有新的提交時, 清除所有可能已過期的項目.
+
+        Args:
+            data_version (int): 目前的 `PRAGMA data_version`.
+        """
+        if data_version != self._data_version:
+            for task_id in [k for k, v in self._entries.items() if v["status"] not in FINAL_STATUSES]:
+                del self._entries[task_id]
+            self._data_version = data_version
+
+    def get(self, task_id: str) -> Optional[dict[str, Any]]:
+        """返回快取的任務狀態; 沒有快取時返回 None."""
+        entry = self._entries.get(task_id)
+        if entry is not None:
+            self._entries.move_to_end(task_id)
+        return entry
 
-    此函數會尋找狀態為 'pending' 的任務, 將其狀態更新為 'processing',
-    然後返回其 ID. 這是原子操作, 以避免多個工人獲取同一個任務.
+    def put(self, task_id: str, task: dict[str, Any], data_version: Optional[int] = None) -> None:
+        """
+        保存一個任務的狀態.
+
+        Args:
+            task_id (str): 任務 ID.
+            task (dict[str, Any]): 任務的欄位.
+            data_version (Optional[int]): 讀取任務之前的 `PRAGMA data_version`. 讀取期間
+                快取已經同步到較新的版本時不保存, 避免較早讀到的狀態在新版本中一直有效.
+        """
+        if data_version is not None and data_version != self._data_version:
+            return
+        self._entries[task_id] = task
+        self._entries.move_to_end(task_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, task_id: str) -> None:
+        """清除一個任務, 以及附加在它上面的重複提交."""
+        self._entries.pop(task_id, None)
+        for duplicate_id in [k for k, v in self._entries.items() if v.get("duplicate_of") == task_id]:
+            del self._entries[duplicate_id]
+
+    def clear(self) -> None:
+        """清除所有項目."""
+        self._entries.clear()
+        self._data_version = None
+
+
+# API 行程的任務狀態快取
+status_cache = TaskStatusCache()
+
+
+async def fetch_task_status(task_id: str) -> Optional[dict[str, Any]]:
+    """
+    查詢任務的狀態與結果.
+
+    'duplicate' 狀態的任務返回其來源任務的狀態、結果與錯誤訊息.
+    使用連線池時 (API 行程), 結果由 `status_cache` 快取.
+
+    Args:
+        task_id (str): 任務 ID.
 
     Returns:
-        Optional[str]: 如果找到待處理任務, 則返回任務 ID; 否則返回 None.
+        Optional[dict[str, Any]]: 任務的欄位; 找不到任務時返回 None.
     """
-    try:
-        async with aiosqlite.connect(DATABASE_FILE) as db:
-            # 原子性地尋找並鎖定一個 'pending' 任務
+    pool = get_connection_pool()
+    data_version = None
+    if pool is not None:
+        data_version = await pool.data_version()
+        status_cache.sync(data_version)
+        cached = status_cache.get(task_id)
+        if cached is not None:
+            return dict(cached)
+
+    async with connect() as db:
+        async with db.execute("SELECT * FROM transcription_tasks WHERE id = ?", (task_id,)) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        task = dict(row)
+        if task["status"] == "duplicate":
+            # 附加在處理中的任務上: 返回來源任務的進度
             async with db.execute(
-                "SELECT id FROM transcription_tasks WHERE status = 'pending' LIMIT 1"
+                "SELECT status, result_text, error_message FROM transcription_tasks WHERE id = ?",
+                (task["duplicate_of"],),
             ) as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    task_id = row[0]
+                source = await cursor.fetchone()
+            if source is not None:
+                task.update(dict(source))
+
+    if pool is not None:
+        status_cache.put(task_id, task, data_version)
+    return dict(task)
+
+
+# 去重任務的 original_filepath: 來源任務的上傳檔案
+_CANONICAL_FILEPATH_SQL = "COALESCE((SELECT original_filepath FROM transcription_tasks WHERE id = ?), '')"
+
+
+async def submit_task(task_id: str, filepath: str, cache_key: str) -> tuple[str, Optional[str]]:
+    """
+    建立一個以內容快取鍵去重的任務.
+
+    查詢快取、尋找處理中的相同任務與新增任務在同一個交易 (BEGIN IMMEDIATE) 中完成,
+    因此同時上傳的相同內容也只會建立一個真正需要轉錄的任務.
+
+    去重的任務不會轉錄自己的上傳, 呼叫端會刪除該檔案, 因此它的 original_filepath
+    指向來源任務的檔案 (來源任務已不存在時為空字串).
+
+    Args:
+        task_id (str): 新任務的 ID.
+        filepath (str): 上傳檔案的保存路徑; 只有需要轉錄的新任務會使用它.
+        cache_key (str): 由 `transcript_cache_key` 產生的快取鍵.
+
+    Returns:
+        tuple[str, Optional[str]]: (結果, 來源任務 ID). 結果為 'cached' (直接從快取完成)、
+        'coalesced' (附加在處理中的來源任務上) 或 'queued' (需要轉錄的新任務, 來源為 None).
+    """
+    try:
+        async with connect() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                async with db.execute(
+                    "SELECT result_text, source_task_id FROM transcript_cache WHERE cache_key = ?",
+                    (cache_key,),
+                ) as cursor:
+                    cached = await cursor.fetchone()
+                if cached:
                     await db.execute(
-                        "UPDATE transcription_tasks SET status = 'processing' WHERE id = ?",
-                        (task_id,),
+                        "INSERT INTO transcription_tasks "
+                        "(id, original_filepath, status, result_text, cache_key, duplicate_of) "
+                        f"VALUES (?, {_CANONICAL_FILEPATH_SQL}, 'completed', ?, ?, ?)",
+                        (task_id, cached[1], cached[0], cache_key, cached[1]),
                     )
-                    await db.commit()
-                    logger.info("從佇列中領取任務 %s.", task_id)
-                    return task_id
-            return None
+                    await db.execute(
+                        "UPDATE transcript_cache SET hits = hits + 1 WHERE cache_key = ?", (cache_key,)
+                    )
+                    outcome: tuple[str, Optional[str]] = ("cached", cached[1])
+                else:
+                    placeholders = ", ".join("?" * len(ACTIVE_STATUSES))
+                    async with db.execute(
+                        "SELECT id FROM transcription_tasks WHERE cache_key = ? "
+                        f"AND status IN ({placeholders}) AND duplicate_of IS NULL "
+                        "ORDER BY created_at LIMIT 1",
+                        (cache_key, *ACTIVE_STATUSES),
+                    ) as cursor:
+                        primary = await cursor.fetchone()
+                    if primary:
+                        await db.execute(
+                            "INSERT INTO transcription_tasks "
+                            "(id, original_filepath, status, cache_key, duplicate_of) "
+                            f"VALUES (?, {_CANONICAL_FILEPATH_SQL}, 'duplicate', ?, ?)",
+                            (task_id, primary[0], cache_key, primary[0]),
+                        )
+                        outcome = ("coalesced", primary[0])
+                    else:
+                        await db.execute(
+                            "INSERT INTO transcription_tasks (id, original_filepath, cache_key) VALUES (?, ?, ?)",
+                            (task_id, filepath, cache_key),
+                        )
+                        outcome = ("queued", None)
+                await db.commit()
+            except aiosqlite.Error:
+                await db.rollback()
+                raise
+        logger.info("任務 %s 已提交 (%s).", task_id, outcome[0])
+        return outcome
     except aiosqlite.Error as e:
-        logger.exception("從佇列獲取任務時發生資料庫錯誤: %s", e)
-        return None
+        logger.exception("提交任務 %s 時發生資料庫錯誤: %s", task_id, e)
+        raise
+
+
+async def claim_tasks(
+    worker_id: str, limit: int = 1, lease_seconds: float = DEFAULT_LEASE_SECONDS
+) -> list[str]:
+    """
+    原子地領取一批待處理的任務.
+
+    領取以單一的 UPDATE ... RETURNING 陳述式完成, 不會有兩個工人領到同一個任務.
+    每個被領取的任務會記錄工人 ID 與租約到期時間; 租約過期仍未完成的任務
+    (例如工人當機) 會在之後的領取中被自動重新領取, 領取次數達到上限的則標記為失敗,
+    附加在它上面的重複提交也一併失敗.
+
+    Args:
+        worker_id (str): 領取任務的工人 ID.
+        limit (int): 最多領取幾個任務.
+        lease_seconds (float): 租約長度 (秒). 處理時間較長時請以 `renew_lease` 延長.
+
+    Returns:
+        list[str]: 領取到的任務 ID, 依建立時間排序; 沒有待處理任務時為空列表.
+    """
+    now = time.time()
+    try:
+        async with connect() as db:
+            # 放棄多次租約過期的任務, 避免一個會讓工人當機的檔案被無限重試
+            give_up = "任務多次逾時未完成, 已放棄."
+            async with db.execute(
+                """
+                UPDATE transcription_tasks
+                SET status = 'failed', error_message = ?, worker_id = NULL, lease_expires_at = NULL
+                WHERE status = 'processing' AND lease_expires_at < ? AND attempts >= ?
+                RETURNING id
+                """,
+                (give_up, now, MAX_ATTEMPTS),
+            ) as cursor:
+                abandoned = [row[0] for row in await cursor.fetchall()]
+            for task_id in abandoned:
+                await _settle_duplicates(db, task_id, "failed", None, give_up)
+            async with db.execute(
+                """
+                UPDATE transcription_tasks
+                SET status = 'processing', worker_id = ?, lease_expires_at = ?, attempts = attempts + 1
+                WHERE id IN (
+                    SELECT id FROM transcription_tasks
+                    WHERE status = 'pending'
+                       OR (status = 'processing' AND lease_expires_at < ?)
+                    ORDER BY created_at, rowid
+                    LIMIT ?
+                )
+                RETURNING id, created_at
+                """,
+                (worker_id, now + lease_seconds, now, limit),
+            ) as cursor:
+                rows = await cursor.fetchall()
+            await db.commit()
+    except aiosqlite.Error as e:
+        logger.exception("工人 %s 領取任務時發生資料庫錯誤: %s", worker_id, e)
+        return []
+
+    for task_id in abandoned:
+        logger.warning("任務 %s 多次逾時未完成, 已標記為失敗.", task_id)
+        status_cache.invalidate(task_id)
+    task_ids = [row[0] for row in sorted(rows, key=lambda row: row[1])]
+    if task_ids:
+        logger.info("工人 %s 領取了任務 %s.", worker_id, ", ".join(task_ids))
+    return task_ids
+
+
+async def get_task_from_queue(
+    worker_id: Optional[str] = None, lease_seconds: float = DEFAULT_LEASE_SECONDS
+) -> Optional[str]:
+    """
+    從佇列中獲取一個待處理的任務.
+
+    這是 `claim_tasks` 領取單一任務的簡便版本.
+
+    Args:
+        worker_id (Optional[str]): 領取任務的工人 ID; 預設為目前行程的 ID.
+        lease_seconds (float): 租約長度 (秒).
+
+    Returns:
+        Optional[str]: 如果找到待處理任務, 則返回任務 ID; 否則返回 None.
+    """
+    task_ids = await claim_tasks(worker_id or default_worker_id(), 1, lease_seconds)
+    return task_ids[0] if task_ids else None
+
+
+async def renew_lease(task_id: str, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+    """
+    延長任務的租約.
+
+    Args:
+        task_id (str): 任務 ID.
+        worker_id (str): 持有租約的工人 ID.
+        lease_seconds (float): 從現在起算的新租約長度 (秒).
+
+    Returns:
+        bool: 是否仍持有此任務; 租約已被其他工人接手時返回 False.
+    """
+    try:
+        async with connect() as db:
+            cursor = await db.execute(
+                """
+                UPDATE transcription_tasks SET lease_expires_at = ?
+                WHERE id = ? AND worker_id = ? AND status = 'processing'
+                """,
+                (time.time() + lease_seconds, task_id, worker_id),
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+    except aiosqlite.Error as e:
+        logger.exception("延長任務 %s 的租約時發生資料庫錯誤: %s", task_id, e)
+        return False
+
+
+async def _settle_duplicates(
+    db: aiosqlite.Connection,
+    task_id: str,
+    status: str,
+    result_text: Optional[str],
+    error_message: Optional[str],
+) -> None:
+    """
+    來源任務結束時, 把附加在它上面的重複提交更新為相同的結果.
+
+    在呼叫端的交易中執行, 與來源任務的更新一起提交.
+
+    Args:
+        db (aiosqlite.Connection): 呼叫端的連線.
+        task_id (str): 已結束的來源任務 ID.
+        status (str): 來源任務的最終狀態 ('completed' 或 'failed').
+        result_text (Optional[str]): 轉錄結果.
+        error_message (Optional[str]): 錯誤訊息.
+    """
+    await db.execute(
+        """
+        UPDATE transcription_tasks
+        SET status = ?, result_text = ?, error_message = ?
+        WHERE duplicate_of = ? AND status = 'duplicate'
+        """,
+        (status, result_text, error_message, task_id),
+    )
 
 
 async def update_task_status(
-    task_id: str, status: str, result_text: Optional[str] = None, error_message: Optional[str] = None
+    task_id: str,
+    status: str,
+    result_text: Optional[str] = None,
+    error_message: Optional[str] = None,
+    worker_id: Optional[str] = None,
 ) -> None:
     """
     更新任務的狀態、結果或錯誤訊息.
 
+    任務結束 ('completed' / 'failed') 時, 附加在此任務上的重複提交會一併更新;
+    轉錄成功的結果同時寫入轉錄快取.
+
     Args:
         task_id (str): 要更新的任務 ID.
         status (str): 新的狀態 ('completed', 'failed', 'retry_pending').
         result_text (Optional[str]): 轉錄成功時的結果文字.
         error_message (Optional[str]): 轉錄失敗時的錯誤訊息.
+        worker_id (Optional[str]): 提供時, 只有仍持有此任務的工人才能更新;
+            租約過期且任務已被其他工人接手時, 這次更新會被忽略.
     """
     try:
-        async with aiosqlite.connect(DATABASE_FILE) as db:
-            await db.execute(
-                """
+        async with connect() as db:
+            owner_clause = "" if worker_id is None else " AND worker_id = ?"
+            cursor = await db.execute(
+                f"""
                 UPDATE transcription_tasks
-                SET status = ?, result_text = ?, error_message = ?
-                WHERE id = ?
+                SET status = ?, result_text = ?, error_message = ?, lease_expires_at = NULL
+                WHERE id = ?{owner_clause}
                 """,
-                (status, result_text, error_message, task_id),
+                (status, result_text, error_message, task_id, *(() if worker_id is None else (worker_id,))),
             )
+            if worker_id is not None and cursor.rowcount == 0:
+                logger.warning("任務 %s 已不屬於工人 %s, 略過狀態更新.", task_id, worker_id)
+                return
+            if status in FINAL_STATUSES:
+                await _settle_duplicates(db, task_id, status, result_text, error_message)
+            if status == "completed" and result_text is not None:
+                await db.execute(
+                    "INSERT OR REPLACE INTO transcript_cache (cache_key, result_text, source_task_id) "
+                    "SELECT cache_key, ?, id FROM transcription_tasks WHERE id = ? AND cache_key IS NOT NULL",
+                    (result_text, task_id),
+                )
             await db.commit()
             logger.info("任務 %s 的狀態已更新為 %s.", task_id, status)
     except aiosqlite.Error as e:
         logger.exception("更新任務 %s 狀態時發生資料庫錯誤: %s", task_id, e)
         raise
+    finally:
+        status_cache.invalidate(task_id)
+
+
+async def get_queue_stats(window_seconds: float = 60.0) -> dict[str, Any]:
+    """
+    統計佇列深度與各工人最近的吞吐量, 供啟動器調整工人數量.
+
+    Args:
+        window_seconds (float): 計算吞吐量的時間窗口 (秒).
+
+    Returns:
+        dict[str, Any]: 'pending' (等待中的任務數, 包括租約已過期的任務)、
+        'processing' (處理中的任務數)、'busy_workers' (正在處理任務的工人 ID 集合)
+        與 'finished' (工人 ID -> 時間窗口內結束的任務數).
+    """
+    now = time.time()
+    async with connect() as db:
+        async with db.execute(
+            """
+            SELECT
+                SUM(status = 'pending' OR (status = 'processing' AND lease_expires_at < ?)),
+                SUM(status = 'processing' AND lease_expires_at >= ?)
+            FROM transcription_tasks WHERE status IN ('pending', 'processing')
+            """,
+            (now, now),
+        ) as cursor:
+            pending, processing = await cursor.fetchone()
+        async with db.execute(
+            "SELECT DISTINCT worker_id FROM transcription_tasks "
+            "WHERE status = 'processing' AND lease_expires_at >= ?",
+            (now,),
+        ) as cursor:
+            busy_workers = {row[0] for row in await cursor.fetchall()}
+        async with db.execute(
+            """
+            SELECT worker_id, COUNT(*) FROM transcription_tasks
+            WHERE status IN ('completed', 'failed') AND worker_id IS NOT NULL
+              AND updated_at >= datetime('now', ?)
+            GROUP BY worker_id
+            """,
+            (f"-{int(window_seconds)} seconds",),
+        ) as cursor:
+            finished = {row[0]: row[1] for row in await cursor.fetchall()}
+    return {
+        "pending": pending or 0,
+        "processing": processing or 0,
+        "busy_workers": busy_workers,
+        "finished": finished,
+    }
+
+
+async def release_worker_tasks(worker_id: str) -> int:
+    """
+    讓已結束的工人手上的租約立即過期, 其他工人不必等到租約到期就能重新領取.
+
+    Args:
+        worker_id (str): 已結束的工人 ID.
+
+    Returns:
+        int: 被釋放的任務數量.
+    """
+    async with connect() as db:
+        cursor = await db.execute(
+            "UPDATE transcription_tasks SET lease_expires_at = 0 WHERE worker_id = ? AND status = 'processing'",
+            (worker_id,),
+        )
+        await db.commit()
+    if cursor.rowcount:
+        logger.info("已釋放工人 %s 的 %d 個任務.", worker_id, cursor.rowcount)
+    return cursor.rowcount
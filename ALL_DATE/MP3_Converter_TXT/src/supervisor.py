@@ -0,0 +1,330 @@
+"""
+工人調度模組.
+
+啟動器以 `WorkerSupervisor` 管理轉錄工人行程:
+
+- 依佇列深度與各工人最近的吞吐量增加工人, 讓突發的大量上傳不會在佇列中堆積.
+- 佇列持續為空時逐一縮減閒置的工人, 閒置期間不佔用模型的記憶體.
+- 工人數量不超過 CPU 核心數、系統記憶體與裝置 (`get_best_hardware_config`) 允許的上限.
+- 意外終止的工人以指數退避重新啟動, 它手上的任務立即釋放給其他工人.
+- 縮減時只通知工人停止 (stop_event), 工人完成目前的任務後自行結束.
+"""
+import asyncio
+import logging
+import math
+import multiprocessing as mp
+import os
+import time
+from multiprocessing.synchronize import Event
+from typing import Any, Callable, Optional
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from src.core import BaseConfig
+from src.queues import DEFAULT_LEASE_SECONDS, default_worker_id, get_queue_stats, release_worker_tasks
+
+# 每個工人行程的記憶體估計 (GB): 模型本身加上 faster-whisper/CTranslate2 的執行期
+WORKER_MEMORY_GB = {"tiny": 0.5, "base": 0.7, "small": 1.2, "medium": 2.5, "large": 4.5}
+# CTranslate2 在 CPU 上每個模型預設使用的執行緒數
+CPU_THREADS_PER_WORKER = 4
+# 工人最多使用的系統記憶體比例
+MEMORY_FRACTION = 0.75
+# 系統 CPU 使用率達到此值時不再增加工人
+CPU_LIMIT_PERCENT = float(os.environ.get("PHOENIX_SCALE_CPU_LIMIT", 90))
+# 預估清空佇列的時間超過此值 (秒) 時增加工人
+TARGET_DRAIN_SECONDS = float(os.environ.get("PHOENIX_SCALE_TARGET_DRAIN_SECONDS", 60))
+# 佇列持續為空多久 (秒) 後縮減一個閒置的工人
+IDLE_SECONDS = float(os.environ.get("PHOENIX_SCALE_IDLE_SECONDS", 120))
+# 兩次增加工人之間的最短間隔 (秒); 新工人需要時間載入模型
+SCALE_UP_COOLDOWN = float(os.environ.get("PHOENIX_SCALE_UP_COOLDOWN", 10))
+# 多久 (秒) 檢查一次佇列
+SCALE_INTERVAL = 2.0
+# 計算吞吐量的時間窗口 (秒)
+THROUGHPUT_WINDOW = 300.0
+# 工人意外終止後重新啟動前的等待時間 (秒): 每次連續終止加倍, 直到上限
+RESTART_BACKOFF_BASE = 1.0
+RESTART_BACKOFF_MAX = 60.0
+# 工人持續運行超過此時間 (秒) 才算穩定; 穩定的工人終止時退避重新計算
+STABLE_SECONDS = 60.0
+
+
+def worker_memory_gb(model_size: str) -> float:
+    """
+    估計載入指定模型的工人行程所需的記憶體.
+
+    Args:
+        model_size (str): 模型大小, 例如 "tiny" 或 "large-v3".
+
+    Returns:
+        float: 記憶體估計 (GB); 未知的模型以最大的估計值計算.
+    """
+    for name, size in WORKER_MEMORY_GB.items():
+        if model_size.startswith(name):
+            return size
+    return max(WORKER_MEMORY_GB.values())
+
+
+def estimate_max_workers(config: BaseConfig, hardware_config: dict[str, Any]) -> int:
+    """
+    依裝置、CPU 核心數與系統記憶體估計可同時運行的工人數量上限.
+
+    Args:
+        config (BaseConfig): 轉錄設定 (決定模型大小).
+        hardware_config (dict[str, Any]): `get_best_hardware_config` 的結果.
+
+    Returns:
+        int: 工人數量上限 (至少為 1).
+    """
+    if hardware_config["device"] != "cpu":
+        # 所有工人共用同一個 GPU, 每個工人各載入一份模型; 更多工人只會互相爭用
+        return 1
+    limit = max(1, (os.cpu_count() or 1) // CPU_THREADS_PER_WORKER)
+    if psutil is not None:
+        total_gb = psutil.virtual_memory().total / 1024**3
+        limit = min(limit, int(total_gb * MEMORY_FRACTION // worker_memory_gb(config.MODEL_SIZE)))
+    return max(1, limit)
+
+
+class ManagedWorker:
+    """一個由 `WorkerSupervisor` 管理的工人行程."""
+
+    def __init__(self, process: mp.Process, stop_event: Event) -> None:
+        """
+        記錄一個已啟動的工人行程.
+
+        Args:
+            process (mp.Process): 工人行程.
+            stop_event (Event): 通知工人完成目前的任務後結束.
+        """
+        self.process = process
+        self.stop_event = stop_event
+        self.started_at = time.monotonic()
+        self.draining_since: Optional[float] = None
+
+    @property
+    def worker_id(self) -> str:
+        """工人領取任務時使用的 ID."""
+        return default_worker_id(self.process.pid)
+
+
+class WorkerSupervisor:
+    """
+    依佇列負載調整工人數量, 並重新啟動意外終止的工人.
+
+    工人函數以 `target(*args, stop_event)` 的形式啟動. 啟動器每秒調用一次 `poll`.
+    """
+
+    def __init__(
+        self,
+        target: Callable[..., None],
+        args: tuple[Any, ...],
+        name: str,
+        logger: logging.Logger,
+        min_workers: int,
+        max_workers: int,
+        initial_workers: int,
+        worker_memory: float = 0.0,
+        autoscale: bool = True,
+    ) -> None:
+        """
+        初始化調度器.
+
+        Args:
+            target (Callable[..., None]): 工人行程函數.
+            args (tuple[Any, ...]): 傳給工人函數的參數 (不含 stop_event).
+            name (str): 工人行程名稱的前綴.
+            logger (logging.Logger): 日誌記錄器.
+            min_workers (int): 最少保留的工人數量.
+            max_workers (int): 最多同時運行的工人數量.
+            initial_workers (int): 啟動時的工人數量.
+            worker_memory (float): 每個工人的記憶體估計 (GB); 可用記憶體不足時不增加工人.
+            autoscale (bool): 是否依佇列負載調整數量; 為 False 時固定為 initial_workers.
+        """
+        self.target = target
+        self.args = args
+        self.name = name
+        self.logger = logger
+        self.min_workers = max(0, min_workers)
+        self.max_workers = max(self.min_workers, max_workers, 1)
+        self.desired = min(max(initial_workers, self.min_workers), self.max_workers)
+        self.worker_memory = worker_memory
+        self.autoscale = autoscale
+        # 超過租約長度仍未結束的縮減中工人會被強制終止
+        self.drain_timeout = DEFAULT_LEASE_SECONDS
+
+        self.workers: list[ManagedWorker] = []
+        self._spawned = 0
+        self._crashes = 0
+        self._restart_at = 0.0
+        self._last_scale_check = 0.0
+        self._last_scale_up = 0.0
+        self._idle_since: Optional[float] = None
+        self._busy_workers: set[str] = set()
+        if psutil is not None:
+            psutil.cpu_percent(interval=None)  # 第一次調用只用於建立基準
+
+    @property
+    def active_workers(self) -> list[ManagedWorker]:
+        """運行中且未被要求停止的工人."""
+        return [w for w in self.workers if w.draining_since is None]
+
+    def start(self) -> None:
+        """啟動初始數量的工人."""
+        for _ in range(self.desired):
+            self._spawn()
+
+    def poll(self) -> None:
+        """檢查工人狀態並調整數量; 由啟動器的監控循環定期調用."""
+        now = time.monotonic()
+        self._reap(now)
+        if self.autoscale and now - self._last_scale_check >= SCALE_INTERVAL:
+            self._last_scale_check = now
+            self._rescale(now)
+        self._reconcile(now)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """
+        停止所有工人.
+
+        Args:
+            timeout (float): 等待工人自行結束的時間 (秒), 之後強制終止.
+        """
+        for worker in self.workers:
+            worker.stop_event.set()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.process.join(timeout=max(0.0, deadline - time.monotonic()))
+        for worker in self.workers:
+            if worker.process.is_alive():
+                self.logger.info("正在終止 %s...", worker.process.name)
+                worker.process.terminate()
+                worker.process.join(timeout=5)
+                self._release_tasks(worker)
+        self.workers.clear()
+
+    # --- 內部方法 ---
+
+    def _spawn(self) -> None:
+        self._spawned += 1
+        stop_event = mp.Event()
+        process = mp.Process(
+            target=self.target,
+            args=(*self.args, stop_event),
+            name=f"{self.name}-{self._spawned}",
+            daemon=True,
+        )
+        self.logger.info("正在啟動 %s 行程...", process.name)
+        process.start()
+        self.workers.append(ManagedWorker(process, stop_event))
+
+    def _drain(self, worker: ManagedWorker, now: float) -> None:
+        self.logger.info("正在縮減工人 %s, 它將在完成目前的任務後結束.", worker.process.name)
+        worker.stop_event.set()
+        worker.draining_since = now
+
+    def _release_tasks(self, worker: ManagedWorker) -> None:
+        try:
+            asyncio.run(release_worker_tasks(worker.worker_id))
+        except Exception as e:
+            self.logger.warning("釋放工人 %s 的任務失敗, 將等待租約到期: %s", worker.process.name, e)
+
+    def _reap(self, now: float) -> None:
+        """移除已結束的工人; 意外終止的工人安排以退避時間重新啟動."""
+        for worker in list(self.workers):
+            process = worker.process
+            if process.is_alive():
+                if worker.draining_since is not None and now - worker.draining_since > self.drain_timeout:
+                    self.logger.warning("工人 %s 未在 %.0f 秒內結束, 強制終止.", process.name, self.drain_timeout)
+                    process.terminate()
+                continue
+
+            self.workers.remove(worker)
+            if worker.draining_since is not None:
+                self.logger.info("工人 %s 已停止 (exitcode: %s).", process.name, process.exitcode)
+                if process.exitcode != 0:
+                    self._release_tasks(worker)
+                continue
+
+            self._release_tasks(worker)
+            if now - worker.started_at >= STABLE_SECONDS:
+                self._crashes = 0
+            self._crashes += 1
+            delay = min(RESTART_BACKOFF_BASE * 2 ** (self._crashes - 1), RESTART_BACKOFF_MAX)
+            self._restart_at = now + delay
+            self.logger.warning(
+                "工人 %s (PID: %s) 意外終止 (exitcode: %s), 將在 %.0f 秒後重新啟動.",
+                process.name, process.pid, process.exitcode, delay,
+            )
+
+    def _has_headroom(self, active_count: int) -> bool:
+        """是否還能在 CPU 與記憶體限制內再啟動一個工人."""
+        if active_count >= self.max_workers:
+            return False
+        if psutil is None:
+            return True
+        if psutil.virtual_memory().available < self.worker_memory * 1024**3:
+            self.logger.debug("可用記憶體不足以再載入一個模型, 暫不增加工人.")
+            return False
+        if psutil.cpu_percent(interval=None) >= CPU_LIMIT_PERCENT:
+            self.logger.debug("CPU 使用率已達 %.0f%%, 暫不增加工人.", CPU_LIMIT_PERCENT)
+            return False
+        return True
+
+    def _rescale(self, now: float) -> None:
+        """依佇列深度與吞吐量調整目標工人數量."""
+        try:
+            stats = asyncio.run(get_queue_stats(THROUGHPUT_WINDOW))
+        except Exception as e:
+            self.logger.warning("讀取佇列狀態失敗: %s", e)
+            return
+
+        active = self.active_workers
+        self._busy_workers = stats["busy_workers"]
+        busy = [w for w in active if w.worker_id in self._busy_workers]
+        pending = stats["pending"]
+        # 全部工人每秒完成的任務數; 新任務的預估等待時間以此計算
+        rate = sum(stats["finished"].get(w.worker_id, 0) for w in active) / THROUGHPUT_WINDOW
+        self.logger.debug(
+            "佇列: 等待 %d, 處理中 %d; 工人 %d/%d (忙碌 %d), 每個工人每分鐘完成 %.2f 個任務.",
+            pending, stats["processing"], len(active), self.desired, len(busy),
+            rate * 60 / max(1, len(active)),
+        )
+
+        if pending:
+            self._idle_since = None
+            eta = pending / rate if rate else math.inf
+            all_busy = len(busy) >= len(active)
+            if (
+                len(active) >= self.desired
+                and (not active or (all_busy and eta > TARGET_DRAIN_SECONDS))
+                and now - self._last_scale_up >= SCALE_UP_COOLDOWN
+                and self._has_headroom(len(active))
+            ):
+                self.desired += 1
+                self._last_scale_up = now
+                self.logger.info(
+                    "佇列中有 %d 個等待的任務 (預估清空時間: %s), 工人增加至 %d 個.",
+                    pending, "未知" if math.isinf(eta) else f"{eta:.0f} 秒", self.desired,
+                )
+        elif self._idle_since is None:
+            self._idle_since = now
+        elif now - self._idle_since >= IDLE_SECONDS and self.desired > self.min_workers:
+            # 每個閒置期間只縮減一個工人
+            self._idle_since = now
+            self.desired -= 1
+            self.logger.info("佇列已閒置 %.0f 秒, 工人縮減至 %d 個.", IDLE_SECONDS, self.desired)
+
+    def _reconcile(self, now: float) -> None:
+        """啟動或縮減工人, 使運行中的數量符合目標."""
+        active = self.active_workers
+        if len(active) < self.desired and now >= self._restart_at:
+            # 固定數量或最少數量內的工人 (包括重新啟動) 不受資源限制
+            if not self.autoscale or len(active) < self.min_workers or self._has_headroom(len(active)):
+                self._spawn()
+        elif len(active) > self.desired:
+            idle = [w for w in active if w.worker_id not in self._busy_workers]
+            if idle:
+                self._drain(idle[-1], now)
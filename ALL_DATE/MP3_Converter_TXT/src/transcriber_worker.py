@@ -1,35 +1,174 @@
 """轉錄工人模組."""
 import asyncio
+import gc
 import multiprocessing as mp
+import os
+import queue
+import threading
 import time
-from typing import Any
+from multiprocessing.synchronize import Event
+from typing import Any, Optional
 
 from faster_whisper import WhisperModel
 
-import aiosqlite
-
-from src.core import DATABASE_FILE, get_logger
+from src.core import BaseConfig, connect, get_config, get_logger
 from src.core.hardware import get_best_hardware_config
-from src.queues import get_task_from_queue, update_task_status
+from src.queues import (
+    DEFAULT_LEASE_SECONDS,
+    default_worker_id,
+    get_task_from_queue,
+    renew_lease,
+    update_task_status,
+)
+
+
+class ResidentModelPool:
+    """
+    工人行程內常駐的 Whisper 模型池.
+
+    模型在第一次需要時載入, 之後的任務直接重用, 每個任務只需付出轉錄本身的時間.
+    只有模型大小或硬體設定 (裝置、計算類型) 改變時才重新載入, 並先釋放舊的模型,
+    避免兩個模型同時佔用記憶體.
+    """
+
+    def __init__(self) -> None:
+        """初始化一個空的模型池."""
+        self._key: Optional[tuple[str, str, str]] = None
+        self._model: Optional[WhisperModel] = None
+
+    def get(self, model_size: str, hardware_config: dict[str, Any]) -> WhisperModel:
+        """
+        取得符合設定的模型, 必要時 (重新) 載入.
+
+        Args:
+            model_size (str): 模型大小, 例如 "tiny" 或 "medium".
+            hardware_config (dict[str, Any]): `get_best_hardware_config` 的結果.
+
+        Returns:
+            WhisperModel: 已載入的模型.
+        """
+        key = (model_size, hardware_config["device"], hardware_config["compute_type"])
+        if self._model is None or key != self._key:
+            self.release()
+            logger = get_logger("轉錄工人")
+            logger.info("正在載入 Whisper 模型 %s (%s, %s)...", *key)
+            started = time.monotonic()
+            self._model = WhisperModel(
+                model_size,
+                device=hardware_config["device"],
+                compute_type=hardware_config["compute_type"],
+            )
+            self._key = key
+            logger.info("模型載入完成, 耗時 %.1f 秒.", time.monotonic() - started)
+        return self._model
+
+    def release(self) -> None:
+        """釋放目前的模型."""
+        self._model = None
+        self._key = None
+        gc.collect()
+
+
+# 每個工人行程各自擁有一個模型池 (行程以 spawn 啟動, 不會共用)
+model_pool = ResidentModelPool()
+
+# 轉錄期間每隔多久延長一次任務的租約 (秒)
+LEASE_RENEW_SECONDS = DEFAULT_LEASE_SECONDS / 3
+
+# 沒有收到通知時, 每隔多久仍檢查一次資料庫 (備援輪詢, 例如租約過期的任務)
+WAKEUP_FALLBACK_SECONDS = float(os.environ.get("PHOENIX_WORKER_POLL_SECONDS", 5))
+
+
+def wait_for_wakeup(
+    task_queue: mp.Queue, timeout: float = WAKEUP_FALLBACK_SECONDS, stop_event: Optional[Event] = None
+) -> bool:
+    """
+    阻塞等待新任務的通知, 閒置時不消耗 CPU.
+
+    Args:
+        task_queue (mp.Queue): `add_task_to_queue` 發送通知的佇列.
+        timeout (float): 最長等待時間 (秒), 逾時即進行一次備援輪詢.
+        stop_event (Optional[Event]): 工人的停止事件. 已設定時工人不會再處理任務,
+            收到的通知會被放回佇列, 交給其他工人.
+
+    Returns:
+        bool: False 表示工人應結束 (收到結束信號 None, 或 stop_event 已設定).
+    """
+    try:
+        message = task_queue.get(timeout=timeout)
+    except queue.Empty:
+        return stop_event is None or not stop_event.is_set()
+    if message is None or (stop_event is not None and stop_event.is_set()):
+        # 將結束信號或通知放回佇列, 讓其他工人也能收到
+        task_queue.put(message)
+        return False
+    return True
 
 
-async def process_single_task() -> None:
-    """處理單個轉錄任務."""
+async def keep_lease(task_id: str, worker_id: str, lease_lost: threading.Event,
+                     interval: float = LEASE_RENEW_SECONDS) -> None:
+    """
+    在轉錄期間定期延長任務的租約, 直到被取消.
+
+    faster-whisper 在產生第一個片段之前會先執行 VAD 與語言偵測, 單一片段的耗時也沒有上限,
+    因此租約由這個背景任務依時間延長, 而不是在片段之間延長.
+
+    Args:
+        task_id (str): 任務 ID.
+        worker_id (str): 持有租約的工人 ID.
+        lease_lost (threading.Event): 租約已被其他工人接手時設定, 通知轉錄執行緒停止.
+        interval (float): 延長租約的間隔 (秒).
+    """
+    while True:
+        await asyncio.sleep(interval)
+        if not await renew_lease(task_id, worker_id):
+            lease_lost.set()
+            return
+
+
+def transcribe_audio(config: BaseConfig, audio_path: str, lease_lost: threading.Event) -> Optional[str]:
+    """
+    以常駐模型轉錄一個音訊檔案; 在執行緒中執行, 不阻塞事件循環.
+
+    Args:
+        config (BaseConfig): 轉錄設定.
+        audio_path (str): 音訊檔案路徑.
+        lease_lost (threading.Event): 設定後在下一個片段停止轉錄.
+
+    Returns:
+        Optional[str]: 完整的轉錄文字; 租約已被其他工人接手時返回 None.
+    """
+    # 模型只在設定改變時重新載入
+    model = model_pool.get(config.MODEL_SIZE, get_best_hardware_config())
+    segments, _info = model.transcribe(audio_path, beam_size=config.BEAM_SIZE)
+    texts = []
+    for segment in segments:
+        if lease_lost.is_set():
+            return None
+        texts.append(segment.text)
+    return None if lease_lost.is_set() else "".join(texts)
+
+
+async def process_single_task(config: Optional[BaseConfig] = None) -> bool:
+    """
+    處理單個轉錄任務.
+
+    Args:
+        config (Optional[BaseConfig]): 轉錄設定 (模型大小與束搜尋寬度); 預設為測試配置.
+
+    Returns:
+        bool: 是否領取到任務 (不論成功或失敗); 佇列為空時返回 False.
+    """
     logger = get_logger("轉錄工人")
-    task_id = await get_task_from_queue()
+    config = config or get_config()
+    worker_id = default_worker_id()
+    task_id = await get_task_from_queue(worker_id)
 
     if task_id:
         logger.info("找到待處理任務: %s", task_id)
 
         try:
-            # 執行轉錄
-            hardware_config = get_best_hardware_config()
-            model = WhisperModel(
-                "tiny",  # Using tiny for testing
-                device=hardware_config["device"],
-                compute_type=hardware_config["compute_type"],
-            )
-            async with aiosqlite.connect(DATABASE_FILE) as db:
+            async with connect() as db:
                 async with db.execute(
                     "SELECT original_filepath FROM transcription_tasks WHERE id = ?",
                     (task_id,),
@@ -37,42 +176,84 @@ async def process_single_task() -> None:
                     row = await cursor.fetchone()
                     if not row:
                         logger.error("在資料庫中找不到任務 %s 的檔案路徑。", task_id)
-                        return
+                        return True
                     audio_path = row[0]
-            segments, _info = model.transcribe(audio_path, beam_size=5)
-            full_transcript = "".join(segment.text for segment in segments)
+
+            # 轉錄在執行緒中進行, 同時由背景任務延長租約, 避免任務被其他工人重新領取
+            lease_lost = threading.Event()
+            renewer = asyncio.create_task(keep_lease(task_id, worker_id, lease_lost, LEASE_RENEW_SECONDS))
+            try:
+                full_transcript = await asyncio.to_thread(transcribe_audio, config, audio_path, lease_lost)
+            finally:
+                renewer.cancel()
+            if full_transcript is None:
+                logger.warning("任務 %s 的租約已被其他工人接手, 停止轉錄.", task_id)
+                return True
             logger.info("任務 %s: 轉錄完成.", task_id)
 
             # 更新最終結果
             await update_task_status(
-                task_id, "completed", result_text=full_transcript.strip()
+                task_id, "completed", result_text=full_transcript.strip(), worker_id=worker_id
             )
             logger.info("任務 %s 狀態更新為: completed", task_id)
 
         except Exception as e:
             logger.exception("轉錄任務 %s 過程中發生錯誤", task_id)
-            await update_task_status(task_id, "failed", error_message=str(e))
+            await update_task_status(task_id, "failed", error_message=str(e), worker_id=worker_id)
             logger.info("任務 %s 狀態更新為: failed", task_id)
 
+    return task_id is not None
+
 
 def transcriber_worker_process(
     log_queue: mp.Queue,
-    _task_queue: mp.Queue,
+    task_queue: mp.Queue,
     _result_queue: mp.Queue,
-    _config: dict[str, Any],
+    config: Optional[BaseConfig] = None,
+    stop_event: Optional[Event] = None,
 ) -> None:
-    """工人的主循環, 現在作為一個獨立的行程函數."""
+    """
+    工人的主循環, 現在作為一個獨立的行程函數.
+
+    工人在 task_queue 上等待新任務的通知, 收到後立即領取; 每次醒來都會處理完
+    所有待處理的任務. 沒有通知時每隔 WAKEUP_FALLBACK_SECONDS 秒仍會檢查一次資料庫.
+
+    Args:
+        log_queue (mp.Queue): 日誌佇列.
+        task_queue (mp.Queue): 新任務通知與結束信號 (None) 的佇列.
+        _result_queue (mp.Queue): 未使用; 保留以與模擬工人的介面一致.
+        config (Optional[BaseConfig]): 轉錄設定.
+        stop_event (Optional[Event]): 設定後, 工人完成目前的任務即結束 (由啟動器用於縮減工人).
+    """
     logger = get_logger("轉錄工人", log_queue)
     logger.info("真實轉錄工人行程已啟動")
+    config = config or get_config()
+
+    # 啟動時先預熱模型, 第一個任務不必等待模型載入
+    try:
+        model_pool.get(config.MODEL_SIZE, get_best_hardware_config())
+    except Exception:
+        logger.exception("預熱模型失敗, 將在處理任務時重試")
+
+    def stopping() -> bool:
+        return stop_event is not None and stop_event.is_set()
 
     async def main() -> None:
-        while True:
+        while not stopping():
             try:
-                await process_single_task()
-                await asyncio.sleep(5)  # 每5秒檢查一次新任務
+                while not stopping() and await process_single_task(config):
+                    pass
             except Exception:
                 logger.exception("工人在主循環中發生嚴重錯誤")
                 await asyncio.sleep(10)  # 如果發生錯誤, 等待更長時間
+            if stopping():
+                break
+            if not await asyncio.to_thread(wait_for_wakeup, task_queue, WAKEUP_FALLBACK_SECONDS, stop_event):
+                break
+        if stopping():
+            logger.info("工人已被要求停止, 目前的任務已完成, 轉錄工人行程即將關閉.")
+        else:
+            logger.info("收到結束信號, 轉錄工人行程即將關閉.")
 
     asyncio.run(main())
 
@@ -87,4 +268,4 @@ if __name__ == "__main__":
             """模擬 put."""
             pass
 
-    transcriber_worker_process(MockQueue(), mp.Queue(), mp.Queue(), {})
+    transcriber_worker_process(MockQueue(), mp.Queue(), mp.Queue(), get_config())
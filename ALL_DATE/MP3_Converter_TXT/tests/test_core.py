@@ -0,0 +1,92 @@
+"""核心模組 (資料庫連線池) 測試."""
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING
+
+import pytest
+
+from src.core import DATABASE_FILE, ConnectionPool, connect, get_connection_pool, set_connection_pool
+
+if TYPE_CHECKING:
+    import aiosqlite
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_a_fixed_set_of_connections(db_connection: aiosqlite.Connection) -> None:
+    """連線被重複使用; 全部借出時, 下一個請求等待歸還."""
+    pool = ConnectionPool(DATABASE_FILE, size=2)
+    await pool.open()
+    try:
+        async def borrow() -> None:
+            async with pool.acquire():
+                pass
+
+        async with pool.acquire() as first, pool.acquire() as second:
+            assert first is not second
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(borrow(), 0.1)
+        async with pool.acquire() as again:
+            assert again in (first, second)
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_rolls_back_uncommitted_work(db_connection: aiosqlite.Connection) -> None:
+    """歸還時未提交的交易會被回滾, 不會洩漏給下一個借用者."""
+    pool = ConnectionPool(DATABASE_FILE, size=1)
+    await pool.open()
+    try:
+        async with pool.acquire() as db:
+            await db.execute("INSERT INTO transcription_tasks (id, original_filepath) VALUES ('t', 'a.wav')")
+            assert db.in_transaction
+        async with pool.acquire() as db:
+            assert not db.in_transaction
+            async with db.execute("SELECT COUNT(*) FROM transcription_tasks") as cursor:
+                assert (await cursor.fetchone())[0] == 0
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_data_version_changes_on_commits_from_other_connections(
+    db_connection: aiosqlite.Connection,
+) -> None:
+    """其他連線 (例如工人行程) 提交變更後, data_version 隨之改變."""
+    pool = ConnectionPool(DATABASE_FILE, size=1)
+    await pool.open()
+    try:
+        version = await pool.data_version()
+        assert await pool.data_version() == version
+
+        await db_connection.execute("INSERT INTO transcription_tasks (id, original_filepath) VALUES ('t', 'a.wav')")
+        await db_connection.commit()
+        changed = await pool.data_version()
+        assert changed != version
+
+        # 連線池自己的連線提交的變更也會被觀察到
+        async with pool.acquire() as db:
+            await db.execute("UPDATE transcription_tasks SET status = 'processing' WHERE id = 't'")
+            await db.commit()
+        assert await pool.data_version() != changed
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_connect_borrows_from_the_configured_pool(db_connection: aiosqlite.Connection) -> None:
+    """設定連線池後, connect() 從池中借用連線; 未設定時每次開啟新連線."""
+    pool = ConnectionPool(DATABASE_FILE, size=1)
+    await pool.open()
+    set_connection_pool(pool)
+    try:
+        assert get_connection_pool() is pool
+        async with connect() as db:
+            assert db is pool._connections[0]
+    finally:
+        set_connection_pool(None)
+        await pool.close()
+
+    async with connect() as db:
+        assert db not in pool._connections
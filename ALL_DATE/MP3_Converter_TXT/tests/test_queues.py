@@ -0,0 +1,283 @@
+"""任務佇列測試."""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import sqlite3
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+
+from src import queues
+from src.core import DATABASE_FILE, ConnectionPool, TestingConfig, connect, set_connection_pool, transcript_cache_key
+from src.queues import (
+    MAX_ATTEMPTS,
+    TaskStatusCache,
+    claim_tasks,
+    fetch_task_status,
+    renew_lease,
+    status_cache,
+    submit_task,
+    update_task_status,
+)
+
+if TYPE_CHECKING:
+    import aiosqlite
+
+
+async def _insert_tasks(db: aiosqlite.Connection, count: int) -> None:
+    await db.executemany(
+        "INSERT INTO transcription_tasks (id, original_filepath) VALUES (?, ?)",
+        [(f"task-{i}", f"audio-{i}.wav") for i in range(count)],
+    )
+    await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_claims_never_overlap(db_connection: aiosqlite.Connection) -> None:
+    """多個工人同時批次領取, 每個任務只會被領取一次."""
+    await _insert_tasks(db_connection, 50)
+
+    async def drain(worker_id: str) -> list[str]:
+        claimed: list[str] = []
+        while task_ids := await claim_tasks(worker_id, limit=4):
+            claimed.extend(task_ids)
+        return claimed
+
+    results = await asyncio.gather(*(drain(f"worker-{i}") for i in range(5)))
+    claimed = [task_id for result in results for task_id in result]
+    assert sorted(claimed) == sorted(f"task-{i}" for i in range(50))
+
+
+@pytest.mark.asyncio
+async def test_expired_leases_are_reclaimed(db_connection: aiosqlite.Connection) -> None:
+    """租約過期的任務被其他工人接手, 原工人之後的更新會被忽略."""
+    await _insert_tasks(db_connection, 1)
+    assert await claim_tasks("worker-a") == ["task-0"]
+    assert await claim_tasks("worker-b") == []
+
+    await db_connection.execute("UPDATE transcription_tasks SET lease_expires_at = 0")
+    await db_connection.commit()
+    assert await claim_tasks("worker-b") == ["task-0"]
+    assert not await renew_lease("task-0", "worker-a")
+
+    await update_task_status("task-0", "completed", result_text="stale", worker_id="worker-a")
+    async with db_connection.execute(
+        "SELECT status, worker_id, attempts FROM transcription_tasks WHERE id = 'task-0'",
+    ) as cursor:
+        assert tuple(await cursor.fetchone()) == ("processing", "worker-b", 2)
+
+    # 達到領取次數上限後, 再次過期的任務被標記為失敗
+    for _ in range(MAX_ATTEMPTS - 1):
+        await db_connection.execute("UPDATE transcription_tasks SET lease_expires_at = 0")
+        await db_connection.commit()
+        await claim_tasks("worker-c")
+    async with db_connection.execute(
+        "SELECT status FROM transcription_tasks WHERE id = 'task-0'",
+    ) as cursor:
+        assert (await cursor.fetchone())[0] == "failed"
+
+
+async def _task_row(db: aiosqlite.Connection, task_id: str) -> tuple:
+    async with db.execute(
+        "SELECT status, result_text, error_message, original_filepath, duplicate_of "
+        "FROM transcription_tasks WHERE id = ?",
+        (task_id,),
+    ) as cursor:
+        return tuple(await cursor.fetchone())
+
+
+@pytest.mark.asyncio
+async def test_identical_uploads_are_coalesced_and_cached(db_connection: aiosqlite.Connection) -> None:
+    """相同內容的上傳附加在處理中的任務上, 之後的上傳直接從轉錄快取完成."""
+    assert await submit_task("first", "uploads/first.wav", "hash-a:tiny:1:int8") == ("queued", None)
+    assert await submit_task("second", "uploads/second.wav", "hash-a:tiny:1:int8") == ("coalesced", "first")
+    # 去重任務的上傳會被刪除, 因此它指向來源任務的檔案
+    assert await _task_row(db_connection, "second") == ("duplicate", None, None, "uploads/first.wav", "first")
+
+    # 附加的任務不會被工人領取, 但查詢時返回來源任務的進度
+    assert await claim_tasks("worker-a", limit=5) == ["first"]
+    assert (await fetch_task_status("second"))["status"] == "processing"
+
+    await update_task_status("first", "completed", result_text="hello", worker_id="worker-a")
+    assert await _task_row(db_connection, "second") == ("completed", "hello", None, "uploads/first.wav", "first")
+
+    assert await submit_task("third", "uploads/third.wav", "hash-a:tiny:1:int8") == ("cached", "first")
+    assert await _task_row(db_connection, "third") == ("completed", "hello", None, "uploads/first.wav", "first")
+    async with db_connection.execute(
+        "SELECT result_text, source_task_id, hits FROM transcript_cache WHERE cache_key = ?",
+        ("hash-a:tiny:1:int8",),
+    ) as cursor:
+        assert tuple(await cursor.fetchone()) == ("hello", "first", 1)
+
+    # 不同的設定是不同的鍵, 需要重新轉錄
+    assert await submit_task("fourth", "uploads/fourth.wav", "hash-a:tiny:1:float16") == ("queued", None)
+
+
+@pytest.mark.asyncio
+async def test_failed_source_fails_its_duplicates(db_connection: aiosqlite.Connection) -> None:
+    """來源任務失敗時, 附加在它上面的任務一併失敗, 且失敗的結果不會進入快取."""
+    await submit_task("first", "uploads/first.wav", "hash-b")
+    await submit_task("second", "uploads/second.wav", "hash-b")
+    await claim_tasks("worker-a")
+
+    await update_task_status("first", "failed", error_message="無法解碼", worker_id="worker-a")
+
+    assert await _task_row(db_connection, "second") == ("failed", None, "無法解碼", "uploads/first.wav", "first")
+    assert await submit_task("third", "uploads/third.wav", "hash-b") == ("queued", None)
+
+
+def test_transcript_cache_key_includes_compute_type() -> None:
+    """快取鍵包含模型大小、束搜尋與計算類型."""
+    assert transcript_cache_key("abc", TestingConfig, "int8") == "abc:tiny:1:int8"
+    assert transcript_cache_key("abc", TestingConfig, "int8") != transcript_cache_key("abc", TestingConfig, "float16")
+
+
+def test_uploads_use_the_compute_type_detected_at_startup(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    """API 啟動時偵測一次硬體, 之後的上傳不再探測, 快取鍵使用啟動時的計算類型."""
+    from fastapi.testclient import TestClient
+
+    from src import main
+
+    probes: list[int] = []
+
+    def probe() -> dict[str, str]:
+        probes.append(1)
+        return {"device": "cuda", "compute_type": "float16"}
+
+    monkeypatch.setattr(main, "get_best_hardware_config", probe)
+    monkeypatch.setattr(main, "UPLOAD_DIR", tmp_path)
+    content = uuid.uuid4().bytes
+
+    with TestClient(main.app) as client:
+        task_ids = [
+            client.post("/upload", files={"file": ("a.wav", content, "audio/wav")}).json()["task_id"]
+            for _ in range(3)
+        ]
+
+    assert len(probes) == 1
+    with sqlite3.connect(DATABASE_FILE) as conn:
+        keys = {
+            conn.execute("SELECT cache_key FROM transcription_tasks WHERE id = ?", (task_id,)).fetchone()[0]
+            for task_id in task_ids
+        }
+    assert keys == {f"{hashlib.sha256(content).hexdigest()}:{main.config.MODEL_SIZE}:{main.config.BEAM_SIZE}:float16"}
+
+
+@pytest.mark.asyncio
+async def test_abandoned_tasks_fail_their_duplicates(db_connection: aiosqlite.Connection) -> None:
+    """多次逾時而被放棄的任務, 附加在它上面的重複提交也一併失敗, 不會永遠停在 'duplicate'."""
+    await submit_task("first", "uploads/first.wav", "hash-c")
+    await submit_task("second", "uploads/second.wav", "hash-c")
+    for _ in range(MAX_ATTEMPTS):
+        assert await claim_tasks("worker-a") == ["first"]
+        await db_connection.execute("UPDATE transcription_tasks SET lease_expires_at = 0 WHERE id = 'first'")
+        await db_connection.commit()
+
+    assert await claim_tasks("worker-b") == []
+
+    first, second = await _task_row(db_connection, "first"), await _task_row(db_connection, "second")
+    assert first[0] == second[0] == "failed"
+    assert second[2] == first[2]
+    assert (await fetch_task_status("second"))["status"] == "failed"
+
+
+def test_status_cache_keeps_final_states_across_versions() -> None:
+    """資料庫有新的提交時, 只有尚未結束的任務失效; 已結束的任務一直有效."""
+    cache = TaskStatusCache()
+    cache.sync(1)
+    cache.put("done", {"status": "completed"})
+    cache.put("running", {"status": "processing"})
+
+    cache.sync(1)
+    assert cache.get("running") is not None
+
+    cache.sync(2)
+    assert cache.get("running") is None
+    assert cache.get("done") == {"status": "completed"}
+
+
+def test_status_cache_evicts_least_recently_used_and_invalidates_duplicates() -> None:
+    """超過容量時淘汰最久未使用的項目; 清除來源任務時一併清除附加在它上面的任務."""
+    cache = TaskStatusCache(max_entries=2)
+    cache.put("a", {"status": "completed"})
+    cache.put("b", {"status": "completed"})
+    assert cache.get("a") is not None
+    cache.put("c", {"status": "completed"})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+    cache = TaskStatusCache()
+    cache.put("a", {"status": "completed"})
+    cache.put("dup", {"status": "duplicate", "duplicate_of": "a"})
+    cache.put("other", {"status": "completed"})
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert cache.get("dup") is None
+    assert cache.get("other") is not None
+
+
+@pytest.mark.asyncio
+async def test_status_cache_follows_commits_from_other_processes(db_connection: aiosqlite.Connection) -> None:
+    """使用連線池時狀態由快取回應; 其他連線 (工人) 提交的變更透過 data_version 立即反映."""
+    await _insert_tasks(db_connection, 1)
+    pool = ConnectionPool(DATABASE_FILE, size=1)
+    await pool.open()
+    set_connection_pool(pool)
+    status_cache.clear()
+    try:
+        assert (await fetch_task_status("task-0"))["status"] == "pending"
+        assert status_cache.get("task-0") is not None
+
+        # 模擬另一個行程中的工人直接更新資料庫 (不經過這個行程的 update_task_status)
+        await db_connection.execute("UPDATE transcription_tasks SET status = 'completed', result_text = 'hi'")
+        await db_connection.commit()
+        task = await fetch_task_status("task-0")
+        assert (task["status"], task["result_text"]) == ("completed", "hi")
+
+        # 已結束的狀態之後不再讀取資料庫
+        await db_connection.execute("UPDATE transcription_tasks SET result_text = 'changed'")
+        await db_connection.commit()
+        assert (await fetch_task_status("task-0"))["result_text"] == "hi"
+
+        assert await fetch_task_status("missing") is None
+    finally:
+        set_connection_pool(None)
+        status_cache.clear()
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_status_cache_skips_rows_read_before_a_newer_version(
+    db_connection: aiosqlite.Connection, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """讀取期間其他連線提交並有其他請求同步了快取時, 讀到的舊狀態不會被快取."""
+    await _insert_tasks(db_connection, 1)
+    pool = ConnectionPool(DATABASE_FILE, size=1)
+    await pool.open()
+    set_connection_pool(pool)
+    status_cache.clear()
+
+    @asynccontextmanager
+    async def connect_then_commit():
+        async with connect() as db:
+            yield db
+        # 讀取完成後: 工人提交了新的狀態, 另一個請求同步了快取
+        await db_connection.execute("UPDATE transcription_tasks SET status = 'completed', result_text = 'hi'")
+        await db_connection.commit()
+        status_cache.sync(await pool.data_version())
+
+    try:
+        monkeypatch.setattr(queues, "connect", connect_then_commit)
+        assert (await fetch_task_status("task-0"))["status"] == "pending"
+        assert status_cache.get("task-0") is None
+
+        monkeypatch.setattr(queues, "connect", connect)
+        assert (await fetch_task_status("task-0"))["status"] == "completed"
+    finally:
+        set_connection_pool(None)
+        status_cache.clear()
+        await pool.close()
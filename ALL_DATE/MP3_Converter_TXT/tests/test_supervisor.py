@@ -0,0 +1,349 @@
+"""工人調度測試."""
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from src import supervisor
+from src.supervisor import (
+    IDLE_SECONDS,
+    RESTART_BACKOFF_MAX,
+    SCALE_UP_COOLDOWN,
+    STABLE_SECONDS,
+    WorkerSupervisor,
+    estimate_max_workers,
+    worker_memory_gb,
+)
+
+GB = 1024**3
+
+
+class FakeProcess:
+    """取代 mp.Process; 由測試決定何時結束."""
+
+    _pids = itertools.count(1000)
+
+    def __init__(self, target: Any = None, args: tuple[Any, ...] = (), name: str = "", daemon: bool = True) -> None:
+        self.name = name
+        self.pid = next(self._pids)
+        self.exitcode: int | None = None
+        self.terminated = False
+        self._alive = False
+
+    def start(self) -> None:
+        self._alive = True
+
+    def is_alive(self) -> bool:
+        return self._alive
+
+    def exit(self, code: int) -> None:
+        self._alive = False
+        self.exitcode = code
+
+    def terminate(self) -> None:
+        self.terminated = True
+        self.exit(-15)
+
+    def join(self, timeout: float | None = None) -> None:
+        pass
+
+
+class FakePsutil:
+    """可調整的系統資源."""
+
+    def __init__(self, total_gb: float = 64.0, available_gb: float = 32.0, cpu_percent: float = 10.0) -> None:
+        self.total_gb = total_gb
+        self.available_gb = available_gb
+        self.cpu = cpu_percent
+
+    def virtual_memory(self) -> SimpleNamespace:
+        return SimpleNamespace(total=self.total_gb * GB, available=self.available_gb * GB)
+
+    def cpu_percent(self, interval: float | None = None) -> float:
+        return self.cpu
+
+
+@pytest.fixture
+def queue_stats(monkeypatch: pytest.MonkeyPatch) -> dict[str, Any]:
+    """以可修改的字典取代 get_queue_stats, 並把 mp 與 psutil 換成假的實作."""
+    stats: dict[str, Any] = {"pending": 0, "processing": 0, "busy_workers": set(), "finished": {}, "released": []}
+
+    async def fake_get_queue_stats(window_seconds: float = 60.0) -> dict[str, Any]:
+        return stats
+
+    async def fake_release_worker_tasks(worker_id: str) -> int:
+        stats["released"].append(worker_id)
+        return 0
+
+    monkeypatch.setattr(supervisor, "get_queue_stats", fake_get_queue_stats)
+    monkeypatch.setattr(supervisor, "release_worker_tasks", fake_release_worker_tasks)
+    monkeypatch.setattr(supervisor, "mp", SimpleNamespace(Process=FakeProcess, Event=threading.Event))
+    monkeypatch.setattr(supervisor, "psutil", None)
+    return stats
+
+
+def make_supervisor(min_workers: int = 1, max_workers: int = 3, initial_workers: int = 1, **kwargs: Any) -> WorkerSupervisor:
+    """建立並啟動一個使用假行程的調度器."""
+    sup = WorkerSupervisor(
+        target=lambda stop_event: None,
+        args=(),
+        name="轉錄工人",
+        logger=logging.getLogger("test_supervisor"),
+        min_workers=min_workers,
+        max_workers=max_workers,
+        initial_workers=initial_workers,
+        **kwargs,
+    )
+    sup.start()
+    return sup
+
+
+def test_scales_up_when_busy_workers_fall_behind(queue_stats: dict[str, Any]) -> None:
+    """所有工人都忙碌且佇列無法及時清空時逐一增加工人, 受冷卻時間與上限限制."""
+    sup = make_supervisor(max_workers=3)
+    queue_stats["pending"] = 10
+    queue_stats["busy_workers"] = {w.worker_id for w in sup.workers}
+
+    now = 1000.0
+    sup._rescale(now)
+    sup._reconcile(now)
+    assert (sup.desired, len(sup.workers)) == (2, 2)
+
+    # 新工人還沒領取任務 (正在載入模型), 不再增加
+    now += SCALE_UP_COOLDOWN
+    sup._rescale(now)
+    assert sup.desired == 2
+
+    queue_stats["busy_workers"] = {w.worker_id for w in sup.workers}
+    sup._rescale(now)
+    sup._reconcile(now)
+    assert (sup.desired, len(sup.workers)) == (3, 3)
+
+    queue_stats["busy_workers"] = {w.worker_id for w in sup.workers}
+    sup._rescale(now + 10 * SCALE_UP_COOLDOWN)
+    assert sup.desired == 3  # 已達上限
+
+
+def test_scale_up_waits_for_the_cooldown(queue_stats: dict[str, Any]) -> None:
+    """兩次增加工人之間至少間隔 SCALE_UP_COOLDOWN 秒."""
+    sup = make_supervisor(max_workers=4)
+    queue_stats["pending"] = 10
+
+    now = 1000.0
+    for expected in (2, 2, 3):
+        queue_stats["busy_workers"] = {w.worker_id for w in sup.workers}
+        sup._rescale(now)
+        sup._reconcile(now)
+        assert sup.desired == expected
+        now += SCALE_UP_COOLDOWN / 2
+
+
+def test_does_not_scale_up_when_queue_drains_in_time(queue_stats: dict[str, Any]) -> None:
+    """依目前的吞吐量能及時清空佇列時不增加工人."""
+    sup = make_supervisor()
+    worker_id = sup.workers[0].worker_id
+    queue_stats["pending"] = 10
+    queue_stats["busy_workers"] = {worker_id}
+    queue_stats["finished"] = {worker_id: 600}  # 每秒 2 個任務, 5 秒即可清空
+
+    sup._rescale(1000.0)
+
+    assert sup.desired == 1
+
+
+def test_scale_up_respects_memory_and_cpu_limits(queue_stats: dict[str, Any], monkeypatch: pytest.MonkeyPatch) -> None:
+    """可用記憶體或 CPU 不足時不增加工人, 但最少數量內的工人不受限制."""
+    machine = FakePsutil(available_gb=1.0)
+    monkeypatch.setattr(supervisor, "psutil", machine)
+    sup = make_supervisor(min_workers=2, initial_workers=1, worker_memory=2.5)
+    queue_stats["pending"] = 10
+    queue_stats["busy_workers"] = {w.worker_id for w in sup.workers}
+
+    sup._rescale(1000.0)
+    assert sup.desired == 2  # initial_workers 不低於 min_workers
+    sup._reconcile(1000.0)
+    assert len(sup.workers) == 2
+
+    queue_stats["busy_workers"] = {w.worker_id for w in sup.workers}
+    sup._rescale(1000.0 + SCALE_UP_COOLDOWN)
+    assert sup.desired == 2
+
+    machine.available_gb = 32.0
+    machine.cpu = 95.0
+    sup._rescale(1000.0 + 2 * SCALE_UP_COOLDOWN)
+    assert sup.desired == 2
+
+    machine.cpu = 10.0
+    sup._rescale(1000.0 + 3 * SCALE_UP_COOLDOWN)
+    assert sup.desired == 3
+
+
+def test_scales_down_one_idle_worker_per_idle_period(queue_stats: dict[str, Any]) -> None:
+    """佇列閒置時每個閒置期間只縮減一個工人, 忙碌的工人不被縮減, 不低於最少數量."""
+    sup = make_supervisor(min_workers=1, max_workers=3, initial_workers=3)
+    first, second, third = sup.workers
+    queue_stats["busy_workers"] = {third.worker_id}
+
+    now = 1000.0
+    sup._rescale(now)
+    sup._reconcile(now)
+    assert sup.desired == 3
+
+    sup._rescale(now + IDLE_SECONDS / 2)
+    assert sup.desired == 3
+
+    now += IDLE_SECONDS
+    sup._rescale(now)
+    sup._reconcile(now)
+    assert sup.desired == 2
+    assert second.stop_event.is_set() and second.draining_since == now
+    assert not first.stop_event.is_set() and not third.stop_event.is_set()
+    assert sup.active_workers == [first, third]
+
+    # 縮減的工人完成目前的任務後正常結束: 不重新啟動, 也不需要釋放任務
+    second.process.exit(0)
+    sup._reap(now + 1)
+    assert second not in sup.workers
+    assert queue_stats["released"] == []
+    assert sup._restart_at == 0.0
+
+    now += IDLE_SECONDS
+    sup._rescale(now)
+    sup._reconcile(now)
+    assert sup.desired == 1
+    assert first.stop_event.is_set()
+
+    now += IDLE_SECONDS
+    sup._rescale(now)
+    assert sup.desired == 1
+
+
+def test_new_work_resets_the_idle_period(queue_stats: dict[str, Any]) -> None:
+    """閒置期間有新任務時重新計算閒置時間."""
+    sup = make_supervisor(initial_workers=2)
+    queue_stats["busy_workers"] = {w.worker_id for w in sup.workers}
+
+    sup._rescale(1000.0)
+    queue_stats["pending"] = 1
+    queue_stats["finished"] = {sup.workers[0].worker_id: 600}
+    sup._rescale(1000.0 + IDLE_SECONDS / 2)
+    queue_stats["pending"] = 0
+    sup._rescale(1000.0 + IDLE_SECONDS)
+    assert sup.desired == 2
+
+    sup._rescale(1000.0 + 2 * IDLE_SECONDS - 1)
+    assert sup.desired == 2
+    sup._rescale(1000.0 + 2 * IDLE_SECONDS)
+    assert sup.desired == 1
+
+
+def test_crashed_worker_restarts_with_exponential_backoff(queue_stats: dict[str, Any]) -> None:
+    """意外終止的工人釋放任務並以指數退避重新啟動; 穩定運行後退避重新計算."""
+    sup = make_supervisor(autoscale=False)
+
+    def crash(after: float) -> float:
+        worker = sup.workers[0]
+        now = worker.started_at + after
+        worker.process.exit(1)
+        sup._reap(now)
+        assert queue_stats["released"][-1] == worker.worker_id
+        assert sup.workers == []
+        return now
+
+    now = crash(after=1)
+    assert sup._restart_at == now + 1
+    sup._reconcile(now + 0.5)
+    assert sup.workers == []
+    sup._reconcile(now + 1)
+    assert len(sup.workers) == 1
+
+    now = crash(after=1)
+    assert sup._restart_at == now + 2
+    sup._reconcile(now + 2)
+
+    now = crash(after=1)
+    assert sup._restart_at == now + 4
+    sup._reconcile(now + 4)
+
+    now = crash(after=STABLE_SECONDS)
+    assert sup._restart_at == now + 1
+    sup._reconcile(now + 1)
+
+    sup._crashes = 100
+    now = crash(after=1)
+    assert sup._restart_at == now + RESTART_BACKOFF_MAX
+
+
+def test_stuck_draining_worker_is_terminated(queue_stats: dict[str, Any]) -> None:
+    """縮減中的工人超過時限仍未結束時被強制終止, 它手上的任務立即釋放."""
+    sup = make_supervisor(min_workers=0, initial_workers=1)
+    worker = sup.workers[0]
+    sup._drain(worker, 1000.0)
+
+    sup._reap(1000.0 + sup.drain_timeout)
+    assert not worker.process.terminated
+
+    sup._reap(1000.0 + sup.drain_timeout + 1)
+    assert worker.process.terminated
+    sup._reap(1000.0 + sup.drain_timeout + 2)
+    assert sup.workers == []
+    assert queue_stats["released"] == [worker.worker_id]
+    assert sup._restart_at == 0.0
+
+
+def test_stats_errors_keep_the_current_size(queue_stats: dict[str, Any], monkeypatch: pytest.MonkeyPatch) -> None:
+    """讀取佇列狀態失敗時維持目前的工人數量."""
+    async def broken_get_queue_stats(window_seconds: float = 60.0) -> dict[str, Any]:
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(supervisor, "get_queue_stats", broken_get_queue_stats)
+    sup = make_supervisor(initial_workers=2)
+
+    sup._rescale(1000.0)
+    sup._rescale(1000.0 + 2 * IDLE_SECONDS)
+
+    assert sup.desired == 2
+
+
+def test_worker_bounds_are_normalized(queue_stats: dict[str, Any]) -> None:
+    """最多數量不低於最少數量與 1, 初始數量限制在兩者之間."""
+    sup = make_supervisor(min_workers=2, max_workers=1, initial_workers=5)
+    assert (sup.min_workers, sup.max_workers, sup.desired, len(sup.workers)) == (2, 2, 2, 2)
+
+    sup = make_supervisor(min_workers=-1, max_workers=0, initial_workers=0)
+    assert (sup.min_workers, sup.max_workers, sup.desired, len(sup.workers)) == (0, 1, 0, 0)
+
+    sup = make_supervisor(min_workers=1, max_workers=4, initial_workers=0)
+    assert sup.desired == 1
+
+
+def test_worker_memory_estimates() -> None:
+    """依模型大小估計記憶體; 未知的模型以最大值計算."""
+    assert worker_memory_gb("tiny") == 0.5
+    assert worker_memory_gb("large-v3") == 4.5
+    assert worker_memory_gb("distil-whatever") == max(supervisor.WORKER_MEMORY_GB.values())
+
+
+def test_estimate_max_workers(monkeypatch: pytest.MonkeyPatch) -> None:
+    """工人上限由裝置、CPU 核心數與系統記憶體中最嚴格的一項決定, 至少為 1."""
+    config = SimpleNamespace(MODEL_SIZE="medium")
+    monkeypatch.setattr(supervisor, "psutil", None)
+    monkeypatch.setattr(supervisor.os, "cpu_count", lambda: 16)
+
+    assert estimate_max_workers(config, {"device": "cuda"}) == 1
+    assert estimate_max_workers(config, {"device": "cpu"}) == 4
+
+    monkeypatch.setattr(supervisor, "psutil", FakePsutil(total_gb=8.0))
+    assert estimate_max_workers(config, {"device": "cpu"}) == 2  # 8 GB * 0.75 // 2.5 GB
+
+    monkeypatch.setattr(supervisor, "psutil", FakePsutil(total_gb=2.0))
+    assert estimate_max_workers(config, {"device": "cpu"}) == 1
+
+    monkeypatch.setattr(supervisor, "psutil", None)
+    monkeypatch.setattr(supervisor.os, "cpu_count", lambda: None)
+    assert estimate_max_workers(config, {"device": "cpu"}) == 1
@@ -1,12 +1,19 @@
 """工人測試."""
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Iterator
 
 import pytest
 
-from src.core import get_logger
-from src.transcriber_worker import process_single_task
+from src import transcriber_worker
+from src.core import DATABASE_FILE, get_logger
+from src.transcriber_worker import process_single_task, transcriber_worker_process, wait_for_wakeup
 
 if TYPE_CHECKING:
     import aiosqlite
@@ -44,3 +51,209 @@ async def test_worker_success_scenario(db_connection: aiosqlite.Connection) -> N
     assert len(result_text) > 0
     # 也可以做一個更具體的檢查, 確認轉錄內容是否符合預期
     assert "birch" in result_text.lower()
+
+
+def test_wait_for_wakeup_messages() -> None:
+    """通知喚醒工人, 逾時進行備援輪詢, 結束信號會被放回佇列給其他工人."""
+    task_queue: queue.Queue = queue.Queue()
+    task_queue.put({"job_id": "task-1"})
+    assert wait_for_wakeup(task_queue, timeout=0.01)
+    assert task_queue.empty()
+
+    assert wait_for_wakeup(task_queue, timeout=0.01)
+
+    task_queue.put(None)
+    assert not wait_for_wakeup(task_queue, timeout=0.01)
+    assert task_queue.get_nowait() is None
+
+
+def test_draining_worker_passes_wakeup_on() -> None:
+    """被要求停止的工人不會吞掉通知, 而是放回佇列交給其他工人."""
+    task_queue: queue.Queue = queue.Queue()
+    stop_event = threading.Event()
+    stop_event.set()
+
+    assert not wait_for_wakeup(task_queue, timeout=0.01, stop_event=stop_event)
+    task_queue.put({"job_id": "task-1"})
+    assert not wait_for_wakeup(task_queue, timeout=0.01, stop_event=stop_event)
+    assert task_queue.get_nowait() == {"job_id": "task-1"}
+
+
+def test_worker_wakes_on_notification_and_drains(monkeypatch: pytest.MonkeyPatch) -> None:
+    """工人收到通知即領取任務; 停止時不再領取任務, 並把收到的通知留給其他工人."""
+    claims: queue.Queue = queue.Queue()
+    release = threading.Event()
+
+    async def fake_process_single_task(_config: object = None) -> bool:
+        claims.put(True)
+        # 模擬一個處理中的任務: 等待測試放行
+        await transcriber_worker.asyncio.to_thread(release.wait, 5)
+        release.clear()
+        return False
+
+    monkeypatch.setattr(transcriber_worker, "process_single_task", fake_process_single_task)
+    monkeypatch.setattr(transcriber_worker.model_pool, "get", lambda *args: None)
+    monkeypatch.setattr(transcriber_worker, "WAKEUP_FALLBACK_SECONDS", 5.0)
+
+    task_queue: queue.Queue = queue.Queue()
+    stop_event = threading.Event()
+    worker = threading.Thread(
+        target=transcriber_worker_process, args=(None, task_queue, None, None, stop_event), daemon=True
+    )
+    worker.start()
+
+    # 啟動時先檢查一次資料庫
+    assert claims.get(timeout=5)
+    release.set()
+
+    # 通知立即喚醒工人, 不必等備援輪詢
+    task_queue.put({"job_id": "task-1"})
+    assert claims.get(timeout=1)
+
+    # 任務完成後回到等待; 等待中被要求停止, 之後收到的通知留給其他工人
+    release.set()
+    time.sleep(0.2)
+    stop_event.set()
+    task_queue.put({"job_id": "task-2"})
+    worker.join(timeout=5)
+    assert not worker.is_alive()
+    assert claims.empty()
+    assert task_queue.get_nowait() == {"job_id": "task-2"}
+
+
+class SlowModel:
+    """模擬 faster-whisper: 產生第一個片段前先花一段時間 (VAD 與語言偵測)."""
+
+    def __init__(self, delay: float, before_first_segment: Any = None) -> None:
+        self.delay = delay
+        self.before_first_segment = before_first_segment
+
+    def transcribe(self, audio_path: str, beam_size: int) -> tuple[Iterator[SimpleNamespace], None]:
+        def segments() -> Iterator[SimpleNamespace]:
+            if self.before_first_segment is not None:
+                self.before_first_segment()
+            time.sleep(self.delay)
+            yield SimpleNamespace(text=" hello")
+            yield SimpleNamespace(text=" world")
+
+        return segments(), None
+
+
+def _use_model(monkeypatch: pytest.MonkeyPatch, model: SlowModel) -> list[str]:
+    """以假的模型取代常駐模型, 並記錄每次延長租約的呼叫."""
+    renewals: list[str] = []
+    real_renew_lease = transcriber_worker.renew_lease
+
+    async def counting_renew_lease(task_id: str, worker_id: str) -> bool:
+        renewals.append(task_id)
+        return await real_renew_lease(task_id, worker_id)
+
+    monkeypatch.setattr(transcriber_worker.model_pool, "get", lambda *args: model)
+    monkeypatch.setattr(transcriber_worker, "get_best_hardware_config", lambda: {})
+    monkeypatch.setattr(transcriber_worker, "renew_lease", counting_renew_lease)
+    monkeypatch.setattr(transcriber_worker, "LEASE_RENEW_SECONDS", 0.05)
+    return renewals
+
+
+@pytest.mark.asyncio
+async def test_lease_is_renewed_before_the_first_segment(
+    db_connection: aiosqlite.Connection, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """第一個片段產生之前 (以及單一片段很慢時) 租約仍依時間延長."""
+    renewals = _use_model(monkeypatch, SlowModel(delay=0.4))
+    await db_connection.execute("INSERT INTO transcription_tasks (id, original_filepath) VALUES ('slow', 'a.wav')")
+    await db_connection.commit()
+
+    assert await process_single_task()
+
+    assert len(renewals) >= 3
+    async with db_connection.execute("SELECT status, result_text FROM transcription_tasks WHERE id = 'slow'") as cursor:
+        assert tuple(await cursor.fetchone()) == ("completed", "hello world")
+
+
+@pytest.mark.asyncio
+async def test_transcription_stops_when_the_lease_is_taken_over(
+    db_connection: aiosqlite.Connection, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """租約被其他工人接手後停止轉錄, 也不覆寫該工人的任務狀態."""
+
+    def take_over() -> None:
+        with sqlite3.connect(DATABASE_FILE) as conn:
+            conn.execute("UPDATE transcription_tasks SET worker_id = 'other-worker' WHERE id = 'stolen'")
+
+    renewals = _use_model(monkeypatch, SlowModel(delay=0.4, before_first_segment=take_over))
+    await db_connection.execute("INSERT INTO transcription_tasks (id, original_filepath) VALUES ('stolen', 'a.wav')")
+    await db_connection.commit()
+
+    assert await process_single_task()
+
+    assert len(renewals) == 1
+    async with db_connection.execute(
+        "SELECT status, worker_id, result_text FROM transcription_tasks WHERE id = 'stolen'"
+    ) as cursor:
+        assert tuple(await cursor.fetchone()) == ("processing", "other-worker", None)
+
+
+class CountingWhisperModel(SlowModel):
+    """記錄每次載入的假 WhisperModel; 載入時檢查先前的模型都已被釋放."""
+
+    loads: list[tuple[str, str, str]] = []
+    alive: weakref.WeakSet = weakref.WeakSet()
+
+    def __init__(self, model_size: str, device: str, compute_type: str) -> None:
+        super().__init__(delay=0)
+        assert not list(self.alive), "重新載入前必須先釋放舊的模型"
+        self.loads.append((model_size, device, compute_type))
+        self.alive.add(self)
+
+
+@pytest.fixture
+def counting_model(monkeypatch: pytest.MonkeyPatch) -> list[tuple[str, str, str]]:
+    """以計數的假模型取代 WhisperModel, 並使用全新的模型池."""
+    monkeypatch.setattr(CountingWhisperModel, "loads", [])
+    monkeypatch.setattr(CountingWhisperModel, "alive", weakref.WeakSet())
+    monkeypatch.setattr(transcriber_worker, "WhisperModel", CountingWhisperModel)
+    monkeypatch.setattr(transcriber_worker, "model_pool", transcriber_worker.ResidentModelPool())
+    return CountingWhisperModel.loads
+
+
+def test_model_pool_reloads_only_when_the_settings_change(counting_model: list[tuple[str, str, str]]) -> None:
+    """相同設定重用常駐模型; 模型大小、裝置或計算類型改變時先釋放再重新載入."""
+    pool = transcriber_worker.model_pool
+    cpu = {"device": "cpu", "compute_type": "int8"}
+
+    assert pool.get("tiny", cpu) is pool.get("tiny", dict(cpu))
+    assert counting_model == [("tiny", "cpu", "int8")]
+
+    pool.get("base", cpu)
+    pool.get("base", {"device": "cuda", "compute_type": "int8"})
+    pool.get("base", {"device": "cuda", "compute_type": "float16"})
+    pool.get("base", {"device": "cuda", "compute_type": "float16"})
+    assert counting_model[1:] == [("base", "cpu", "int8"), ("base", "cuda", "int8"), ("base", "cuda", "float16")]
+
+    pool.release()
+    assert not list(CountingWhisperModel.alive)
+    pool.get("base", {"device": "cuda", "compute_type": "float16"})
+    assert len(counting_model) == 5
+
+
+@pytest.mark.asyncio
+async def test_resident_model_is_reused_across_tasks(
+    db_connection: aiosqlite.Connection,
+    monkeypatch: pytest.MonkeyPatch,
+    counting_model: list[tuple[str, str, str]],
+) -> None:
+    """同一個工人行程處理多個任務時, 模型只載入一次."""
+    monkeypatch.setattr(transcriber_worker, "get_best_hardware_config", lambda: {"device": "cpu", "compute_type": "int8"})
+    for task_id in ("first", "second", "third"):
+        await db_connection.execute(
+            "INSERT INTO transcription_tasks (id, original_filepath) VALUES (?, 'a.wav')", (task_id,)
+        )
+    await db_connection.commit()
+
+    for _ in range(3):
+        assert await process_single_task()
+
+    assert len(counting_model) == 1
+    async with db_connection.execute("SELECT DISTINCT status, result_text FROM transcription_tasks") as cursor:
+        assert [tuple(row) for row in await cursor.fetchall()] == [("completed", "hello world")]
@@ -4,15 +4,17 @@
 """
 import sys
 from pathlib import Path
+from typing import List, Literal, Optional, Tuple
 
-from fastapi import APIRouter, Body, HTTPException
+from fastapi import APIRouter, Body, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 
 # --- 設置導入路徑 ---
 # 確保可以從 quant 目錄導入 logic 模組
 sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 
-from quant.logic import analysis, database
+from quant.logic import database, jobs
 
 # 建立一個 APIRouter 實例，我們可以稍後將它包含到主 App 中
 router = APIRouter(
@@ -27,43 +29,96 @@ class BacktestRequest(BaseModel):
     start_date: str = Field(..., description="回測開始日期", json_schema_extra={"example": "2023-01-01"})
     end_date: str = Field(..., description="回測結束日期", json_schema_extra={"example": "2024-01-01"})
 
+class GridBacktestRequest(BaseModel):
+    stock_ids: List[str] = Field(..., min_length=1, description="要進行回測的股票代號列表", json_schema_extra={"example": ["2330", "2317"]})
+    start_date: str = Field(..., description="回測開始日期", json_schema_extra={"example": "2023-01-01"})
+    end_date: str = Field(..., description="回測結束日期", json_schema_extra={"example": "2024-01-01"})
+    window_pairs: List[Tuple[int, int]] = Field([(10, 30)], min_length=1, description="(短均線, 長均線) 窗口組合列表", json_schema_extra={"example": [[5, 20], [10, 30], [20, 60]]})
+    initial_capitals: List[float] = Field([100000.0], min_length=1, description="初始資金設定列表", json_schema_extra={"example": [100000, 1000000]})
+    rank_by: str = Field("total_return_pct", description="排序指標: total_return_pct / sharpe / max_drawdown_pct")
+    top_n: Optional[int] = Field(None, ge=1, description="只返回排名前 N 的組合")
+
 # --- API 路由定義 ---
 
-@router.post("/backtest", summary="執行一個簡單的回測策略")
+@router.post("/backtest", status_code=202, summary="提交一個簡單的回測工作")
 async def perform_backtest(request: BacktestRequest = Body(...)):
     """
-    接收回測請求，執行簡單的移動平均線交叉策略，並返回結果。
-    結果也會被儲存到資料庫中。
+    接收回測請求，交給背景進程池執行移動平均線交叉策略，並立即返回工作 ID。
+    使用 `/v1/backtest/jobs/{job_id}` 查詢狀態，完成後以 `/v1/backtest/jobs/{job_id}/result` 取得結果。
+    成功的結果也會被儲存到資料庫中。
     """
-    # 呼叫業務邏輯層的函式
-    result = analysis.run_simple_backtest(
-        stock_id=request.stock_id,
-        start_date=request.start_date,
-        end_date=request.end_date,
-    )
-
-    # 明確地檢查業務邏輯層是否返回了錯誤
-    if "error" in result:
-        # 如果有錯誤，就引發一個 400 Bad Request 異常，並將錯誤訊息作為詳細內容
-        raise HTTPException(status_code=400, detail=result["error"])
+    try:
+        job = jobs.job_manager.submit(request.model_dump())
+    except jobs.QueueFullError as e:
+        # 工作已達上限，請客戶端稍後重試
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.to_dict()
 
-    # 如果沒有錯誤，則將成功的結果存入資料庫
+@router.post("/backtest/grid", status_code=202, summary="提交一個多股票、多參數的網格回測工作")
+async def perform_grid_backtest(request: GridBacktestRequest = Body(...)):
+    """
+    一次回測多檔股票與多組 (均線窗口, 初始資金) 組合，所有組合在同一個工作中以向量化方式計算，
+    結果依 `rank_by` 排序。查詢方式與 `/v1/backtest` 相同；網格回測的結果不會寫入資料庫。
+    """
     try:
-        database.db_manager.save_backtest_result(result)
-    except Exception as e:
-        # 如果資料庫儲存失敗，這是一個伺服器內部問題
-        raise HTTPException(status_code=500, detail=f"回測成功，但結果存儲失敗: {e}")
+        job = jobs.job_manager.submit(request.model_dump(), kind=jobs.GRID)
+    except jobs.QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.to_dict()
+
+def _get_job_or_404(job_id: str) -> jobs.BacktestJob:
+    job = jobs.job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"找不到回測工作: {job_id}")
+    return job
 
-    return result
+@router.get("/backtest/jobs/{job_id}", summary="查詢回測工作狀態")
+async def get_backtest_job(job_id: str):
+    """
+    返回工作的狀態 (queued / running / succeeded / failed) 與錯誤訊息 (若有)。
+    """
+    return _get_job_or_404(job_id).to_dict()
+
+@router.get("/backtest/jobs/{job_id}/result", summary="取得回測工作的結果")
+async def get_backtest_job_result(job_id: str):
+    """
+    工作成功時返回回測結果；仍在執行時返回 409；回測失敗時返回 400 與錯誤訊息。
+    """
+    job = _get_job_or_404(job_id)
+    if job.status in (jobs.QUEUED, jobs.RUNNING):
+        raise HTTPException(status_code=409, detail=f"回測工作尚未完成 (狀態: {job.status})")
+    if job.error:
+        raise HTTPException(status_code=400, detail=job.error)
+    return job.result
 
-@router.get("/backtest/results", summary="獲取所有歷史回測結果")
-async def get_backtest_results():
+@router.get("/backtest/results", summary="分頁查詢歷史回測結果")
+async def get_backtest_results(
+    fields: Optional[str] = Query(None, description="以逗號分隔的欄位列表，例如 `stock_id,total_return_pct,sharpe`"),
+    stock_id: Optional[str] = Query(None, description="只返回此股票的結果"),
+    date_from: Optional[str] = Query(None, description="回測開始日期不早於 (YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, description="回測結束日期不晚於 (YYYY-MM-DD)"),
+    min_return: Optional[float] = Query(None, description="總報酬率 (%) 下限"),
+    max_return: Optional[float] = Query(None, description="總報酬率 (%) 上限"),
+    min_sharpe: Optional[float] = Query(None, description="Sharpe 比率下限"),
+    sort_by: str = Query("run_timestamp", description=f"排序欄位: {', '.join(database.SORTABLE_COLUMNS)}"),
+    order: Literal["asc", "desc"] = Query("desc", description="排序方向"),
+    limit: int = Query(database.DEFAULT_PAGE_SIZE, ge=1, le=database.MAX_PAGE_SIZE, description="每頁筆數"),
+    cursor: Optional[str] = Query(None, description="上一頁回應中的 `next_cursor`"),
+):
     """
-    從資料庫中讀取所有已儲存的回測結果紀錄。
+    從資料庫中分頁讀取回測結果；篩選、排序與欄位選取都在資料庫中完成。
+    回應中的 `next_cursor` 不為 null 時，把它作為 `cursor` 參數傳回即可取得下一頁。
     """
     try:
-        results_df = database.db_manager.get_all_backtest_results()
-        # 將 DataFrame 轉換為 JSON 格式的回應
-        return results_df.to_dict(orient="records")
+        items, next_cursor = await run_in_threadpool(
+            database.db_manager.query_backtest_results,
+            fields=[f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+            stock_id=stock_id, date_from=date_from, date_to=date_to,
+            min_return=min_return, max_return=max_return, min_sharpe=min_sharpe,
+            sort_by=sort_by, descending=order == "desc", limit=limit, cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"讀取回測結果時發生內部錯誤: {e}")
+    return {"items": items, "next_cursor": next_cursor, "limit": limit}
@@ -4,10 +4,19 @@
 
 負責執行核心的金融分析，例如回測、壓力指數計算、遺傳演算法等。
 """
+from itertools import product
+from typing import Callable, Optional, Sequence
+
+import numpy as np
 import pandas as pd
 
 from . import data_sourcing, factor_engineering
 
+# 年化 Sharpe 比率使用的交易日數
+TRADING_DAYS_PER_YEAR = 252
+# 網格回測可排序的指標
+RANK_METRICS = ("total_return_pct", "sharpe", "max_drawdown_pct")
+
 
 def run_simple_backtest(stock_id: str, start_date: str, end_date: str) -> dict:
     """
@@ -23,9 +32,9 @@ def run_simple_backtest(stock_id: str, start_date: str, end_date: str) -> dict:
     :return: 一個包含回測結果的字典。
     """
     # 步驟 1: 獲取數據
-    # 注意：這裡假設 FinMindSource 已被正確配置 API token
+    # 注意：這裡假設 FinMindSource 已被正確配置 API token (離線模式除外)
     try:
-        finmind_source = data_sourcing.FinMindSource()
+        finmind_source = data_sourcing.get_finmind_source()
         # FinMind 的欄位名稱是 'Close'
         price_df = finmind_source.get_stock_daily(stock_id, start_date, end_date)
         # 為了統一，我們將欄位名改為小寫
@@ -72,6 +81,8 @@ def run_simple_backtest(stock_id: str, start_date: str, end_date: str) -> dict:
     # 步驟 5: 返回結果
     final_value = portfolio['total'].iloc[-1]
     total_return = (final_value / initial_capital) - 1
+    returns_std = portfolio['returns'].std()
+    sharpe = portfolio['returns'].mean() / returns_std * np.sqrt(TRADING_DAYS_PER_YEAR) if returns_std > 0 else 0.0
 
     # 找到交易日
     trades = price_df[price_df['positions'] != 0]
@@ -84,6 +95,141 @@ def run_simple_backtest(stock_id: str, start_date: str, end_date: str) -> dict:
         "final_value": final_value,
         "total_return_pct": total_return * 100,
         "trade_count": len(trades),
+        "sharpe": float(sharpe),
         "buy_signals": trades[trades['positions'] == 1].index.strftime('%Y-%m-%d').tolist(),
         "sell_signals": trades[trades['positions'] == -1].index.strftime('%Y-%m-%d').tolist(),
     }
+
+
+def load_close_prices(stock_ids: Sequence[str], start_date: str, end_date: str,
+                      source: Optional[data_sourcing.FinMindSource] = None) -> tuple[pd.DataFrame, dict]:
+    """
+    取得多檔股票的收盤價，並對齊成一個「日期 x 股票」的價格矩陣。
+
+    不同股票的交易日不完全相同：對齊後在每檔股票自己的上市區間內以前值補齊缺漏，
+    上市前的日期保持 NaN。
+
+    :return: (價格矩陣, {stock_id: 錯誤訊息})；抓取失敗的股票不會出現在矩陣中。
+    """
+    source = source or data_sourcing.get_finmind_source()
+    closes, errors = {}, {}
+    for stock_id in dict.fromkeys(stock_ids):
+        try:
+            df = source.get_stock_daily(stock_id, start_date, end_date)
+            if df is None or df.empty:
+                errors[stock_id] = "查無數據"
+                continue
+            closes[stock_id] = df.assign(date=pd.to_datetime(df['date'])).set_index('date')['close']
+        except Exception as e:
+            errors[stock_id] = f"數據獲取失敗: {e}"
+    if not closes:
+        return pd.DataFrame(), errors
+    prices = pd.concat(closes, axis=1).sort_index()
+    return prices.ffill().where(prices.bfill().notna()), errors
+
+
+def run_grid_backtest(stock_ids: Sequence[str], start_date: str, end_date: str,
+                      window_pairs: Sequence[tuple[int, int]] = ((10, 30),),
+                      initial_capitals: Sequence[float] = (100000.0,),
+                      rank_by: str = "total_return_pct", top_n: Optional[int] = None,
+                      price_loader: Optional[Callable[..., tuple[pd.DataFrame, dict]]] = None) -> dict:
+    """
+    向量化的多股票、多參數移動平均線交叉策略回測。
+
+    所有 (股票, 短/長均線, 初始資金) 組合在同一次運算中完成：
+    每個均線窗口只對整個價格矩陣計算一次，交叉信號、部位、現金與淨值都以
+    「參數組 x 日期 x 股票」的 numpy 陣列一次算出。淨值與初始資金成正比，
+    因此只需以單位資金計算，再依各資金設定縮放。
+
+    與 `run_simple_backtest` 相同：短均線高於長均線時全額持有，否則空手；
+    長均線尚未有值的期間不交易。
+
+    :param stock_ids: 股票代號列表。
+    :param start_date: 回測開始日期。
+    :param end_date: 回測結束日期。
+    :param window_pairs: (短均線, 長均線) 窗口組合列表，短窗口必須小於長窗口。
+    :param initial_capitals: 初始資金設定列表。
+    :param rank_by: 排序指標 ("total_return_pct", "sharpe" 或 "max_drawdown_pct")，皆由高到低排序。
+    :param top_n: 只返回排名前 N 的組合；None 代表全部返回。
+    :param price_loader: 取得價格矩陣的函式，預設為 `load_close_prices`。
+    :return: 一個包含排序後結果的字典；參數錯誤時返回 {"error": ...}。
+    """
+    window_pairs = [(int(short), int(long)) for short, long in window_pairs]
+    if not stock_ids or not window_pairs or not initial_capitals:
+        return {"error": "股票、均線窗口與初始資金都至少需要一組。"}
+    invalid = [pair for pair in window_pairs if not 0 < pair[0] < pair[1]]
+    if invalid:
+        return {"error": f"無效的均線窗口組合 (短窗口必須小於長窗口): {invalid}"}
+    if rank_by not in RANK_METRICS:
+        return {"error": f"無效的排序指標: {rank_by}，可用: {list(RANK_METRICS)}"}
+
+    # 步驟 1: 取得對齊後的價格矩陣
+    price_loader = price_loader or load_close_prices
+    try:
+        prices, errors = price_loader(stock_ids, start_date, end_date)
+    except Exception as e:
+        return {"error": f"數據獲取失敗: {e}"}
+    if prices.empty:
+        return {"error": "所有股票的數據獲取皆失敗。", "errors": errors}
+
+    symbols = list(prices.columns)
+    close = prices.to_numpy(dtype=float)                  # (T, S)
+    listed = ~np.isnan(close)
+
+    # 步驟 2: 每個窗口只計算一次移動平均
+    windows = sorted({w for pair in window_pairs for w in pair})
+    moving_averages = {w: prices.rolling(window=w).mean().to_numpy() for w in windows}
+    short_ma = np.stack([moving_averages[short] for short, _ in window_pairs])   # (P, T, S)
+    long_ma = np.stack([moving_averages[long] for _, long in window_pairs])      # (P, T, S)
+
+    # 步驟 3: 交叉信號；長均線有值之後才開始交易
+    active = ~np.isnan(long_ma)
+    signal = np.where(active, short_ma > long_ma, False).astype(float)
+
+    # 步驟 4: 以單位資金計算部位、現金與淨值
+    safe_close = np.where(listed, close, 0.0)[None, :, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = np.where(signal > 0, signal / safe_close, 0.0)
+    trades = np.diff(shares, axis=1, prepend=0.0)
+    cash = 1.0 - np.cumsum(trades * safe_close, axis=1)
+    equity = cash + shares * safe_close                  # (P, T, S)
+
+    final_equity = equity[:, -1, :]
+    trade_count = np.abs(np.diff(signal, axis=1, prepend=0.0)).sum(axis=1)
+
+    # 步驟 5: 風險指標 (只計算可交易期間)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        daily_returns = np.where(active[:, 1:, :], equity[:, 1:, :] / equity[:, :-1, :] - 1.0, np.nan)
+        mean_returns = np.nanmean(daily_returns, axis=1)
+        std_returns = np.nanstd(daily_returns, axis=1, ddof=1)
+        sharpe = np.where(std_returns > 0, mean_returns / std_returns * np.sqrt(TRADING_DAYS_PER_YEAR), 0.0)
+    drawdown = equity / np.maximum.accumulate(equity, axis=1) - 1.0
+    max_drawdown = drawdown.min(axis=1)
+
+    # 步驟 6: 展開成結果列並排序
+    results = []
+    for (p, (short, long)), (s, stock_id), capital in product(enumerate(window_pairs), enumerate(symbols),
+                                                             initial_capitals):
+        results.append({
+            "stock_id": stock_id,
+            "short_window": short,
+            "long_window": long,
+            "initial_capital": float(capital),
+            "final_value": float(final_equity[p, s] * capital),
+            "total_return_pct": float((final_equity[p, s] - 1.0) * 100),
+            "sharpe": float(np.nan_to_num(sharpe[p, s])),
+            "max_drawdown_pct": float(max_drawdown[p, s] * 100),
+            "trade_count": int(trade_count[p, s]),
+        })
+    results.sort(key=lambda row: row[rank_by], reverse=True)
+    for rank, row in enumerate(results, start=1):
+        row["rank"] = rank
+
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "rank_by": rank_by,
+        "combinations": len(results),
+        "results": results[:top_n] if top_n else results,
+        "errors": errors,
+    }
@@ -4,13 +4,18 @@
 
 負責所有與外部數據 API 的互動，例如 FinMind, FRED, yfinance 等。
 這個模組的目標是提供一個統一、乾淨的介面來獲取各種金融數據。
+所有歷史數據都經過本機的市場數據快取 (見 market_cache.py)，重複的查詢不會再連網。
 """
 import os
+import threading
+from typing import Optional
 
 import pandas as pd
 from FinMind.data import DataLoader
 from fredapi import Fred
 
+from .market_cache import MarketDataCache, market_cache
+
 # --- 環境變數與設定 ---
 # 建議將 API Keys 存放在環境變數中，而不是寫死在程式碼裡
 # 這樣可以提高安全性與彈性
@@ -20,8 +25,13 @@ FRED_API_KEY = os.environ.get("FRED_API_KEY")
 class FinMindSource:
     """
     對 FinMind API 的封裝。
+    離線模式下不需要 token，也不會登入。
     """
-    def __init__(self, token: str = FINMIND_API_TOKEN):
+    def __init__(self, token: str = FINMIND_API_TOKEN, cache: Optional[MarketDataCache] = None):
+        self.cache = cache or market_cache
+        self.api = None
+        if self.cache.offline:
+            return
         if not token:
             raise ValueError("FinMind API token 未設定。請設定 FINMIND_API_TOKEN 環境變數。")
         self.api = DataLoader()
@@ -29,20 +39,35 @@ class FinMindSource:
 
     def get_stock_daily(self, stock_id: str, start_date: str, end_date: str) -> pd.DataFrame:
         """
-        獲取指定股票的日成交資訊。
+        獲取指定股票的日成交資訊 (優先使用本機快取)。
         """
-        df = self.api.taiwan_stock_daily(
-            stock_id=stock_id,
-            start_date=start_date,
-            end_date=end_date
-        )
-        return df
+        def fetch(start: str, end: str) -> pd.DataFrame:
+            return self.api.taiwan_stock_daily(stock_id=stock_id, start_date=start, end_date=end)
+
+        return self.cache.get("finmind_daily", stock_id, start_date, end_date, fetch, date_column="date")
+
+_finmind_source: Optional[FinMindSource] = None
+_finmind_source_lock = threading.Lock()
+
+def get_finmind_source() -> FinMindSource:
+    """
+    返回本進程共用的 FinMindSource，只在第一次呼叫時登入。
+    """
+    global _finmind_source
+    with _finmind_source_lock:
+        if _finmind_source is None:
+            _finmind_source = FinMindSource()
+        return _finmind_source
 
 class FredSource:
     """
     對 FRED (Federal Reserve Economic Data) API 的封裝。
     """
-    def __init__(self, api_key: str = FRED_API_KEY):
+    def __init__(self, api_key: str = FRED_API_KEY, cache: Optional[MarketDataCache] = None):
+        self.cache = cache or market_cache
+        self.fred = None
+        if self.cache.offline:
+            return
         if not api_key:
             raise ValueError("FRED API key 未設定。請設定 FRED_API_KEY 環境變數。")
         self.fred = Fred(api_key=api_key)
@@ -51,26 +76,37 @@ class FredSource:
         """
         獲取指定的經濟數據系列。
         例如，'DGS10' 代表 10 年期美國國債殖利率。
+        只有同時指定開始與結束日期時才使用快取，未指定時直接抓取完整系列。
         """
-        series_data = self.fred.get_series(series_id, observation_start=start_date, observation_end=end_date)
-        return series_data.to_frame(name=series_id)
+        def fetch(start: str, end: str) -> pd.DataFrame:
+            series_data = self.fred.get_series(series_id, observation_start=start, observation_end=end)
+            return series_data.to_frame(name=series_id)
+
+        if start_date and end_date:
+            return self.cache.get("fred", series_id, start_date, end_date, fetch)
+        return fetch(start_date, end_date)
 
 # --- yfinance 的簡易函式封裝 ---
 # yfinance 通常不需要 API Key，使用起來更簡單
 try:
     import yfinance as yf
 
-    def get_crypto_daily(ticker: str, start_date: str, end_date: str) -> pd.DataFrame:
+    def get_crypto_daily(ticker: str, start_date: str, end_date: str,
+                         cache: Optional[MarketDataCache] = None) -> pd.DataFrame:
         """
-        使用 yfinance 獲取加密貨幣的日成交資訊。
+        使用 yfinance 獲取加密貨幣的日成交資訊 (優先使用本機快取)。
         例如，'BTC-USD' 代表比特幣對美元。
         """
-        crypto = yf.Ticker(ticker)
-        df = crypto.history(start=start_date, end=end_date)
-        return df
+        def fetch(start: str, end: str) -> pd.DataFrame:
+            # yfinance 的 end 不含當天，因此往後多抓一天以維持閉區間
+            end_exclusive = (pd.Timestamp(end) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+            return yf.Ticker(ticker).history(start=start, end=end_exclusive)
+
+        return (cache or market_cache).get("yfinance_daily", ticker, start_date, end_date, fetch)
 
 except ImportError:
-    def get_crypto_daily(ticker: str, start_date: str, end_date: str) -> pd.DataFrame:
+    def get_crypto_daily(ticker: str, start_date: str, end_date: str,
+                         cache: Optional[MarketDataCache] = None) -> pd.DataFrame:
         """
         如果 yfinance 未安裝，則返回一個錯誤訊息。
         """
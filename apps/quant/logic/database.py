@@ -5,39 +5,129 @@
 負責所有與數據庫的互動，包括數據的持久化儲存和讀取。
 為了保持微服務的獨立性，我們在這裡使用一個簡單的 SQLite 資料庫。
 """
+import base64
+import json
+import queue
 import sqlite3
+import threading
+from concurrent.futures import Future
 from pathlib import Path
+from typing import Optional, Sequence
 
 import pandas as pd
 
 # --- 資料庫設定 ---
 DB_FILE = Path("quant_app.db")
 
+# 回測結果查詢可選取、排序的欄位
+RESULT_COLUMNS = ("id", "run_timestamp", "stock_id", "start_date", "end_date", "initial_capital",
+                  "final_value", "total_return_pct", "sharpe", "trade_count")
+SORTABLE_COLUMNS = ("id", "run_timestamp", "stock_id", "start_date", "total_return_pct", "sharpe")
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# 在既有資料庫上補上的欄位 (欄位名稱, 型別)
+_MIGRATED_COLUMNS = (("sharpe", "REAL"),)
+# 篩選與排序用的索引；每個都以 id 結尾，讓游標分頁可以直接沿索引往下讀
+_INDEXES = {
+    "idx_backtest_results_stock_id": "stock_id, id",
+    "idx_backtest_results_start_date": "start_date, id",
+    "idx_backtest_results_return": "total_return_pct, id",
+    "idx_backtest_results_sharpe": "sharpe, id",
+}
+
+_INSERT_RESULT_SQL = """
+    INSERT INTO backtest_results (
+        stock_id, start_date, end_date, initial_capital,
+        final_value, total_return_pct, trade_count, sharpe
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _result_row(result: dict) -> tuple:
+    """把回測結果字典轉換成 backtest_results 的一列。"""
+    return (
+        result.get("stock_id"),
+        result.get("start_date"),
+        result.get("end_date"),
+        result.get("initial_capital"),
+        result.get("final_value"),
+        result.get("total_return_pct"),
+        result.get("trade_count"),
+        result.get("sharpe"),
+    )
+
+def encode_cursor(sort_value, row_id: int) -> str:
+    """把分頁位置 (排序欄位的值, id) 編碼成不透明的游標字串。"""
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    解碼游標字串。
+
+    :raises ValueError: 游標格式不正確時。
+    """
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return sort_value, int(row_id)
+    except Exception as e:
+        raise ValueError(f"無效的分頁游標: {cursor}") from e
+
 class DBManager:
     """
-    一個簡單的 SQLite 資料庫管理器。
+    SQLite 資料庫管理器 (WAL 模式)。
+
+    - 讀取：每個執行緒使用自己的連線，WAL 模式下多個讀取可以平行進行，也不會被寫入阻塞。
+    - 寫入：所有寫入都交給單一背景寫入執行緒，它把同時到達的多筆回測結果合併成一個交易提交，
+      因此多個回測同時完成時不會互相競爭寫入鎖。
     """
-    def __init__(self, db_file: str = DB_FILE):
+    def __init__(self, db_file: str = DB_FILE, batch_size: int = 200, busy_timeout: float = 5.0):
         """
-        初始化資料庫管理器並建立連接。
+        初始化資料庫管理器，並把資料庫切換為 WAL 模式。
+
+        :param db_file: SQLite 資料庫檔案路徑。
+        :param batch_size: 寫入執行緒一次交易最多提交幾筆結果。
+        :param busy_timeout: 等待資料庫鎖的最長時間 (秒)。
         """
         self.db_file = db_file
-        self.conn = None
+        self.batch_size = batch_size
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: list = []
+        self._connections_lock = threading.Lock()
+        self._write_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
         try:
-            self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
-            # 使用 `check_same_thread=False` 允許在 FastAPI 的不同執行緒中使用
+            conn = self._connect()
+            conn.execute("PRAGMA journal_mode=WAL")
             print(f"成功連接到資料庫: {self.db_file}")
         except sqlite3.Error as e:
             print(f"資料庫連接錯誤: {e}")
             raise
 
+    # --- 連線管理 ---
+
+    def _connect(self) -> sqlite3.Connection:
+        """建立一條新連線並登記，以便 close() 時一併關閉。"""
+        # 每條連線只會被建立它的執行緒使用；關閉 check_same_thread 只是為了讓 close() 能在其他執行緒關閉它
+        conn = sqlite3.connect(self.db_file, timeout=self.busy_timeout, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """目前執行緒專用的連線 (第一次使用時建立)。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
     def initialize_tables(self):
         """
         如果表不存在，則創建它們。
         """
-        if not self.conn:
-            return
-
         try:
             cursor = self.conn.cursor()
             # 創建一個用於儲存回測結果的表
@@ -51,51 +141,127 @@ class DBManager:
                     initial_capital REAL,
                     final_value REAL,
                     total_return_pct REAL,
-                    trade_count INTEGER
+                    trade_count INTEGER,
+                    sharpe REAL
                 )
             """)
+            # 舊版資料庫沒有的欄位以 ALTER TABLE 補上
+            existing = {row[1] for row in cursor.execute("PRAGMA table_info(backtest_results)")}
+            for column, column_type in _MIGRATED_COLUMNS:
+                if column not in existing:
+                    cursor.execute(f"ALTER TABLE backtest_results ADD COLUMN {column} {column_type}")
+            for index_name, columns in _INDEXES.items():
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON backtest_results ({columns})")
             self.conn.commit()
             print("資料表 'backtest_results' 已成功初始化。")
         except sqlite3.Error as e:
             print(f"建立資料表時發生錯誤: {e}")
 
-    def save_backtest_result(self, result: dict):
+    # --- 寫入 ---
+
+    def save_backtest_result(self, result: dict, wait: bool = True) -> Optional[Future]:
         """
         將回測結果儲存到資料庫。
 
         :param result: 從 analysis.run_simple_backtest() 返回的結果字典。
+        :param wait: 是否等待結果提交後才返回；為 False 時立即返回一個 Future。
+        :raises Exception: wait=True 且寫入失敗時 (通常是 sqlite3.Error)。
         """
-        if not self.conn or "error" in result:
-            return
+        futures = self.save_backtest_results([result], wait=wait)
+        return futures[0] if futures else None
+
+    def save_backtest_results(self, results: Sequence[dict], wait: bool = True) -> list:
+        """
+        將多筆回測結果交給寫入執行緒；同一批次的結果在同一個交易中提交。
+
+        :param results: 回測結果字典列表，包含 "error" 的結果會被略過。
+        :param wait: 是否等待全部提交後才返回。
+        :return: 每筆被接受的結果對應的 Future；一筆寫入失敗不影響同批次的其他結果。
+        :raises Exception: wait=True 且任一筆寫入失敗時 (通常是 sqlite3.Error)。
+        """
+        self._ensure_writer()
+        futures = []
+        for result in results:
+            if "error" in result:
+                continue
+            future = Future()
+            self._write_queue.put((_result_row(result), future))
+            futures.append(future)
+        if wait:
+            for future in futures:
+                future.result()
+        return futures
+
+    def _ensure_writer(self):
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="QuantDBWriter", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        """寫入執行緒：取出佇列中所有已到達的結果，以單一交易提交。"""
+        conn = self._connect()
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write_queue.put(None)  # 先寫完這一批再結束
+                    break
+                batch.append(item)
+            try:
+                self._write_batch(conn, batch)
+            except Exception as e:
+                # 任何錯誤都不能讓寫入執行緒結束，否則之後排入的結果永遠不會被寫入
+                print(f"儲存回測結果時發生未預期的錯誤: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
 
+    @staticmethod
+    def _write_batch(conn: sqlite3.Connection, batch: list):
+        """
+        以單一交易提交一批結果；整批失敗時改為逐筆各自提交，只讓有問題的那幾筆失敗。
+
+        :param conn: 寫入執行緒的連線。
+        :param batch: (資料列, Future) 的列表。
+        """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                INSERT INTO backtest_results (
-                    stock_id, start_date, end_date, initial_capital,
-                    final_value, total_return_pct, trade_count
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                result.get("stock_id"),
-                result.get("start_date"),
-                result.get("end_date"),
-                result.get("initial_capital"),
-                result.get("final_value"),
-                result.get("total_return_pct"),
-                result.get("trade_count"),
-            ))
-            self.conn.commit()
-            print(f"已成功將股票 {result.get('stock_id')} 的回測結果存入資料庫。")
-        except sqlite3.Error as e:
-            print(f"儲存回測結果時發生錯誤: {e}")
+            with conn:
+                conn.executemany(_INSERT_RESULT_SQL, [row for row, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                print(f"儲存回測結果時發生錯誤: {e}")
+                batch[0][1].set_exception(e)
+                return
+            print(f"批次儲存 {len(batch)} 筆回測結果失敗，改為逐筆儲存: {e}")
+            saved = 0
+            for row, future in batch:
+                try:
+                    with conn:
+                        conn.execute(_INSERT_RESULT_SQL, row)
+                except Exception as row_error:
+                    print(f"儲存回測結果時發生錯誤: {row_error}")
+                    future.set_exception(row_error)
+                else:
+                    future.set_result(None)
+                    saved += 1
+            print(f"已逐筆將 {saved}/{len(batch)} 筆回測結果存入資料庫。")
+            return
+        for _, future in batch:
+            future.set_result(None)
+        print(f"已成功將 {len(batch)} 筆回測結果存入資料庫。")
 
     def get_all_backtest_results(self) -> pd.DataFrame:
         """
         從資料庫讀取所有回測結果。
         """
-        if not self.conn:
-            return pd.DataFrame() # 返回空的 DataFrame
-
         try:
             df = pd.read_sql_query("SELECT * FROM backtest_results ORDER BY run_timestamp DESC", self.conn)
             return df
@@ -103,13 +269,105 @@ class DBManager:
             print(f"讀取回測結果時發生錯誤: {e}")
             return pd.DataFrame()
 
+    def query_backtest_results(self, fields: Optional[Sequence[str]] = None, stock_id: Optional[str] = None,
+                               date_from: Optional[str] = None, date_to: Optional[str] = None,
+                               min_return: Optional[float] = None, max_return: Optional[float] = None,
+                               min_sharpe: Optional[float] = None, sort_by: str = "id", descending: bool = True,
+                               limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> tuple[list, Optional[str]]:
+        """
+        以游標分頁查詢回測結果；篩選、排序與欄位選取都在 SQL 中完成。
+
+        排序以 (排序欄位, id) 為鍵，游標記錄上一頁最後一筆的鍵值，下一頁從該處接著讀，
+        不使用 OFFSET，因此翻到後面的頁數時也不會變慢，期間新增的結果也不會造成重複或遺漏。
+
+        :param fields: 要返回的欄位；None 代表全部欄位。
+        :param stock_id: 只返回該股票的結果。
+        :param date_from: 回測開始日期不早於此日期 (YYYY-MM-DD)。
+        :param date_to: 回測結束日期不晚於此日期 (YYYY-MM-DD)。
+        :param min_return: 總報酬率 (%) 下限。
+        :param max_return: 總報酬率 (%) 上限。
+        :param min_sharpe: Sharpe 比率下限。
+        :param sort_by: 排序欄位，見 SORTABLE_COLUMNS；run_timestamp 以 id 代替 (兩者順序相同)。
+        :param descending: 是否由大到小排序。
+        :param limit: 每頁筆數 (1 ~ MAX_PAGE_SIZE)。
+        :param cursor: 上一頁返回的 next_cursor；None 代表第一頁。
+        :return: (結果列表, 下一頁的游標)；沒有下一頁時游標為 None。
+        :raises ValueError: 欄位、排序或游標不正確時。
+        """
+        fields = list(fields) if fields else list(RESULT_COLUMNS)
+        unknown = [f for f in fields if f not in RESULT_COLUMNS]
+        if unknown:
+            raise ValueError(f"未知的欄位: {unknown}，可用: {list(RESULT_COLUMNS)}")
+        if sort_by not in SORTABLE_COLUMNS:
+            raise ValueError(f"無法以 {sort_by} 排序，可用: {list(SORTABLE_COLUMNS)}")
+        if sort_by == "run_timestamp":
+            sort_by = "id"
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        where, params = [], []
+        for clause, value in (("stock_id = ?", stock_id), ("start_date >= ?", date_from),
+                              ("end_date <= ?", date_to), ("total_return_pct >= ?", min_return),
+                              ("total_return_pct <= ?", max_return), ("sharpe >= ?", min_sharpe)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        if cursor is not None:
+            clause, cursor_params = self._keyset_clause(sort_by, descending, *decode_cursor(cursor))
+            where.append(clause)
+            params.extend(cursor_params)
+
+        direction = "DESC" if descending else "ASC"
+        order_by = f"{sort_by} {direction}" if sort_by == "id" else f"{sort_by} {direction}, id {direction}"
+        # 游標需要排序欄位與 id，即使呼叫端沒有選取它們
+        selected = list(dict.fromkeys(fields + [sort_by, "id"]))
+        sql = (f"SELECT {', '.join(selected)} FROM backtest_results"
+               f"{' WHERE ' + ' AND '.join(where) if where else ''} ORDER BY {order_by} LIMIT ?")
+        params.append(limit + 1)
+
+        try:
+            rows = [dict(zip(selected, row)) for row in self.conn.execute(sql, params)]
+        except sqlite3.Error as e:
+            print(f"查詢回測結果時發生錯誤: {e}")
+            raise
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][sort_by], rows[-1]["id"])
+        return [{f: row[f] for f in fields} for row in rows], next_cursor
+
+    @staticmethod
+    def _keyset_clause(sort_by: str, descending: bool, last_value, last_id: int) -> tuple[str, list]:
+        """
+        產生「排在 (last_value, last_id) 之後」的 WHERE 條件。
+        SQLite 中 NULL 比任何值都小：由大到小排序時 NULL 在最後，由小到大時在最前。
+        """
+        op = "<" if descending else ">"
+        if sort_by == "id":
+            return f"id {op} ?", [last_id]
+        if last_value is None:
+            if descending:
+                return f"({sort_by} IS NULL AND id {op} ?)", [last_id]
+            return f"(({sort_by} IS NULL AND id {op} ?) OR {sort_by} IS NOT NULL)", [last_id]
+        clause = f"({sort_by} {op} ? OR ({sort_by} = ? AND id {op} ?)"
+        clause += f" OR {sort_by} IS NULL)" if descending else ")"
+        return clause, [last_value, last_value, last_id]
+
     def close(self):
         """
-        關閉資料庫連接。
+        寫完佇列中剩餘的結果，並關閉所有執行緒的資料庫連接。
         """
-        if self.conn:
-            self.conn.close()
-            print("資料庫連接已關閉。")
+        with self._writer_lock:
+            if self._writer is not None and self._writer.is_alive():
+                self._write_queue.put(None)
+                self._writer.join(timeout=10)
+            self._writer = None
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+        print("資料庫連接已關閉。")
 
 # --- 全局實例 ---
 # 可以在 App 啟動時創建一個全局的 DBManager 實例
@@ -4,7 +4,16 @@
 
 負責計算各種技術指標和因子。
 這些函式通常接收一個 pandas DataFrame，並返回一個添加了新因子欄位的 DataFrame。
+
+檔案後半部的 `IncrementalFactorEngine` 是同一組因子的增量版本：
+為每個代號保存滾動窗口的狀態，每根新 K 線只需 O(1) 的更新，
+輸出與批次函式逐位元相同 (包括 NaN 的位置)。
 """
+import math
+from collections import deque
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
 import pandas as pd
 
 
@@ -56,3 +65,176 @@ def add_all_factors(df: pd.DataFrame, price_col: str = 'close') -> pd.DataFrame:
     return df
 
 # 你可以在這裡繼續添加更多的因子計算函式，例如 MACD, Bollinger Bands 等。
+# 新增的因子若需要增量更新，也請在下方加入對應的增量計算類別。
+
+
+# --- 增量因子計算 (Incremental Factors) ---
+
+class RollingMean:
+    """
+    與 `Series.rolling(window).mean()` 結果完全相同的增量移動平均。
+
+    pandas 以 Kahan 補償求和維護窗口總和 (加入與移除各自有一個補償項)，並且：
+    - 窗口內有 NaN 時 (有效筆數不足 window) 輸出 NaN；
+    - 最近連續相同的值涵蓋整個窗口時，直接輸出該值以消除浮點誤差；
+    - 窗口內全為非負 (或全為負) 值但總和的符號相反時輸出 0。
+    這裡按相同的運算順序重現這些步驟，所以能得到逐位元相同的結果。
+    """
+
+    def __init__(self, window: int):
+        if window < 1:
+            raise ValueError(f"窗口大小必須是正整數: {window}")
+        self.window = window
+        self._values: deque = deque()
+        self._started = False
+        self._reset()
+
+    def _reset(self):
+        self._nobs = 0
+        self._neg_ct = 0
+        self._sum = 0.0
+        self._comp_add = 0.0
+        self._comp_remove = 0.0
+        self._same_count = 0
+        self._prev_value = math.nan
+
+    def _add(self, value: float):
+        if value != value:  # NaN 不計入
+            return
+        self._nobs += 1
+        y = value - self._comp_add
+        t = self._sum + y
+        self._comp_add = t - self._sum - y
+        self._sum = t
+        if math.copysign(1.0, value) < 0:
+            self._neg_ct += 1
+        if value == self._prev_value:
+            self._same_count += 1
+        else:
+            self._same_count = 1
+        self._prev_value = value
+
+    def _remove(self, value: float):
+        if value != value:
+            return
+        self._nobs -= 1
+        y = -value - self._comp_remove
+        t = self._sum + y
+        self._comp_remove = t - self._sum - y
+        self._sum = t
+        if math.copysign(1.0, value) < 0:
+            self._neg_ct -= 1
+
+    def update(self, value: float) -> float:
+        """加入一個新值，返回加入後的移動平均。"""
+        value = float(value)
+        self._values.append(value)
+        if not self._started or self.window == 1:
+            # pandas 在第一個窗口 (以及窗口大小為 1 時的每個窗口) 都從頭計算
+            self._started = True
+            while len(self._values) > self.window:
+                self._values.popleft()
+            self._reset()
+            self._prev_value = self._values[0]
+            self._add(value)
+        else:
+            if len(self._values) > self.window:
+                self._remove(self._values.popleft())
+            self._add(value)
+        return self._mean()
+
+    def _mean(self) -> float:
+        if self._nobs < self.window:
+            return math.nan
+        result = self._sum / self._nobs
+        if self._same_count >= self._nobs:
+            return self._prev_value
+        if self._neg_ct == 0 and result < 0:
+            return 0.0
+        if self._neg_ct == self._nobs and result > 0:
+            return 0.0
+        return result
+
+
+class RollingRSI:
+    """與 `calculate_rsi` 結果完全相同的增量 RSI。"""
+
+    def __init__(self, window: int = 14):
+        self.window = window
+        self._gain = RollingMean(window)
+        self._loss = RollingMean(window)
+        self._prev_price = math.nan
+
+    def update(self, price: float) -> float:
+        """加入一個新價格，返回加入後的 RSI。"""
+        price = float(price)
+        delta = price - self._prev_price
+        self._prev_price = price
+        # 與 delta.where(delta > 0, 0) 相同：NaN 的變動量 (例如第一筆) 被視為 0
+        gain = self._gain.update(delta if delta > 0 else 0.0)
+        loss = self._loss.update(-(delta if delta < 0 else 0.0))
+        # 以 numpy 純量計算，讓除以 0 的結果 (inf / NaN) 與 pandas 一致
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rs = np.float64(gain) / np.float64(loss)
+            return float(100 - (100 / (1 + rs)))
+
+
+class IncrementalFactorEngine:
+    """
+    為每個代號保存因子狀態的增量計算引擎。
+
+    預設計算與 `add_all_factors` 相同的因子 (MA_10, MA_30, RSI_14)。
+    每根新 K 線的更新成本與歷史長度無關；引擎本身可以被 pickle，
+    因此每日更新時只需載入前一天的狀態，再餵入新的 K 線即可。
+    """
+
+    def __init__(self, ma_windows: Sequence[int] = (10, 30), rsi_windows: Sequence[int] = (14,)):
+        """
+        :param ma_windows: 要計算的移動平均窗口。
+        :param rsi_windows: 要計算的 RSI 窗口。
+        """
+        self.ma_windows = tuple(ma_windows)
+        self.rsi_windows = tuple(rsi_windows)
+        self._states: Dict[str, dict] = {}
+
+    @property
+    def factor_names(self) -> list:
+        """輸出的因子欄位名稱，與批次函式產生的欄位名稱相同。"""
+        return [f'MA_{w}' for w in self.ma_windows] + [f'RSI_{w}' for w in self.rsi_windows]
+
+    def _state_for(self, symbol: str) -> dict:
+        state = self._states.get(symbol)
+        if state is None:
+            state = {f'MA_{w}': RollingMean(w) for w in self.ma_windows}
+            state.update({f'RSI_{w}': RollingRSI(w) for w in self.rsi_windows})
+            self._states[symbol] = state
+        return state
+
+    def update(self, symbol: str, price: float) -> Dict[str, float]:
+        """
+        為某個代號加入一根新 K 線的價格。
+
+        :return: {因子名稱: 最新值}。
+        """
+        return {name: calc.update(price) for name, calc in self._state_for(symbol).items()}
+
+    def update_many(self, symbol: str, prices: Iterable[float], index: Optional[pd.Index] = None) -> pd.DataFrame:
+        """
+        依序加入多根 K 線 (例如首次載入歷史數據或補上缺少的幾天)。
+
+        :param prices: 依時間排序的價格。
+        :param index: 返回的 DataFrame 所使用的索引 (例如日期)。
+        :return: 每根 K 線對應的因子值。
+        """
+        rows = [self.update(symbol, price) for price in prices]
+        return pd.DataFrame(rows, index=index, columns=self.factor_names)
+
+    def symbols(self) -> list:
+        return list(self._states)
+
+    def reset(self, symbol: Optional[str] = None):
+        """清除某個代號 (或所有代號) 的狀態。"""
+        if symbol is None:
+            self._states.clear()
+        else:
+            self._states.pop(symbol, None)
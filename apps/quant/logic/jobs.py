@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+回測工作管理 (Backtest Jobs)
+
+把耗時的回測 (抓取數據 + 計算) 從 API 的事件迴圈中移出，交給有上限的進程池執行。
+
+- 提交後立即返回工作 ID，API 處理器不會被任何回測阻塞。
+- 同時執行的回測數量 (進程數) 與排隊中的工作數量都有上限，超過時拒絕新的提交。
+- 回測完成後在主進程中把結果存入資料庫，並保留最近一段時間的工作狀態供查詢。
+- 工作進程意外終止 (例如大型網格回測耗盡記憶體) 時，受影響的工作記為失敗，
+  進程池在下一次提交時重新建立，不需要重啟服務。
+"""
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from . import analysis, database
+
+# --- 預設值 (可由環境變數覆寫) ---
+DEFAULT_MAX_WORKERS = int(os.environ.get("QUANT_BACKTEST_WORKERS", min(4, os.cpu_count() or 1)))
+DEFAULT_MAX_QUEUED = int(os.environ.get("QUANT_BACKTEST_MAX_QUEUED", 32))
+DEFAULT_MAX_FINISHED = 1000
+
+# 工作狀態
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# 工作類型
+SIMPLE = "simple"
+GRID = "grid"
+
+
+class QueueFullError(Exception):
+    """排隊中的工作已達上限。"""
+
+
+def _run_backtest_job(params: dict) -> dict:
+    """在工作進程中執行的函式 (必須是模組層級函式才能被 pickle)。"""
+    return analysis.run_simple_backtest(**params)
+
+
+def _run_grid_backtest_job(params: dict) -> dict:
+    """在工作進程中執行的網格回測。"""
+    return analysis.run_grid_backtest(**params)
+
+
+# 工作類型 -> (在工作進程中執行的函式, 完成後是否存入 backtest_results)
+_JOB_KINDS = {
+    SIMPLE: (_run_backtest_job, True),
+    GRID: (_run_grid_backtest_job, False),
+}
+
+
+class BacktestJob:
+    """單一回測工作的狀態。"""
+
+    def __init__(self, job_id: str, params: dict, future: Future, kind: str = SIMPLE):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.future = future
+        self.submitted_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self._done = threading.Event()
+
+    @property
+    def status(self) -> str:
+        if self._done.is_set():
+            return FAILED if self.error else SUCCEEDED
+        return RUNNING if self.future.running() else QUEUED
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待工作 (包含結果入庫) 完成。"""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "submitted_at": self.submitted_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error,
+        }
+
+
+class BacktestJobManager:
+    """
+    回測工作管理器。
+
+    進程池在第一次提交時才建立，因此只匯入模組 (例如測試或健康檢查) 不會產生子進程。
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, max_queued: int = DEFAULT_MAX_QUEUED,
+                 max_finished: int = DEFAULT_MAX_FINISHED, executor_factory: Optional[Callable[[int], Executor]] = None):
+        """
+        :param max_workers: 同時執行的回測數量上限。
+        :param max_queued: 等待執行的工作數量上限 (不含正在執行的)。
+        :param max_finished: 保留多少個已完成的工作供查詢，超過時淘汰最舊的。
+        :param executor_factory: 建立執行器的函式，預設為 ProcessPoolExecutor。
+        """
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.executor_factory = executor_factory or (lambda workers: ProcessPoolExecutor(max_workers=workers))
+        self._executor: Optional[Executor] = None
+        self._jobs: "OrderedDict[str, BacktestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self.executor_factory(self.max_workers)
+        return self._executor
+
+    def _discard_executor(self, executor: Executor):
+        """丟棄已損壞的進程池；下一次提交時由 _get_executor 重新建立。"""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def pending_count(self) -> int:
+        """尚未完成的工作數量 (執行中 + 排隊中)。"""
+        return sum(1 for job in self._jobs.values() if not job._done.is_set())
+
+    def submit(self, params: dict, kind: str = SIMPLE) -> BacktestJob:
+        """
+        提交一個回測工作並立即返回。
+
+        :param params: 傳給回測函式的參數。
+        :param kind: 工作類型，SIMPLE (單一回測，結果會入庫) 或 GRID (網格回測)。
+        :raises QueueFullError: 執行中與排隊中的工作已達上限時。
+        """
+        with self._lock:
+            if self.pending_count() >= self.max_workers + self.max_queued:
+                raise QueueFullError(f"回測工作已達上限 ({self.max_workers} 執行中 + {self.max_queued} 排隊中)，請稍後再試。")
+            job_id = uuid.uuid4().hex
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_JOB_KINDS[kind][0], params)
+            except BrokenProcessPool:
+                # 先前的工作進程意外終止，但還沒有工作回報 (_on_done 尚未執行)
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = self._get_executor()
+                future = executor.submit(_JOB_KINDS[kind][0], params)
+            job = BacktestJob(job_id, params, future, kind)
+            self._jobs[job_id] = job
+            self._evict_finished()
+        future.add_done_callback(lambda f, job=job, executor=executor: self._on_done(job, f, executor))
+        return job
+
+    def _on_done(self, job: BacktestJob, future: Future, executor: Optional[Executor] = None):
+        """回測結束後 (在主進程中) 保存結果；業務邏輯回傳的錯誤與例外都記為失敗。"""
+        try:
+            result = future.result()
+            if "error" in result:
+                job.error = result["error"]
+            elif not _JOB_KINDS[job.kind][1]:
+                job.result = result
+            else:
+                try:
+                    database.db_manager.save_backtest_result(result)
+                    job.result = result
+                except Exception as e:
+                    job.error = f"回測成功，但結果存儲失敗: {e}"
+        except BrokenProcessPool as e:
+            # 進程池中的某個工作進程意外終止 (可能是記憶體不足)，池中所有未完成的工作都會失敗
+            job.error = f"回測工作進程意外終止 (可能是記憶體不足)，請稍後重新提交: {e}"
+            if executor is not None:
+                self._discard_executor(executor)
+        except Exception as e:
+            job.error = f"回測執行失敗: {e}"
+        job.finished_at = datetime.now(timezone.utc)
+        job._done.set()
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job._done.is_set()]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[BacktestJob]:
+        return self._jobs.get(job_id)
+
+    def shutdown(self, wait: bool = False):
+        """關閉進程池；尚未開始的工作會被取消。"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+
+# --- 全局實例 ---
+job_manager = BacktestJobManager()
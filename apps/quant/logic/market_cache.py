@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+市場數據快取 (Market Data Cache)
+
+把從外部 API 取得的歷史數據以 Parquet 欄式格式保存在本機磁碟，避免每次回測都重新下載完整歷史。
+
+- 每個 (數據集, 代號) 一個 Parquet 檔；檔案的中繼資料記錄「已向數據源查詢過的日期區間」，
+  和數據本身在同一次原子寫入中完成，多個進程同時更新也不會讓兩者不一致。
+- 請求的區間若超出已快取的範圍，只向數據源補抓缺少的頭尾兩段，再與既有數據合併。
+- 當天的數據可能尚未收盤，所以已快取區間最多只到昨天，今天的部分下次仍會重新抓取。
+- 離線模式 (環境變數 QUANT_OFFLINE=1) 完全不連網，只返回快取中已有的數據。
+"""
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# --- 快取設定 (可由環境變數覆寫) ---
+DEFAULT_CACHE_DIR = Path(os.environ.get("QUANT_DATA_CACHE_DIR", "quant_data_cache"))
+OFFLINE_MODE = os.environ.get("QUANT_OFFLINE", "").lower() in ("1", "true", "yes")
+
+# Parquet 中繼資料中記錄已快取區間的鍵
+_COVERAGE_KEY = b"phoenix_cache_coverage"
+
+# 向數據源抓取 [start, end] 區間數據的函式
+FetchFunction = Callable[[str, str], pd.DataFrame]
+
+
+class CacheMissError(LookupError):
+    """離線模式下，快取中沒有請求的數據。"""
+
+
+class MarketDataCache:
+    """
+    以 (數據集, 代號) 為鍵、按日期區間增量更新的本機數據快取。
+    """
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, offline: bool = OFFLINE_MODE):
+        """
+        :param cache_dir: 快取目錄，每個數據集一個子目錄。
+        :param offline: 離線模式；為 True 時不呼叫任何數據源。
+        """
+        self.cache_dir = Path(cache_dir)
+        self.offline = offline
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def path_for(self, dataset: str, symbol: str) -> Path:
+        """返回某個 (數據集, 代號) 的 Parquet 檔路徑。"""
+        safe_symbol = "".join(c if c.isalnum() or c in "-_." else "_" for c in symbol)
+        return self.cache_dir / dataset / f"{safe_symbol}.parquet"
+
+    def _lock_for(self, dataset: str, symbol: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault((dataset, symbol), threading.Lock())
+
+    # --- 讀寫 ---
+
+    def _read(self, path: Path) -> Tuple[Optional[pd.DataFrame], Optional[Tuple[date, date]]]:
+        """讀取快取檔，返回 (數據, 已快取區間)；檔案不存在或損毀時返回 (None, None)。"""
+        if not path.exists():
+            return None, None
+        try:
+            table = pq.read_table(path)
+            coverage = json.loads(table.schema.metadata[_COVERAGE_KEY])
+            return table.to_pandas(), (date.fromisoformat(coverage["start"]), date.fromisoformat(coverage["end"]))
+        except Exception as e:
+            print(f"讀取市場數據快取失敗，將重新抓取 ({path}): {e}")
+            return None, None
+
+    def _write(self, path: Path, df: pd.DataFrame, coverage: Tuple[date, date]):
+        """把數據與已快取區間原子地寫入快取檔。"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(df)
+        metadata = dict(table.schema.metadata or {})
+        metadata[_COVERAGE_KEY] = json.dumps({
+            "start": coverage[0].isoformat(),
+            "end": coverage[1].isoformat(),
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        }).encode()
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+        os.replace(tmp_path, path)
+
+    # --- 查詢 ---
+
+    def get(self, dataset: str, symbol: str, start_date: str, end_date: str, fetch: FetchFunction,
+            date_column: Optional[str] = None) -> pd.DataFrame:
+        """
+        返回 [start_date, end_date] 區間的數據，必要時只向數據源補抓缺少的部分。
+
+        :param dataset: 數據集名稱，例如 "finmind_daily"。
+        :param symbol: 股票代號、經濟數據系列 ID 等。
+        :param start_date: 開始日期 (YYYY-MM-DD)。
+        :param end_date: 結束日期 (YYYY-MM-DD)。
+        :param fetch: 抓取某個區間數據的函式 fetch(start_date, end_date)。
+        :param date_column: 日期所在的欄位；None 代表日期在索引上。
+        :raises CacheMissError: 離線模式下快取中沒有任何該代號的數據時。
+        """
+        start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+        path = self.path_for(dataset, symbol)
+
+        with self._lock_for(dataset, symbol):
+            cached, coverage = self._read(path)
+
+            if self.offline:
+                if cached is None:
+                    raise CacheMissError(f"離線模式下快取中沒有 {dataset}/{symbol} 的數據。")
+                if start < coverage[0] or end > coverage[1]:
+                    print(f"離線模式: {dataset}/{symbol} 只快取了 {coverage[0]} ~ {coverage[1]}，返回部分數據。")
+                return self._slice(cached, start, end, date_column)
+
+            # 計算需要補抓的頭尾區段；中間若有空缺也一併補上，讓快取區間保持連續
+            if coverage is None:
+                missing = [(start, end)]
+                new_coverage = (start, end)
+            else:
+                missing = []
+                if start < coverage[0]:
+                    missing.append((start, coverage[0] - timedelta(days=1)))
+                if end > coverage[1]:
+                    missing.append((coverage[1] + timedelta(days=1), end))
+                new_coverage = (min(start, coverage[0]), max(end, coverage[1]))
+
+            if missing:
+                frames = [] if cached is None else [cached]
+                for seg_start, seg_end in missing:
+                    fetched = fetch(seg_start.isoformat(), seg_end.isoformat())
+                    if fetched is not None and not fetched.empty:
+                        frames.append(fetched)
+                merged = self._merge(frames, date_column)
+                # 當天 (以及未來) 的數據尚未確定，不列入已快取區間
+                yesterday = date.today() - timedelta(days=1)
+                new_coverage = (new_coverage[0], min(new_coverage[1], yesterday))
+                if new_coverage[0] <= new_coverage[1] and merged is not None:
+                    self._write(path, merged, new_coverage)
+                cached = merged
+
+        if cached is None:
+            return pd.DataFrame()
+        return self._slice(cached, start, end, date_column)
+
+    # --- 工具函式 ---
+
+    @staticmethod
+    def _dates(df: pd.DataFrame, date_column: Optional[str]) -> pd.Series:
+        values = df.index if date_column is None else df[date_column]
+        dates = pd.to_datetime(values)
+        if getattr(dates.dtype, "tz", None) is not None:
+            dates = dates.tz_localize(None)
+        return pd.Series(pd.DatetimeIndex(dates).normalize(), index=df.index)
+
+    @classmethod
+    def _merge(cls, frames, date_column: Optional[str]) -> Optional[pd.DataFrame]:
+        """合併既有與新抓取的數據，同一天只保留最新抓取的那一筆。"""
+        if not frames:
+            return None
+        merged = pd.concat(frames)
+        dates = cls._dates(merged, date_column)
+        keep = ~dates.duplicated(keep="last").to_numpy()
+        merged = merged[keep]
+        return merged.iloc[dates[keep].argsort(kind="stable").to_numpy()]
+
+    @classmethod
+    def _slice(cls, df: pd.DataFrame, start: date, end: date, date_column: Optional[str]) -> pd.DataFrame:
+        dates = cls._dates(df, date_column)
+        mask = ((dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))).to_numpy()
+        result = df[mask]
+        return result.reset_index(drop=True) if date_column is not None else result.copy()
+
+
+# --- 全局實例 ---
+market_cache = MarketDataCache()
@@ -16,7 +16,7 @@ from fastapi import FastAPI
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from quant.api.v1 import routes as v1_routes
-from quant.logic import database
+from quant.logic import database, jobs
 
 # 建立 FastAPI 應用實例
 app = FastAPI(
@@ -34,7 +34,8 @@ async def lifespan(app: FastAPI):
     print("量化服務啟動...")
     yield
     # 在應用程式關閉時執行的程式碼
-    print("量化服務正在關閉，關閉資料庫連接...")
+    print("量化服務正在關閉，停止回測進程池並關閉資料庫連接...")
+    jobs.job_manager.shutdown()
     database.db_manager.close()
 
 # 建立 FastAPI 應用實例，並傳入 lifespan 管理器
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+語音轉寫 App 的長音訊分段
+
+長錄音被切成約 TRANSCRIBER_CHUNK_SECONDS 秒的區段，切點選在目標位置附近最安靜的地方
+(以短時能量判斷靜音)，避免把一個字切成兩半。各區段可以由不同的工作進程平行轉寫，
+每個區段只讀取自己那一段音訊，所以記憶體用量與錄音長度無關。
+
+- 只有 PCM WAV 檔案可以不經解碼直接按位置讀取，因此只有 WAV 會被分段；
+  其他格式 (mp3 等) 仍整檔交給 faster-whisper 解碼，但轉寫出的片段同樣會即時回報。
+- 分段需要 numpy (faster-whisper 的依賴)；未安裝時不分段。
+"""
+import os
+import wave
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --- 分段設定 (可由環境變數覆寫) ---
+CHUNK_SECONDS = float(os.environ.get("TRANSCRIBER_CHUNK_SECONDS", 60.0))
+# 在目標切點前後多少秒內尋找最安靜的位置
+SILENCE_SEARCH_SECONDS = float(os.environ.get("TRANSCRIBER_SILENCE_SEARCH_SECONDS", 10.0))
+# 轉寫時是否再以 faster-whisper 內建的 VAD 略過區段內的靜音
+VAD_FILTER = os.environ.get("TRANSCRIBER_VAD_FILTER", "true").lower() in ("1", "true", "yes")
+
+# Whisper 模型要求的取樣率
+SAMPLE_RATE = 16000
+# 計算能量的音框長度 (秒)
+FRAME_SECONDS = 0.03
+# 每次從檔案讀取的音框數量
+_READ_BLOCK_FRAMES = 2000
+
+# 區段: (開始秒數, 結束秒數)；結束為 None 代表整個檔案
+Span = Tuple[float, Optional[float]]
+WHOLE_FILE: List[Span] = [(0.0, None)]
+
+
+def _to_mono_float(data: bytes, sample_width: int, channels: int):
+    """把 PCM 位元組轉成 [-1, 1] 範圍的單聲道 float32 陣列。"""
+    if sample_width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    elif sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        values = np.where(values >= 1 << 23, values - (1 << 24), values)
+        samples = values.astype(np.float32) / float(1 << 23)
+    elif sample_width == 4:
+        samples = np.frombuffer(data, dtype="<i4").astype(np.float32) / float(1 << 31)
+    else:
+        raise ValueError(f"不支援的取樣寬度: {sample_width} bytes")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+def _frame_energies(file_path: Path) -> Optional[Tuple[object, float, float]]:
+    """
+    逐塊讀取 WAV 檔，計算每個音框的 RMS 能量。
+
+    :return: (能量陣列, 總秒數, 實際音框長度秒數)；不是 PCM WAV 或 numpy 不可用時返回 None。
+             音框的樣本數取整數，所以實際長度 (hop / rate) 不一定等於 FRAME_SECONDS。
+    """
+    if np is None:
+        return None
+    try:
+        with wave.open(str(file_path), "rb") as wav:
+            rate, channels, width = wav.getframerate(), wav.getnchannels(), wav.getsampwidth()
+            total_frames = wav.getnframes()
+            hop = max(1, int(rate * FRAME_SECONDS))
+            energies, carry = [], np.zeros(0, dtype=np.float32)
+            while True:
+                data = wav.readframes(hop * _READ_BLOCK_FRAMES)
+                if not data:
+                    break
+                samples = np.concatenate([carry, _to_mono_float(data, width, channels)])
+                usable = len(samples) // hop * hop
+                frames = samples[:usable].reshape(-1, hop)
+                energies.append(np.sqrt((frames ** 2).mean(axis=1)))
+                carry = samples[usable:]
+    except (wave.Error, EOFError, ValueError):
+        return None
+    if not energies:
+        return None
+    return np.concatenate(energies), total_frames / float(rate), hop / float(rate)
+
+
+def plan_chunks(file_path: Path, chunk_seconds: float = CHUNK_SECONDS,
+                search_seconds: float = SILENCE_SEARCH_SECONDS) -> List[Span]:
+    """
+    規劃一個音訊檔案的轉寫區段。
+
+    :param chunk_seconds: 每個區段的目標長度 (秒)。
+    :param search_seconds: 在目標切點前後多少秒內尋找最安靜的音框作為實際切點。
+    :return: 依時間排序的區段；檔案很短或無法分段時返回整個檔案一個區段。
+    """
+    info = _frame_energies(Path(file_path))
+    if info is None:
+        return list(WHOLE_FILE)
+    energies, duration, frame_seconds = info
+    if duration <= chunk_seconds + search_seconds:
+        return list(WHOLE_FILE)
+
+    spans: List[Span] = []
+    position = 0.0
+    while duration - position > chunk_seconds + search_seconds:
+        target = position + chunk_seconds
+        lo = int(max(target - search_seconds, position + frame_seconds) / frame_seconds)
+        hi = min(int((target + search_seconds) / frame_seconds), len(energies) - 1)
+        if hi <= lo:
+            break
+        quietest = lo + int(np.argmin(energies[lo:hi + 1]))
+        cut = round((quietest + 0.5) * frame_seconds, 3)
+        spans.append((position, cut))
+        position = cut
+    spans.append((position, duration))
+    return spans
+
+
+def read_chunk(file_path: Path, start_seconds: float, end_seconds: float):
+    """
+    只讀取 WAV 檔中的一個區段，轉成模型所需的 16 kHz 單聲道 float32 陣列。
+    """
+    with wave.open(str(file_path), "rb") as wav:
+        rate, channels, width = wav.getframerate(), wav.getnchannels(), wav.getsampwidth()
+        start_frame = int(start_seconds * rate)
+        wav.setpos(min(start_frame, wav.getnframes()))
+        data = wav.readframes(max(0, int(end_seconds * rate) - start_frame))
+    samples = _to_mono_float(data, width, channels)
+    if rate != SAMPLE_RATE and len(samples):
+        # 線性內插重新取樣；語音內容集中在低頻，對轉寫品質的影響很小
+        target_len = int(round(len(samples) * SAMPLE_RATE / rate))
+        positions = np.arange(target_len, dtype=np.float64) * rate / SAMPLE_RATE
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+    return samples
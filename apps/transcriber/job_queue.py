@@ -0,0 +1,718 @@
+# -*- coding: utf-8 -*-
+"""
+語音轉寫 App 的持久化工作佇列與背景工作進程池
+
+- 每個上傳的檔案都是 SQLite (WAL 模式) 中的一筆工作，API 處理器只負責寫入佇列並立即返回。
+- 工作進程以交易 (BEGIN IMMEDIATE) 原子地領取工作，同一筆工作不會被兩個進程同時處理。
+- 每筆工作在領取後被規劃成一或多個區段 (長音訊按靜音切段)；區段由任何閒置的工作進程領取，
+  所以一個長檔案可以由多個工作進程平行轉寫。轉寫出的片段即時寫入資料庫，
+  狀態查詢可以在整個檔案完成前就看到部分結果；最後一個完成的區段負責組合完整結果。
+- 上傳的內容以雜湊值 (加上模型與束搜尋設定) 作為快取鍵：已轉寫過的內容直接從持久化的
+  轉寫快取返回結果；與處理中工作相同的內容則附加到該工作上，完成時一併得到結果，不重複轉寫。
+- 服務重新啟動時，上次還在處理中的工作 (或區段) 會被放回佇列；工作進程意外結束時，
+  監督執行緒會重新啟動它，並把它手上的工作放回佇列 (超過重試次數則標記為錯誤)。
+"""
+import multiprocessing as mp
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+# --- 預設值 (可由環境變數覆寫) ---
+DEFAULT_DB_PATH = Path(os.environ.get("TRANSCRIBER_DB", "transcriber_jobs.db"))
+DEFAULT_NUM_WORKERS = int(os.environ.get("TRANSCRIBER_WORKERS", min(2, os.cpu_count() or 1)))
+DEFAULT_MAX_ATTEMPTS = 3
+# 重新啟動的工作進程最多重播幾則廣播過的控制訊息
+MAX_REPLAYED_BROADCASTS = 8
+
+# 工作狀態 (沿用原本 tasks 字典中的狀態名稱)
+QUEUED = "queued"
+PROCESSING = "processing"
+COMPLETED = "completed"
+ERROR = "error"
+# 附加在另一筆內容相同、仍在處理中的工作上 (duplicate_of)，查詢狀態時返回該工作的進度
+DUPLICATE = "duplicate"
+
+# 後來加入的欄位；舊版資料庫在初始化時補上
+_ADDED_JOB_COLUMNS = (
+    ("chunks_total", "INTEGER"),
+    ("cache_key", "TEXT"),
+    ("duplicate_of", "TEXT"),
+)
+_ADDED_SEGMENT_COLUMNS = (
+    ("attempt", "INTEGER NOT NULL DEFAULT 1"),
+)
+
+
+class TranscriptionJobQueue:
+    """
+    以 SQLite 為後端的轉寫工作佇列；可以在 API 進程與多個工作進程中同時使用。
+    """
+
+    def __init__(self, db_path: Path = DEFAULT_DB_PATH, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        """
+        :param db_path: SQLite 資料庫檔案路徑。
+        :param max_attempts: 工作進程意外結束時，一筆工作最多被重新執行幾次。
+        """
+        self.db_path = Path(db_path)
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self.initialize()
+
+    def _conn(self) -> sqlite3.Connection:
+        """目前執行緒專用的連線；以 autocommit 模式開啟，交易由各方法自行控制。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def initialize(self):
+        """建立資料表與索引。"""
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS transcription_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                original_filename TEXT,
+                file_path TEXT,
+                mode TEXT,
+                result TEXT,
+                error_message TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker_id TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                chunks_total INTEGER,
+                cache_key TEXT,
+                duplicate_of TEXT
+            )""")
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(transcription_jobs)")}
+        for name, column_type in _ADDED_JOB_COLUMNS:
+            if name not in columns:
+                conn.execute(f"ALTER TABLE transcription_jobs ADD COLUMN {name} {column_type}")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_transcription_jobs_status "
+                     "ON transcription_jobs (status, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_transcription_jobs_cache_key "
+                     "ON transcription_jobs (cache_key, status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_transcription_jobs_duplicate_of "
+                     "ON transcription_jobs (duplicate_of)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS transcript_cache (
+                cache_key TEXT PRIMARY KEY,
+                result TEXT,
+                mode TEXT,
+                source_task_id TEXT,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            )""")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS transcription_chunks (
+                job_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                start_seconds REAL NOT NULL,
+                end_seconds REAL,
+                status TEXT NOT NULL,
+                result TEXT,
+                mode TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker_id TEXT,
+                PRIMARY KEY (job_id, chunk_index)
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_transcription_chunks_status ON transcription_chunks (status)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS transcription_segments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                start_seconds REAL,
+                end_seconds REAL,
+                text TEXT,
+                attempt INTEGER NOT NULL DEFAULT 1
+            )""")
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(transcription_segments)")}
+        for name, column_type in _ADDED_SEGMENT_COLUMNS:
+            if name not in columns:
+                conn.execute(f"ALTER TABLE transcription_segments ADD COLUMN {name} {column_type}")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_transcription_segments_job ON transcription_segments (job_id, id)")
+
+    # --- 生產者 (API 進程) ---
+
+    def enqueue(self, task_id: str, original_filename: str, file_path: Path, mode: str = "real"):
+        """新增一筆等待處理的工作。"""
+        self._conn().execute(
+            "INSERT INTO transcription_jobs (id, status, original_filename, file_path, mode, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (task_id, QUEUED, original_filename, str(file_path), mode, time.time()),
+        )
+
+    def submit(self, task_id: str, original_filename: str, file_path: Path, cache_key: str) -> Tuple[str, Optional[str]]:
+        """
+        以內容快取鍵提交一筆工作：查詢快取、合併相同的處理中工作、新增工作三者在同一個交易中完成，
+        同時上傳的相同內容也只會轉寫一次。
+
+        :param cache_key: 由內容雜湊值與模型設定組成的鍵。
+        :return: (結果, 來源工作 ID)；結果為 "cached" (直接從快取完成)、
+                 "coalesced" (附加在處理中的來源工作上) 或 "queued" (新工作，來源為 None)。
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cached = conn.execute(
+                "SELECT result, mode, source_task_id FROM transcript_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if cached is not None:
+                conn.execute(
+                    "INSERT INTO transcription_jobs (id, status, original_filename, mode, result, cache_key, "
+                    "duplicate_of, created_at, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (task_id, COMPLETED, original_filename, cached["mode"], cached["result"], cache_key,
+                     cached["source_task_id"], now, now),
+                )
+                conn.execute("UPDATE transcript_cache SET hits = hits + 1 WHERE cache_key = ?", (cache_key,))
+                outcome = ("cached", cached["source_task_id"])
+            else:
+                primary = conn.execute(
+                    "SELECT id FROM transcription_jobs WHERE cache_key = ? AND status IN (?, ?) "
+                    "AND duplicate_of IS NULL ORDER BY created_at LIMIT 1",
+                    (cache_key, QUEUED, PROCESSING),
+                ).fetchone()
+                if primary is not None:
+                    conn.execute(
+                        "INSERT INTO transcription_jobs (id, status, original_filename, mode, cache_key, duplicate_of, "
+                        "created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (task_id, DUPLICATE, original_filename, "real", cache_key, primary["id"], now),
+                    )
+                    outcome = ("coalesced", primary["id"])
+                else:
+                    conn.execute(
+                        "INSERT INTO transcription_jobs (id, status, original_filename, file_path, mode, cache_key, "
+                        "created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (task_id, QUEUED, original_filename, str(file_path), "real", cache_key, now),
+                    )
+                    outcome = ("queued", None)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return outcome
+
+    def add_completed(self, task_id: str, original_filename: str, result: str, mode: str):
+        """直接記錄一筆已完成的工作 (例如模擬模式，不需要工作進程)。"""
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO transcription_jobs (id, status, original_filename, mode, result, created_at, finished_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (task_id, COMPLETED, original_filename, mode, result, now, now),
+        )
+
+    def add_failed(self, task_id: str, original_filename: str, error_message: str):
+        """記錄一筆在進入佇列前就失敗的工作 (例如檔案無法保存)。"""
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO transcription_jobs (id, status, original_filename, error_message, created_at, finished_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (task_id, ERROR, original_filename, error_message, now, now),
+        )
+
+    # --- 消費者 (工作進程) ---
+
+    def claim(self, worker_id: str) -> Optional[dict]:
+        """
+        原子地領取最早的一筆等待中的工作。
+
+        :return: 工作內容；佇列為空時返回 None。
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM transcription_jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE transcription_jobs SET status = ?, worker_id = ?, started_at = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (PROCESSING, worker_id, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        job = dict(row)
+        job.update(status=PROCESSING, worker_id=worker_id, started_at=now, attempts=row["attempts"] + 1)
+        return job
+
+    def add_chunks(self, task_id: str, spans: Sequence[Tuple[float, Optional[float]]]) -> int:
+        """
+        為一筆已領取的工作建立區段。工作被重新領取時 (例如工作進程意外結束後)，
+        已建立的區段與已完成的結果會被保留，不會重新規劃。
+
+        :param spans: [(開始秒數, 結束秒數)]；結束為 None 代表整個檔案。
+        :return: 區段數量。
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            total = conn.execute("SELECT COUNT(*) FROM transcription_chunks WHERE job_id = ?", (task_id,)).fetchone()[0]
+            if not total:
+                conn.executemany(
+                    "INSERT INTO transcription_chunks (job_id, chunk_index, start_seconds, end_seconds, status) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(task_id, index, start, end, QUEUED) for index, (start, end) in enumerate(spans)],
+                )
+                total = len(spans)
+                conn.execute("UPDATE transcription_jobs SET chunks_total = ? WHERE id = ?", (total, task_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return total
+
+    def claim_chunk(self, worker_id: str) -> Optional[dict]:
+        """
+        原子地領取一個等待中的區段；最早的工作優先，同一工作中按時間順序，讓前面的文字最先出現。
+
+        :return: 工作欄位加上 chunk_index、start_seconds、end_seconds；沒有可領取的區段時返回 None。
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT c.job_id, c.chunk_index, c.start_seconds, c.end_seconds, c.attempts, "
+                "j.original_filename, j.file_path, j.chunks_total "
+                "FROM transcription_chunks c JOIN transcription_jobs j ON j.id = c.job_id "
+                "WHERE c.status = ? AND j.status = ? ORDER BY j.created_at, c.chunk_index LIMIT 1",
+                (QUEUED, PROCESSING),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE transcription_chunks SET status = ?, worker_id = ?, attempts = attempts + 1 "
+                "WHERE job_id = ? AND chunk_index = ?",
+                (PROCESSING, worker_id, row["job_id"], row["chunk_index"]),
+            )
+            # 重新執行的區段：丟棄上次未完成時留下的片段
+            conn.execute("DELETE FROM transcription_segments WHERE job_id = ? AND chunk_index = ?",
+                         (row["job_id"], row["chunk_index"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        work = dict(row)
+        work["id"] = work.pop("job_id")
+        work["attempts"] += 1
+        return work
+
+    def add_segment(self, task_id: str, chunk_index: int, start_seconds: float, end_seconds: float, text: str):
+        """
+        記錄一個剛轉寫完成的片段 (時間為相對於整個檔案的秒數)。
+
+        片段記下區段目前的領取次數：區段只有在原本的工作進程結束後才會被重新領取，
+        所以寫入者一定是最後一次領取它的進程；串流端點以此判斷客戶端看過的片段是否已被丟棄。
+        """
+        self._conn().execute(
+            "INSERT INTO transcription_segments (job_id, chunk_index, start_seconds, end_seconds, text, attempt) "
+            "VALUES (?, ?, ?, ?, ?, COALESCE((SELECT attempts FROM transcription_chunks "
+            "WHERE job_id = ? AND chunk_index = ?), 1))",
+            (task_id, chunk_index, start_seconds, end_seconds, text, task_id, chunk_index),
+        )
+
+    def complete_chunk(self, task_id: str, chunk_index: int, result: str, mode: str) -> bool:
+        """
+        標記區段完成；若這是工作的最後一個區段，依區段順序組合完整結果並完成整筆工作。
+
+        :return: 整筆工作是否因此完成。
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE transcription_chunks SET status = ?, result = ?, mode = ? WHERE job_id = ? AND chunk_index = ?",
+                (COMPLETED, result, mode, task_id, chunk_index),
+            )
+            remaining = conn.execute(
+                "SELECT COUNT(*) FROM transcription_chunks WHERE job_id = ? AND status != ?", (task_id, COMPLETED)
+            ).fetchone()[0]
+            finished = False
+            if not remaining:
+                rows = conn.execute(
+                    "SELECT result, mode FROM transcription_chunks WHERE job_id = ? ORDER BY chunk_index", (task_id,)
+                ).fetchall()
+                modes = {r["mode"] for r in rows}
+                finished = self._finish_job(conn, task_id, " ".join(r["result"] for r in rows if r["result"]),
+                                            "mock" if "mock" in modes else mode)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return finished
+
+    def fail_chunk(self, task_id: str, chunk_index: int, error_message: str):
+        """任何一個區段失敗，整筆工作即標記為錯誤；尚未開始的區段不再執行。"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE transcription_chunks SET status = ? WHERE job_id = ? AND (chunk_index = ? OR status = ?)",
+                (ERROR, task_id, chunk_index, QUEUED),
+            )
+            self._fail_job(conn, task_id, error_message, only_processing=True)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def complete(self, task_id: str, result: str, mode: str):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._finish_job(conn, task_id, result, mode)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def fail(self, task_id: str, error_message: str):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._fail_job(conn, task_id, error_message)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # --- 結束工作 (在呼叫者的交易中執行) ---
+
+    @staticmethod
+    def _settle_duplicates(conn: sqlite3.Connection, task_id: str):
+        """把附加在此工作上的重複提交同步為此工作的最終狀態與結果。"""
+        conn.execute(
+            "UPDATE transcription_jobs SET (status, result, mode, error_message, finished_at) = "
+            "(SELECT status, result, mode, error_message, finished_at FROM transcription_jobs WHERE id = ?) "
+            "WHERE duplicate_of = ? AND status = ?",
+            (task_id, task_id, DUPLICATE),
+        )
+
+    def _finish_job(self, conn: sqlite3.Connection, task_id: str, result: str, mode: str) -> bool:
+        """完成工作、同步重複的提交，並把真實轉寫的結果寫入轉寫快取。"""
+        now = time.time()
+        finished = conn.execute(
+            "UPDATE transcription_jobs SET status = ?, result = ?, mode = ?, finished_at = ? "
+            "WHERE id = ? AND status IN (?, ?)",
+            (COMPLETED, result, mode, now, task_id, QUEUED, PROCESSING),
+        ).rowcount > 0
+        if not finished:
+            return False
+        self._settle_duplicates(conn, task_id)
+        # 模擬結果 (模型無法載入時的退路) 不寫入快取
+        if mode == "real":
+            conn.execute(
+                "INSERT OR REPLACE INTO transcript_cache (cache_key, result, mode, source_task_id, created_at) "
+                "SELECT cache_key, ?, ?, id, ? FROM transcription_jobs WHERE id = ? AND cache_key IS NOT NULL",
+                (result, mode, now, task_id),
+            )
+        return True
+
+    def _fail_job(self, conn: sqlite3.Connection, task_id: str, error_message: str, only_processing: bool = False):
+        where = "id = ? AND status = ?" if only_processing else "id = ?"
+        params = (task_id, PROCESSING) if only_processing else (task_id,)
+        conn.execute(
+            f"UPDATE transcription_jobs SET status = ?, error_message = ?, finished_at = ? WHERE {where}",
+            (ERROR, error_message, time.time(), *params),
+        )
+        self._settle_duplicates(conn, task_id)
+
+    # --- 恢復 ---
+
+    def requeue_in_flight(self, worker_ids: Optional[List[str]] = None) -> int:
+        """
+        把處理中的工作放回佇列；已達重試上限的則標記為錯誤。
+
+        :param worker_ids: 只處理這些工作進程手上的工作；None 代表全部 (服務啟動時使用)。
+        :return: 被放回佇列的工作數量。
+        """
+        conn = self._conn()
+        where, params = "status = ?", [PROCESSING]
+        if worker_ids is not None:
+            if not worker_ids:
+                return 0
+            where += f" AND worker_id IN ({', '.join('?' * len(worker_ids))})"
+            params.extend(worker_ids)
+        give_up = "轉寫工作進程多次意外結束，已放棄此任務。"
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 已規劃區段的工作由區段記錄進度，只需恢復區段；尚未規劃的工作整筆放回佇列
+            job_where = f"{where} AND chunks_total IS NULL"
+            exhausted_jobs = conn.execute(
+                f"SELECT id FROM transcription_jobs WHERE {job_where} AND attempts >= ?",
+                [*params, self.max_attempts],
+            ).fetchall()
+            for row in exhausted_jobs:
+                self._fail_job(conn, row["id"], give_up)
+            requeued = conn.execute(
+                f"UPDATE transcription_jobs SET status = ?, worker_id = NULL, started_at = NULL WHERE {job_where}",
+                [QUEUED, *params],
+            ).rowcount
+
+            exhausted = conn.execute(
+                f"SELECT DISTINCT job_id FROM transcription_chunks WHERE {where} AND attempts >= ?",
+                [*params, self.max_attempts],
+            ).fetchall()
+            for row in exhausted:
+                conn.execute("UPDATE transcription_chunks SET status = ? WHERE job_id = ? AND status IN (?, ?)",
+                             (ERROR, row["job_id"], QUEUED, PROCESSING))
+                self._fail_job(conn, row["job_id"], give_up, only_processing=True)
+            requeued += conn.execute(
+                f"UPDATE transcription_chunks SET status = ?, worker_id = NULL WHERE {where}",
+                [QUEUED, *params],
+            ).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return requeued
+
+    # --- 查詢 ---
+
+    def get(self, task_id: str) -> Optional[dict]:
+        row = self._conn().execute("SELECT * FROM transcription_jobs WHERE id = ?", (task_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_segments(self, task_id: str, after_id: int = 0) -> List[dict]:
+        """
+        返回某筆工作已轉寫的片段 (依寫入順序)。
+
+        :param after_id: 只返回 id 大於此值的片段，用於串流時只取新的片段。
+        """
+        rows = self._conn().execute(
+            "SELECT id, chunk_index, start_seconds, end_seconds, text, attempt FROM transcription_segments "
+            "WHERE job_id = ? AND id > ? ORDER BY id",
+            (task_id, after_id),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def chunk_attempts(self, task_id: str) -> Dict[int, int]:
+        """返回 {區段編號: 目前的領取次數}；次數增加代表該區段被重新領取，之前的片段已被丟棄。"""
+        rows = self._conn().execute(
+            "SELECT chunk_index, attempts FROM transcription_chunks WHERE job_id = ?", (task_id,)
+        ).fetchall()
+        return {row["chunk_index"]: row["attempts"] for row in rows}
+
+    def chunk_progress(self, task_id: str) -> Tuple[int, int]:
+        """返回 (已完成的區段數, 區段總數)。"""
+        row = self._conn().execute(
+            "SELECT COALESCE(SUM(status = ?), 0), COUNT(*) FROM transcription_chunks WHERE job_id = ?",
+            (COMPLETED, task_id),
+        ).fetchone()
+        return row[0], row[1]
+
+    def count(self, status: str) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM transcription_jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def run_worker(job_queue: TranscriptionJobQueue, worker_id: str, transcribe: Callable[[dict, Callable], tuple],
+               stop_event, wakeup=None, poll_interval: float = 1.0,
+               handle_control: Optional[Callable[[], None]] = None,
+               plan: Optional[Callable[[dict], list]] = None):
+    """
+    工作進程的主迴圈：不斷領取並處理區段與工作，直到 stop_event 被設定。
+
+    :param transcribe: 轉寫一個區段的函式 transcribe(work, emit)，返回 (轉寫結果, 模式)。
+                       work 是工作欄位加上 chunk_index / start_seconds / end_seconds；
+                       每轉寫出一個片段就呼叫 emit(開始秒數, 結束秒數, 文字)。
+    :param wakeup: 每有一筆新工作就會被 release 一次的信號量；佇列為空時在此等待，
+                   poll_interval 只是保底的輪詢間隔。
+    :param handle_control: 每次領取工作前呼叫，用來處理控制訊息 (例如預載模型)。
+    :param plan: 規劃區段的函式 plan(job)，返回 [(開始秒數, 結束秒數或 None)]；None 代表整個檔案一個區段。
+    """
+    while not stop_event.is_set():
+        if handle_control is not None:
+            handle_control()
+        # 先幫忙完成進行中的工作，再領取新的工作
+        work = job_queue.claim_chunk(worker_id)
+        if work is not None:
+            _process_chunk(job_queue, work, transcribe)
+            continue
+        job = job_queue.claim(worker_id)
+        if job is None:
+            if wakeup is not None:
+                wakeup.acquire(timeout=poll_interval)
+            else:
+                stop_event.wait(poll_interval)
+            continue
+        try:
+            spans = plan(job) if plan is not None else [(0.0, None)]
+            total = job_queue.add_chunks(job["id"], spans)
+        except Exception as e:
+            job_queue.fail(job["id"], str(e))
+            continue
+        # 喚醒其他閒置的工作進程，一起轉寫其餘的區段
+        if wakeup is not None:
+            for _ in range(total - 1):
+                wakeup.release()
+
+
+def _process_chunk(job_queue: TranscriptionJobQueue, work: dict, transcribe: Callable[[dict, Callable], tuple]):
+    def emit(start_seconds: float, end_seconds: float, text: str):
+        job_queue.add_segment(work["id"], work["chunk_index"], start_seconds, end_seconds, text)
+
+    try:
+        result, mode = transcribe(work, emit)
+        job_queue.complete_chunk(work["id"], work["chunk_index"], result, mode)
+    except Exception as e:
+        job_queue.fail_chunk(work["id"], work["chunk_index"], str(e))
+
+
+def _worker_process_main(db_path: str, worker_id: str, stop_event, wakeup, control_queue):
+    """工作進程的進入點 (以 spawn 啟動，因此只在這裡才匯入轉寫邏輯與模型)。"""
+    from transcriber import logic
+
+    def handle_control():
+        while True:
+            try:
+                message = control_queue.get_nowait()
+            except queue.Empty:
+                return
+            logic.handle_control_message(message)
+
+    job_queue = TranscriptionJobQueue(Path(db_path))
+    try:
+        run_worker(job_queue, worker_id, logic.transcribe_job, stop_event, wakeup,
+                   handle_control=handle_control, plan=logic.plan_job)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        job_queue.close()
+
+
+class TranscriptionWorkerPool:
+    """
+    管理固定數量的轉寫工作進程，並監督它們的存活狀態。
+    """
+
+    def __init__(self, db_path: Path = DEFAULT_DB_PATH, num_workers: int = DEFAULT_NUM_WORKERS,
+                 monitor_interval: float = 1.0):
+        """
+        :param db_path: 工作佇列的資料庫路徑。
+        :param num_workers: 工作進程數量。
+        :param monitor_interval: 監督執行緒檢查工作進程存活狀態的間隔 (秒)。
+        """
+        self.db_path = Path(db_path)
+        self.num_workers = max(1, num_workers)
+        self.monitor_interval = monitor_interval
+        # 使用 spawn：API 進程有事件迴圈與多個執行緒，fork 它並不安全
+        self._ctx = mp.get_context("spawn")
+        self._stop_event = self._ctx.Event()
+        # 以信號量而非 Event 喚醒工作進程：等待中的進程被強制終止時，
+        # multiprocessing.Event 內部的 Condition 會讓之後的 set() 永遠阻塞，信號量則不受影響
+        self._wakeup = self._ctx.Semaphore(0)
+        self._workers: dict = {}
+        self._controls: dict = {}
+        # 要重播給重新啟動的工作進程的控制訊息：每個鍵只保留最新一則，依最後廣播的先後排列
+        self._broadcasts: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._monitor: Optional[threading.Thread] = None
+        self._monitor_stop = threading.Event()
+
+    def start(self):
+        """啟動所有工作進程與監督執行緒。"""
+        self._stop_event.clear()
+        self._monitor_stop.clear()
+        for index in range(self.num_workers):
+            self._spawn(f"worker-{index}")
+        self._monitor = threading.Thread(target=self._monitor_loop, name="TranscriberPoolMonitor", daemon=True)
+        self._monitor.start()
+        print(f"已啟動 {self.num_workers} 個轉寫工作進程。")
+
+    def _spawn(self, worker_id: str):
+        # 每個工作進程有自己的控制佇列，重新啟動時也換一個新的
+        control_queue = self._ctx.Queue()
+        for message in self._broadcasts.values():
+            control_queue.put(message)
+        process = self._ctx.Process(
+            target=_worker_process_main,
+            args=(str(self.db_path), worker_id, self._stop_event, self._wakeup, control_queue),
+            name=f"transcriber-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        self._workers[worker_id] = process
+        self._controls[worker_id] = control_queue
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def broadcast(self, message, replay_key: Optional[Hashable] = None) -> int:
+        """
+        把控制訊息送給所有工作進程 (閒置的進程會立即被喚醒處理)。
+
+        :param message: 控制訊息。
+        :param replay_key: 重播用的鍵；重新啟動的工作進程會收到每個鍵最新的一則訊息
+                           (最多 MAX_REPLAYED_BROADCASTS 則，最舊的先被捨棄)。None 代表不重播。
+        :return: 收到訊息的工作進程數量。
+        """
+        if replay_key is not None:
+            self._broadcasts.pop(replay_key, None)
+            self._broadcasts[replay_key] = message
+            while len(self._broadcasts) > MAX_REPLAYED_BROADCASTS:
+                self._broadcasts.popitem(last=False)
+        for control_queue in self._controls.values():
+            control_queue.put(message)
+        for _ in self._controls:
+            self._wakeup.release()
+        return len(self._controls)
+
+    def notify(self):
+        """通知一個閒置的工作進程有新工作。"""
+        self._wakeup.release()
+
+    def _monitor_loop(self):
+        job_queue = TranscriptionJobQueue(self.db_path)
+        try:
+            while not self._monitor_stop.wait(self.monitor_interval):
+                dead = [wid for wid, proc in self._workers.items() if not proc.is_alive()]
+                if not dead or self._stop_event.is_set():
+                    continue
+                requeued = job_queue.requeue_in_flight(dead)
+                print(f"轉寫工作進程 {dead} 意外結束，已重新啟動 (放回佇列的工作: {requeued})。")
+                for worker_id in dead:
+                    self._spawn(worker_id)
+                self.notify()
+        finally:
+            job_queue.close()
+
+    def stop(self, timeout: float = 10.0):
+        """通知所有工作進程在完成手上的工作後結束；逾時未結束的會被強制終止。"""
+        self._monitor_stop.set()
+        if self._monitor is not None:
+            self._monitor.join(timeout=timeout)
+        self._stop_event.set()
+        for _ in self._workers:
+            self._wakeup.release()
+        deadline = time.monotonic() + timeout
+        for process in self._workers.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+        self._workers.clear()
+        self._controls.clear()
@@ -2,94 +2,228 @@
 """
 語音轉寫 App 的核心業務邏輯
 """
+import hashlib
 import os
-import shutil
 import uuid
 from pathlib import Path
+from typing import Dict, Optional
 
 from fastapi import UploadFile
 
-# --- 嘗試導入大型依賴 ---
-try:
-    from faster_whisper import WhisperModel
-    _FASTER_WHISPER_AVAILABLE = True
-except ImportError:
-    _FASTER_WHISPER_AVAILABLE = False
+from transcriber import chunking
+from transcriber.job_queue import COMPLETED, DUPLICATE, ERROR, PROCESSING, TranscriptionJobQueue, TranscriptionWorkerPool
+from transcriber.models import ModelLoadError, ModelSettings, WhisperModelManager
 
 # --- 全局變數與設定 ---
-# 在真實模式下，我們會初始化一個模型
-# 注意：這在生產環境中應該有更複雜的模型管理
-MODEL_SIZE = "tiny" # 使用一個小模型以加快速度
-_model = None
-
-if _FASTER_WHISPER_AVAILABLE:
-    # 這裡的下載只會在第一次執行時發生
-    # 在 launch.py 啟動時，這會被觸發
-    try:
-        _model = WhisperModel(MODEL_SIZE, device="cpu", compute_type="int8")
-    except Exception as e:
-        print(f"警告：無法初始化 Whisper 模型: {e}")
-        _model = None
-
+# 模型在工作進程第一次轉寫時才載入，API 進程本身不載入模型
+model_settings = ModelSettings()
+model_manager = WhisperModelManager()
 
 UPLOAD_DIRECTORY = Path("transcriber_uploads")
 UPLOAD_DIRECTORY.mkdir(exist_ok=True)
+# 保存上傳檔案時每次讀取的大小 (同時計算內容雜湊值)
+UPLOAD_READ_SIZE = 1024 * 1024
+
+# 持久化的任務佇列 (取代原本記憶體中的 tasks 字典，服務重啟後任務不會遺失)
+job_queue = TranscriptionJobQueue()
+# 由 main.py 在服務啟動時建立；未啟動時 (例如測試)，真實模式的任務會留在佇列中等待
+worker_pool: Optional[TranscriptionWorkerPool] = None
+
+
+def _is_mock_mode() -> bool:
+    # os.environ.get("APP_MOCK_MODE") == "true" 是由我們的測試腳本設定的
+    return not model_manager.available or os.environ.get("APP_MOCK_MODE") == "true"
+
+
+def _mock_result(filename: str) -> str:
+    return f"這是 '{filename}' 的模擬轉寫結果。"
+
+
+def _cache_key(content_hash: str) -> str:
+    """轉寫快取的鍵：內容雜湊值加上會影響轉寫結果的模型與束搜尋設定。"""
+    return f"{content_hash}:{model_settings.model_size}:{model_settings.compute_type}:{model_settings.beam_size}"
 
-# 模擬一個任務資料庫
-tasks = {}
 
 def process_audio_file(file: UploadFile) -> str:
     """
-    處理上傳的音訊檔案，並啟動一個轉寫任務。
+    保存上傳的音訊檔案，並建立一個轉寫任務。
 
-    - 如果處於真實模式 (`faster-whisper` 可用)，則執行轉寫。
-    - 如果處於模擬模式，則返回一個模擬結果。
+    - 如果處於真實模式，任務會進入佇列，由背景工作進程轉寫；此函式不等待轉寫完成。
+      轉寫過的相同內容直接從快取完成，與處理中的任務內容相同時則附加到該任務上。
+    - 如果處於模擬模式，任務直接以模擬結果完成。
     """
     task_id = str(uuid.uuid4())
     safe_filename = Path(file.filename).name
     file_path = UPLOAD_DIRECTORY / f"{task_id}_{safe_filename}"
 
     try:
-        # 保存上傳的檔案
+        # 保存上傳的檔案，並在寫入的同時計算內容雜湊值
+        hasher = hashlib.sha256()
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            while chunk := file.file.read(UPLOAD_READ_SIZE):
+                hasher.update(chunk)
+                buffer.write(chunk)
 
         file.file.close()
 
-        # 根據是否能使用模型來決定行為
-        # os.environ.get("APP_MOCK_MODE") == "true" 是由我們的測試腳本設定的
-        if not _FASTER_WHISPER_AVAILABLE or os.environ.get("APP_MOCK_MODE") == "true" or _model is None:
+        if _is_mock_mode():
             # --- 模擬模式 ---
-            tasks[task_id] = {
-                "status": "completed",
-                "original_filename": safe_filename,
-                "result": f"這是 '{safe_filename}' 的模擬轉寫結果。",
-                "mode": "mock"
-            }
+            job_queue.add_completed(task_id, safe_filename, _mock_result(safe_filename), mode="mock")
         else:
             # --- 真實模式 ---
-            tasks[task_id] = {
-                "status": "processing",
-                "original_filename": safe_filename,
-                "result": None,
-                "mode": "real"
-            }
-            # 實際執行轉寫
-            segments, _ = _model.transcribe(str(file_path), beam_size=5)
-            transcription = " ".join([segment.text for segment in segments])
-
-            tasks[task_id]["status"] = "completed"
-            tasks[task_id]["result"] = transcription
+            outcome, _ = job_queue.submit(task_id, safe_filename, file_path, _cache_key(hasher.hexdigest()))
+            if outcome == "queued":
+                if worker_pool is not None:
+                    worker_pool.notify()
+            else:
+                # 結果來自快取或另一個處理中的任務，不需要保留這份重複的檔案
+                file_path.unlink(missing_ok=True)
 
         return task_id
     except Exception as e:
-        # 如果轉寫過程出錯，也記錄下來
-        tasks[task_id] = {"status": "error", "error_message": str(e)}
+        # 如果保存或建立任務時出錯，也記錄下來
+        job_queue.add_failed(task_id, safe_filename, str(e))
         return task_id
 
 
+def plan_job(job: dict) -> list:
+    """在工作進程中規劃一筆任務的轉寫區段 (長的 WAV 檔按靜音切段)。"""
+    if not model_manager.available:
+        return list(chunking.WHOLE_FILE)
+    return chunking.plan_chunks(Path(job["file_path"]))
+
+
+def transcribe_job(job: dict, emit) -> tuple:
+    """
+    在工作進程中轉寫一筆任務的一個區段。
+
+    :param job: 任務欄位加上區段的 chunk_index / start_seconds / end_seconds。
+    :param emit: 每轉寫出一個片段就呼叫 emit(開始秒數, 結束秒數, 文字)，讓狀態查詢即時看到部分結果。
+    :return: (轉寫結果, 模式)；模型無法載入時退回模擬結果，與原本的行為相同。
+    """
+    try:
+        with model_manager.use(model_settings) as model:
+            if job["end_seconds"] is None:
+                audio, offset = job["file_path"], 0.0
+            else:
+                # 只讀取這個區段的音訊，記憶體用量與檔案長度無關
+                audio = chunking.read_chunk(Path(job["file_path"]), job["start_seconds"], job["end_seconds"])
+                offset = job["start_seconds"]
+            segments, _ = model.transcribe(audio, beam_size=model_settings.beam_size,
+                                           vad_filter=chunking.VAD_FILTER)
+            # segments 是生成器：每個片段一解碼出來就回報，不必等整段完成
+            texts = []
+            for segment in segments:
+                emit(offset + segment.start, offset + segment.end, segment.text)
+                texts.append(segment.text)
+            return " ".join(texts), "real"
+    except ModelLoadError as e:
+        print(f"警告：無法初始化 Whisper 模型: {e}")
+        return _mock_result(job["original_filename"]), "mock"
+
+
+def handle_control_message(message: tuple):
+    """處理工作進程收到的控制訊息。"""
+    kind, payload = message
+    if kind == "warmup":
+        model_manager.warm_up(ModelSettings(**payload))
+
+
+def warm_up_models(overrides: dict) -> dict:
+    """
+    預載模型：工作進程已啟動時通知每個工作進程預載，否則在目前進程中預載。
+
+    :param overrides: 覆寫預設模型設定的欄位 (model_size, device, compute_type, cpu_threads)。
+    """
+    settings = ModelSettings(**{**model_settings.to_dict(), **overrides})
+    payload = {k: v for k, v in settings.to_dict().items() if k != "beam_size"}
+    if worker_pool is not None and worker_pool.running:
+        # 同一組模型設定只需重播最新的一次預載給重新啟動的工作進程
+        workers = worker_pool.broadcast(("warmup", payload), replay_key=("warmup",) + settings.key())
+        return {"status": "scheduled", "workers": workers, "settings": payload}
+    loaded = model_manager.warm_up(settings)
+    return {"status": "loaded" if loaded else "failed", "workers": 0, "settings": payload}
+
+
+def get_model_info() -> dict:
+    """返回目前的模型設定與 (本進程中) 已載入的模型。"""
+    return {
+        "available": model_manager.available,
+        "storage_strategy": model_manager.storage_strategy,
+        "settings": model_settings.to_dict(),
+        "loaded_in_api_process": model_manager.loaded_models(),
+        "workers": worker_pool.num_workers if worker_pool is not None and worker_pool.running else 0,
+    }
+
+
 def get_task_status(task_id: str) -> dict:
     """
     根據任務 ID 獲取轉寫任務的狀態和結果。
     """
-    return tasks.get(task_id, {"status": "not_found"})
+    job = job_queue.get(task_id)
+    if job is None:
+        return {"status": "not_found"}
+    original_filename = job["original_filename"]
+    source_task_id = job["duplicate_of"]
+    if job["status"] == DUPLICATE:
+        # 附加在處理中的任務上：返回該任務目前的進度
+        job = job_queue.get(source_task_id) or job
+    status = {
+        "status": job["status"],
+        "original_filename": original_filename,
+        "result": job["result"],
+        "mode": job["mode"],
+    }
+    if source_task_id:
+        status["deduplicated_from"] = source_task_id
+    if job["status"] == ERROR:
+        status["error_message"] = job["error_message"]
+    if job["chunks_total"]:
+        completed, total = job_queue.chunk_progress(job["id"])
+        status["progress"] = {"chunks_completed": completed, "chunks_total": total}
+    # 各區段平行轉寫，片段的寫入順序不一定是時間順序；重複的內容使用來源任務的片段
+    segments = sorted(job_queue.get_segments(source_task_id or task_id),
+                      key=lambda seg: (seg["start_seconds"], seg["id"]))
+    status["segments"] = [_public_segment(seg) for seg in segments]
+    if job["status"] == PROCESSING:
+        status["partial_result"] = " ".join(seg["text"] for seg in segments)
+    return status
+
+
+def _public_segment(segment: dict) -> dict:
+    return {"start": segment["start_seconds"], "end": segment["end_seconds"], "text": segment["text"]}
+
+
+def get_task_updates(task_id: str, after_id: int = 0, sent_attempts: Optional[Dict[int, int]] = None) -> dict:
+    """
+    返回串流端點所需的增量更新：上次之後新增的片段、被重新轉寫的區段，以及任務結束時的最終狀態。
+
+    :param after_id: 上次已送出的最後一個片段 id。
+    :param sent_attempts: {區段編號: 已送出片段的領取次數}；區段之後被重新領取時，
+                          它在 resets 中返回，客戶端應丟棄該區段已收到的片段。
+    """
+    # 先讀狀態再讀片段：若狀態已是完成，之後讀到的片段必定完整
+    job = job_queue.get(task_id)
+    if job is None:
+        return {"status": "not_found", "resets": [], "segments": []}
+    if job["status"] == DUPLICATE:
+        job = job_queue.get(job["duplicate_of"]) or job
+    source_id = job["duplicate_of"] or job["id"]
+    sent_attempts = sent_attempts or {}
+    # 先讀領取次數再讀片段：讀到的新片段若來自更新的領取，也會被視為重設
+    attempts = job_queue.chunk_attempts(source_id) if sent_attempts else {}
+    segments = job_queue.get_segments(source_id, after_id)
+    resets = {chunk for chunk, attempt in sent_attempts.items() if attempts.get(chunk, attempt) > attempt}
+    resets.update(seg["chunk_index"] for seg in segments
+                  if seg["chunk_index"] in sent_attempts and seg["attempt"] > sent_attempts[seg["chunk_index"]])
+    updates = {
+        "status": job["status"],
+        "resets": sorted(resets),
+        "segments": [{"id": seg["id"], "chunk": seg["chunk_index"], "attempt": seg["attempt"], **_public_segment(seg)}
+                     for seg in segments],
+    }
+    if job["status"] in (COMPLETED, ERROR):
+        final = get_task_status(task_id)
+        final.pop("segments", None)
+        updates["final"] = final
+    return updates
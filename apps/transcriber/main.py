@@ -2,17 +2,22 @@
 """
 語音轉寫 App (Transcriber) - FastAPI 伺服器入口
 """
-import os
-
 # 這裡我們需要能夠導入同目錄下的 logic 模組
 # 在微服務架構中，每個 App 都是一個獨立的執行單元
 # 所以我們需要確保 Python 的導入路徑是正確的
+import asyncio
+import json
+import os
 import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import Optional
 
 import uvicorn
-from fastapi import FastAPI, File, HTTPException, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import Body, FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 
 # 將 'apps' 目錄添加到 sys.path
 # 這樣 `from transcriber import logic` 才能正確工作
@@ -20,18 +25,40 @@ from fastapi.responses import JSONResponse
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from transcriber import logic
+from transcriber.job_queue import TranscriptionWorkerPool
+
+
+# --- Lifespan 事件處理 ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 啟動時：把上次未完成的任務放回佇列，再啟動背景工作進程
+    requeued = logic.job_queue.requeue_in_flight()
+    if requeued:
+        print(f"已將 {requeued} 個上次未完成的轉寫任務放回佇列。")
+    logic.worker_pool = TranscriptionWorkerPool(logic.job_queue.db_path)
+    logic.worker_pool.start()
+    # 可選：啟動時就讓每個工作進程預載預設模型 (TRANSCRIBER_PRELOAD_MODEL=1)
+    if os.environ.get("TRANSCRIBER_PRELOAD_MODEL", "").lower() in ("1", "true", "yes"):
+        logic.warm_up_models({})
+    yield
+    # 關閉時：等待工作進程完成手上的任務
+    print("語音轉寫服務正在關閉，停止背景工作進程...")
+    logic.worker_pool.stop()
+    logic.worker_pool = None
 
 # 建立 FastAPI 應用實例
 app = FastAPI(
     title="鳳凰之心 - 語音轉寫服務 (Transcriber App)",
     description="一個獨立的微服務，負責接收音訊檔案並進行語音轉寫。",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 @app.post("/upload", summary="上傳音訊檔案以進行轉寫")
 async def upload_audio(file: UploadFile = File(...)):
     """
-    接收使用者上傳的音訊檔案，並啟動轉寫任務。
+    接收使用者上傳的音訊檔案，並建立轉寫任務。
+    轉寫由背景工作進程執行，此端點在檔案保存後立即返回。
 
     - **file**: 必要參數，使用者上傳的音訊檔案。
 
@@ -41,11 +68,12 @@ async def upload_audio(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="沒有提供檔案。")
 
     # 使用業務邏輯層來處理檔案
-    task_id = logic.process_audio_file(file)
+    # 保存檔案與寫入佇列都是阻塞 I/O，放到執行緒池中執行
+    task_id = await run_in_threadpool(logic.process_audio_file, file)
 
     return JSONResponse(
         status_code=202,  # 202 Accepted: 請求已被接受處理，但處理尚未完成
-        content={"message": "檔案已成功上傳並開始處理。", "task_id": task_id}
+        content={"message": "檔案已成功上傳，已加入轉寫佇列。", "task_id": task_id}
     )
 
 @app.get("/status/{task_id}", summary="查詢轉寫任務的狀態與結果")
@@ -57,12 +85,73 @@ async def get_transcription_status(task_id: str):
 
     如果任務完成，將在 `result` 欄位中包含轉寫文字。
     """
-    status_info = logic.get_task_status(task_id)
+    status_info = await run_in_threadpool(logic.get_task_status, task_id)
     if status_info.get("status") == "not_found":
         raise HTTPException(status_code=404, detail=f"找不到任務 ID: {task_id}")
 
     return JSONResponse(content=status_info)
 
+# 串流端點檢查新片段的間隔 (秒)
+STREAM_POLL_SECONDS = 0.5
+
+@app.get("/status/{task_id}/stream", summary="以 Server-Sent Events 串流轉寫片段")
+async def stream_transcription(task_id: str, request: Request):
+    """
+    以 SSE 即時推送轉寫出的片段，長錄音不必等整個檔案完成就能看到文字。
+
+    - `segment` 事件：一個新片段 (`id`, `chunk`, `attempt`, `start`, `end`, `text`)；
+      各區段平行轉寫，片段不一定依時間順序送達，請以 `start` 排序。
+    - `chunk_reset` 事件 (`chunk`)：該區段的工作進程意外結束、區段被重新轉寫，
+      請丟棄此區段先前收到的所有片段；重新轉寫的片段會以新的 `segment` 事件送達。
+    - `status` 事件：任務完成或失敗時送出最終狀態，之後串流結束。
+    """
+    first = await run_in_threadpool(logic.get_task_updates, task_id)
+    if first["status"] == "not_found":
+        raise HTTPException(status_code=404, detail=f"找不到任務 ID: {task_id}")
+
+    async def events():
+        updates, last_id, sent_attempts = first, 0, {}
+        while True:
+            for chunk in updates["resets"]:
+                sent_attempts.pop(chunk, None)
+                yield f"event: chunk_reset\ndata: {json.dumps({'chunk': chunk})}\n\n"
+            for segment in updates["segments"]:
+                last_id = segment["id"]
+                sent_attempts[segment["chunk"]] = segment["attempt"]
+                yield f"event: segment\ndata: {json.dumps(segment, ensure_ascii=False)}\n\n"
+            if "final" in updates:
+                yield f"event: status\ndata: {json.dumps(updates['final'], ensure_ascii=False)}\n\n"
+                return
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(STREAM_POLL_SECONDS)
+            updates = await run_in_threadpool(logic.get_task_updates, task_id, last_id, dict(sent_attempts))
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+class WarmUpRequest(BaseModel):
+    model_size: Optional[str] = Field(None, description="模型大小，例如 tiny / base / small；未指定時使用部署設定")
+    device: Optional[str] = Field(None, description="cpu 或 cuda")
+    compute_type: Optional[str] = Field(None, description="例如 int8 / float16")
+    cpu_threads: Optional[int] = Field(None, ge=0, description="CPU 執行緒數，0 代表自動")
+
+@app.post("/models/warmup", summary="預先載入 Whisper 模型")
+async def warm_up_models(request: WarmUpRequest = Body(WarmUpRequest())):
+    """
+    在流量到來前預載模型，避免第一個任務承擔模型載入時間。
+    背景工作進程已啟動時，每個工作進程都會在閒置時載入 (返回 202)；否則在 API 進程中載入。
+    """
+    overrides = request.model_dump(exclude_none=True)
+    result = await run_in_threadpool(logic.warm_up_models, overrides)
+    return JSONResponse(status_code=202 if result["status"] == "scheduled" else 200, content=result)
+
+@app.get("/models", summary="查詢模型設定")
+async def get_models():
+    """
+    返回目前部署的模型設定、儲存策略與工作進程數量。
+    """
+    return logic.get_model_info()
+
 @app.get("/health", summary="服務健康檢查")
 def health_check():
     """
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+語音轉寫 App 的 Whisper 模型管理
+
+- 模型在第一次使用時才載入；匯入模組 (例如 API 進程或測試收集) 不會載入任何模型。
+- 已載入的模型以 (大小, 裝置, 計算類型, 執行緒數) 為鍵快取，同一個工作進程中的任務共用。
+- 載入新模型前若記憶體使用率超過設定的閾值，會先釋放最久未使用且閒置中的模型。
+- 遵循 config/resource_settings.yml 中的 `model_storage_strategy`：
+  - "memory": 模型常駐記憶體，直到因記憶體壓力或數量上限被淘汰。
+  - "disk": 模型檔案保存在本機目錄，只在任務執行期間載入，任務結束即釋放記憶體。
+- 模型大小、束搜尋寬度等可由環境變數設定，不需修改程式碼。
+"""
+import gc
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+# --- 嘗試導入大型依賴 ---
+try:
+    from faster_whisper import WhisperModel
+    _FASTER_WHISPER_AVAILABLE = True
+except ImportError:
+    WhisperModel = None
+    _FASTER_WHISPER_AVAILABLE = False
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+RESOURCE_SETTINGS_PATH = Path(os.environ.get("TRANSCRIBER_RESOURCE_SETTINGS", "config/resource_settings.yml"))
+STORAGE_STRATEGIES = ("memory", "disk")
+
+# 模型快取的鍵: (模型大小, 裝置, 計算類型, CPU 執行緒數)
+ModelKey = Tuple[str, str, str, int]
+
+
+class ModelLoadError(RuntimeError):
+    """faster-whisper 未安裝或模型無法載入。"""
+
+
+class ModelSettings:
+    """單一部署的模型設定；預設值可由環境變數覆寫。"""
+
+    def __init__(self, model_size: Optional[str] = None, device: Optional[str] = None,
+                 compute_type: Optional[str] = None, cpu_threads: Optional[int] = None,
+                 beam_size: Optional[int] = None):
+        self.model_size = model_size or os.environ.get("TRANSCRIBER_MODEL_SIZE", "tiny")
+        self.device = device or os.environ.get("TRANSCRIBER_DEVICE", "cpu")
+        self.compute_type = compute_type or os.environ.get("TRANSCRIBER_COMPUTE_TYPE", "int8")
+        # 0 代表由 CTranslate2 自行決定
+        self.cpu_threads = int(cpu_threads if cpu_threads is not None else os.environ.get("TRANSCRIBER_CPU_THREADS", 0))
+        self.beam_size = int(beam_size if beam_size is not None else os.environ.get("TRANSCRIBER_BEAM_SIZE", 5))
+
+    def key(self) -> ModelKey:
+        return self.model_size, self.device, self.compute_type, self.cpu_threads
+
+    def to_dict(self) -> dict:
+        return {
+            "model_size": self.model_size,
+            "device": self.device,
+            "compute_type": self.compute_type,
+            "cpu_threads": self.cpu_threads,
+            "beam_size": self.beam_size,
+        }
+
+
+def load_resource_settings(path: Path = RESOURCE_SETTINGS_PATH) -> dict:
+    """讀取 resource_monitoring 設定區塊；檔案或 PyYAML 不存在時返回空字典。"""
+    if yaml is None or not path.exists():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return (yaml.safe_load(f) or {}).get("resource_monitoring", {}) or {}
+    except Exception as e:
+        print(f"警告：無法讀取資源設定 {path}: {e}")
+        return {}
+
+
+class WhisperModelManager:
+    """
+    惰性載入、可共用的 Whisper 模型快取。
+    """
+
+    def __init__(self, storage_strategy: Optional[str] = None, max_models: Optional[int] = None,
+                 memory_threshold_percent: Optional[float] = None, download_root: Optional[Path] = None):
+        """
+        :param storage_strategy: "memory" 或 "disk"；未指定時讀取 resource_settings.yml。
+        :param max_models: 同時常駐的模型數量上限。
+        :param memory_threshold_percent: 系統記憶體使用率超過此值時淘汰閒置的模型；未指定時讀取設定檔。
+        :param download_root: 模型檔案的本機目錄；"disk" 策略下預設為 transcriber_models/。
+        """
+        settings = load_resource_settings()
+        strategy = storage_strategy or settings.get("model_storage_strategy", "memory")
+        if strategy not in STORAGE_STRATEGIES:
+            print(f"警告：未知的 model_storage_strategy '{strategy}'，改用 'memory'。")
+            strategy = "memory"
+        self.storage_strategy = strategy
+        self.max_models = max_models or int(os.environ.get("TRANSCRIBER_MAX_MODELS", 2))
+        self.memory_threshold_percent = float(memory_threshold_percent if memory_threshold_percent is not None
+                                              else settings.get("memory_usage_threshold_percent", 75.0))
+        default_root = Path(os.environ.get("TRANSCRIBER_MODEL_DIR", "transcriber_models"))
+        self.download_root = download_root or (default_root if strategy == "disk" else None)
+
+        # 鍵 -> 模型，依最近使用的順序排列 (最舊的在前)
+        self._models: "OrderedDict[ModelKey, object]" = OrderedDict()
+        self._in_use: Dict[ModelKey, int] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[ModelKey, threading.Lock] = {}
+
+    @property
+    def available(self) -> bool:
+        return _FASTER_WHISPER_AVAILABLE
+
+    def loaded_models(self) -> list:
+        with self._lock:
+            return [dict(zip(("model_size", "device", "compute_type", "cpu_threads"), key)) for key in self._models]
+
+    # --- 載入與淘汰 ---
+
+    def _memory_pressure(self) -> bool:
+        if psutil is None:
+            return False
+        return psutil.virtual_memory().percent >= self.memory_threshold_percent
+
+    def _evict_idle(self, keep: ModelKey) -> int:
+        """
+        為即將載入的模型騰出空間：由最久未使用的開始釋放閒置中的模型，
+        直到模型數量低於上限且沒有記憶體壓力為止。
+        """
+        evicted = 0
+        while True:
+            with self._lock:
+                if len(self._models) < self.max_models and not self._memory_pressure():
+                    break
+                candidates = [k for k in self._models if k != keep and not self._in_use.get(k)]
+                if not candidates:
+                    break
+                del self._models[candidates[0]]
+            evicted += 1
+            gc.collect()
+        return evicted
+
+    def _load(self, key: ModelKey):
+        model_size, device, compute_type, cpu_threads = key
+        kwargs = {"device": device, "compute_type": compute_type, "cpu_threads": cpu_threads}
+        if self.download_root is not None:
+            self.download_root.mkdir(parents=True, exist_ok=True)
+            kwargs["download_root"] = str(self.download_root)
+        print(f"正在載入 Whisper 模型 {model_size} ({device}, {compute_type}, threads={cpu_threads})...")
+        return WhisperModel(model_size, **kwargs)
+
+    def get(self, settings: Optional[ModelSettings] = None):
+        """
+        取得 (必要時載入) 符合設定的模型。
+
+        :raises ModelLoadError: faster-whisper 未安裝或模型無法載入時。
+        """
+        if not _FASTER_WHISPER_AVAILABLE:
+            raise ModelLoadError("faster-whisper 未安裝，無法載入 Whisper 模型。")
+        key = (settings or ModelSettings()).key()
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # 同一個模型只載入一次；不同模型可以同時載入
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    return self._models[key]
+            evicted = self._evict_idle(keep=key)
+            if evicted:
+                print(f"已釋放 {evicted} 個閒置的 Whisper 模型。")
+            try:
+                model = self._load(key)
+            except Exception as e:
+                raise ModelLoadError(f"無法載入 Whisper 模型 {key[0]}: {e}") from e
+            with self._lock:
+                self._models[key] = model
+            return model
+
+    @contextmanager
+    def use(self, settings: Optional[ModelSettings] = None) -> Iterator[object]:
+        """
+        在任務期間使用模型；使用中的模型不會被淘汰。
+        "disk" 策略下，最後一個使用者結束時模型即被釋放。
+        """
+        settings = settings or ModelSettings()
+        key = settings.key()
+        with self._lock:
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+        try:
+            yield self.get(settings)
+        finally:
+            with self._lock:
+                self._in_use[key] -= 1
+                release = self.storage_strategy == "disk" and not self._in_use[key]
+                if release:
+                    self._models.pop(key, None)
+            if release:
+                gc.collect()
+
+    def warm_up(self, settings: Optional[ModelSettings] = None) -> bool:
+        """
+        預先載入模型 (若尚未載入)。"disk" 策略下只會確保模型檔案已下載到本機。
+
+        :return: 是否成功。
+        """
+        try:
+            if self.storage_strategy == "disk":
+                with self.use(settings):
+                    pass
+            else:
+                self.get(settings)
+            return True
+        except Exception as e:
+            print(f"警告：預載 Whisper 模型失敗: {e}")
+            return False
+
+    def clear(self):
+        """釋放所有閒置中的模型。"""
+        with self._lock:
+            for key in [k for k in self._models if not self._in_use.get(k)]:
+                del self._models[key]
+        gc.collect()
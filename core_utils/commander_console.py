@@ -2,28 +2,54 @@
 """
 鳳凰之心指揮中心 TUI 核心模組 (V3 架構)
 """
+import sys
 import time
 import threading
 from collections import deque
-from IPython.display import display, clear_output
+from IPython.display import display, Pretty
 import psutil
 import datetime
 
+PANEL_WIDTH = 56
+
+
+def _in_notebook() -> bool:
+    """是否在 Jupyter/Colab 核心中執行 (只有這時才能使用可原地更新的 display handle)。"""
+    try:
+        from IPython import get_ipython
+    except ImportError:
+        return False
+    shell = get_ipython()
+    return shell is not None and getattr(shell, "kernel", None) is not None
+
+
 class CommanderConsole:
     """
     管理 Colab 輸出儲存格的 TUI 儀表板。
-    使用 clear_output 和 print 實現，專為 V3 指揮中心架構設計。
+
+    - 日誌存放在固定大小的環形緩衝區；`add_log` 只做 O(1) 的附加並標記畫面需要更新。
+    - 由單一渲染執行緒依「幀預算」(每秒最多 max_fps 幀) 合併所有更新後再繪製，
+      日誌洪流期間的渲染成本是固定的，不會隨日誌數量增加。
+    - 畫面分為「近況彙報」與「狀態行」兩個區域，每一幀只重繪內容有變動的區域：
+      Notebook 中使用 display handle 原地更新 (不再 clear_output，因此不會閃爍)；
+      終端機中以 ANSI 游標移動只改寫變動的行；輸出被導向檔案/管線時則只附加新的日誌行。
     """
 
-    def __init__(self, max_log_entries=15):
+    def __init__(self, max_log_entries=15, max_fps=4.0, monitor_interval=1.0):
         """
         初始化儀表板。
-        :param max_log_entries: 上半部「近況彙報」區顯示的最大日誌行數。
+        :param max_log_entries: 上半部「近況彙報」區顯示的最大日誌行數 (亦即環形緩衝區大小)。
+        :param max_fps: 每秒最多重繪幾次。
+        :param monitor_interval: 背景資源取樣的間隔 (秒)。
         """
         self.log_buffer = deque(maxlen=max_log_entries)
+        self.max_fps = max_fps
+        self.monitor_interval = monitor_interval
         self._lock = threading.Lock()
         self._stop_event = threading.Event()
+        self._dirty = threading.Event()
         self._monitor_thread = None
+        self._render_thread = None
 
         # --- 即時狀態行的數據 ---
         self.start_time = time.time()
@@ -31,89 +57,168 @@ class CommanderConsole:
         self.ram_usage = 0.0
         self.status_tag = "[初始化中...]"
 
+        # --- 增量渲染狀態 ---
+        self._log_seq = 0            # 累計收到的日誌筆數 (作為每行的序號)
+        self._printed_seq = 0        # 附加模式下已輸出的最後一個序號
+        self._regions = {}           # 區域名稱 -> 上一次繪製的內容
+        self._handles = {}           # Notebook 模式下各區域的 display handle
+        self._terminal_lines = []    # 終端機模式下目前畫面上的每一行
+        self._mode = "notebook" if _in_notebook() else ("terminal" if sys.stdout.isatty() else "append")
+        self.frames_rendered = 0
+
+    # --- 畫面組成 ---
+
+    def _compose(self) -> dict:
+        """依目前狀態組出各區域的文字內容。"""
+        with self._lock:
+            logs_to_render = [line for _, line in self.log_buffer]
+
+        lines = [
+            "┌────────────────── 鳳凰之心指揮中心 V3 ──────────────────┐",
+            "│ 近況彙報 (最新日誌)                                      │",
+            "├──────────────────────────────────────────────────────────┤",
+        ]
+        for i in range(self.log_buffer.maxlen):
+            log_line = logs_to_render[i] if i < len(logs_to_render) else ""
+            # 截斷過長的日誌以避免破壞排版
+            if len(log_line) > PANEL_WIDTH:
+                log_line = log_line[:PANEL_WIDTH - 3] + "..."
+            lines.append(f"│ {log_line.ljust(PANEL_WIDTH)} │")
+        lines.append("└──────────────────────────────────────────────────────────┘")
+
+        elapsed_time = str(datetime.timedelta(seconds=int(time.time() - self.start_time)))
+        status_line = (
+            f"🕒 {elapsed_time} | "
+            f"CPU: {self.cpu_usage:5.1f}% | "
+            f"RAM: {self.ram_usage:5.1f}% | "
+            f"{self.status_tag}"
+        )
+        return {"logs": "\n".join(lines), "status": status_line}
+
     def _render(self):
         """
-        核心渲染函數。
-        它會清除目前的輸出，然後重繪整個儀表板。
+        繪製一幀：只輸出內容有變動的區域。
+        只應由渲染執行緒 (或停止時的最後一幀) 呼叫。
         """
+        frame = self._compose()
+        changed = {name: text for name, text in frame.items() if self._regions.get(name) != text}
+        if not changed:
+            return
+        if self._mode == "notebook":
+            self._render_notebook(changed)
+        elif self._mode == "terminal":
+            self._render_terminal(frame)
+        else:
+            self._render_append(changed)
+        self._regions.update(changed)
+        self.frames_rendered += 1
+
+    def _render_notebook(self, changed: dict):
+        for name, text in changed.items():
+            handle = self._handles.get(name)
+            if handle is None:
+                self._handles[name] = display(Pretty(text), display_id=True)
+            else:
+                handle.update(Pretty(text))
+
+    def _render_terminal(self, frame: dict):
+        lines = frame["logs"].split("\n") + [frame["status"]]
+        out = []
+        if not self._terminal_lines:
+            out.append("\n".join(lines))
+        else:
+            # 游標停在最後一行 (狀態行) 的末端；逐行比對，只改寫變動的行
+            last = len(lines) - 1
+            for i, line in enumerate(lines):
+                if line == self._terminal_lines[i]:
+                    continue
+                up = last - i
+                out.append((f"\x1b[{up}A" if up else "") + f"\r{line}\x1b[K" + (f"\x1b[{up}B" if up else ""))
+        self._terminal_lines = lines
+        sys.stdout.write("".join(out))
+        sys.stdout.flush()
+
+    def _render_append(self, changed: dict):
+        # 輸出不是終端機 (例如被導向檔案)：不重繪框線，只附加新的日誌行與變動的狀態標籤
         with self._lock:
-            clear_output(wait=True)
-
-            # --- 1. 繪製上半部：近況彙報 ---
-            print("┌────────────────── 鳳凰之心指揮中心 V3 ──────────────────┐")
-            print("│ 近況彙報 (最新日誌)                                      │")
-            print("├──────────────────────────────────────────────────────────┤")
-
-            # 複製一份緩衝區以避免在迭代時發生變更
-            logs_to_render = list(self.log_buffer)
-            for i in range(self.log_buffer.maxlen):
-                if i < len(logs_to_render):
-                    log_line = logs_to_render[i]
-                    # 截斷過長的日誌以避免破壞排版
-                    if len(log_line) > 56:
-                        log_line = log_line[:53] + "..."
-                    print(f"│ {log_line.ljust(56)} │")
-                else:
-                    # 打印空行以保持框架完整
-                    print("│                                                          │")
-
-            # --- 2. 繪製下半部：即時狀態 (原地刷新) ---
-            # 由於 clear_output 的存在，我們不需要 \r，直接打印即可
-            print("└──────────────────────────────────────────────────────────┘")
-
-            elapsed_time = str(datetime.timedelta(seconds=int(time.time() - self.start_time)))
-            status_line = (
-                f"🕒 {elapsed_time} | "
-                f"CPU: {self.cpu_usage:5.1f}% | "
-                f"RAM: {self.ram_usage:5.1f}% | "
-                f"{self.status_tag}"
-            )
-            # 打印狀態行，並用 flush=True 確保立即輸出
-            print(status_line, end="", flush=True)
+            new_lines = [(seq, line) for seq, line in self.log_buffer if seq > self._printed_seq]
+            dropped = new_lines[0][0] - self._printed_seq - 1 if new_lines else 0
+            if new_lines:
+                self._printed_seq = new_lines[-1][0]
+        if dropped > 0:
+            print(f"... (略過 {dropped} 行日誌) ...")
+        for _, line in new_lines:
+            print(line)
+        if "status" in changed and self.status_tag != self._regions.get("status_tag"):
+            self._regions["status_tag"] = self.status_tag
+            print(changed["status"], flush=True)
+
+    # --- 渲染與監控執行緒 ---
+
+    def _render_loop(self):
+        """依幀預算合併更新：收到更新後立即繪製，之後至少間隔 1/max_fps 秒才繪製下一幀。"""
+        frame_interval = 1.0 / self.max_fps
+        while not self._stop_event.is_set():
+            self._dirty.wait()
+            if self._stop_event.is_set():
+                break
+            self._dirty.clear()
+            started = time.monotonic()
+            self._render()
+            self._stop_event.wait(max(0.0, frame_interval - (time.monotonic() - started)))
+
+    def _request_render(self):
+        """標記畫面需要更新；實際繪製由渲染執行緒依幀預算進行。"""
+        self._dirty.set()
 
     def add_log(self, message: str):
         """
-        向日誌緩衝區新增一條日誌，並觸發一次低頻的畫面重繪。
+        向日誌緩衝區新增一條日誌，並要求一次 (會被合併的) 畫面更新。
         :param message: 要顯示的日誌訊息。
         """
         timestamp = datetime.datetime.now().strftime('%H:%M:%S')
         # 格式化日誌，使其包含時間戳
         formatted_message = f"[{timestamp}] {message}"
-        self.log_buffer.append(formatted_message)
-        self._render()
+        with self._lock:
+            self._log_seq += 1
+            self.log_buffer.append((self._log_seq, formatted_message))
+        self._request_render()
 
     def update_status_tag(self, new_tag: str):
         """
         更新狀態標籤 (例如：安裝依賴、執行分析)。
-        這會觸發一次畫面重繪。
+        這會要求一次畫面更新。
         :param new_tag: 新的狀態標籤文字。
         """
         self.status_tag = new_tag
-        self._render()
+        self._request_render()
 
     def _resource_monitor_loop(self):
         """
-        在背景執行緒中運行的循環，高頻更新資源使用率。
+        在背景執行緒中運行的循環，定期更新資源使用率。
+        只有數值 (或經過的秒數) 有變動時才要求重繪。
         """
         while not self._stop_event.is_set():
             self.cpu_usage = psutil.cpu_percent()
             self.ram_usage = psutil.virtual_memory().percent
 
-            # 觸發重繪以更新狀態行
-            self._render()
+            # 狀態行包含經過時間，每個取樣週期都需要更新；是否真的重繪由區域比對決定
+            self._request_render()
 
             # 更新頻率
-            time.sleep(1)
+            self._stop_event.wait(self.monitor_interval)
 
     def start(self):
         """
-        啟動儀表板的背景資源監控。
+        啟動儀表板的背景資源監控與渲染執行緒。
         """
         self.add_log("指揮中心介面已啟動。")
         if not self._monitor_thread:
             self._stop_event.clear()
             self._monitor_thread = threading.Thread(target=self._resource_monitor_loop, daemon=True)
             self._monitor_thread.start()
+            self._render_thread = threading.Thread(target=self._render_loop, daemon=True)
+            self._render_thread.start()
 
     def stop(self, final_message="任務完成。"):
         """
@@ -122,9 +227,12 @@ class CommanderConsole:
         """
         if self._monitor_thread:
             self._stop_event.set()
+            self._dirty.set()  # 喚醒渲染執行緒
             # 等待執行緒結束
             self._monitor_thread.join(timeout=1.5)
+            self._render_thread.join(timeout=1.5)
             self._monitor_thread = None
+            self._render_thread = None
 
         self.status_tag = f"[ {final_message} ]"
         self._render()
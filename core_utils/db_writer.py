@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+核心工具：批次資料庫寫入器 (Batched DB Writer)
+
+將 `phoenix_logs` 的日誌插入與 `status_table` 的狀態更新，
+集中交由一個背景執行緒透過「單一長連線」批次寫入 SQLite。
+
+- 呼叫端 (`log_event`, `update_status`) 只需把資料放入行程內佇列，不會被磁碟 I/O 阻塞。
+- 背景執行緒依「筆數」或「時間」兩種條件觸發一次交易提交，大幅減少 fsync 次數。
+- 資料庫使用 WAL 模式，讓狀態 API 等唯讀連線可以與寫入並行。
+- 關閉時會把佇列中剩餘的資料全部寫完，不會遺失日誌；關閉後的寫入改為直接同步寫入。
+- 每次提交後會通知已註冊的監聽者，讓讀取端 (例如狀態 API) 只在資料變動時才讀取資料庫。
+"""
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# status_table 中允許被更新的欄位
+STATUS_COLUMNS = ("current_stage", "apps_status", "action_url", "cpu_usage", "ram_usage")
+
+
+class BatchedDBWriter:
+    """
+    以單一連線、批次提交的方式寫入日誌與狀態的背景寫入器。
+    """
+
+    def __init__(self, db_path: Path, batch_size: int = 500, flush_interval: float = 0.2):
+        """
+        :param db_path: SQLite 資料庫檔案路徑 (資料表需已由 setup_database 建立)。
+        :param batch_size: 累積多少筆日誌就立即提交一次。
+        :param flush_interval: 最長多久 (秒) 必須提交一次，即使筆數未達 batch_size。
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._pending_status: Dict[str, Any] = {}
+        self._status_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._direct_lock = threading.Lock()
+        self._listeners: List[Callable[[], None]] = []
+
+        # 統計資訊，方便除錯與效能觀察
+        self.rows_written = 0
+        self.commits = 0
+
+    # --- 生產者介面 (可由任意執行緒呼叫) ---
+
+    def log(self, timestamp: str, level: str, message: str, cpu: Optional[float] = None, ram: Optional[float] = None):
+        """
+        將一條日誌放入寫入佇列。此呼叫不會觸碰磁碟。
+        寫入器停止後已沒有背景執行緒消費佇列，改為直接同步寫入。
+        """
+        row = (timestamp, level, message, cpu, ram)
+        if self._stop_event.is_set():
+            self._write_direct([row], {})
+            return
+        self._queue.put(row)
+
+    def update_status(self, **fields: Any):
+        """
+        合併一次狀態更新。同一批次內對同一欄位的多次更新只會寫入最後一次的值。
+        """
+        unknown = set(fields) - set(STATUS_COLUMNS)
+        if unknown:
+            raise ValueError(f"未知的狀態欄位: {sorted(unknown)}")
+        if self._stop_event.is_set():
+            self._write_direct([], fields)
+            return
+        with self._status_lock:
+            self._pending_status.update(fields)
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """
+        阻塞直到目前為止放入佇列的所有資料都已提交。
+
+        :return: 是否在逾時前完成。
+        """
+        if not self._thread or not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def add_listener(self, callback: Callable[[], None]):
+        """
+        註冊一個在每次成功提交後被呼叫的回呼函式。
+        回呼會在寫入執行緒中執行，必須快速返回 (例如只設定一個事件)。
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[], None]):
+        """移除先前註冊的回呼函式。"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    # --- 生命週期 ---
+
+    def start(self):
+        """啟動背景寫入執行緒。"""
+        if self._thread:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="BatchedDBWriter", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> bool:
+        """
+        停止背景執行緒，並在停止前把佇列中剩餘的資料全部寫完。
+
+        :return: 背景執行緒是否在逾時前結束。未結束時保留執行緒參考，可再次呼叫 stop 等待。
+        """
+        if not self._thread:
+            return True
+        self._stop_event.set()
+        self._queue.put(None)  # 喚醒正在等待的執行緒
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            print(f"警告：批次寫入器未在 {timeout} 秒內結束，仍在寫入剩餘的資料。")
+            return False
+        self._thread = None
+        return True
+
+    # --- 背景執行緒 ---
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 模式下 NORMAL 已能保證資料庫一致性，只在 checkpoint 時 fsync
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                batch, waiters, stopping = self._collect_batch()
+                self._write_batch(conn, batch, self._take_pending_status())
+                for waiter in waiters:
+                    waiter.set()
+                if stopping:
+                    break
+        finally:
+            conn.close()
+
+    def _collect_batch(self) -> Tuple[List[tuple], List[threading.Event], bool]:
+        """從佇列收集一個批次，直到達到筆數上限、時間上限、或收到 flush/stop 要求。"""
+        batch: List[tuple] = []
+        waiters: List[threading.Event] = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # 停止信號：把佇列中已經存在的資料一併帶走
+                return self._drain(batch, waiters) + (True,)
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+                break
+            batch.append(item)
+
+        if self._stop_event.is_set():
+            return self._drain(batch, waiters) + (True,)
+        return batch, waiters, False
+
+    def _drain(self, batch: List[tuple], waiters: List[threading.Event]) -> Tuple[List[tuple], List[threading.Event]]:
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return batch, waiters
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not None:
+                batch.append(item)
+
+    def _take_pending_status(self) -> Dict[str, Any]:
+        with self._status_lock:
+            status, self._pending_status = self._pending_status, {}
+        return status
+
+    def _write_direct(self, batch: List[tuple], status: Dict[str, Any]):
+        """寫入器停止後的同步寫入：每次開啟一條短連線。"""
+        with self._direct_lock:
+            conn = self._connect()
+            try:
+                self._write_batch(conn, batch, status)
+            finally:
+                conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[tuple], status: Dict[str, Any]):
+        if not batch and not status:
+            return
+        try:
+            with conn:
+                if batch:
+                    conn.executemany(
+                        "INSERT INTO phoenix_logs (timestamp, level, message, cpu_usage, ram_usage) VALUES (?, ?, ?, ?, ?)",
+                        batch,
+                    )
+                if status:
+                    assignments = ", ".join(f"{column} = ?" for column in status)
+                    conn.execute(f"UPDATE status_table SET {assignments} WHERE id = 1", tuple(status.values()))
+            self.rows_written += len(batch)
+            self.commits += 1
+        except sqlite3.Error as e:
+            # 寫入器本身不能因為一次失敗而停止，否則後續所有日誌都會遺失
+            print(f"Error writing batch to db: {e}")
+            return
+
+        for callback in list(self._listeners):
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in db writer listener: {e}")
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+核心工具：環境快取倉庫 (Environment Store)
+
+以「解析後的依賴清單」的內容雜湊作為鍵，集中管理所有 App 的虛擬環境：
+
+- 依賴未變動的 App 會直接重用上次建立完成的 venv，不再重新建立與安裝。
+- 多個 App 共同依賴且版本完全相同的套件 (例如 fastapi, uvicorn, pydantic)，
+  會被抽出成一個共用的「基礎層」環境只安裝一次；各 App 的環境只安裝自己獨有的套件，
+  並透過 `.pth` 檔把基礎層的 site-packages 接到自己的匯入路徑之後。
+
+這個模組只負責鍵的計算、路徑、完成標記與分層連結；實際的 venv 建立與安裝由呼叫端執行，
+以便沿用各啟動器自己的日誌與資源檢查流程。
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .safe_installer import parse_requirements
+
+DEFAULT_STORE_DIR = Path(".venv_store")
+READY_MARKER = ".phoenix_env_ready.json"
+BASE_LAYER_PTH = "_phoenix_base_layer.pth"
+# 超過此時間 (秒) 未被使用、且不在目前規劃中的環境會被清除
+PRUNE_AFTER_SECONDS = 14 * 24 * 3600
+
+_NAME_RE = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+
+def normalize_requirement(requirement: str) -> str:
+    """正規化單行需求 (小寫、去除空白、套件名稱中的 `_`/`.` 統一為 `-`)，讓雜湊不受書寫差異影響。"""
+    requirement = "".join(requirement.split())
+    match = _NAME_RE.match(requirement)
+    if not match:
+        return requirement.lower()
+    name = re.sub(r"[-_.]+", "-", match.group(1)).lower()
+    return name + requirement[match.end():].lower()
+
+
+def requirement_name(requirement: str) -> str:
+    """取出正規化後的套件名稱。"""
+    return re.split(r"[<>=!~;\[ ]", normalize_requirement(requirement), maxsplit=1)[0]
+
+
+def is_fully_pinned(requirements: Iterable[str]) -> bool:
+    """是否每一行都以 `==` 釘選版本 (例如 pip-compile 產生的鎖定檔)。只有這種清單才能安全地分層。"""
+    requirements = list(requirements)
+    return bool(requirements) and all("==" in req for req in requirements)
+
+
+def split_shared_layer(app_requirements: Dict[str, List[str]]) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    找出所有 App 都使用、且版本完全相同的套件作為共用基礎層。
+
+    只有當每個 App 的清單都是完整釘選、且同一 App 內沒有重複套件名稱時才會分層，
+    否則返回空的基礎層，各 App 各自保留完整清單。
+
+    Returns:
+        (基礎層套件列表, {app_name: 該 App 獨有的套件列表})
+    """
+    normalized = {app: sorted({normalize_requirement(r) for r in reqs}) for app, reqs in app_requirements.items()}
+    layerable = len(normalized) > 1 and all(
+        is_fully_pinned(reqs) and len({requirement_name(r) for r in reqs}) == len(reqs)
+        for reqs in normalized.values()
+    )
+    if not layerable:
+        return [], normalized
+
+    shared = set.intersection(*(set(reqs) for reqs in normalized.values()))
+    if not shared:
+        return [], normalized
+    return sorted(shared), {app: [r for r in reqs if r not in shared] for app, reqs in normalized.items()}
+
+
+def plan_environments(store: "EnvStore", app_requirement_files: Dict[str, List[Path]], extra: str = "") -> Dict[str, Any]:
+    """
+    依據各 App 的 requirements 檔案規劃要使用的環境。
+
+    :param store: 環境倉庫。
+    :param app_requirement_files: {app_name: [依安裝順序排列的 requirements 檔案]}。
+    :param extra: 會影響 App 環境內容的額外描述 (例如額外安裝的測試工具)，只計入 App 層的鍵。
+    :return: {"base": {"key", "packages"} 或 None,
+              "apps": {app_name: {"key", "packages", "files", "layered"}}}
+    """
+    app_requirements = {
+        app: [req for path in files if Path(path).exists() for req in parse_requirements(str(path))]
+        for app, files in app_requirement_files.items()
+    }
+    shared, own = split_shared_layer(app_requirements)
+
+    base = None
+    if shared:
+        base = {"key": store.key_for(shared, layer="base"), "packages": shared}
+
+    apps = {}
+    for app, files in app_requirement_files.items():
+        packages = own[app] if base else sorted({normalize_requirement(r) for r in app_requirements[app]})
+        apps[app] = {
+            "key": store.key_for(packages, base_key=base["key"] if base else None, extra=extra),
+            "packages": packages,
+            "files": [Path(path) for path in files if Path(path).exists()],
+            "layered": base is not None,
+        }
+    return {"base": base, "apps": apps}
+
+
+def planned_keys(env_plan: Dict[str, Any]) -> List[str]:
+    """返回環境規劃中用到的所有環境鍵 (基礎層與各 App)。"""
+    keys = [app_plan["key"] for app_plan in env_plan["apps"].values()]
+    if env_plan["base"]:
+        keys.append(env_plan["base"]["key"])
+    return keys
+
+
+def python_executable(env_path: Path) -> Path:
+    """返回 venv 中 Python 解譯器的路徑。"""
+    return env_path / ('Scripts/python.exe' if sys.platform == 'win32' else 'bin/python')
+
+
+class EnvStore:
+    """
+    以內容雜湊為鍵的虛擬環境倉庫。
+    """
+
+    def __init__(self, root: Path = DEFAULT_STORE_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def key_for(self, requirements: Iterable[str], *, layer: str = "app", base_key: Optional[str] = None,
+                extra: str = "") -> str:
+        """
+        計算環境鍵。
+
+        :param requirements: 要安裝到此環境中的需求行。
+        :param layer: 環境種類 ("base" 或 "app")，避免兩者內容相同時共用同一個目錄。
+        :param base_key: 此環境所連結的基礎層鍵；基礎層變動時，上層環境也必須重建。
+        :param extra: 其他會影響環境內容的字串 (例如額外的安裝參數)。
+        """
+        payload = {
+            "layer": layer,
+            "requirements": sorted({normalize_requirement(r) for r in requirements}),
+            "base": base_key,
+            "extra": extra,
+            "python": f"{sys.version_info.major}.{sys.version_info.minor}",
+            "platform": sys.platform,
+        }
+        digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+        return f"{layer}-{digest[:16]}"
+
+    def env_path(self, key: str) -> Path:
+        return self.root / key
+
+    def write_layer_requirements(self, key: str, packages: List[str]) -> Path:
+        """把此層要安裝的套件寫成 requirements 檔，交給安全安裝器使用。"""
+        path = self.env_path(key) / "phoenix-layer-requirements.txt"
+        path.write_text("\n".join(packages) + "\n", encoding="utf-8")
+        return path
+
+    def is_ready(self, key: str) -> bool:
+        """環境是否已完整建立 (完成標記只會在安裝成功後寫入)。"""
+        return (self.env_path(key) / READY_MARKER).exists() and python_executable(self.env_path(key)).exists()
+
+    def mark_ready(self, key: str, **metadata):
+        """在所有安裝步驟成功後寫入完成標記。"""
+        marker = self.env_path(key) / READY_MARKER
+        tmp = marker.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"key": key, "created_at": time.time(), **metadata}, ensure_ascii=False, indent=2),
+                       encoding="utf-8")
+        tmp.replace(marker)
+
+    def mark_used(self, key: str):
+        """重用環境時更新完成標記的修改時間，prune 以此判斷環境最近是否被使用。"""
+        marker = self.env_path(key) / READY_MARKER
+        if marker.exists():
+            os.utime(marker)
+
+    def discard(self, key: str):
+        """刪除一個 (可能建立到一半的) 環境。"""
+        shutil.rmtree(self.env_path(key), ignore_errors=True)
+
+    def link_base_layer(self, env_path: Path, base_env_path: Path):
+        """
+        在 env_path 的 site-packages 中寫入 `.pth` 檔，把基礎層的 site-packages 附加到匯入路徑。
+        `.pth` 的路徑會排在環境自身的 site-packages 之後，因此 App 獨有的版本永遠優先。
+        """
+        site_packages = self._site_packages(env_path)
+        base_site_packages = self._site_packages(base_env_path)
+        (site_packages / BASE_LAYER_PTH).write_text(f"{base_site_packages.resolve()}\n", encoding="utf-8")
+
+    def prune(self, keep: Iterable[str], max_age: float = PRUNE_AFTER_SECONDS) -> List[str]:
+        """
+        刪除不在 keep 中、且超過 max_age 秒未被使用的環境，回收磁碟空間。
+
+        不同的啟動器 (例如帶有測試工具的 phoenix_starter) 會使用不同的鍵，
+        因此只以最近使用時間判斷，不會刪除其他啟動器仍在使用的環境。
+
+        :return: 被刪除的環境鍵。
+        """
+        keep = set(keep)
+        cutoff = time.time() - max_age
+        removed = []
+        for path in self.root.iterdir():
+            if not path.is_dir() or path.name in keep:
+                continue
+            marker = path / READY_MARKER
+            last_used = (marker if marker.exists() else path).stat().st_mtime
+            if last_used < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(path.name)
+        return sorted(removed)
+
+    @staticmethod
+    def _site_packages(env_path: Path) -> Path:
+        if sys.platform == 'win32':
+            return env_path / "Lib" / "site-packages"
+        candidates = sorted((env_path / "lib").glob("python*/site-packages"))
+        if not candidates:
+            raise FileNotFoundError(f"找不到 {env_path} 的 site-packages 目錄")
+        return candidates[-1]
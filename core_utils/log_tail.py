@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+核心工具：事件驅動的日誌追蹤 (Log Tail)
+
+以非同步產生器的方式持續讀取一個正在被寫入的日誌檔，每次產出「一整塊」新增的文字：
+
+- Linux 上使用 inotify (透過 ctypes 呼叫 libc，不需額外套件)，並把 inotify 的
+  檔案描述子交給事件迴圈監聽；檔案沒有被寫入時，協程完全不會被喚醒。
+- 其他平台退回自適應輪詢：有資料時以短間隔讀取，閒置時間隔逐步拉長到上限。
+
+呼叫端拿到的是一次讀取的完整區塊 (可能包含多行)，可以整塊解析、整批更新畫面，
+不必為每一行各做一次處理。
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import sys
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+# inotify 事件旗標 (見 <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+READ_CHUNK_BYTES = 64 * 1024
+
+
+class _InotifyWatch:
+    """以 inotify 監看單一檔案；檔案有變動時設定 asyncio 事件。"""
+
+    def __init__(self, path: Path, loop: asyncio.AbstractEventLoop):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._loop = loop
+        self.changed = asyncio.Event()
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失敗")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF
+        if libc.inotify_add_watch(self._fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"inotify_add_watch 失敗: {path}")
+        loop.add_reader(self._fd, self._on_readable)
+
+    def _on_readable(self):
+        # 讀空事件佇列即可；具體是哪種事件不重要，反正都要重新讀檔
+        try:
+            while os.read(self._fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        self.changed.set()
+
+    async def wait(self, timeout: Optional[float] = None):
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.changed.clear()
+
+    def close(self):
+        self._loop.remove_reader(self._fd)
+        os.close(self._fd)
+
+
+class _PollingWatch:
+    """沒有 inotify 時的自適應輪詢：每次等待的時間在沒有新資料時逐步加倍。"""
+
+    def __init__(self, min_interval: float = 0.05, max_interval: float = 1.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._interval = min_interval
+
+    def got_data(self, has_data: bool):
+        self._interval = self.min_interval if has_data else min(self._interval * 2, self.max_interval)
+
+    async def wait(self, timeout: Optional[float] = None):
+        await asyncio.sleep(self._interval if timeout is None else min(self._interval, timeout))
+
+    def close(self):
+        pass
+
+
+def _create_watch(path: Path, loop: asyncio.AbstractEventLoop):
+    if sys.platform.startswith("linux"):
+        try:
+            return _InotifyWatch(path, loop)
+        except (OSError, AttributeError):
+            pass
+    return _PollingWatch()
+
+
+async def follow_file(path: Path, stop_event: asyncio.Event, from_end: bool = True,
+                      encoding: str = "utf-8") -> AsyncIterator[str]:
+    """
+    追蹤一個檔案，每當有新內容寫入時產出新增的文字區塊。
+
+    :param path: 要追蹤的檔案 (必須已存在)。
+    :param stop_event: 設定後，會把剩餘內容讀完再結束。
+    :param from_end: 是否從檔案目前的結尾開始讀 (忽略既有內容)。
+    :param encoding: 檔案編碼；無法解碼的位元組會被替換。
+    :raises FileNotFoundError: 檔案不存在時。
+    """
+    loop = asyncio.get_running_loop()
+    with open(path, "rb") as f:
+        if from_end:
+            f.seek(0, os.SEEK_END)
+        watch = _create_watch(path, loop)
+        stop_waiter = asyncio.ensure_future(stop_event.wait())
+        pending = b""
+        try:
+            while True:
+                data = f.read(READ_CHUNK_BYTES)
+                if isinstance(watch, _PollingWatch):
+                    watch.got_data(bool(data))
+                if data:
+                    pending += data
+                    # 只產出完整的行，最後一行若尚未寫完就留到下一次
+                    cut = max(pending.rfind(b"\n"), pending.rfind(b"\r")) + 1
+                    if cut:
+                        chunk, pending = pending[:cut], pending[cut:]
+                        yield chunk.decode(encoding, errors="replace")
+                    continue
+                if stop_event.is_set():
+                    break
+                watch_waiter = asyncio.ensure_future(watch.wait())
+                await asyncio.wait({watch_waiter, stop_waiter}, return_when=asyncio.FIRST_COMPLETED)
+                watch_waiter.cancel()
+            if pending:
+                yield pending.decode(encoding, errors="replace")
+        finally:
+            stop_waiter.cancel()
+            watch.close()
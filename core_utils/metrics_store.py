@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+核心工具：效能指標倉庫 (Metrics Store)
+
+取代「每秒往 phoenix_logs 插入一筆 PERF 日誌」的做法：
+
+- 原始取樣只保存在固定大小的記憶體環形緩衝區中，供即時檢視使用，不落地。
+- 取樣同時被彙總成 1 秒 / 10 秒 / 1 分鐘三種解析度的 min/avg/max，
+  只有「已結束的時間桶」才會定期以單一交易批次寫入 `perf_rollups` 表。
+- 每種解析度都有各自的保留期限，長時間運行時資料量仍有上限。
+- 指標以 (來源, 指標名稱) 區分，來源可以是主機 (`host`) 或個別 App 的進程，
+  報告可直接讀取預先算好的彙總值。
+"""
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+HOST_SOURCE = "host"
+DEFAULT_RESOLUTIONS = (1, 10, 60)
+# 各解析度的保留期限 (秒)；None 代表不清除
+DEFAULT_RETENTION_SECONDS = {1: 15 * 60, 10: 6 * 3600, 60: 7 * 86400}
+
+
+class MetricsStore:
+    """
+    以環形緩衝區保存原始取樣，並把多解析度的彙總值批次寫入 SQLite。
+    """
+
+    def __init__(self, db_path: Path, resolutions: Tuple[int, ...] = DEFAULT_RESOLUTIONS,
+                 ring_size: int = 900, persist_interval: float = 10.0,
+                 retention: Optional[Dict[int, Optional[float]]] = None):
+        """
+        :param db_path: SQLite 資料庫檔案路徑。
+        :param resolutions: 要彙總的時間桶大小 (秒)。
+        :param ring_size: 記憶體中保留的原始取樣筆數上限。
+        :param persist_interval: 每隔多久 (秒) 把已結束的時間桶寫入資料庫。
+        :param retention: {解析度: 保留秒數}，未指定時使用 DEFAULT_RETENTION_SECONDS。
+        """
+        self.db_path = db_path
+        self.resolutions = tuple(sorted(resolutions))
+        self.persist_interval = persist_interval
+        self.retention = DEFAULT_RETENTION_SECONDS if retention is None else retention
+
+        self._samples = deque(maxlen=ring_size)
+        # (解析度, 來源, 指標) -> [時間桶起點, 最小值, 總和, 最大值, 筆數]
+        self._open_buckets: Dict[Tuple[int, str, str], list] = {}
+        self._completed: List[tuple] = []
+        self._lock = threading.Lock()
+        self._last_persist = time.monotonic()
+
+    @staticmethod
+    def create_table(conn: sqlite3.Connection):
+        """建立彙總表；由啟動器的 setup_database 呼叫。"""
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS perf_rollups (
+            resolution INTEGER NOT NULL,
+            bucket_start REAL NOT NULL,
+            source TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            min_value REAL,
+            avg_value REAL,
+            max_value REAL,
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (resolution, source, metric, bucket_start)
+        )""")
+
+    # --- 取樣 ---
+
+    def record(self, source: str, metrics: Dict[str, Optional[float]], timestamp: Optional[float] = None):
+        """
+        記錄一次取樣，並視需要把已結束的時間桶寫入資料庫。
+
+        :param source: 指標來源，例如 HOST_SOURCE 或 App 名稱。
+        :param metrics: {指標名稱: 數值}，值為 None 的指標會被略過。
+        :param timestamp: 取樣時間 (epoch 秒)，預設為現在。
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        metrics = {name: float(value) for name, value in metrics.items() if value is not None}
+        with self._lock:
+            self._samples.append((timestamp, source, metrics))
+            for resolution in self.resolutions:
+                bucket_start = timestamp - timestamp % resolution
+                for metric, value in metrics.items():
+                    key = (resolution, source, metric)
+                    bucket = self._open_buckets.get(key)
+                    if bucket and bucket[0] != bucket_start:
+                        self._completed.append(self._to_row(key, bucket))
+                        bucket = None
+                    if bucket is None:
+                        self._open_buckets[key] = [bucket_start, value, value, value, 1]
+                    else:
+                        bucket[1] = min(bucket[1], value)
+                        bucket[2] += value
+                        bucket[3] = max(bucket[3], value)
+                        bucket[4] += 1
+
+        if time.monotonic() - self._last_persist >= self.persist_interval:
+            self.flush()
+
+    def recent(self, source: Optional[str] = None, limit: Optional[int] = None) -> List[tuple]:
+        """返回環形緩衝區中的原始取樣 [(timestamp, source, metrics), ...]，由舊到新。"""
+        with self._lock:
+            samples = [s for s in self._samples if source is None or s[1] == source]
+        return samples[-limit:] if limit else samples
+
+    # --- 持久化 ---
+
+    def flush(self, include_open: bool = False):
+        """
+        把已結束的時間桶寫入資料庫，並清除超過保留期限的資料。
+
+        :param include_open: 為 True 時連同尚未結束的時間桶的目前彙總值一起寫入
+                             (生成報告或程式結束時使用)；該時間桶結束後會以完整的值覆寫。
+        """
+        with self._lock:
+            completed, self._completed = self._completed, []
+            rows = list(completed)
+            if include_open:
+                rows.extend(self._to_row(key, bucket) for key, bucket in self._open_buckets.items())
+            self._last_persist = time.monotonic()
+        if not rows:
+            return
+
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=5.0)
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO perf_rollups "
+                        "(resolution, bucket_start, source, metric, min_value, avg_value, max_value, samples) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    now = time.time()
+                    for resolution, keep_seconds in self.retention.items():
+                        if keep_seconds is not None:
+                            conn.execute("DELETE FROM perf_rollups WHERE resolution = ? AND bucket_start < ?",
+                                         (resolution, now - keep_seconds))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Error writing perf rollups to db: {e}")
+            # 已結束的時間桶放回佇列，下一次 flush 時重試 (尚未結束的時間桶之後仍會寫入)
+            with self._lock:
+                self._completed[:0] = completed
+
+    def close(self):
+        """寫入所有剩餘的彙總資料。"""
+        self.flush(include_open=True)
+
+    @staticmethod
+    def _to_row(key: Tuple[int, str, str], bucket: list) -> tuple:
+        resolution, source, metric = key
+        bucket_start, minimum, total, maximum, count = bucket
+        return resolution, bucket_start, source, metric, minimum, total / count, maximum, count
@@ -1,51 +1,130 @@
 # -*- coding: utf-8 -*-
 """
 核心工具：V15 報告生成器
+
+所有統計 (各等級筆數、各階段耗時、效能百分位數) 都以 SQL 在資料庫中完成，
+詳細日誌則以游標分塊串流寫入檔案，不會把整張 phoenix_logs 載入記憶體，
+因此不論執行多久、累積多少日誌，報告生成的記憶體用量都維持固定。
+資料庫使用 WAL 模式，報告也可以在執行途中隨時生成。
 """
 import sqlite3
-import pandas as pd
 from pathlib import Path
 from datetime import datetime
 import json
+from typing import Dict, List, Optional, TextIO, Tuple
 import pytz
 
+from .metrics_store import HOST_SOURCE
+
+KEY_EVENT_LEVELS = ('SUCCESS', 'ERROR', 'WARN', 'BATTLE', 'CRITICAL')
+PERCENTILES = (50, 95, 99)
+
+# 階段所屬的「泳道」：以 "[App]" 開頭的階段屬於該 App，其他屬於整體系統。
+# 平行啟動的 App 各自計時，不會互相截斷。
+STAGE_TIMINGS_SQL = """
+WITH stages AS (
+    SELECT id, timestamp, message,
+           CASE WHEN message LIKE '[%]%' THEN substr(message, 2, instr(message, ']') - 2) ELSE '' END AS lane
+    FROM phoenix_logs WHERE level = 'STAGE'
+)
+SELECT lane, message, timestamp,
+       (julianday(COALESCE(LEAD(timestamp) OVER (PARTITION BY lane ORDER BY id), ?)) - julianday(timestamp)) * 86400
+FROM stages ORDER BY id
+"""
+
+
 class ReportGenerator:
     """
     從 logs.sqlite 生成三份標準 Markdown 報告。
     """
-    def __init__(self, db_path: Path, config_path: Path):
+    def __init__(self, db_path: Path, config_path: Path, output_dir: Path = Path("logs"), chunk_size: int = 5000):
+        """
+        :param db_path: SQLite 資料庫檔案路徑。
+        :param config_path: config.json 路徑 (讀取 TIMEZONE)。
+        :param output_dir: 報告輸出目錄。
+        :param chunk_size: 串流詳細日誌時每次從資料庫取出的筆數。
+        """
         self.db_path = db_path
         self.config = self._load_config(config_path)
         self.timezone = pytz.timezone(self.config.get("TIMEZONE", "Asia/Taipei"))
-        self.df = None
+        self.chunk_size = chunk_size
         self.start_time = None
         self.end_time = None
         self.total_duration_seconds = 0
-        self.output_dir = Path("logs")
+        self.level_counts: Dict[str, int] = {}
+        self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
 
     def _load_config(self, config_path: Path):
         with open(config_path, 'r', encoding='utf-8') as f:
             return json.load(f)
 
-    def _load_data(self):
-        """從資料庫載入數據到 pandas DataFrame"""
-        with sqlite3.connect(self.db_path) as conn:
-            self.df = pd.read_sql_query("SELECT * FROM phoenix_logs", conn)
-
-        if self.df.empty:
-            return
-
-        self.df['timestamp'] = pd.to_datetime(self.df['timestamp']).dt.tz_localize('UTC').dt.tz_convert(self.timezone)
-        self.df = self.df.set_index('timestamp')
-
-        self.start_time = self.df.index.min()
-        self.end_time = self.df.index.max()
-        if pd.notna(self.start_time) and pd.notna(self.end_time):
-            self.total_duration_seconds = (self.end_time - self.start_time).total_seconds()
-        else:
-            self.total_duration_seconds = 0
-
+    def _connect(self) -> sqlite3.Connection:
+        # 只讀取資料；WAL 模式下可以與啟動器的寫入器並行
+        return sqlite3.connect(self.db_path, timeout=5.0)
+
+    def _load_summary(self, conn: sqlite3.Connection):
+        """以 SQL 取得執行區間與各等級的日誌筆數"""
+        self.start_time, self.end_time, self.total_duration_seconds = conn.execute(
+            "SELECT MIN(timestamp), MAX(timestamp), "
+            "(julianday(MAX(timestamp)) - julianday(MIN(timestamp))) * 86400 FROM phoenix_logs"
+        ).fetchone()
+        self.total_duration_seconds = self.total_duration_seconds or 0
+        self.level_counts = dict(conn.execute(
+            "SELECT level, COUNT(*) FROM phoenix_logs GROUP BY level ORDER BY COUNT(*) DESC"
+        ).fetchall())
+
+    def _stage_timings(self, conn: sqlite3.Connection) -> List[tuple]:
+        """返回 [(泳道, 階段, 開始時間, 耗時秒數)]；每個泳道最後一個階段計算到最後一筆日誌為止"""
+        return conn.execute(STAGE_TIMINGS_SQL, (self.end_time,)).fetchall()
+
+    def _metric_summaries(self, conn: sqlite3.Connection, resolution: int = 60) -> Dict[Tuple[str, str], tuple]:
+        """
+        以 SQL 彙總 MetricsStore 的數據：{(來源, 指標): (加權平均值, 峰值, 最低值)}。
+        舊版資料庫沒有 perf_rollups 表時返回空字典。
+        """
+        try:
+            rows = conn.execute(
+                "SELECT source, metric, SUM(avg_value * samples) / SUM(samples), MAX(max_value), MIN(min_value) "
+                "FROM perf_rollups WHERE resolution = ? GROUP BY source, metric",
+                (resolution,)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return {}
+        return {(source, metric): values for source, metric, *values in rows}
+
+    def _percentile_resolution(self, conn: sqlite3.Connection) -> Optional[int]:
+        """
+        選出仍完整涵蓋整段執行期間的最細解析度 (較細的解析度保留期限較短，長時間執行時可能已被清除)。
+        """
+        try:
+            coverage = conn.execute(
+                "SELECT resolution, MIN(bucket_start) FROM perf_rollups WHERE source = ? GROUP BY resolution "
+                "ORDER BY resolution", (HOST_SOURCE,)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return None
+        if not coverage:
+            return None
+        earliest = min(start for _, start in coverage)
+        coarsest = max(resolution for resolution, _ in coverage)
+        for resolution, start in coverage:
+            if start - earliest <= coarsest:
+                return resolution
+        return coarsest
+
+    def _percentiles(self, conn: sqlite3.Connection, resolution: int, metric: str) -> Dict[int, float]:
+        """以 ORDER BY + OFFSET 在 SQL 中取出各百分位數 (以時間桶平均值計算)"""
+        where = "FROM perf_rollups WHERE resolution = ? AND source = ? AND metric = ?"
+        params = (resolution, HOST_SOURCE, metric)
+        count = conn.execute(f"SELECT COUNT(*) {where}", params).fetchone()[0]
+        if not count:
+            return {}
+        return {
+            p: conn.execute(f"SELECT avg_value {where} ORDER BY avg_value LIMIT 1 OFFSET ?",
+                            params + (min(count - 1, int(count * p / 100)),)).fetchone()[0]
+            for p in PERCENTILES
+        }
 
     def _format_duration(self, seconds: int) -> str:
         """將秒數格式化為 'X 分 Y 秒'"""
@@ -53,54 +132,66 @@ class ReportGenerator:
         minutes, seconds = divmod(seconds, 60)
         return f"{minutes} 分 {seconds} 秒"
 
-    def generate_all_reports(self):
-        """生成所有報告並寫入檔案"""
-        self._load_data()
-
-        if self.df is None or self.df.empty:
-            print("⚠️ 沒有數據可供生成報告。")
-            return
-
-        reports = {
-            "綜合戰情簡報.md": self._generate_summary_report,
-            "效能分析報告.md": self._generate_performance_report,
-            "詳細日誌報告.md": self._generate_log_report,
-        }
-
-        for filename, generator_func in reports.items():
-            content = generator_func()
-            report_path = self.output_dir / filename
-            report_path.write_text(content, encoding='utf-8')
-            print(f"✅ 已生成報告: {report_path}")
-
-    def _generate_summary_report(self) -> str:
+    def _now(self) -> str:
+        return datetime.now(self.timezone).strftime('%Y-%m-%d %H:%M:%S %Z')
+
+    def generate_all_reports(self) -> List[Path]:
+        """
+        生成所有報告並寫入檔案。可在執行途中重複呼叫，每次都會覆寫為最新內容。
+
+        :return: 已生成的報告路徑列表。
+        """
+        conn = self._connect()
+        try:
+            self._load_summary(conn)
+
+            if not self.level_counts:
+                print("⚠️ 沒有數據可供生成報告。")
+                return []
+
+            reports = {
+                "綜合戰情簡報.md": self._write_summary_report,
+                "效能分析報告.md": self._write_performance_report,
+                "詳細日誌報告.md": self._write_log_report,
+            }
+
+            generated = []
+            for filename, writer_func in reports.items():
+                report_path = self.output_dir / filename
+                # 先寫入暫存檔再替換，讓執行途中讀取報告的人不會看到寫到一半的檔案
+                tmp_path = report_path.with_suffix(".md.tmp")
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    writer_func(conn, f)
+                tmp_path.replace(report_path)
+                generated.append(report_path)
+                print(f"✅ 已生成報告: {report_path}")
+            return generated
+        finally:
+            conn.close()
+
+    def _write_summary_report(self, conn: sqlite3.Connection, f: TextIO):
         """生成綜合戰情簡報"""
-        if self.df.empty: return "# 綜合戰情簡報\n\n無數據。"
-
-        # 效能摘要
-        perf_df = self.df[self.df['level'] == 'PERF'].copy()
-        avg_cpu = perf_df['cpu_usage'].mean() if not perf_df.empty else 0
-        peak_cpu = perf_df['cpu_usage'].max() if not perf_df.empty else 0
-        avg_ram = perf_df['ram_usage'].mean() if not perf_df.empty else 0
-        peak_ram = perf_df['ram_usage'].max() if not perf_df.empty else 0
-
-        # 關鍵事件
-        key_events = self.df[self.df['level'].isin(['SUCCESS', 'ERROR', 'WARN', 'BATTLE', 'CRITICAL'])].copy()
+        # 效能摘要 (直接使用預先彙總的數據)
+        metrics = self._metric_summaries(conn)
+        avg_cpu, peak_cpu, _ = metrics.get((HOST_SOURCE, 'cpu_percent'), (0, 0, 0))
+        avg_ram, peak_ram, _ = metrics.get((HOST_SOURCE, 'ram_percent'), (0, 0, 0))
 
         # 最終狀態
-        has_errors = "ERROR" in self.df['level'].values or "CRITICAL" in self.df['level'].values
+        has_errors = bool(self.level_counts.get("ERROR") or self.level_counts.get("CRITICAL"))
         status_color = "red" if has_errors else "green"
         status_text = "執行完畢，但有錯誤發生" if has_errors else "任務成功"
+        level_summary = "、".join(f"{level} {count}" for level, count in self.level_counts.items())
 
-        md = f"""# 📑 綜合戰情簡報
+        f.write(f"""# 📑 綜合戰情簡報
 
-**報告產生時間:** {datetime.now(self.timezone).strftime('%Y-%m-%d %H:%M:%S %Z')}
+**報告產生時間:** {self._now()}
 **總耗時:** {self._format_duration(self.total_duration_seconds)}
 
 ---
 
 ### 一、總體結果
 **狀態:** <font color="{status_color}">{status_text}</font>
+**日誌統計:** {level_summary}
 
 ### 二、效能重點
 - **平均 CPU 使用率:** {avg_cpu:.1f}%
@@ -108,62 +199,101 @@ class ReportGenerator:
 - **平均記憶體使用率:** {avg_ram:.1f}%
 - **峰值記憶體使用率:** {peak_ram:.1f}%
 
-### 三、關鍵事件摘要
-"""
-        if not key_events.empty:
-            for _, row in key_events.iterrows():
-                md += f"- **[{row['level']}]** {row['message']}\n"
+### 三、各階段耗時
+""")
+        stages = self._stage_timings(conn)
+        if stages:
+            f.write("\n| 對象 | 階段 | 開始時間 | 耗時 |\n|---|---|---|---|\n")
+            for lane, stage, started_at, seconds in stages:
+                f.write(f"| {lane or '系統'} | {stage} | {started_at} | {seconds or 0:.1f} 秒 |\n")
         else:
-            md += "- 無關鍵事件記錄。\n"
+            f.write("- 無階段記錄。\n")
 
-        return md.strip()
-
-    def _generate_performance_report(self) -> str:
+        # 關鍵事件
+        f.write("\n### 四、關鍵事件摘要\n")
+        placeholders = ", ".join("?" for _ in KEY_EVENT_LEVELS)
+        cursor = conn.execute(
+            f"SELECT level, message FROM phoenix_logs WHERE level IN ({placeholders}) ORDER BY id", KEY_EVENT_LEVELS
+        )
+        has_events = False
+        while rows := cursor.fetchmany(self.chunk_size):
+            has_events = True
+            f.writelines(f"- **[{level}]** {message}\n" for level, message in rows)
+        if not has_events:
+            f.write("- 無關鍵事件記錄。\n")
+
+    def _write_performance_report(self, conn: sqlite3.Connection, f: TextIO):
         """生成詳細效能報告"""
-        if self.df.empty: return "# 效能分析報告\n\n無數據。"
-
-        perf_df = self.df[self.df['level'] == 'PERF'].copy()
-        if perf_df.empty: return "# 效能分析報告\n\n無效能數據。"
+        metrics = self._metric_summaries(conn)
+        cpu = metrics.get((HOST_SOURCE, 'cpu_percent'))
+        ram = metrics.get((HOST_SOURCE, 'ram_percent'))
+        if cpu is None or ram is None:
+            f.write("# 效能分析報告\n\n無效能數據。\n")
+            return
 
-        summary = {
-            'CPU 使用率': (perf_df['cpu_usage'].mean(), perf_df['cpu_usage'].max(), perf_df['cpu_usage'].min()),
-            'RAM 使用率': (perf_df['ram_usage'].mean(), perf_df['ram_usage'].max(), perf_df['ram_usage'].min())
-        }
+        resolution = self._percentile_resolution(conn)
+        cpu_p = self._percentiles(conn, resolution, 'cpu_percent')
+        ram_p = self._percentiles(conn, resolution, 'ram_percent')
+        percentile_header = " | ".join(f"P{p}" for p in PERCENTILES)
 
-        md = f"""# 📊 效能分析報告
+        f.write(f"""# 📊 效能分析報告
 
-**報告產生時間:** {datetime.now(self.timezone).strftime('%Y-%m-%d %H:%M:%S %Z')}
+**報告產生時間:** {self._now()}
 **監控持續時間:** {self._format_duration(self.total_duration_seconds)}
 
 ---
 
 ### 一、總體效能摘要
 
-| 指標 | 平均值 | 峰值 | 最低值 |
-|---|---|---|---|
-| CPU 使用率 | {summary['CPU 使用率'][0]:.1f}% | {summary['CPU 使用率'][1]:.1f}% | {summary['CPU 使用率'][2]:.1f}% |
-| 記憶體使用率 | {summary['RAM 使用率'][0]:.1f}% | {summary['RAM 使用率'][1]:.1f}% | {summary['RAM 使用率'][2]:.1f}% |
-
-### 二、詳細數據表
-{perf_df[['cpu_usage', 'ram_usage']].to_markdown()}
-"""
-        return md.strip()
-
-    def _generate_log_report(self) -> str:
-        """生成詳細日誌報告"""
-        if self.df.empty: return "# 詳細日誌報告\n\n無數據。"
-
-        log_df = self.df[self.df['level'] != 'PERF']
-        if log_df.empty: return "# 詳細日誌報告\n\n無日誌數據。"
-
-        md = f"""# 📝 詳細日誌報告
-
-**報告產生時間:** {datetime.now(self.timezone).strftime('%Y-%m-%d %H:%M:%S %Z')}
-**任務執行區間:** {self.start_time.strftime('%Y-%m-%d %H:%M:%S')} - {self.end_time.strftime('%Y-%m-%d %H:%M:%S')}
+| 指標 | 平均值 | 峰值 | 最低值 | {percentile_header} |
+|---|---|---|---|{"---|" * len(PERCENTILES)}
+| CPU 使用率 | {cpu[0]:.1f}% | {cpu[1]:.1f}% | {cpu[2]:.1f}% | {" | ".join(f"{cpu_p.get(p, 0):.1f}%" for p in PERCENTILES)} |
+| 記憶體使用率 | {ram[0]:.1f}% | {ram[1]:.1f}% | {ram[2]:.1f}% | {" | ".join(f"{ram_p.get(p, 0):.1f}%" for p in PERCENTILES)} |
+
+> 百分位數以每 {resolution} 秒的平均值計算。
+
+### 二、各 App 進程資源用量
+""")
+        app_sources = sorted({source for source, _ in metrics} - {HOST_SOURCE})
+        if app_sources:
+            f.write("\n| App | 平均 CPU | 峰值 CPU | 平均 RSS | 峰值 RSS |\n|---|---|---|---|---|\n")
+            for source in app_sources:
+                app_cpu = metrics.get((source, 'cpu_percent'), (0, 0, 0))
+                app_rss = metrics.get((source, 'rss_mb'), (0, 0, 0))
+                f.write(f"| {source} | {app_cpu[0]:.1f}% | {app_cpu[1]:.1f}% | {app_rss[0]:.1f} MB | {app_rss[1]:.1f} MB |\n")
+        else:
+            f.write("\n- 無 App 進程數據。\n")
+
+        # 每分鐘的主機數據表 (平均值 / 峰值)，以游標分塊寫出
+        f.write("\n### 三、每分鐘數據表\n\n"
+                "| 時間 | CPU 平均 | CPU 峰值 | 記憶體平均 | 記憶體峰值 |\n|---|---|---|---|---|\n")
+        cursor = conn.execute(
+            "SELECT bucket_start, "
+            "MAX(CASE WHEN metric = 'cpu_percent' THEN avg_value END), "
+            "MAX(CASE WHEN metric = 'cpu_percent' THEN max_value END), "
+            "MAX(CASE WHEN metric = 'ram_percent' THEN avg_value END), "
+            "MAX(CASE WHEN metric = 'ram_percent' THEN max_value END) "
+            "FROM perf_rollups WHERE resolution = 60 AND source = ? GROUP BY bucket_start ORDER BY bucket_start",
+            (HOST_SOURCE,)
+        )
+        while rows := cursor.fetchmany(self.chunk_size):
+            for bucket_start, *values in rows:
+                minute = datetime.fromtimestamp(bucket_start, self.timezone).strftime('%Y-%m-%d %H:%M')
+                cells = " | ".join("-" if v is None else f"{v:.1f}%" for v in values)
+                f.write(f"| {minute} | {cells} |\n")
+
+    def _write_log_report(self, conn: sqlite3.Connection, f: TextIO):
+        """生成詳細日誌報告 (分塊串流，不會一次載入所有日誌)"""
+        f.write(f"""# 📝 詳細日誌報告
+
+**報告產生時間:** {self._now()}
+**任務執行區間:** {self.start_time[:19]} - {self.end_time[:19]}
 
 ---
 ```
-{log_df[['level', 'message']].to_string()}
-```
-"""
-        return md.strip()
+""")
+        # 舊版資料庫中可能仍有 PERF 日誌，效能數據請見效能分析報告
+        cursor = conn.execute("SELECT timestamp, level, message FROM phoenix_logs WHERE level != 'PERF' ORDER BY id")
+        while rows := cursor.fetchmany(self.chunk_size):
+            f.writelines(f"{timestamp}  {level:<8} {message}\n" for timestamp, level, message in rows)
+        f.write("```\n")
@@ -2,8 +2,13 @@
 """
 核心工具：資源監控器 (Resource Monitor)
 """
+import asyncio
+import itertools
 import shutil
-from typing import Dict, Any
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional
 
 def get_system_resources() -> Dict[str, Any]:
     """
@@ -58,6 +63,9 @@ def is_resource_sufficient(settings: Dict[str, Any]) -> tuple[bool, str]:
     """
     根據提供的設定，檢查系統資源是否充足。
 
+    若啟動器已呼叫 start_resource_sampler() 啟動共用背景取樣器，使用它的平滑數值
+    (不會因為一瞬間的尖峰而改變判斷)；否則退回即時取樣一次。呼叫本身不會啟動取樣器。
+
     Args:
         settings: 從設定檔載入的參數字典。
 
@@ -66,7 +74,8 @@ def is_resource_sufficient(settings: Dict[str, Any]) -> tuple[bool, str]:
         如果資源充足，is_sufficient 為 True，否則為 False，
         message 包含檢查的詳細資訊。
     """
-    resources = get_system_resources()
+    sampler = get_resource_sampler()
+    resources = sampler.snapshot() if sampler else get_system_resources()
     thresholds = settings.get("resource_monitoring", {})
 
     mem_threshold = thresholds.get("memory_usage_threshold_percent", 75.0)
@@ -85,6 +94,318 @@ def is_resource_sufficient(settings: Dict[str, Any]) -> tuple[bool, str]:
 
     return mem_ok and disk_ok, message
 
+class Reservation:
+    """
+    一筆已通過准入控制的資源預留。離開 with 區塊或呼叫 release() 時歸還。
+    """
+
+    def __init__(self, sampler: "ResourceSampler", reservation_id: int, name: str, memory_mb: float, disk_mb: float):
+        self.sampler = sampler
+        self.id = reservation_id
+        self.name = name
+        self.memory_mb = memory_mb
+        self.disk_mb = disk_mb
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.sampler._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class ResourceSampler:
+    """
+    常駐的背景資源取樣器與准入控制器。
+
+    - 背景執行緒定期取樣記憶體與磁碟，以指數移動平均 (EWMA) 平滑，並保留一個時間視窗內的取樣。
+    - 呼叫端以 `try_reserve` / `admit` / `admit_async` 詢問「能否啟動一個需要 X MB 的工作」。
+      判斷會扣除其他進行中工作 (安裝、模型載入…) 已預留但尚未實際用到的量，
+      因此多個工作可以安全地平行啟動，而不必全部排隊。
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, interval: float = 1.0,
+                 window_seconds: float = 10.0, smoothing: float = 0.3):
+        """
+        Args:
+            settings: 從設定檔載入的參數字典 (讀取 resource_monitoring 的閾值)。
+            interval: 取樣間隔 (秒)。
+            window_seconds: 視窗長度 (秒)，用於計算視窗內的峰值。
+            smoothing: EWMA 的權重；越大越貼近最新取樣。
+        """
+        thresholds = (settings or {}).get("resource_monitoring", {})
+        self.memory_threshold_percent = thresholds.get("memory_usage_threshold_percent", 75.0)
+        self.min_disk_space_mb = thresholds.get("min_disk_space_mb", 512)
+        self.interval = interval
+        self.smoothing = smoothing
+        self._window = deque(maxlen=max(1, int(window_seconds / interval)))
+        self._smoothed: Dict[str, float] = {}
+        self._reservations: Dict[int, Reservation] = {}
+        # 最早一筆仍有效的預留建立時的記憶體用量；之後的增長視為預留已被實際使用
+        self._reserved_since_used_mb: Optional[float] = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.total_memory_mb = 0.0
+
+    # --- 取樣 ---
+
+    def _sample(self):
+        import psutil
+        memory = psutil.virtual_memory()
+        disk_usage = shutil.disk_usage("/")
+        sample = {
+            "timestamp": time.time(),
+            "cpu_percent": psutil.cpu_percent(),
+            "memory_used_mb": (memory.total - memory.available) / (1024**2),
+            "disk_free_mb": disk_usage.free / (1024**2),
+        }
+        with self._changed:
+            self.total_memory_mb = memory.total / (1024**2)
+            self._window.append(sample)
+            for key, value in sample.items():
+                if key == "timestamp":
+                    continue
+                previous = self._smoothed.get(key)
+                self._smoothed[key] = value if previous is None else previous + self.smoothing * (value - previous)
+            # 新的取樣可能讓排隊中的工作得以通過
+            self._changed.notify_all()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:
+                print(f"Error sampling resources: {e}")
+
+    def start(self) -> "ResourceSampler":
+        """先同步取樣一次 (讓第一次查詢就有數值)，再啟動背景執行緒。"""
+        if self._thread:
+            return self
+        self._sample()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ResourceSampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread:
+            self._stop_event.set()
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        返回平滑後的資源數值，格式與 get_system_resources 相容，並附上視窗峰值與預留資訊。
+        """
+        with self._lock:
+            used_mb = self._smoothed["memory_used_mb"]
+            peak_used_mb = max(s["memory_used_mb"] for s in self._window)
+            disk_free_mb = self._smoothed["disk_free_mb"]
+            reserved_memory_mb, reserved_disk_mb = self._outstanding_locked(used_mb)
+            total_mb = self.total_memory_mb
+        return {
+            "memory": {
+                "total_gb": round(total_mb / 1024, 2),
+                "available_gb": round((total_mb - used_mb) / 1024, 2),
+                "used_percent": round(used_mb / total_mb * 100, 1),
+                "window_peak_percent": round(peak_used_mb / total_mb * 100, 1),
+                "reserved_mb": round(reserved_memory_mb, 1),
+            },
+            "disk": {
+                "free_gb": round(disk_free_mb / 1024, 2),
+                "free_mb": round(disk_free_mb, 2),
+                "reserved_mb": round(reserved_disk_mb, 1),
+            },
+            "cpu_percent": round(self._smoothed["cpu_percent"], 1),
+        }
+
+    # --- 准入控制 ---
+
+    def _outstanding_locked(self, used_mb: float) -> tuple[float, float]:
+        """尚未被實際用掉的預留量 (記憶體, 磁碟)。需持有鎖。"""
+        if not self._reservations:
+            return 0.0, 0.0
+        reserved_memory = sum(r.memory_mb for r in self._reservations.values())
+        reserved_disk = sum(r.disk_mb for r in self._reservations.values())
+        # 預留之後記憶體的增長，視為預留的工作已經開始實際使用
+        growth = max(0.0, used_mb - self._reserved_since_used_mb)
+        return max(0.0, reserved_memory - growth), reserved_disk
+
+    def _check_locked(self, memory_mb: float, disk_mb: float) -> tuple[bool, str]:
+        used_mb = self._smoothed["memory_used_mb"]
+        outstanding_memory, outstanding_disk = self._outstanding_locked(used_mb)
+        projected_percent = (used_mb + outstanding_memory + memory_mb) / self.total_memory_mb * 100
+        projected_disk_mb = self._smoothed["disk_free_mb"] - outstanding_disk - disk_mb
+        mem_ok = projected_percent < self.memory_threshold_percent
+        disk_ok = projected_disk_mb > self.min_disk_space_mb
+        message = (
+            f"Memory: {projected_percent:.1f}% (含預留 {outstanding_memory:.0f}MB + 需求 {memory_mb:.0f}MB) "
+            f"< {self.memory_threshold_percent:.1f}% -> {'OK' if mem_ok else 'FAIL'}. "
+            f"Disk: {projected_disk_mb:.0f}MB > {self.min_disk_space_mb}MB -> {'OK' if disk_ok else 'FAIL'}."
+        )
+        return mem_ok and disk_ok, message
+
+    def can_admit(self, memory_mb: float = 0.0, disk_mb: float = 0.0) -> tuple[bool, str]:
+        """只詢問、不預留：目前能否啟動一個需要 memory_mb / disk_mb 的工作。"""
+        with self._lock:
+            return self._check_locked(memory_mb, disk_mb)
+
+    def try_reserve(self, name: str, memory_mb: float = 0.0, disk_mb: float = 0.0) -> tuple[Optional[Reservation], str]:
+        """
+        原子地檢查並預留資源。
+
+        Returns:
+            (reservation, message)；資源不足時 reservation 為 None。
+            沒有任何其他預留時一律放行，避免單一大型工作永遠無法啟動。
+        """
+        with self._lock:
+            ok, message = self._check_locked(memory_mb, disk_mb)
+            if not ok and self._reservations:
+                return None, message
+            if not self._reservations:
+                self._reserved_since_used_mb = self._smoothed["memory_used_mb"]
+            reservation = Reservation(self, next(self._ids), name, memory_mb, disk_mb)
+            self._reservations[reservation.id] = reservation
+            return reservation, message
+
+    def admit(self, name: str, memory_mb: float = 0.0, disk_mb: float = 0.0,
+              timeout: Optional[float] = None) -> Reservation:
+        """
+        阻塞直到資源足夠並取得預留。
+
+        Raises:
+            TimeoutError: 超過 timeout 仍無法取得。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            reservation, message = self.try_reserve(name, memory_mb, disk_mb)
+            if reservation:
+                return reservation
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError(f"等待資源逾時 ({name}): {message}")
+            with self._changed:
+                self._changed.wait(self.interval if remaining is None else min(self.interval, remaining))
+
+    async def admit_async(self, name: str, memory_mb: float = 0.0, disk_mb: float = 0.0,
+                          timeout: Optional[float] = None) -> Reservation:
+        """admit 的非同步版本；等待期間不會阻塞事件迴圈。"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            reservation, message = self.try_reserve(name, memory_mb, disk_mb)
+            if reservation:
+                return reservation
+            if deadline is not None and loop.time() >= deadline:
+                raise TimeoutError(f"等待資源逾時 ({name}): {message}")
+            await asyncio.sleep(self.interval)
+
+    def _release(self, reservation: Reservation):
+        with self._changed:
+            self._reservations.pop(reservation.id, None)
+            if not self._reservations:
+                self._reserved_since_used_mb = None
+            self._changed.notify_all()
+
+_shared_sampler: Optional[ResourceSampler] = None
+_shared_sampler_lock = threading.Lock()
+
+def start_resource_sampler(settings: Optional[Dict[str, Any]] = None) -> ResourceSampler:
+    """
+    建立並啟動行程內共用的資源取樣器；已啟動時直接返回同一個。
+
+    背景執行緒只應由啟動器在開始時明確啟動，其他模組透過 get_resource_sampler() 取用。
+
+    Args:
+        settings: 建立時使用的設定；None 時從設定檔載入。
+    """
+    global _shared_sampler
+    with _shared_sampler_lock:
+        if _shared_sampler is None:
+            settings = settings if settings is not None else load_resource_settings()
+            interval = settings.get("resource_monitoring", {}).get("sampler_interval_seconds", 1.0)
+            window = settings.get("resource_monitoring", {}).get("sampler_window_seconds", 10.0)
+            _shared_sampler = ResourceSampler(settings, interval=interval, window_seconds=window).start()
+        return _shared_sampler
+
+def get_resource_sampler() -> Optional[ResourceSampler]:
+    """返回已啟動的共用資源取樣器；尚未呼叫 start_resource_sampler() 時返回 None。"""
+    with _shared_sampler_lock:
+        return _shared_sampler
+
+def stop_resource_sampler():
+    """停止並丟棄共用的資源取樣器。"""
+    global _shared_sampler
+    with _shared_sampler_lock:
+        sampler, _shared_sampler = _shared_sampler, None
+    if sampler:
+        sampler.stop()
+
+class ProcessSampler:
+    """
+    追蹤多個具名進程 (連同其子進程) 的 CPU 與常駐記憶體 (RSS) 用量。
+
+    psutil 的 cpu_percent 是以「與上一次呼叫的間隔」計算，因此這裡會快取每個
+    psutil.Process 物件；新出現的子進程在第一次取樣時 CPU 會記為 0。
+    """
+
+    def __init__(self):
+        self._roots: Dict[str, int] = {}
+        self._processes: Dict[int, Any] = {}
+
+    def track(self, name: str, pid: int):
+        """開始追蹤一個進程。"""
+        self._roots[name] = pid
+
+    def untrack(self, name: str):
+        """停止追蹤一個進程。"""
+        self._roots.pop(name, None)
+
+    def _process(self, pid: int):
+        import psutil
+        process = self._processes.get(pid)
+        if process is None:
+            process = self._processes[pid] = psutil.Process(pid)
+            process.cpu_percent(None)  # 建立計算基準
+        return process
+
+    def sample(self) -> Dict[str, Dict[str, float]]:
+        """
+        取樣所有被追蹤的進程。
+
+        Returns:
+            {name: {"cpu_percent": float, "rss_mb": float}}；已結束的進程會自動停止追蹤。
+        """
+        import psutil
+        results = {}
+        alive = set()
+        for name, pid in list(self._roots.items()):
+            try:
+                root = self._process(pid)
+                tree = [root] + [self._process(child.pid) for child in root.children(recursive=True)]
+            except psutil.Error:
+                self.untrack(name)
+                continue
+            cpu, rss = 0.0, 0
+            for process in tree:
+                try:
+                    cpu += process.cpu_percent(None)
+                    rss += process.memory_info().rss
+                    alive.add(process.pid)
+                except psutil.Error:
+                    continue
+            results[name] = {"cpu_percent": round(cpu, 1), "rss_mb": round(rss / (1024**2), 1)}
+        # 丟棄已消失進程的快取
+        self._processes = {pid: p for pid, p in self._processes.items() if pid in alive}
+        return results
+
 if __name__ == "__main__":
     # 這個區塊允許我們獨立執行此檔案進行快速測試
     print("--- 執行資源監控器獨立測試 ---")
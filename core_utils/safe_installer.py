@@ -8,14 +8,19 @@ import subprocess
 import sys
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional
 
-from .resource_monitor import is_resource_sufficient, load_resource_settings
+from .resource_monitor import get_system_resources, is_resource_sufficient, load_resource_settings, start_resource_sampler
 
 # --- 日誌設定 ---
 LOGS_DIR = Path("logs")
 LOGS_DIR.mkdir(exist_ok=True)
 
+# --- 批次安裝預設值 (可由 resource_settings.yml 的 `installer` 區塊覆寫) ---
+DEFAULT_WHEEL_CACHE_DIR = ".uv_cache"
+DEFAULT_BATCH_MEMORY_HEADROOM_PERCENT = 15.0
+DEFAULT_BATCH_MIN_DISK_SPACE_MB = 2048
+
 def setup_logger(app_name: str) -> logging.Logger:
     """為指定的 App 設定一個詳細的日誌記錄器。"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -43,7 +48,100 @@ def setup_logger(app_name: str) -> logging.Logger:
 
     return logger
 
-def install_packages(app_name: str, requirements_path: str, python_executable: str):
+def parse_requirements(requirements_path: str) -> List[str]:
+    """讀取 requirements 檔案，去除註解與空行後返回套件列表。"""
+    with open(requirements_path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+
+    packages = []
+    for line in lines:
+        # 去除行內註解 (從 '#' 開始的部分)
+        line_content = line.split('#')[0].strip()
+        # 只有在處理後還有內容時才加入列表
+        if line_content:
+            packages.append(line_content)
+    return packages
+
+def get_wheel_cache_dir(settings: Dict[str, Any]) -> Path:
+    """
+    返回所有 App 虛擬環境共用的 uv 快取目錄。
+    快取與各個 venv 位於同一個檔案系統時，uv 會以硬連結方式安裝，幾乎不佔額外空間。
+    """
+    installer_settings = settings.get("installer", {}) or {}
+    cache_dir = Path(os.environ.get("UV_CACHE_DIR") or installer_settings.get("wheel_cache_dir", DEFAULT_WHEEL_CACHE_DIR))
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+def should_batch_install(settings: Dict[str, Any]) -> tuple[bool, str]:
+    """
+    判斷資源是否寬裕到可以一次性批次安裝整個 requirements 檔案。
+
+    只有當記憶體使用率低於「閾值減去保留空間」且磁碟剩餘空間足夠時才使用批次模式；
+    否則應退回逐一套件、每次安裝前都檢查資源的保守模式。
+
+    Returns:
+        一個元組 (use_batch, message)。
+    """
+    thresholds = settings.get("resource_monitoring", {})
+    installer_settings = settings.get("installer", {}) or {}
+
+    if not installer_settings.get("batch_install", True):
+        return False, "設定中已停用批次安裝。"
+
+    mem_threshold = thresholds.get("memory_usage_threshold_percent", 75.0)
+    headroom = installer_settings.get("batch_memory_headroom_percent", DEFAULT_BATCH_MEMORY_HEADROOM_PERCENT)
+    min_disk_mb = max(
+        thresholds.get("min_disk_space_mb", 512),
+        installer_settings.get("batch_min_disk_space_mb", DEFAULT_BATCH_MIN_DISK_SPACE_MB),
+    )
+
+    resources = get_system_resources()
+    mem_percent = resources["memory"]["used_percent"]
+    disk_free_mb = resources["disk"]["free_mb"]
+    mem_ok = mem_percent < mem_threshold - headroom
+    disk_ok = disk_free_mb > min_disk_mb
+
+    message = (
+        f"Memory: {mem_percent:.1f}% < {mem_threshold - headroom:.1f}% -> {'OK' if mem_ok else 'TIGHT'}. "
+        f"Disk: {disk_free_mb:.0f}MB > {min_disk_mb}MB -> {'OK' if disk_ok else 'TIGHT'}."
+    )
+    return mem_ok and disk_ok, message
+
+def build_install_command(python_executable: str, cache_dir: Path, packages: Optional[List[str]] = None,
+                          requirements_path: Optional[str] = None, extra_args: Optional[List[str]] = None) -> List[str]:
+    """組出 uv 安裝命令。給定 requirements_path 時，uv 會一次解析整個檔案並在單一交易中安裝。"""
+    command = ["uv", "pip", "install", "--python", python_executable, "--cache-dir", str(cache_dir)]
+    if extra_args:
+        command += extra_args
+    if requirements_path:
+        command += ["-r", str(requirements_path)]
+    if packages:
+        command += packages
+    return command
+
+def _install_batch(logger: logging.Logger, app_name: str, requirements_path: str, python_executable: str,
+                   cache_dir: Path, package_count: int, extra_args: Optional[List[str]] = None) -> bool:
+    """
+    以單一 uv 交易安裝整個 requirements 檔案。
+
+    Returns:
+        是否安裝成功；失敗時由呼叫端退回逐一套件安裝模式。
+    """
+    logger.info(f"資源充足，以批次模式一次安裝 {package_count} 個套件 (共用快取: {cache_dir})...")
+    command = build_install_command(python_executable, cache_dir, requirements_path=requirements_path,
+                                    extra_args=extra_args)
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, check=True, encoding='utf-8')
+        logger.debug(f"批次安裝命令輸出:\n{result.stdout}\n{result.stderr}")
+    except subprocess.CalledProcessError as e:
+        logger.warning(f"批次安裝時發生錯誤。返回碼: {e.returncode}")
+        logger.warning(f"錯誤訊息:\n{e.stderr}")
+        return False
+    logger.info(f"--- App '{app_name}' 所有套件均已成功安裝 (批次模式) ---")
+    return True
+
+def install_packages(app_name: str, requirements_path: str, python_executable: str,
+                     extra_args: Optional[List[str]] = None):
     """
     安全地安裝指定 requirements.txt 中的所有套件。
 
@@ -51,6 +149,7 @@ def install_packages(app_name: str, requirements_path: str, python_executable: s
         app_name: 正在安裝的 App 名稱 (e.g., "quant")。
         requirements_path: requirements.txt 檔案的路徑。
         python_executable: 目標虛擬環境的 Python 解譯器路徑。
+        extra_args: 額外傳給 `uv pip install` 的參數 (例如分層環境使用的 `--no-deps`)。
     """
     logger = setup_logger(app_name)
     logger.info(f"--- 開始為 App '{app_name}' 進行安全安裝 ---")
@@ -65,24 +164,29 @@ def install_packages(app_name: str, requirements_path: str, python_executable: s
         logger.info(f"--- App '{app_name}' 安裝結束 (無檔案) ---")
         return
 
-    with open(requirements_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    packages = []
-    for line in lines:
-        # 去除行內註解 (從 '#' 開始的部分)
-        line_content = line.split('#')[0].strip()
-        # 只有在處理後還有內容時才加入列表
-        if line_content:
-            packages.append(line_content)
-
+    packages = parse_requirements(requirements_path)
     logger.info(f"從 {requirements_path} 發現 {len(packages)} 個套件需要安裝。")
-
-    # 3. 逐一套件安裝
+    cache_dir = get_wheel_cache_dir(settings)
+
+    # 3. 資源寬裕時，一次解析並安裝整個檔案
+    use_batch, batch_message = should_batch_install(settings)
+    logger.debug(f"批次安裝評估: {batch_message}")
+    if use_batch:
+        if _install_batch(logger, app_name, requirements_path, python_executable, cache_dir, len(packages),
+                          extra_args):
+            return
+        # 批次交易失敗時不會留下半套環境；改以逐一安裝找出出問題的套件
+        logger.warning("批次安裝失敗，改為逐一套件安裝模式。")
+    else:
+        logger.warning(f"資源吃緊，改為逐一套件安裝模式。{batch_message}")
+
+    # 4. 資源吃緊或批次安裝失敗時，退回逐一套件安裝，並在每個套件前檢查資源
+    # 安裝器是獨立的子進程；逐一安裝時啟動自己的背景取樣器，讓每次檢查都使用平滑後的數值
+    start_resource_sampler(settings)
     for i, package in enumerate(packages):
         logger.info(f"--- [{i+1}/{len(packages)}] 準備安裝: {package} ---")
 
-        # 3.1. 安裝前檢查資源
+        # 4.1. 安裝前檢查資源
         sufficient, message = is_resource_sufficient(settings)
         logger.debug(f"資源檢查結果: {message}")
 
@@ -93,14 +197,10 @@ def install_packages(app_name: str, requirements_path: str, python_executable: s
 
         logger.info(f"資源充足。開始安裝 '{package}'...")
 
-        # 3.2. 執行安裝命令
+        # 4.2. 執行安裝命令
         try:
             # 使用 uv 來進行快速安裝
-            command = [
-                "uv", "pip", "install",
-                "--python", python_executable,
-                package
-            ]
+            command = build_install_command(python_executable, cache_dir, packages=[package], extra_args=extra_args)
             # 使用 subprocess.run 來執行命令並捕獲輸出
             result = subprocess.run(
                 command,
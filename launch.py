@@ -8,6 +8,7 @@ import os
 import time
 import json
 from datetime import datetime
+from collections import deque
 import shlex
 import threading
 import argparse
@@ -19,6 +20,7 @@ try:
     import psutil
     from IPython.display import display, clear_output
     import nest_asyncio
+    import aiohttp
     from aiohttp import web
     import pandas  # 確保 pandas 也被檢查
 except ImportError:
@@ -31,6 +33,7 @@ except ImportError:
         import psutil
         from IPython.display import display, clear_output
         import nest_asyncio
+        import aiohttp
         from aiohttp import web
         import pandas
     except Exception as e:
@@ -39,8 +42,15 @@ except ImportError:
         sys.exit(1)
 
 from core_utils.commander_console import CommanderConsole
-from core_utils.resource_monitor import is_resource_sufficient, load_resource_settings
+from core_utils.resource_monitor import (
+    ProcessSampler, get_resource_sampler, is_resource_sufficient, load_resource_settings, start_resource_sampler,
+    stop_resource_sampler,
+)
 from core_utils.report_generator import ReportGenerator
+from core_utils.safe_installer import build_install_command, get_wheel_cache_dir, parse_requirements, should_batch_install
+from core_utils.env_store import EnvStore, plan_environments, planned_keys, python_executable as env_python
+from core_utils.db_writer import BatchedDBWriter
+from core_utils.metrics_store import HOST_SOURCE, MetricsStore
 
 # --- 全域設定 ---
 LOGS_DIR = Path("logs")
@@ -48,9 +58,20 @@ LOGS_DIR.mkdir(exist_ok=True)
 DB_FILE = None # 將由命令列參數提供
 TAIWAN_TZ = pytz.timezone('Asia/Taipei')
 APPS_DIR = Path("apps")
+# App 就緒檢查的預設值，可由 config.json 中的同名鍵覆寫
+APP_READY_TIMEOUT_SECONDS = 60.0
+APP_READY_INITIAL_BACKOFF_SECONDS = 0.2
+APP_READY_MAX_BACKOFF_SECONDS = 2.0
 
 # 全域控制台物件
 console = CommanderConsole()
+# 全域資料庫寫入器，將在 main() 中建立資料表後啟動
+db_writer = None
+# 全域效能指標倉庫與 App 進程取樣器
+metrics_store = None
+process_sampler = ProcessSampler()
+# 環境倉庫中每個環境鍵的建立鎖，避免平行啟動的 App 重複建立同一個共用環境
+_env_build_locks = {}
 
 def setup_database():
     """初始化 SQLite 資料庫，建立前端所需的所有表。"""
@@ -59,6 +80,7 @@ def setup_database():
         # 確保從乾淨的狀態開始
         cursor.execute("DROP TABLE IF EXISTS phoenix_logs")
         cursor.execute("DROP TABLE IF EXISTS status_table")
+        cursor.execute("DROP TABLE IF EXISTS perf_rollups")
         cursor.execute("""
         CREATE TABLE phoenix_logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -77,30 +99,31 @@ def setup_database():
             cpu_usage REAL,
             ram_usage REAL
         )""")
+        # 效能指標只保存多解析度的彙總值，不再寫入 phoenix_logs
+        MetricsStore.create_table(conn)
         # 插入唯一的狀態行
         cursor.execute("INSERT OR IGNORE INTO status_table (id) VALUES (1)")
         conn.commit()
 
 def update_status(stage=None, apps_status=None, url=None, cpu=None, ram=None):
-    """安全地更新 status_table 中的狀態。"""
-    if not DB_FILE: return
-    try:
-        with sqlite3.connect(DB_FILE) as conn:
-            cursor = conn.cursor()
-            if stage is not None:
-                cursor.execute("UPDATE status_table SET current_stage = ? WHERE id = 1", (stage,))
-            if apps_status is not None:
-                cursor.execute("UPDATE status_table SET apps_status = ? WHERE id = 1", (json.dumps(apps_status),))
-            if url is not None:
-                cursor.execute("UPDATE status_table SET action_url = ? WHERE id = 1", (url,))
-            if cpu is not None:
-                cursor.execute("UPDATE status_table SET cpu_usage = ? WHERE id = 1", (cpu,))
-            if ram is not None:
-                cursor.execute("UPDATE status_table SET ram_usage = ? WHERE id = 1", (ram,))
-            conn.commit()
-    except Exception as e:
-        # 在啟動初期，TUI 可能還不存在，所以用 print
-        print(f"Error updating status db: {e}")
+    """將狀態更新交給批次寫入器，同一批次內的多次更新會被合併。"""
+    if not db_writer: return
+    fields = {}
+    if stage is not None:
+        fields["current_stage"] = stage
+        # 階段切換同時記錄為 STAGE 日誌，報告據此以 SQL 計算各階段耗時
+        timestamp = datetime.now(TAIWAN_TZ).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        db_writer.log(timestamp, "STAGE", stage)
+    if apps_status is not None:
+        fields["apps_status"] = json.dumps(apps_status)
+    if url is not None:
+        fields["action_url"] = url
+    if cpu is not None:
+        fields["cpu_usage"] = cpu
+    if ram is not None:
+        fields["ram_usage"] = ram
+    if fields:
+        db_writer.update_status(**fields)
 
 
 def log_event(level, message, cpu=None, ram=None):
@@ -110,18 +133,10 @@ def log_event(level, message, cpu=None, ram=None):
 
     console.add_log(f"[{level}] {message}")
 
-    if not DB_FILE: return
+    if not db_writer: return
     timestamp = datetime.now(TAIWAN_TZ).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-    try:
-        with sqlite3.connect(DB_FILE) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO phoenix_logs (timestamp, level, message, cpu_usage, ram_usage) VALUES (?, ?, ?, ?, ?)",
-                (timestamp, level, message, cpu, ram)
-            )
-            conn.commit()
-    except Exception as e:
-        print(f"Error logging to db: {e}")
+    # 只放入佇列，實際寫入由背景執行緒批次完成
+    db_writer.log(timestamp, level, message, cpu, ram)
 
 async def run_command_async_and_log(command: str, cwd: Path):
     """異步執行命令並將其輸出即時記錄到日誌中"""
@@ -146,18 +161,34 @@ async def run_command_async_and_log(command: str, cwd: Path):
         log_event("ERROR", f"Command failed with exit code {return_code}: {command}")
         raise RuntimeError(f"Command failed: {command}")
 
-async def safe_install_packages(app_name: str, requirements_path: Path, python_executable: str):
-    """安全地逐一安裝套件，並將日誌整合到主 TUI"""
+async def safe_install_packages(app_name: str, requirements_path: Path, python_executable: str, extra_args=None):
+    """
+    安全地安裝套件，並將日誌整合到主 TUI。
+    資源寬裕時以單一 uv 交易安裝整個檔案；資源吃緊時才退回逐一安裝並逐次檢查資源。
+    """
     if not requirements_path.exists():
         log_event("WARN", f"找不到 {requirements_path}，跳過安裝。")
         return
 
-    with open(requirements_path, "r") as f:
-        packages = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-
+    packages = parse_requirements(str(requirements_path))
+    settings = load_resource_settings()
+    cache_dir = get_wheel_cache_dir(settings)
+
+    use_batch, batch_message = should_batch_install(settings)
+    if use_batch:
+        log_event("BATTLE", f"開始為 {app_name} 批次安裝 {len(packages)} 個依賴 (共用快取: {cache_dir})。")
+        console.update_status_tag(f"[{app_name}] 批次安裝 {len(packages)} 個依賴")
+        command = shlex.join(build_install_command(python_executable, cache_dir, requirements_path=str(requirements_path),
+                                                   extra_args=extra_args))
+        try:
+            await run_command_async_and_log(command, APPS_DIR.parent)
+            return
+        except Exception as e:
+            log_event("WARN", f"批次安裝 {app_name} 的依賴失敗，改為逐一安裝模式: {e}")
+    else:
+        log_event("WARN", f"資源吃緊，{app_name} 改為逐一安裝模式: {batch_message}")
     log_event("BATTLE", f"開始為 {app_name} 安裝 {len(packages)} 個依賴。")
 
-    settings = load_resource_settings()
     for i, package in enumerate(packages):
         console.update_status_tag(f"[{app_name}] 安裝依賴: {i+1}/{len(packages)}")
         log_event("PROGRESS", f"正在安裝 {i+1}/{len(packages)}: {package}")
@@ -168,39 +199,151 @@ async def safe_install_packages(app_name: str, requirements_path: Path, python_e
             raise RuntimeError(f"Resource insufficient for {app_name}: {message}")
 
         try:
-            command = f"uv pip install --python {shlex.quote(python_executable)} {package}"
+            command = shlex.join(build_install_command(python_executable, cache_dir, packages=[package], extra_args=extra_args))
             await run_command_async_and_log(command, APPS_DIR.parent)
         except Exception as e:
             log_event("ERROR", f"安裝套件 '{package}' 失敗: {e}")
             raise
 
+async def wait_for_app_ready(app_name: str, process: subprocess.Popen, port: int, health_path: str = "/health",
+                             timeout: float = APP_READY_TIMEOUT_SECONDS,
+                             initial_backoff: float = APP_READY_INITIAL_BACKOFF_SECONDS,
+                             max_backoff: float = APP_READY_MAX_BACKOFF_SECONDS):
+    """
+    輪詢 App 的健康檢查端點，直到其回應 200 為止。
+    輪詢間隔以指數方式退避；若子程序提前結束或超過 timeout 則引發 RuntimeError。
+    """
+    url = f"http://127.0.0.1:{port}{health_path}"
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delay = initial_backoff
+    attempts = 0
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=2)) as session:
+        while True:
+            return_code = process.poll()
+            if return_code is not None:
+                raise RuntimeError(f"[{app_name}] 服務程序在就緒前已結束 (返回碼: {return_code})")
+
+            attempts += 1
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        return attempts
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass # 服務尚未開始監聽或仍在匯入模組
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise RuntimeError(f"[{app_name}] 等待健康檢查 {url} 逾時 ({timeout:.0f} 秒)")
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_backoff)
+
+def app_requirement_files(app_name: str) -> list:
+    """依安裝順序返回 App 的 requirements 檔案 (核心依賴在前，大型依賴在後)。"""
+    return [APPS_DIR / app_name / "requirements.txt", APPS_DIR / app_name / "requirements.large.txt"]
+
+async def ensure_store_env(store: EnvStore, key: str, label: str, packages=None, requirement_files=None,
+                           base_key=None) -> Path:
+    """
+    確保環境倉庫中 key 對應的 venv 已建立完成並返回其路徑。
+    已完成的環境直接重用；同一個 key 在平行啟動時只會被建立一次。
+
+    - 給定 packages 時視為分層環境：鎖定檔已包含完整的依賴閉包，因此以 --no-deps 只安裝本層的套件。
+    - 否則依序安裝 requirement_files 中的每個檔案。
+    """
+    lock = _env_build_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        env_path = store.env_path(key)
+        if store.is_ready(key):
+            store.mark_used(key)
+            log_event("INFO", f"[{label}] 重用已快取的環境 {key}，跳過建立與安裝。")
+            return env_path
+
+        # 沒有完成標記的目錄可能是上次中斷留下的，一律重建
+        store.discard(key)
+        await run_command_async_and_log(
+            f"uv venv --python {shlex.quote(sys.executable)} {shlex.quote(str(env_path))}", APPS_DIR.parent
+        )
+        if base_key:
+            store.link_base_layer(env_path, store.env_path(base_key))
+
+        extra_args = None
+        if packages is not None:
+            requirement_files = [store.write_layer_requirements(key, packages)] if packages else []
+            extra_args = ["--no-deps"]
+        for requirements_path in requirement_files or []:
+            await safe_install_packages(label, requirements_path, str(env_python(env_path)), extra_args=extra_args)
+
+        store.mark_ready(key, label=label)
+        log_event("INFO", f"[{label}] 環境 {key} 已建立並加入快取。")
+        return env_path
+
+async def prepare_app_env(store: EnvStore, env_plan: dict, app_name: str) -> Path:
+    """依照環境規劃為 App 準備 venv：分層時先確保共用基礎層，再安裝 App 獨有的套件。"""
+    app_plan = env_plan["apps"][app_name]
+    if not app_plan["layered"]:
+        return await ensure_store_env(store, app_plan["key"], app_name, requirement_files=app_plan["files"])
+
+    base = env_plan["base"]
+    await ensure_store_env(store, base["key"], "shared-base", packages=base["packages"])
+    return await ensure_store_env(store, app_plan["key"], app_name, packages=app_plan["packages"],
+                                  base_key=base["key"])
+
 # --- 核心啟動邏輯 ---
-async def manage_app_lifecycle(app_name, port, app_status):
-    """完整的應用生命週期管理：安裝、啟動"""
+async def admit_work(app_name: str, work: str, memory_mb: float, disk_mb: float = 0, timeout: float = None):
+    """
+    向共用的資源取樣器預留資源；資源不足時等待其他工作釋放或實際用掉預留量。
+    返回的預留物件應以 with 包住對應的工作。
+    """
+    sampler = get_resource_sampler()
+    if sampler is None:
+        raise RuntimeError("資源取樣器尚未啟動，請先呼叫 start_resource_sampler()。")
+    reservation, message = sampler.try_reserve(f"{app_name}:{work}", memory_mb, disk_mb)
+    if reservation:
+        return reservation
+    log_event("WARN", f"[{app_name}] 資源暫時不足，等待後再開始{work}: {message}")
+    return await sampler.admit_async(f"{app_name}:{work}", memory_mb, disk_mb, timeout=timeout)
+
+async def stop_app_process(app_name: str, process: subprocess.Popen, timeout: float = 5.0):
+    """終止 App 進程：先 terminate，逾時仍未結束則 kill；並停止追蹤它的資源用量。"""
+    process_sampler.untrack(app_name)
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        await asyncio.to_thread(process.wait, timeout)
+    except subprocess.TimeoutExpired:
+        log_event("WARN", f"[{app_name}] 服務程序未在 {timeout:.0f} 秒內結束，強制終止。")
+        process.kill()
+        await asyncio.to_thread(process.wait)
+
+async def manage_app_lifecycle(app_name, port, app_status, ready_timeout=APP_READY_TIMEOUT_SECONDS,
+                               max_backoff=APP_READY_MAX_BACKOFF_SECONDS, env_store=None, env_plan=None,
+                               admission=None):
+    """
+    完整的應用生命週期管理：安裝、啟動，並在健康檢查通過後才標記為 running。
+    安裝與啟動前都會先通過准入控制，讓平行執行的 App 不會同時把資源用盡。
+    """
     app_status[app_name] = "pending"
     update_status(apps_status=app_status)
-    venv_path = APPS_DIR / app_name / ".venv"
-    python_executable = str(venv_path / ('Scripts/python.exe' if sys.platform == 'win32' else 'bin/python'))
+    env_store = env_store or EnvStore()
+    env_plan = env_plan or plan_environments(env_store, {app_name: app_requirement_files(app_name)})
+    admission = admission if admission is not None else load_resource_settings().get("admission_control", {})
+    admission_timeout = admission.get("wait_timeout_seconds", 600)
+    process = None
 
     try:
-        # --- 1. 環境準備 ---
+        # --- 1. 環境準備與安裝依賴 (依賴未變動時直接重用快取的環境) ---
         app_status[app_name] = "installing"
         update_status(stage=f"[{app_name}] 準備環境", apps_status=app_status)
         console.update_status_tag(f"[{app_name}] 準備虛擬環境")
-        if not venv_path.exists():
-            await run_command_async_and_log(f"uv venv {shlex.quote(str(venv_path))}", APPS_DIR.parent)
+        with await admit_work(app_name, "安裝", admission.get("install_memory_mb", 512),
+                              admission.get("install_disk_mb", 1024), timeout=admission_timeout):
+            venv_path = await prepare_app_env(env_store, env_plan, app_name)
+        python_executable = str(env_python(venv_path))
 
-        # --- 2. 安裝依賴 ---
-        update_status(stage=f"[{app_name}] 安裝依賴")
-        req_file = APPS_DIR / app_name / "requirements.txt"
-        await safe_install_packages(app_name, req_file, python_executable)
-
-        # 安裝大型依賴 (如果存在)
-        large_req_file = APPS_DIR / app_name / "requirements.large.txt"
-        if large_req_file.exists():
-            await safe_install_packages(f"{app_name}-large", large_req_file, python_executable)
-
-        log_event("SUCCESS", f"[{app_name}] 所有依賴已成功安裝。")
+        log_event("SUCCESS", f"[{app_name}] 所有依賴已就緒 (環境: {venv_path})。")
 
         # --- 3. 啟動服務 ---
         app_status[app_name] = "starting"
@@ -211,22 +354,31 @@ async def manage_app_lifecycle(app_name, port, app_status):
 
         log_file = LOGS_DIR / f"{app_name}_service.log"
         main_script_path = APPS_DIR / app_name / "main.py"
-        with open(log_file, "w") as f:
-            subprocess.Popen(
-                [python_executable, str(main_script_path)],
-                env=env,
-                stdout=f, stderr=subprocess.STDOUT
-            )
-
-        await asyncio.sleep(10) # 給予服務啟動時間
+        # 啟動期間 (匯入模組、載入模型) 的記憶體用量預留到健康檢查通過為止，之後以實際用量計算
+        with await admit_work(app_name, "啟動", admission.get("app_start_memory_mb", 256), timeout=admission_timeout):
+            with open(log_file, "w") as f:
+                process = subprocess.Popen(
+                    [python_executable, str(main_script_path)],
+                    env=env,
+                    stdout=f, stderr=subprocess.STDOUT
+                )
+            # 讓效能取樣執行緒記錄此 App 進程的 CPU 與記憶體用量
+            process_sampler.track(app_name, process.pid)
+
+            started_at = time.monotonic()
+            attempts = await wait_for_app_ready(app_name, process, port, timeout=ready_timeout, max_backoff=max_backoff)
         app_status[app_name] = "running"
         update_status(apps_status=app_status)
-        log_event("SUCCESS", f"[{app_name}] 服務已在背景啟動 (日誌: {log_file})")
+        log_event("SUCCESS", f"[{app_name}] 服務已就緒，耗時 {time.monotonic() - started_at:.1f} 秒，"
+                             f"健康檢查 {attempts} 次 (日誌: {log_file})")
 
-    except Exception as e:
+    except BaseException as e:
+        # 啟動後的任何失敗 (健康檢查逾時、提前結束、被取消) 都不能留下佔用埠號的孤兒進程
+        if process is not None:
+            await stop_app_process(app_name, process)
         app_status[app_name] = "failed"
         update_status(apps_status=app_status)
-        log_event("CRITICAL", f"管理應用 '{app_name}' 時發生嚴重錯誤: {e}")
+        log_event("CRITICAL", f"管理應用 '{app_name}' 時發生嚴重錯誤: {e or type(e).__name__}")
         raise
 
 def load_config():
@@ -242,7 +394,7 @@ def load_config():
         return json.load(f)
 
 async def main_logic(config: dict):
-    """核心的循序啟動邏輯"""
+    """核心的啟動邏輯"""
     is_full_mode = not config.get("FAST_TEST_MODE", True)
     apps_status = { "quant": "pending", "transcriber": "pending" }
 
@@ -270,9 +422,26 @@ async def main_logic(config: dict):
         {"name": "transcriber", "port": 8002}
     ]
 
-    # 循序執行以避免資源競爭
-    for app_config in app_configs:
-        await manage_app_lifecycle(app_config['name'], app_config['port'], apps_status)
+    # 各 App 的環境建立、安裝與啟動彼此獨立，平行執行，總耗時取決於最慢的 App
+    ready_timeout = float(config.get("APP_READY_TIMEOUT_SECONDS", APP_READY_TIMEOUT_SECONDS))
+    max_backoff = float(config.get("APP_READY_MAX_BACKOFF_SECONDS", APP_READY_MAX_BACKOFF_SECONDS))
+    # 以依賴內容雜湊規劃環境：未變動的 App 重用快取，共同的套件只安裝一次
+    env_store = EnvStore()
+    env_plan = plan_environments(env_store, {c['name']: app_requirement_files(c['name']) for c in app_configs})
+    admission = load_resource_settings().get("admission_control", {})
+    if env_plan["base"]:
+        log_event("INFO", f"共用基礎層包含 {len(env_plan['base']['packages'])} 個套件 ({env_plan['base']['key']})。")
+    removed = env_store.prune(planned_keys(env_plan))
+    if removed:
+        log_event("INFO", f"已清除 {len(removed)} 個長期未使用的快取環境: {', '.join(removed)}")
+
+    # 單一 App 失敗不應中斷其他 App，失敗狀態已由 manage_app_lifecycle 記錄
+    await asyncio.gather(
+        *(manage_app_lifecycle(app_config['name'], app_config['port'], apps_status, ready_timeout, max_backoff,
+                               env_store, env_plan, admission)
+          for app_config in app_configs),
+        return_exceptions=True
+    )
 
     if all(status == "running" for status in apps_status.values()):
         log_event("SUCCESS", "所有核心服務已成功啟動。")
@@ -292,61 +461,259 @@ async def main_logic(config: dict):
 
 # --- 主程序 ---
 def performance_logger_thread(settings: dict):
-    """一個獨立的執行緒，專門用來將效能數據寫入資料庫"""
-    # 從 settings 中獲取刷新率，如果沒有則使用預設值 1 秒
-    refresh_interval = settings.get('resource_monitoring', {}).get('monitor_refresh_seconds', 1.0)
+    """
+    一個獨立的執行緒，專門負責效能取樣。
+    取樣交給 metrics_store 彙總 (1 秒 / 10 秒 / 1 分鐘)，只有彙總值會定期落地。
+    """
+    # 取樣間隔至少 1 秒；monitor_refresh_seconds 是給前端儀表板用的，可能更短
+    refresh_interval = max(settings.get('resource_monitoring', {}).get('monitor_refresh_seconds', 1.0), 1.0)
 
     while not console._stop_event.is_set():
-        # 更新 status_table
+        # 更新 status_table (同一批次內的多次更新會被合併)
         update_status(cpu=console.cpu_usage, ram=console.ram_usage)
 
-        # 也將其記錄到日誌表
-        timestamp = datetime.now(TAIWAN_TZ).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-        try:
-            with sqlite3.connect(DB_FILE) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "INSERT INTO phoenix_logs (timestamp, level, message, cpu_usage, ram_usage) VALUES (?, ?, ?, ?, ?)",
-                    (timestamp, "PERF", "performance_snapshot", console.cpu_usage, console.ram_usage)
-                )
-                conn.commit()
-        except Exception as e:
-            print(f"Error in perf logger: {e}")
+        if metrics_store:
+            now = time.time()
+            metrics_store.record(HOST_SOURCE, {"cpu_percent": console.cpu_usage, "ram_percent": console.ram_usage}, now)
+            for app_name, usage in process_sampler.sample().items():
+                metrics_store.record(app_name, usage, now)
 
-        time.sleep(1) # 每秒記錄一次
+        time.sleep(refresh_interval)
 
 # --- API 伺服器邏輯 ---
-async def get_status_api(request):
-    """API 端點，用於獲取當前的完整狀態"""
-    try:
-        with sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+class StatusHub:
+    """
+    狀態 API 的共享快取。
+
+    寫入器每次提交後會通知此物件，由單一背景任務讀取一次資料庫，
+    並把新增的日誌保存在記憶體中；所有 long-poll / SSE 請求都從這份快取取得增量資料，
+    因此不論開了多少個儀表板分頁，每次資料變動都只需要一次資料庫讀取。
+    """
+
+    def __init__(self, db_path: Path, max_cached_logs: int = 1000, min_refresh_interval: float = 0.1):
+        self.db_path = db_path
+        self.min_refresh_interval = min_refresh_interval
+        self.status = None
+        self.logs = deque(maxlen=max_cached_logs)
+        self.cursor = 0   # 快取中最新一筆日誌的 id
+        self.version = 0  # 每次快取更新後遞增
+        self._loop = asyncio.get_running_loop()
+        self._dirty = asyncio.Event()
+        self._changed = asyncio.Condition()
+
+    def notify_threadsafe(self):
+        """由寫入執行緒呼叫，標記資料庫已有新資料。"""
+        self._loop.call_soon_threadsafe(self._dirty.set)
+
+    def _connect(self):
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _read_changes(self, since: int):
+        """
+        讀取狀態列與 id 大於 since 的日誌。
+
+        日誌由舊到新最多返回 maxlen 筆；返回筆數等於 maxlen 時，之後可能還有日誌，
+        呼叫端以最後一筆的 id 作為下一次的 since 繼續讀取。
+        """
+        with self._connect() as conn:
+            status = conn.execute("SELECT * FROM status_table WHERE id = 1").fetchone()
+            rows = conn.execute(
+                "SELECT id, timestamp, level, message FROM phoenix_logs WHERE id > ? ORDER BY id ASC LIMIT ?",
+                (since, self.logs.maxlen)
+            ).fetchall()
+        return (dict(status) if status else None), [dict(row) for row in rows]
+
+    async def refresh(self):
+        """從資料庫讀取所有增量資料，並喚醒所有等待中的請求。"""
+        while True:
+            status, rows = await asyncio.to_thread(self._read_changes, self.cursor)
+            self.status = status
+            if rows:
+                self.logs.extend(rows)
+                self.cursor = rows[-1]["id"]
+            if len(rows) < self.logs.maxlen:
+                break
+        async with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    async def run(self):
+        """背景任務：每次被通知時刷新快取，並以 min_refresh_interval 合併密集的寫入。"""
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            try:
+                await self.refresh()
+            except sqlite3.Error as e:
+                print(f"Error refreshing status cache: {e}")
+            await asyncio.sleep(self.min_refresh_interval)
+
+    async def wait_for_change(self, version: int, timeout: float) -> bool:
+        """等待快取版本超過 version，逾時則返回 False。"""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self.version > version), timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    async def logs_since(self, since: int) -> list:
+        """
+        返回 id 大於 since 的日誌 (由舊到新)。
+
+        快取不足以涵蓋時才回頭查詢資料庫，此時只返回緊接在 since 之後的最多 maxlen 筆，
+        客戶端以新的 cursor 再次請求即可補齊其餘的日誌，不會跳過任何一筆。
+        """
+        if not self.logs or since >= self.logs[0]["id"] - 1:
+            return [log for log in self.logs if log["id"] > since]
+        _, rows = await asyncio.to_thread(self._read_changes, since)
+        return rows
+
+    async def snapshot(self, since: int) -> dict:
+        logs = await self.logs_since(since)
+        return {
+            "status": self.status,
+            "logs": logs,
+            "cursor": logs[-1]["id"] if logs else max(since, 0),
+        }
 
-            # 獲取主狀態
-            cursor.execute("SELECT * FROM status_table WHERE id = 1")
-            status_data = cursor.fetchone()
 
-            # 獲取最新的 20 條日誌
-            cursor.execute("SELECT timestamp, level, message FROM phoenix_logs ORDER BY id DESC LIMIT 20")
-            logs_data = cursor.fetchall()
+REPORT_LOCK = web.AppKey("report_lock", asyncio.Lock)
+STATUS_HUB = web.AppKey("status_hub", StatusHub)
+# long-poll 單次最長等待秒數
+STATUS_MAX_WAIT_SECONDS = 30.0
+# SSE 連線在無資料時送出心跳的間隔
+SSE_KEEPALIVE_SECONDS = 15.0
 
-        if not status_data:
-            return web.json_response({"error": "Status not found"}, status=404)
 
-        response_data = {
-            "status": dict(status_data),
-            "logs": [dict(log) for log in logs_data]
-        }
-        return web.json_response(response_data)
+def _parse_non_negative(request, name: str, cast=int):
+    value = request.query.get(name)
+    if value is None:
+        return None
+    parsed = cast(value)
+    if parsed < 0:
+        raise ValueError(f"{name} 不可為負數")
+    return parsed
+
+
+async def get_status_api(request):
+    """
+    API 端點，用於獲取當前狀態與日誌。
+
+    - 不帶參數：返回狀態與最新的 20 條日誌 (由新到舊)，與舊版前端相容。
+    - `since=<log id>`：只返回 id 大於該值的日誌 (由舊到新)，並附上新的 `cursor`。
+    - `wait=<秒數>`：搭配 `since` 使用的 long-poll；若目前沒有新日誌，最多等待該秒數直到有資料變動。
+    """
+    hub = request.app[STATUS_HUB]
+    try:
+        since = _parse_non_negative(request, "since")
+        wait = _parse_non_negative(request, "wait", float)
+    except ValueError as e:
+        return web.json_response({"error": f"參數錯誤: {e}"}, status=400)
+
+    try:
+        if since is None:
+            if hub.status is None:
+                return web.json_response({"error": "Status not found"}, status=404)
+            latest = list(hub.logs)[-20:]
+            return web.json_response({
+                "status": hub.status,
+                "logs": [{k: log[k] for k in ("timestamp", "level", "message")} for log in reversed(latest)],
+                "cursor": hub.cursor,
+            })
+
+        if wait and hub.cursor <= since:
+            await hub.wait_for_change(hub.version, min(wait, STATUS_MAX_WAIT_SECONDS))
+
+        if hub.status is None:
+            return web.json_response({"error": "Status not found"}, status=404)
+        return web.json_response(await hub.snapshot(since))
 
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
+
+async def stream_status_api(request):
+    """
+    Server-Sent Events 端點：每當狀態或日誌變動時推送一次增量資料。
+    斷線重連時，瀏覽器會自動帶上 Last-Event-ID，從上次的 cursor 繼續。
+    """
+    hub = request.app[STATUS_HUB]
+    try:
+        since = int(request.headers.get("Last-Event-ID") or request.query.get("since", 0))
+    except ValueError:
+        return web.json_response({"error": "參數錯誤: since 必須是整數"}, status=400)
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+    })
+    await response.prepare(request)
+
+    version = hub.version
+    try:
+        while True:
+            if hub.status is not None:
+                payload = await hub.snapshot(since)
+                since = payload["cursor"]
+                data = json.dumps(payload, ensure_ascii=False)
+                await response.write(f"id: {since}\ndata: {data}\n\n".encode("utf-8"))
+                if since < hub.cursor:
+                    # 還沒追上快取 (一次最多送出一頁)：不等待資料變動，直接送出下一頁
+                    continue
+            while not await hub.wait_for_change(version, SSE_KEEPALIVE_SECONDS):
+                await response.write(b": keep-alive\n\n")
+            version = hub.version
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    return response
+
+
+def generate_reports() -> list:
+    """
+    把目前為止的日誌與效能彙總落地後生成報告。
+    可在執行途中呼叫 (經由報告 API)，也會在程式結束時呼叫。
+    """
+    # 報告直接讀取資料庫，先確保佇列中的日誌與效能彙總都已落地
+    db_writer.flush()
+    metrics_store.flush(include_open=True)
+    config_path = Path("config.json")
+    if not config_path.exists():
+        raise FileNotFoundError("找不到設定檔 (config.json)，無法生成報告。")
+    return ReportGenerator(db_path=DB_FILE, config_path=config_path).generate_all_reports()
+
+
+async def create_reports_api(request):
+    """
+    POST /api/v1/reports：在執行途中按需生成報告。
+    報告生成在執行緒中進行，不會阻塞狀態 API；同時只會有一個生成工作。
+    """
+    lock = request.app[REPORT_LOCK]
+    if lock.locked():
+        return web.json_response({"error": "報告正在生成中，請稍後再試"}, status=409)
+    async with lock:
+        try:
+            paths = await asyncio.get_running_loop().run_in_executor(None, generate_reports)
+        except FileNotFoundError as e:
+            return web.json_response({"error": str(e)}, status=404)
+    return web.json_response({"reports": [str(path) for path in paths]})
+
+
 async def run_api_server():
     """運行 aiohttp API 伺服器"""
+    hub = StatusHub(DB_FILE)
+    await hub.refresh()
+    db_writer.add_listener(hub.notify_threadsafe)
+    hub_task = asyncio.create_task(hub.run())
+
     app = web.Application()
+    app[STATUS_HUB] = hub
+    app[REPORT_LOCK] = asyncio.Lock()
     app.router.add_get("/api/v1/status", get_status_api)
+    app.router.add_get("/api/v1/status/stream", stream_status_api)
+    app.router.add_post("/api/v1/reports", create_reports_api)
     runner = web.AppRunner(app)
     await runner.setup()
     # 使用一個前端不太可能衝突的埠
@@ -360,23 +727,32 @@ async def run_api_server():
     except asyncio.CancelledError:
         log_event("INFO", "狀態 API 伺服器正在關閉...")
     finally:
+        db_writer.remove_listener(hub.notify_threadsafe)
+        hub_task.cancel()
         await runner.cleanup()
 
 
 async def main(db_path: Path):
     """包含 TUI、API 和休眠邏輯的主異步函數"""
-    global DB_FILE
+    global DB_FILE, db_writer, metrics_store
     DB_FILE = db_path
 
     if DB_FILE.exists():
         os.remove(DB_FILE)
     setup_database()
 
+    # 所有日誌與狀態都經由同一條長連線批次寫入
+    db_writer = BatchedDBWriter(DB_FILE)
+    db_writer.start()
+    metrics_store = MetricsStore(DB_FILE)
+
     config = load_config()
     console.start()
 
     # 讀取資源設定以傳遞給效能日誌記錄執行緒
     resource_settings = load_resource_settings()
+    # 啟動常駐的資源取樣器；之後的資源檢查與准入控制都讀取它的平滑數值
+    start_resource_sampler(resource_settings)
 
     # 啟動專門的效能日誌記錄執行緒
     perf_thread = threading.Thread(target=performance_logger_thread, args=(resource_settings,), daemon=True)
@@ -409,6 +785,7 @@ async def main(db_path: Path):
         console.stop("程序結束。")
         # 確保效能日誌執行緒也已停止
         perf_thread.join(timeout=1.5)
+        stop_resource_sampler()
 
         # 停止 API 伺服器
         if not api_task.done():
@@ -418,15 +795,15 @@ async def main(db_path: Path):
         # --- 報告生成 ---
         log_event("INFO", "開始生成最終報告...")
         try:
-            config_path = Path("config.json")
-            if config_path.exists():
-                generator = ReportGenerator(db_path=DB_FILE, config_path=config_path)
-                generator.generate_all_reports()
-                log_event("SUCCESS", "所有報告已成功生成。")
-            else:
-                log_event("WARN", "找不到設定檔 (config.json)，無法生成報告。")
+            generate_reports()
+            log_event("SUCCESS", "所有報告已成功生成。")
+        except FileNotFoundError as e:
+            log_event("WARN", str(e))
         except Exception as e:
             log_event("CRITICAL", f"生成報告時發生嚴重錯誤: {e}")
+        finally:
+            # 關閉前把剩餘的日誌全部寫完
+            db_writer.stop()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="鳳凰之心 v18.0 後端啟動器")
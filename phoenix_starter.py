@@ -31,6 +31,8 @@ import re
 # --- 常數與設定 ---
 APPS_DIR = Path("apps")
 PROJECT_ROOT = Path(__file__).parent.resolve()
+# 每個 App 環境都會額外安裝的測試工具
+COMMON_TEST_DEPS = "pytest pytest-mock ruff httpx"
 
 # --- 應用程式狀態枚舉 ---
 class AppStatus:
@@ -49,7 +51,7 @@ class App:
         self.path = path
         self.name = path.name
         self.status = AppStatus.PENDING
-        self.venv_path = path / ".venv_visual" # 使用獨立的 venv
+        self.venv_path = path / ".venv_visual" # 實際路徑由環境倉庫在準備環境時決定
         self.log = []
         self.dashboard = None
 
@@ -63,6 +65,14 @@ class App:
         if self.dashboard:
             self.dashboard.add_log_entry(message)
 
+    def add_logs(self, messages: list[str]):
+        """一次加入多行日誌，儀表板只會為整批日誌重繪一次"""
+        if not messages:
+            return
+        self.log.extend(messages)
+        if self.dashboard:
+            self.dashboard.add_log_entries(messages)
+
 # 用於解析 uv 進度條的正則表達式
 PROGRESS_RE = re.compile(
     r"(?P<package>[\w\-]+)\s+"  # 套件名稱
@@ -72,9 +82,30 @@ PROGRESS_RE = re.compile(
     r"(?P<size>[\d\./\w ]+)\s+@\s+" # 大小
     r"(?P<speed>[\d\.\w /s]+)"     # 速度
 )
+# 同一個樣式的多行版本，用來在一整塊輸出中一次找出所有進度行
+PROGRESS_LINE_RE = re.compile(r"(?:^|(?<=\r))[ \t]*" + PROGRESS_RE.pattern + r"[^\r\n]*", re.MULTILINE)
+# 子進程輸出每次讀取的最大位元組數
+READ_CHUNK_BYTES = 64 * 1024
+
+def split_progress(chunk: str) -> tuple[list[str], str | None]:
+    """
+    把一塊輸出拆成「一般日誌行」與「最新的一條進度行」。
+    整塊文字只做一次正則掃描；同一塊中較舊的進度行已經過時，直接捨棄。
+    """
+    parts, last_progress, pos = [], None, 0
+    for match in PROGRESS_LINE_RE.finditer(chunk):
+        parts.append(chunk[pos:match.start()])
+        pos = match.end()
+        last_progress = match.group(0).strip()
+    parts.append(chunk[pos:])
+    lines = [line.strip() for line in re.split(r"[\r\n]+", "".join(parts)) if line.strip()]
+    return lines, last_progress
 
 async def run_command_async(command: str, cwd: Path, app: App):
-    """異步執行一個子進程命令，並將其輸出串流到 App 的日誌中"""
+    """
+    異步執行一個子進程命令，並將其輸出串流到 App 的日誌中。
+    輸出以區塊為單位讀取：每個區塊只解析一次，日誌整批加入、進度只顯示最新一條。
+    """
     is_install_command = "pip install" in command
     task_name = f"安裝依賴於 {app.name}" if is_install_command else f"執行 {command.split()[0]}"
 
@@ -88,46 +119,55 @@ async def run_command_async(command: str, cwd: Path, app: App):
     else:
         process = await asyncio.create_subprocess_shell(command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, cwd=cwd)
 
+    pending = b""
     while True:
-        line = await process.stdout.readline()
-        if not line:
-            break
-        decoded_line = line.decode('utf-8', errors='replace').strip()
-        if not decoded_line:
-            continue
-
-        match = PROGRESS_RE.match(decoded_line)
-        if match and app.dashboard and is_install_command:
-            # 這是進度條，更新當前任務區塊
-            app.dashboard.update_current_task(progress_line=decoded_line)
+        data = await process.stdout.read(READ_CHUNK_BYTES)
+        if data:
+            pending += data
+            # 只處理完整的行 (uv 的進度條以 \r 覆寫同一行)，不完整的尾巴留到下一塊
+            cut = max(pending.rfind(b"\n"), pending.rfind(b"\r")) + 1
+            if not cut:
+                continue
+            chunk, pending = pending[:cut], pending[cut:]
+        elif pending:
+            chunk, pending = pending, b""
         else:
-            # 這是普通日誌
-            app.add_log(decoded_line)
+            break
+        handle_output_chunk(app, chunk.decode('utf-8', errors='replace'), is_install_command)
 
     if app.dashboard and is_install_command:
         app.dashboard.update_current_task(task_name="[空閒]", progress_line="")
 
     return await process.wait()
 
+def handle_output_chunk(app: App, chunk: str, is_install_command: bool = True):
+    """把一塊輸出轉為 App 日誌與當前任務的進度顯示"""
+    lines, progress_line = split_progress(chunk)
+    if progress_line and app.dashboard and is_install_command:
+        # 這是進度條，更新當前任務區塊
+        app.dashboard.update_current_task(progress_line=progress_line)
+    elif progress_line:
+        lines.append(progress_line)
+    # 這是普通日誌
+    app.add_logs(lines)
+
 async def watch_log_file(log_file: Path, app: App):
-    """在背景監控指定的日誌檔案，並將新內容添加到 App 的日誌中"""
+    """
+    在背景追蹤指定的日誌檔案，並將新內容添加到 App 的日誌中。
+    只有檔案真的被寫入時才會被喚醒 (Linux 上使用 inotify)，安裝結束後會把剩餘內容讀完。
+    """
+    from core_utils.log_tail import follow_file
     app.add_log(f"日誌監控已啟動: {log_file}")
     try:
-        with open(log_file, 'r', encoding='utf-8') as f:
-            f.seek(0, 2) # 移動到檔案末尾
-            while not app.install_finished.is_set():
-                line = f.readline()
-                if not line:
-                    await asyncio.sleep(0.1)
-                    continue
-                app.add_log(line.strip())
+        async for chunk in follow_file(log_file, app.install_finished):
+            handle_output_chunk(app, chunk)
     except FileNotFoundError:
         app.add_log(f"警告：日誌檔案 {log_file} 未找到。")
     except Exception as e:
         app.add_log(f"日誌監控錯誤: {e}")
 
 
-async def run_safe_installer(app: App, reqs_file: Path, python_executable: str):
+async def run_safe_installer(app: App, reqs_file: Path, python_executable: str, extra_args=None):
     """在一個單獨的執行緒中運行同步的 safe_installer"""
     from core_utils.safe_installer import install_packages
     loop = asyncio.get_event_loop()
@@ -137,76 +177,125 @@ async def run_safe_installer(app: App, reqs_file: Path, python_executable: str):
         install_packages,
         app.name,
         str(reqs_file),
-        python_executable
+        python_executable,
+        extra_args
     )
 
-async def prepare_app_environment(app: App, install_large_deps=False):
-    """為單個 App 準備環境和依賴 (使用 safe_installer)"""
+def app_requirement_files(app: App, install_large_deps=False) -> list[Path]:
+    """依安裝順序返回 App 需要安裝的 requirements 檔案"""
+    files = [app.path / "requirements.txt"]
+    if install_large_deps:
+        files.append(app.path / "requirements.large.txt")
+    return files
+
+async def install_with_log_watcher(app: App, label: str, reqs_file: Path, python_executable: Path, extra_args=None):
+    """執行安全安裝，並在安裝期間把 safe_installer 的日誌檔即時轉送到儀表板"""
     from core_utils.safe_installer import setup_logger
+    # 我們需要找到 safe_installer 將要建立的日誌檔
+    # 為了簡化，我們讓 safe_installer 返回日誌檔路徑
+    logger = setup_logger(label)
+    log_file_path = logger.handlers[0].baseFilename
+
+    app.install_finished = asyncio.Event()
+    log_watcher_task = asyncio.create_task(watch_log_file(Path(log_file_path), app))
+    try:
+        await run_safe_installer(app, reqs_file, str(python_executable), extra_args)
+    finally:
+        # 通知追蹤器把剩餘的日誌讀完後結束
+        app.install_finished.set()
+        try:
+            await asyncio.wait_for(log_watcher_task, timeout=2.0)
+        except asyncio.TimeoutError:
+            pass
+
+async def ensure_base_layer(app: App, store, base: dict):
+    """確保共用基礎層環境已建立；它只包含所有 App 共同且版本相同的套件"""
+    from core_utils.env_store import python_executable as env_python
+    if store.is_ready(base["key"]):
+        store.mark_used(base["key"])
+        return
+    app.add_log(f"建立共用基礎層環境 ({len(base['packages'])} 個套件)...")
+    store.discard(base["key"])
+    env_path = store.env_path(base["key"])
+    # 明確指定解譯器：環境鍵包含啟動器的 Python 版本，環境必須以同一個解譯器建立
+    return_code = await run_command_async(
+        f"uv venv --python {shlex.quote(sys.executable)} {shlex.quote(str(env_path))}", cwd=PROJECT_ROOT, app=app
+    )
+    if return_code != 0: raise RuntimeError("建立共用基礎層環境失敗")
+    reqs_file = store.write_layer_requirements(base["key"], base["packages"])
+    await install_with_log_watcher(app, "shared_base", reqs_file, env_python(env_path), ["--no-deps"])
+    store.mark_ready(base["key"], label="shared-base")
+
+async def prepare_app_environment(app: App, install_large_deps=False, store=None, env_plan=None):
+    """
+    為單個 App 準備環境和依賴 (使用 safe_installer)。
+    環境存放在以依賴內容雜湊為鍵的環境倉庫中：依賴未變動時直接重用，
+    與其他 App 共同的套件則由共用基礎層提供，不再重複安裝。
+    """
+    from core_utils.env_store import EnvStore, plan_environments, python_executable as env_python
     app.set_status(AppStatus.INSTALLING)
     app.install_finished = asyncio.Event()
 
-    log_watcher_task = None
+    store = store or EnvStore()
+    env_plan = env_plan or plan_environments(
+        store, {app.name: app_requirement_files(app, install_large_deps)}, extra=COMMON_TEST_DEPS
+    )
+    app_plan = env_plan["apps"][app.name]
+    app.venv_path = store.env_path(app_plan["key"])
+    python_executable = env_python(app.venv_path)
+
     try:
-        # 1. 建立虛擬環境
-        venv_cmd = f"uv venv {shlex.quote(str(app.venv_path))} --seed"
+        if store.is_ready(app_plan["key"]):
+            store.mark_used(app_plan["key"])
+            app.add_log(f"♻️ 依賴未變動，重用已快取的環境 {app_plan['key']}。")
+            app.set_status(AppStatus.INSTALL_DONE)
+            return True
+
+        # 0. 分層時，先確保共用基礎層已就緒
+        if app_plan["layered"]:
+            await ensure_base_layer(app, store, env_plan["base"])
+
+        # 1. 建立虛擬環境 (沒有完成標記的目錄可能是上次中斷留下的，一律重建)
+        store.discard(app_plan["key"])
+        venv_cmd = f"uv venv --python {shlex.quote(sys.executable)} {shlex.quote(str(app.venv_path))} --seed"
         return_code = await run_command_async(venv_cmd, cwd=PROJECT_ROOT, app=app)
         if return_code != 0: raise RuntimeError("建立虛擬環境失敗")
 
-        python_executable = app.venv_path / ('Scripts/python.exe' if sys.platform == 'win32' else 'bin/python')
         if not python_executable.exists(): raise FileNotFoundError(f"找不到 Python 解譯器: {python_executable}")
+        if app_plan["layered"]:
+            store.link_base_layer(app.venv_path, store.env_path(env_plan["base"]["key"]))
 
         # 2. 安裝通用測試依賴 (這些通常很小，直接安裝)
-        common_deps = "pytest pytest-mock ruff httpx"
-        pip_cmd = f'uv pip install --python "{python_executable}" {common_deps}'
+        # 以 App 自己的鎖定檔作為約束，確保測試工具帶入的依賴與 App 的版本一致
+        constraints = " ".join(f'-c "{path}"' for path in app_plan["files"])
+        pip_cmd = f'uv pip install --python "{python_executable}" {constraints} {COMMON_TEST_DEPS}'
         await run_command_async(pip_cmd, cwd=PROJECT_ROOT, app=app)
 
-        # 找出最新的日誌檔案以進行監控
-        log_dir = Path("logs")
-        list_of_logs = list(log_dir.glob(f"install_{app.name}_*.log"))
-        # 這裡我們假設在執行此函式前，safe_installer 尚未建立日誌
-        # 我們將在啟動安裝執行緒後，再開始尋找日誌
-
-        # 3. 安裝 App 核心依賴
-        reqs_file = app.path / "requirements.txt"
-        if reqs_file.exists():
-            app.add_log(f"啟動核心依賴的安全安裝程序...")
-            # 我們需要找到 safe_installer 將要建立的日誌檔
-            # 為了簡化，我們讓 safe_installer 返回日誌檔路徑
-            logger = setup_logger(app.name)
-            log_file_path = logger.handlers[0].baseFilename
-
-            log_watcher_task = asyncio.create_task(watch_log_file(Path(log_file_path), app))
-
-            await run_safe_installer(app, reqs_file, str(python_executable))
-
-        # 4. (可選) 安裝大型依賴
-        if install_large_deps:
-            large_reqs_file = app.path / "requirements.large.txt"
-            if large_reqs_file.exists():
-                app.add_log("啟動大型依賴的安全安裝程序...")
+        # 3. 安裝 App 依賴 (分層時只安裝 App 獨有的套件)
+        if app_plan["layered"]:
+            app.add_log(f"啟動 App 獨有依賴的安全安裝程序 ({len(app_plan['packages'])} 個套件)...")
+            if app_plan["packages"]:
+                reqs_file = store.write_layer_requirements(app_plan["key"], app_plan["packages"])
+                await install_with_log_watcher(app, app.name, reqs_file, python_executable, ["--no-deps"])
+        else:
+            for reqs_file in app_plan["files"]:
+                is_large = reqs_file.name == "requirements.large.txt"
+                app.add_log("啟動大型依賴的安全安裝程序..." if is_large else "啟動核心依賴的安全安裝程序...")
                 # 為大型依賴建立一個新的 logger 和日誌檔案
-                large_logger = setup_logger(f"{app.name}_large")
-                large_log_file_path = large_logger.handlers[0].baseFilename
-
-                if log_watcher_task and not log_watcher_task.done():
-                    log_watcher_task.cancel() # 停止上一個監控
-
-                log_watcher_task = asyncio.create_task(watch_log_file(Path(large_log_file_path), app))
-
-                await run_safe_installer(app, large_reqs_file, str(python_executable))
+                label = f"{app.name}_large" if is_large else app.name
+                await install_with_log_watcher(app, label, reqs_file, python_executable)
 
+        store.mark_ready(app_plan["key"], label=app.name)
         app.set_status(AppStatus.INSTALL_DONE)
         return True
 
     except Exception as e:
+        store.discard(app_plan["key"])
         app.set_status(AppStatus.FAILED)
         app.add_log(f"💥 環境準備過程中發生嚴重錯誤: {e}")
         return False
     finally:
         app.install_finished.set()
-        if log_watcher_task and not log_watcher_task.done():
-            log_watcher_task.cancel()
 
 
 def discover_apps() -> list[App]:
@@ -310,14 +399,19 @@ class ANSIDashboard:
     使用 ANSI Escape Codes 管理終端儀表板的類別。
     這個類別負責所有與 TUI 渲染相關的工作，包括繪製佈局、更新動態區塊、
     以及確保多執行緒寫入終端時的畫面正確性。
+
+    所有更新方法都只記錄資料並把對應區塊標記為「待重繪」，由單一渲染執行緒
+    依幀預算 (每秒最多 max_fps 幀) 一次寫出所有變動的區塊；沒有變動時渲染執行緒不會被喚醒。
     """
 
-    def __init__(self, apps: list[App]):
+    def __init__(self, apps: list[App], max_fps: float = 10.0, status_interval: float = 2.0):
         """
         初始化儀表板。
 
         Args:
             apps (list[App]): 需要在儀表板上顯示的應用程式物件列表。
+            max_fps (float): 每秒最多重繪幾次。
+            status_interval (float): 系統狀態的取樣間隔 (秒)。
         """
         self.apps = apps
         try:
@@ -325,10 +419,16 @@ class ANSIDashboard:
         except OSError:
             # 在非標準 TTY 環境（如 CI/CD）中，提供一個預設尺寸
             self.width, self.height = 120, 24
+        self.max_fps = max_fps
+        self.status_interval = status_interval
         self.log_queue = deque(maxlen=5) # 只保留最新的 5 條日誌
         self._lock = threading.Lock() # 用於確保對 stdout 的寫入是執行緒安全的
         self.current_task_name = "[空閒]"
         self.current_task_progress_line = ""
+        self.system_status_text = ""
+        self._dirty = set()              # 待重繪的區塊名稱
+        self._wake = threading.Event()   # 有區塊待重繪時設定
+        self.frames_rendered = 0
 
     def _write(self, text: str):
         """
@@ -339,6 +439,12 @@ class ANSIDashboard:
             sys.stdout.write(text)
             sys.stdout.flush()
 
+    def _mark_dirty(self, region: str):
+        """標記區塊待重繪，並喚醒渲染執行緒"""
+        with self._lock:
+            self._dirty.add(region)
+        self._wake.set()
+
     def draw_static_layout(self):
         """繪製靜態 UI 框架"""
         title = " 🚀 鳳凰之心指揮中心 v8.0 "
@@ -361,7 +467,7 @@ class ANSIDashboard:
         self._write(ANSI.CLEAR_SCREEN + layout + bottom_bar)
 
     def update_system_status(self, stop_event):
-        """在背景執行緒中更新系統狀態"""
+        """在背景執行緒中定期取樣系統狀態；只有顯示內容改變時才要求重繪"""
         import psutil
         while not stop_event.is_set():
             ram = psutil.virtual_memory()
@@ -376,44 +482,40 @@ class ANSIDashboard:
                            f"RAM: {ram_color}{ram.used/1e9:.1f}/{ram.total/1e9:.1f} GB ({ram.percent}%){ANSI.RESET}   "
                            f"DISK: {disk.used/1e9:.1f}/{disk.total/1e9:.1f} GB ({disk.percent}%)")
 
-            self._write(f"{ANSI.move_cursor(3, 3)}{ANSI.CLEAR_LINE}{status_text}")
-            time.sleep(1)
+            if status_text != self.system_status_text:
+                self.system_status_text = status_text
+                self._mark_dirty("system")
+            stop_event.wait(self.status_interval)
 
     def update_app_status(self):
-        """更新所有 App 的狀態顯示"""
-        app_statuses = []
-        icons = {"quant": "📈", "transcriber": "🎤"}
-        for app in self.apps:
-            icon = icons.get(app.name, "📦")
-            app_statuses.append(f"{icon} {app.name.capitalize()} App".ljust(20) + f"[{app.status}]")
-
-        # 將狀態並排顯示
-        status_line = "         ".join(app_statuses)
-        self._write(f"{ANSI.move_cursor(6, 3)}{ANSI.CLEAR_LINE}{status_line}")
+        """要求重繪所有 App 的狀態顯示"""
+        self._mark_dirty("apps")
 
     def add_log_entry(self, message: str):
-        """向日誌隊列中添加一條新日誌並刷新顯示"""
-        timestamp = time.strftime('%H:%M:%S', time.localtime())
-
-        # 簡單的日誌級別判斷
-        level = "INFO"
-        color = ANSI.WHITE
-        if "error" in message.lower() or "failed" in message.lower():
-            level = "ERROR"
-            color = ANSI.RED
-        elif "warn" in message.lower():
-            level = "WARN"
-            color = ANSI.YELLOW
+        """向日誌隊列中添加一條新日誌並要求刷新顯示"""
+        self.add_log_entries([message])
 
-        log_line = f"{ANSI.move_cursor(0,0)}[{timestamp}] [{level}] {message}"
-        self.log_queue.append(log_line)
-        self.update_logs()
+    def add_log_entries(self, messages: list[str]):
+        """一次添加多條日誌；不論幾條，只會要求一次重繪"""
+        timestamp = time.strftime('%H:%M:%S', time.localtime())
+        with self._lock:
+            # 日誌區只顯示最新的幾條，較舊的不需要格式化
+            for message in messages[-self.log_queue.maxlen:]:
+                # 簡單的日誌級別判斷
+                level = "INFO"
+                color = ANSI.WHITE
+                if "error" in message.lower() or "failed" in message.lower():
+                    level = "ERROR"
+                    color = ANSI.RED
+                elif "warn" in message.lower():
+                    level = "WARN"
+                    color = ANSI.YELLOW
+                self.log_queue.append((color, f"[{timestamp}] [{level}] {message}"))
+        self._mark_dirty("logs")
 
     def update_logs(self):
-        """繪製日誌區域"""
-        for i, log_entry in enumerate(list(self.log_queue)):
-            # 從 y=9 開始繪製
-            self._write(f"{ANSI.move_cursor(9 + i, 3)}{ANSI.CLEAR_LINE}{log_entry[:self.width-4]}")
+        """要求重繪日誌區域"""
+        self._mark_dirty("logs")
 
     def update_current_task(self, task_name=None, progress_line=None):
         """更新當前任務的顯示"""
@@ -421,9 +523,48 @@ class ANSIDashboard:
             self.current_task_name = task_name
         if progress_line is not None:
             self.current_task_progress_line = progress_line
-
-        self._write(f"{ANSI.move_cursor(16, 3)}{ANSI.CLEAR_LINE}[{self.current_task_name}]")
-        self._write(f"{ANSI.move_cursor(17, 3)}{ANSI.CLEAR_LINE}{self.current_task_progress_line}")
+        self._mark_dirty("task")
+
+    def _draw_region(self, region: str) -> str:
+        """返回重繪單一區塊所需的 ANSI 指令"""
+        if region == "system":
+            return f"{ANSI.move_cursor(3, 3)}{ANSI.CLEAR_LINE}{self.system_status_text}"
+        if region == "apps":
+            app_statuses = []
+            icons = {"quant": "📈", "transcriber": "🎤"}
+            for app in self.apps:
+                icon = icons.get(app.name, "📦")
+                app_statuses.append(f"{icon} {app.name.capitalize()} App".ljust(20) + f"[{app.status}]")
+            # 將狀態並排顯示
+            status_line = "         ".join(app_statuses)
+            return f"{ANSI.move_cursor(6, 3)}{ANSI.CLEAR_LINE}{status_line}"
+        if region == "logs":
+            with self._lock:
+                entries = list(self.log_queue)
+            # 從 y=9 開始繪製
+            return "".join(f"{ANSI.move_cursor(9 + i, 3)}{ANSI.CLEAR_LINE}{color}{text[:self.width-4]}{ANSI.RESET}"
+                           for i, (color, text) in enumerate(entries))
+        if region == "task":
+            return (f"{ANSI.move_cursor(16, 3)}{ANSI.CLEAR_LINE}[{self.current_task_name}]"
+                    f"{ANSI.move_cursor(17, 3)}{ANSI.CLEAR_LINE}{self.current_task_progress_line[:self.width-4]}")
+        return ""
+
+    def render_dirty(self):
+        """把所有待重繪的區塊合併成一次寫入"""
+        with self._lock:
+            regions, self._dirty = self._dirty, set()
+        if regions:
+            self._write("".join(self._draw_region(region) for region in sorted(regions)))
+            self.frames_rendered += 1
+
+    def _render_loop(self, stop_event):
+        """渲染執行緒：等待更新，繪製一幀後至少間隔 1/max_fps 秒再處理下一幀"""
+        frame_interval = 1.0 / self.max_fps
+        while not stop_event.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            self.render_dirty()
+            stop_event.wait(frame_interval)
 
     def run(self, main_logic_coro):
         """啟動儀表板的主循環"""
@@ -434,19 +575,27 @@ class ANSIDashboard:
         status_thread = threading.Thread(target=self.update_system_status, args=(stop_event,))
         status_thread.daemon = True
         status_thread.start()
+        render_thread = threading.Thread(target=self._render_loop, args=(stop_event,))
+        render_thread.daemon = True
+        render_thread.start()
 
         loop = asyncio.get_event_loop()
         try:
             loop.run_until_complete(main_logic_coro)
-            self._write(f"{ANSI.move_cursor(21, 3)}{ANSI.GREEN}✅ 所有任務已完成。{ANSI.RESET}")
+            final_line = f"{ANSI.move_cursor(21, 3)}{ANSI.GREEN}✅ 所有任務已完成。{ANSI.RESET}"
         except Exception as e:
-            self._write(f"{ANSI.move_cursor(21, 3)}{ANSI.RED}❌ 發生錯誤: {e}{ANSI.RESET}")
+            final_line = f"{ANSI.move_cursor(21, 3)}{ANSI.RED}❌ 發生錯誤: {e}{ANSI.RESET}"
         finally:
             stop_event.set()
+            self._wake.set()
             status_thread.join(timeout=1.5)
-            # 將游標移動到最後，顯示提示訊息並等待使用者輸入
-            self._write(f"{ANSI.move_cursor(22, 1)}{ANSI.SHOW_CURSOR}")
-            input(f"{ANSI.YELLOW}請按 Enter 鍵退出...{ANSI.RESET}")
+            render_thread.join(timeout=1.5)
+            # 畫出最後一幀，確保最終狀態都已顯示
+            self.render_dirty()
+        self._write(final_line)
+        # 將游標移動到最後，顯示提示訊息並等待使用者輸入
+        self._write(f"{ANSI.move_cursor(22, 1)}{ANSI.SHOW_CURSOR}")
+        input(f"{ANSI.YELLOW}請按 Enter 鍵退出...{ANSI.RESET}")
 
 
 async def run_tests_for_app(app: App):
@@ -492,8 +641,22 @@ async def main_logic(dashboard: ANSIDashboard = None):
             app.dashboard = dashboard # 建立關聯
         dashboard.update_app_status()
 
+    # 一次規劃所有 App 的環境，讓共同的套件能被抽成共用基礎層
+    from core_utils.env_store import EnvStore, plan_environments, planned_keys
+    store = EnvStore()
+    env_plan = plan_environments(
+        store, {app.name: app_requirement_files(app, install_large_deps) for app in apps}, extra=COMMON_TEST_DEPS
+    )
+    removed = store.prune(planned_keys(env_plan))
+    if removed:
+        message = f"已清除 {len(removed)} 個長期未使用的快取環境: {', '.join(removed)}"
+        if dashboard:
+            dashboard.add_log_entry(message)
+        else:
+            print(message)
+
     for app in apps:
-        success = await prepare_app_environment(app, install_large_deps)
+        success = await prepare_app_environment(app, install_large_deps, store, env_plan)
         if success:
             await run_tests_for_app(app)
 
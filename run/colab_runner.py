@@ -246,69 +246,77 @@ def render_dashboard_html():
             "failed": "🔴 失敗", "unknown": "❓ 未知"
         }};
         const apiUrl = 'http://localhost:8088/api/v1/status';
+        const maxLogLines = {LOG_DISPLAY_LINES};
+        // 已收到的最新日誌 id；後端只會返回比它更新的日誌
+        let cursor = 0;
+        let logBuffer = [];
+
+        function renderStatus(status) {{
+            // 更新系統資源
+            document.getElementById('cpu-usage').textContent = `${{status.cpu_usage ? status.cpu_usage.toFixed(1) : '0.0'}}%`;
+            document.getElementById('ram-usage').textContent = `${{status.ram_usage ? status.ram_usage.toFixed(1) : '0.0'}}%`;
+
+            // 更新微服務狀態
+            const appStatusTable = document.getElementById('app-status-table').querySelector('tbody');
+            let apps = {{}};
+            try {{
+                apps = JSON.parse(status.apps_status || '{{}}');
+            }} catch(e) {{}}
+
+            let appRows = '';
+            if (Object.keys(apps).length > 0) {{
+                for (const [appName, appStatus] of Object.entries(apps)) {{
+                    const statusText = statusMap[appStatus] || statusMap['unknown'];
+                    appRows += `<tr><td>${{appName.charAt(0).toUpperCase() + appName.slice(1)}}</td><td>${{statusText}}</td></tr>`;
+                }}
+            }} else {{
+                appRows = '<tr><td>等待後端回報...</td></tr>';
+            }}
+            appStatusTable.innerHTML = appRows;
+
+            // 更新頁腳狀態
+            const footer = document.getElementById('footer-status');
+            if (status.action_url) {{
+                footer.innerHTML = `✅ 服務啟動完成！操作儀表板: <a href="${{status.action_url}}" target="_blank" style="color: #50fa7b;">${{status.action_url}}</a>`;
+            }} else {{
+                footer.textContent = `指揮中心後端任務: ${{status.current_stage || '執行中...'}}`;
+            }}
+        }}
+
+        function renderLogs(newLogs) {{
+            if (newLogs.length === 0) return;
+            // 增量日誌由舊到新排列，只保留最後 maxLogLines 條
+            logBuffer = logBuffer.concat(newLogs).slice(-maxLogLines);
+            let logEntries = '';
+            logBuffer.forEach(log => {{
+                const time = new Date(log.timestamp).toLocaleTimeString('en-GB');
+                logEntries += `<div class="log-entry"><span class="log-level-${{log.level}}">[${{time}}] [${{log.level}}]</span> ${{log.message}}</div>`;
+            }});
+            document.getElementById('log-container').innerHTML = logEntries;
+        }}
 
-        function updateDashboard() {{
-            fetch(apiUrl)
-                .then(response => {{
+        // 以 long-poll 方式取得增量資料：後端在有新資料時才返回，沒有變動時最多等待 wait 秒
+        async function pollDashboard() {{
+            while (true) {{
+                try {{
+                    const response = await fetch(`${{apiUrl}}?since=${{cursor}}&wait=25`);
                     if (!response.ok) {{
                         throw new Error('後端服務尚未就緒...');
                     }}
-                    return response.json();
-                }})
-                .then(data => {{
-                    // 更新系統資源
-                    document.getElementById('cpu-usage').textContent = `${{data.status.cpu_usage ? data.status.cpu_usage.toFixed(1) : '0.0'}}%`;
-                    document.getElementById('ram-usage').textContent = `${{data.status.ram_usage ? data.status.ram_usage.toFixed(1) : '0.0'}}%`;
-
-                    // 更新微服務狀態
-                    const appStatusTable = document.getElementById('app-status-table').querySelector('tbody');
-                    let apps = {{}};
-                    try {{
-                        apps = JSON.parse(data.status.apps_status || '{{}}');
-                    }} catch(e) {{}}
-
-                    let appRows = '';
-                    if (Object.keys(apps).length > 0) {{
-                        for (const [appName, status] of Object.entries(apps)) {{
-                            const statusText = statusMap[status] || statusMap['unknown'];
-                            appRows += `<tr><td>${{appName.charAt(0).toUpperCase() + appName.slice(1)}}</td><td>${{statusText}}</td></tr>`;
-                        }}
-                    }} else {{
-                        appRows = '<tr><td>等待後端回報...</td></tr>';
-                    }}
-                    appStatusTable.innerHTML = appRows;
-
-                    // 更新日誌
-                    const logContainer = document.getElementById('log-container');
-                    let logEntries = '';
-                    if (data.logs && data.logs.length > 0) {{
-                        // 日誌是從新到舊的，我們顯示時要反轉
-                        data.logs.reverse().forEach(log => {{
-                            const time = new Date(log.timestamp).toLocaleTimeString('en-GB');
-                            logEntries += `<div class="log-entry"><span class="log-level-${{log.level}}">[${{time}}] [${{log.level}}]</span> ${{log.message}}</div>`;
-                        }});
-                    }} else {{
-                        logEntries = '等待日誌...';
-                    }}
-                    logContainer.innerHTML = logEntries;
-
-                    // 更新頁腳狀態
-                    const footer = document.getElementById('footer-status');
-                    if (data.status.action_url) {{
-                        footer.innerHTML = `✅ 服務啟動完成！操作儀表板: <a href="${{data.status.action_url}}" target="_blank" style="color: #50fa7b;">${{data.status.action_url}}</a>`;
-                    }} else {{
-                        footer.textContent = `指揮中心後端任務: ${{data.status.current_stage || '執行中...'}}`;
-                    }}
-                }})
-                .catch(error => {{
+                    const data = await response.json();
+                    renderStatus(data.status);
+                    renderLogs(data.logs || []);
+                    cursor = data.cursor;
+                }} catch (error) {{
                     const footer = document.getElementById('footer-status');
                     footer.textContent = `前端狀態: ${{error.message}}`;
-                }});
+                    // 後端尚未啟動或暫時無法連線時，依照設定的刷新頻率重試
+                    await new Promise(resolve => setTimeout(resolve, {refresh_interval_ms}));
+                }}
+            }}
         }}
 
-        // 立即執行一次，然後設定定時器
-        updateDashboard();
-        setInterval(updateDashboard, {refresh_interval_ms});
+        pollDashboard();
     </script>
     """
     return css + html_body + javascript
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+啟動器的 App 生命週期測試：健康檢查的退避輪詢、逾時，以及啟動失敗時終止服務程序
+"""
+import asyncio
+import contextlib
+import socket
+import subprocess
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root))
+
+import launch
+from launch import manage_app_lifecycle, wait_for_app_ready
+
+
+class FakeProcess:
+    def __init__(self, return_code=None):
+        self.return_code = return_code
+
+    def poll(self):
+        return self.return_code
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_with_health_server(statuses, scenario):
+    """啟動一個依序回應 statuses (最後一個值重複使用) 的 /health 服務，返回 (結果, 每次請求的時間)。"""
+    hits = []
+
+    async def health(request):
+        hits.append(time.monotonic())
+        return web.Response(status=statuses[min(len(hits), len(statuses)) - 1])
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/health", health)
+        async with TestServer(app, host="127.0.0.1") as server:
+            return await scenario(server.port)
+
+    return asyncio.run(run()), hits
+
+
+def test_polls_with_exponential_backoff_until_healthy():
+    result, hits = run_with_health_server(
+        [503, 503, 503, 503, 200],
+        lambda port: wait_for_app_ready("demo", FakeProcess(), port, timeout=5, initial_backoff=0.05,
+                                        max_backoff=0.2),
+    )
+
+    assert result == 5 and len(hits) == 5
+    gaps = [later - earlier for earlier, later in zip(hits, hits[1:])]
+    for gap, expected in zip(gaps, [0.05, 0.1, 0.2, 0.2]):
+        assert expected - 0.01 <= gap < expected + 0.15
+
+
+def test_times_out_when_the_app_never_becomes_healthy():
+    started = time.monotonic()
+    with pytest.raises(RuntimeError, match="逾時"):
+        run_with_health_server(
+            [503],
+            lambda port: wait_for_app_ready("demo", FakeProcess(), port, timeout=0.5, initial_backoff=0.05,
+                                            max_backoff=0.1),
+        )
+    assert 0.5 <= time.monotonic() - started < 2
+
+
+def test_keeps_polling_while_the_port_is_not_listening():
+    started = time.monotonic()
+    with pytest.raises(RuntimeError, match="逾時"):
+        asyncio.run(wait_for_app_ready("demo", FakeProcess(), free_port(), timeout=0.3, initial_backoff=0.05))
+    assert 0.3 <= time.monotonic() - started < 2
+
+
+def test_fails_fast_when_the_process_exits():
+    started = time.monotonic()
+    with pytest.raises(RuntimeError, match="返回碼: 3"):
+        asyncio.run(wait_for_app_ready("demo", FakeProcess(3), free_port(), timeout=5))
+    assert time.monotonic() - started < 1
+
+
+@pytest.fixture
+def fake_app(monkeypatch, tmp_path):
+    """以當前 Python 直接執行 tmp_path 下的 App，略過環境建立與准入控制，並記錄啟動的進程。"""
+    async def prepare_app_env(store, env_plan, app_name):
+        return tmp_path / "venv"
+
+    async def admit_work(*args, **kwargs):
+        return contextlib.nullcontext()
+
+    processes = []
+
+    class RecordingPopen(subprocess.Popen):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            processes.append(self)
+
+    monkeypatch.setattr(launch, "APPS_DIR", tmp_path)
+    monkeypatch.setattr(launch, "LOGS_DIR", tmp_path)
+    monkeypatch.setattr(launch, "prepare_app_env", prepare_app_env)
+    monkeypatch.setattr(launch, "admit_work", admit_work)
+    monkeypatch.setattr(launch, "env_python", lambda venv_path: Path(sys.executable))
+    monkeypatch.setattr(launch.subprocess, "Popen", RecordingPopen)
+
+    def write_app(source: str):
+        (tmp_path / "demo").mkdir()
+        (tmp_path / "demo" / "main.py").write_text(textwrap.dedent(source), encoding="utf-8")
+
+    yield write_app, processes
+    for process in processes:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def run_lifecycle(app_status, port, **kwargs):
+    return manage_app_lifecycle("demo", port, app_status, env_store=object(), env_plan={"apps": {"demo": {}}},
+                                admission={}, **kwargs)
+
+
+def test_app_is_running_after_the_health_check_passes(fake_app):
+    write_app, processes = fake_app
+    write_app("""
+        import os
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200 if self.path == "/health" else 404)
+                self.end_headers()
+
+        HTTPServer(("127.0.0.1", int(os.environ["PORT"])), Handler).serve_forever()
+    """)
+    app_status = {}
+
+    asyncio.run(run_lifecycle(app_status, free_port(), ready_timeout=20, max_backoff=0.2))
+
+    assert app_status == {"demo": "running"}
+    assert len(processes) == 1 and processes[0].poll() is None
+
+
+def test_failed_startup_terminates_the_process(fake_app):
+    write_app, processes = fake_app
+    write_app("import time\ntime.sleep(600)\n")  # 永遠不會開始監聽
+    app_status = {}
+
+    with pytest.raises(RuntimeError, match="逾時"):
+        asyncio.run(run_lifecycle(app_status, free_port(), ready_timeout=0.5, max_backoff=0.1))
+
+    assert app_status == {"demo": "failed"}
+    assert len(processes) == 1 and processes[0].poll() is not None
+
+
+def test_process_that_exits_during_startup_is_reported(fake_app):
+    write_app, processes = fake_app
+    write_app("raise SystemExit(2)\n")
+    app_status = {}
+
+    with pytest.raises(RuntimeError, match="返回碼: 2"):
+        asyncio.run(run_lifecycle(app_status, free_port(), ready_timeout=20, max_backoff=0.1))
+
+    assert app_status == {"demo": "failed"}
+
+
+def test_cancelled_startup_terminates_the_process(fake_app):
+    write_app, processes = fake_app
+    write_app("import time\ntime.sleep(600)\n")
+    app_status = {}
+
+    async def start_then_cancel():
+        task = asyncio.create_task(run_lifecycle(app_status, free_port(), ready_timeout=20, max_backoff=0.1))
+        while not processes and not task.done():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(start_then_cancel())
+
+    assert app_status == {"demo": "failed"}
+    assert processes[0].poll() is not None
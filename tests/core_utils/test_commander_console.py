@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+核心工具的指揮中心 TUI 測試：區域比對的增量繪製與幀預算
+"""
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root))
+
+from core_utils import commander_console
+from core_utils.commander_console import CommanderConsole
+
+
+class FakeHandle:
+    def __init__(self, text):
+        self.updates = [text]
+
+    def update(self, text):
+        self.updates.append(text)
+
+
+@pytest.fixture(autouse=True)
+def frozen_clock(monkeypatch):
+    """固定狀態行的經過時間，只有測試修改的數值會讓畫面變動。"""
+    clock = SimpleNamespace(time=lambda: 1000.0, monotonic=time.monotonic)
+    monkeypatch.setattr(commander_console, "time", clock)
+    return clock
+
+
+def make_console(mode, **kwargs):
+    console = CommanderConsole(max_log_entries=3, **kwargs)
+    console._mode = mode
+    return console
+
+
+def test_notebook_mode_updates_only_changed_regions(monkeypatch):
+    handles = []
+
+    def fake_display(text, display_id):
+        assert display_id is True
+        handles.append(FakeHandle(text))
+        return handles[-1]
+
+    monkeypatch.setattr(commander_console, "display", fake_display)
+    monkeypatch.setattr(commander_console, "Pretty", lambda text: text)
+    console = make_console("notebook")
+
+    console._render()
+    logs, status = handles
+    assert console.frames_rendered == 1
+
+    # 沒有變動時不繪製
+    console._render()
+    assert console.frames_rendered == 1
+    assert len(logs.updates) == len(status.updates) == 1
+
+    console.add_log("第一行")
+    console._render()
+    assert len(logs.updates) == 2 and "第一行" in logs.updates[-1]
+    assert len(status.updates) == 1
+
+    console.cpu_usage = 42.0
+    console._render()
+    assert len(logs.updates) == 2
+    assert len(status.updates) == 2 and "CPU:  42.0%" in status.updates[-1]
+    assert len(handles) == 2
+
+
+def test_terminal_mode_rewrites_only_changed_lines(capsys):
+    console = make_console("terminal")
+    console._render()
+    first = capsys.readouterr().out
+    assert first == console._compose()["logs"] + "\n" + console._compose()["status"]
+
+    console._render()
+    assert capsys.readouterr().out == ""
+
+    # 框線 3 行之後是第一個日誌行；游標在狀態行 (第 8 行)，需要上移 4 行
+    console.add_log("第一行")
+    console._render()
+    log_line = console._compose()["logs"].split("\n")[3]
+    assert capsys.readouterr().out == f"\x1b[4A\r{log_line}\x1b[K\x1b[4B"
+
+    console.update_status_tag("[執行中]")
+    console._render()
+    assert capsys.readouterr().out == f"\r{console._compose()['status']}\x1b[K"
+
+
+def test_append_mode_prints_only_new_lines_and_status_tag_changes(capsys):
+    console = make_console("append")
+    console.add_log("第一行")
+    console._render()
+    out = capsys.readouterr().out.splitlines()
+    assert out[0].endswith("第一行") and out[1] == console._compose()["status"]
+
+    # 只有數值變動的狀態行不會重複輸出
+    console.cpu_usage = 50.0
+    console._render()
+    assert capsys.readouterr().out == ""
+
+    console.add_log("第二行")
+    console._render()
+    out = capsys.readouterr().out.splitlines()
+    assert len(out) == 1 and out[0].endswith("第二行")
+
+    # 兩幀之間的日誌超過緩衝區大小時，標示略過的行數
+    for i in range(5):
+        console.add_log(f"洪流 {i}")
+    console.update_status_tag("[完成]")
+    console._render()
+    out = capsys.readouterr().out.splitlines()
+    assert out[0] == "... (略過 2 行日誌) ..."
+    assert [line.split("] ", 1)[1] for line in out[1:4]] == ["洪流 2", "洪流 3", "洪流 4"]
+    assert out[4].endswith("[完成]")
+
+
+def test_render_loop_respects_max_fps():
+    console = make_console("append", max_fps=10.0)
+    frames = []
+    console._render = lambda: frames.append(time.monotonic())
+    renderer = threading.Thread(target=console._render_loop, daemon=True)
+    renderer.start()
+
+    try:
+        started = time.monotonic()
+        console.add_log("第一行")
+        while not frames and time.monotonic() - started < 1:
+            time.sleep(0.001)
+        # 第一個更新立即繪製，不必等待一整個幀間隔
+        assert frames and frames[0] - started < 0.05
+
+        updates = 0
+        while time.monotonic() - started < 0.6:
+            console.add_log(f"洪流 {updates}")
+            updates += 1
+            time.sleep(0.001)
+    finally:
+        console._stop_event.set()
+        console._dirty.set()
+        renderer.join(timeout=2)
+
+    assert not renderer.is_alive()
+    assert updates > 100
+    # 0.6 秒內最多 7 幀 (10 fps)，相鄰兩幀至少間隔 1/max_fps 秒
+    assert 3 <= len(frames) <= 7
+    assert all(later - earlier >= 0.1 - 0.005 for earlier, later in zip(frames, frames[1:]))
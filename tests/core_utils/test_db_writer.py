@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+核心工具的批次資料庫寫入器測試
+"""
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root))
+
+from core_utils.db_writer import BatchedDBWriter
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "phoenix.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("""
+        CREATE TABLE phoenix_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, level TEXT NOT NULL,
+            message TEXT NOT NULL, cpu_usage REAL, ram_usage REAL
+        )""")
+        conn.execute("""
+        CREATE TABLE status_table (
+            id INTEGER PRIMARY KEY, current_stage TEXT, apps_status TEXT, action_url TEXT,
+            cpu_usage REAL, ram_usage REAL
+        )""")
+        conn.execute("INSERT INTO status_table (id) VALUES (1)")
+    return path
+
+
+def _messages(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return [row[0] for row in conn.execute("SELECT message FROM phoenix_logs ORDER BY id")]
+
+
+def _wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_batch_is_committed_when_size_is_reached(db_path):
+    writer = BatchedDBWriter(db_path, batch_size=3, flush_interval=60)
+    writer.start()
+    try:
+        for i in range(3):
+            writer.log("t", "INFO", f"m{i}")
+        # 筆數達到上限：不必等待 60 秒的時間上限
+        assert _wait_for(lambda: _messages(db_path) == ["m0", "m1", "m2"])
+        assert writer.commits == 1
+
+        writer.log("t", "INFO", "m3")
+        time.sleep(0.2)
+        assert len(_messages(db_path)) == 3
+    finally:
+        writer.stop()
+
+
+def test_batch_is_committed_when_interval_elapses(db_path):
+    writer = BatchedDBWriter(db_path, batch_size=1000, flush_interval=0.05)
+    writer.start()
+    try:
+        writer.log("t", "INFO", "only one")
+        assert _wait_for(lambda: _messages(db_path) == ["only one"])
+    finally:
+        writer.stop()
+
+
+def test_flush_commits_logs_and_merged_status(db_path):
+    writer = BatchedDBWriter(db_path, batch_size=1000, flush_interval=60)
+    writer.start()
+    try:
+        writer.log("t", "INFO", "a")
+        writer.update_status(current_stage="安裝中")
+        writer.update_status(current_stage="運行中", cpu_usage=12.5)
+        assert writer.flush()
+        assert _messages(db_path) == ["a"]
+        with sqlite3.connect(db_path) as conn:
+            assert conn.execute("SELECT current_stage, cpu_usage FROM status_table").fetchone() == ("運行中", 12.5)
+        with pytest.raises(ValueError):
+            writer.update_status(unknown="x")
+    finally:
+        writer.stop()
+
+
+def test_stop_drains_queue_and_later_writes_are_not_dropped(db_path):
+    writer = BatchedDBWriter(db_path, batch_size=1000, flush_interval=60)
+    writer.start()
+    for i in range(10):
+        writer.log("t", "INFO", f"m{i}")
+    assert writer.stop()
+    assert _messages(db_path) == [f"m{i}" for i in range(10)]
+
+    # 停止之後的寫入直接同步寫入資料庫
+    writer.log("t", "INFO", "after stop")
+    writer.update_status(current_stage="已關閉")
+    assert _messages(db_path)[-1] == "after stop"
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT current_stage FROM status_table").fetchone() == ("已關閉",)
+
+
+def test_stop_keeps_thread_when_join_times_out(db_path):
+    writer = BatchedDBWriter(db_path, batch_size=1, flush_interval=60)
+    release = threading.Event()
+    writer.add_listener(release.wait)  # 監聽者在寫入執行緒中執行，阻塞住寫入器
+    writer.start()
+    writer.log("t", "INFO", "blocked")
+    assert _wait_for(lambda: _messages(db_path) == ["blocked"])
+
+    assert not writer.stop(timeout=0.1)
+    assert writer._thread is not None and writer._thread.is_alive()
+
+    release.set()
+    assert writer.stop()
+    assert writer._thread is None
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+核心工具的環境快取倉庫測試
+"""
+import os
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root))
+
+from core_utils import env_store
+from core_utils.env_store import EnvStore, plan_environments, planned_keys, python_executable, READY_MARKER
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EnvStore(root=tmp_path / "store")
+
+
+def make_ready(store, key):
+    """模擬一個已建立完成的環境：建立解譯器檔案並寫入完成標記。"""
+    python = python_executable(store.env_path(key))
+    python.parent.mkdir(parents=True, exist_ok=True)
+    python.touch()
+    store.mark_ready(key)
+
+
+def age(store, key, seconds):
+    """把環境的最後使用時間往前推。"""
+    past = time.time() - seconds
+    for path in (store.env_path(key), store.env_path(key) / READY_MARKER):
+        if path.exists():
+            os.utime(path, (past, past))
+
+
+def test_key_ignores_spelling_and_order(store):
+    key = store.key_for(["FastAPI == 0.110.0", "python_multipart==0.0.9"])
+    assert key == store.key_for(["python-multipart==0.0.9", "fastapi==0.110.0", "fastapi==0.110.0"])
+    assert key.startswith("app-")
+
+
+def test_key_changes_with_inputs(store, monkeypatch):
+    requirements = ["fastapi==0.110.0"]
+    key = store.key_for(requirements)
+
+    assert store.key_for(["fastapi==0.111.0"]) != key
+    assert store.key_for(requirements, layer="base") != key
+    assert store.key_for(requirements, base_key="base-0123") != key
+    assert store.key_for(requirements, extra="pytest") != key
+
+    monkeypatch.setattr(env_store.sys, "version_info", SimpleNamespace(major=3, minor=99))
+    assert store.key_for(requirements) != key
+
+
+def test_plan_extracts_shared_base_layer(store, tmp_path):
+    (tmp_path / "a.txt").write_text("fastapi==0.110.0\nuvicorn==0.29.0\nnumpy==1.26.4\n", encoding="utf-8")
+    (tmp_path / "b.txt").write_text("FastAPI==0.110.0\nuvicorn==0.29.0\n", encoding="utf-8")
+
+    plan = plan_environments(store, {"a": [tmp_path / "a.txt"], "b": [tmp_path / "b.txt", tmp_path / "missing.txt"]})
+
+    assert plan["base"]["packages"] == ["fastapi==0.110.0", "uvicorn==0.29.0"]
+    assert plan["apps"]["a"]["packages"] == ["numpy==1.26.4"]
+    assert plan["apps"]["b"]["packages"] == []
+    assert plan["apps"]["b"]["files"] == [tmp_path / "b.txt"]
+    assert plan["apps"]["a"]["layered"] is True
+    assert sorted(planned_keys(plan)) == sorted([plan["base"]["key"], plan["apps"]["a"]["key"], plan["apps"]["b"]["key"]])
+
+
+def test_unpinned_requirements_are_not_layered(store, tmp_path):
+    (tmp_path / "a.txt").write_text("fastapi\nuvicorn==0.29.0\n", encoding="utf-8")
+    (tmp_path / "b.txt").write_text("fastapi\nuvicorn==0.29.0\n", encoding="utf-8")
+
+    plan = plan_environments(store, {"a": [tmp_path / "a.txt"], "b": [tmp_path / "b.txt"]})
+
+    assert plan["base"] is None
+    assert plan["apps"]["a"]["packages"] == ["fastapi", "uvicorn==0.29.0"]
+    assert plan["apps"]["a"]["key"] == plan["apps"]["b"]["key"]
+
+
+def test_cache_reused_until_requirements_change(store, tmp_path):
+    req = tmp_path / "requirements.txt"
+    req.write_text("fastapi==0.110.0\n", encoding="utf-8")
+    key = plan_environments(store, {"app": [req]})["apps"]["app"]["key"]
+
+    assert not store.is_ready(key)
+    store.env_path(key).mkdir(parents=True)
+    store.mark_ready(key)
+    assert not store.is_ready(key), "沒有解譯器的環境不算完成"
+
+    make_ready(store, key)
+    assert store.is_ready(key)
+    assert plan_environments(store, {"app": [req]})["apps"]["app"]["key"] == key
+
+    req.write_text("fastapi==0.111.0\n", encoding="utf-8")
+    assert plan_environments(store, {"app": [req]})["apps"]["app"]["key"] != key
+
+    store.discard(key)
+    assert not store.is_ready(key)
+
+
+def test_prune_removes_only_stale_unplanned_envs(store):
+    for key in ("app-planned", "app-recent", "app-stale", "app-unfinished"):
+        make_ready(store, key)
+    (store.env_path("app-unfinished") / READY_MARKER).unlink()
+    for key in ("app-planned", "app-stale", "app-unfinished"):
+        age(store, key, 30 * 24 * 3600)
+
+    removed = store.prune(["app-planned"])
+
+    assert removed == ["app-stale", "app-unfinished"]
+    assert store.is_ready("app-planned")
+    assert store.is_ready("app-recent")
+    assert not store.env_path("app-stale").exists()
+
+
+def test_mark_used_protects_reused_env_from_prune(store):
+    make_ready(store, "app-reused")
+    age(store, "app-reused", 30 * 24 * 3600)
+
+    store.mark_used("app-reused")
+
+    assert store.prune([]) == []
+    assert store.is_ready("app-reused")
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+核心工具的日誌追蹤測試 (follow_file) 與啟動器的進度行拆分 (split_progress)
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root))
+
+from core_utils import log_tail
+from core_utils.log_tail import follow_file
+from phoenix_starter import split_progress
+
+
+def progress(percent: int) -> str:
+    return f"numpy 1.26.4 [━━━━╸     ] {percent}% - 5.1/11.3 MiB @ 2.1 MiB/s"
+
+
+@pytest.fixture(params=["native", "polling"])
+def watch_mode(request, monkeypatch):
+    """分別以平台原生的監看 (Linux 上為 inotify) 與自適應輪詢執行同一組測試。"""
+    if request.param == "polling":
+        monkeypatch.setattr(log_tail, "_create_watch", lambda path, loop: log_tail._PollingWatch())
+    return request.param
+
+
+async def collect(path: Path, writes, from_end: bool = True, pause: float = 0.1):
+    """在追蹤檔案的同時依序寫入 writes，寫完後設定停止事件，返回產出的所有區塊。"""
+    stop_event = asyncio.Event()
+    chunks = []
+
+    async def reader():
+        async for chunk in follow_file(path, stop_event, from_end=from_end):
+            chunks.append(chunk)
+
+    task = asyncio.create_task(reader())
+    await asyncio.sleep(pause)
+    for data in writes:
+        with open(path, "ab") as f:
+            f.write(data.encode("utf-8"))
+        await asyncio.sleep(pause)
+    stop_event.set()
+    await asyncio.wait_for(task, timeout=5)
+    return chunks
+
+
+def test_follow_file_skips_existing_content(tmp_path, watch_mode):
+    path = tmp_path / "install.log"
+    path.write_text("舊的內容\n", encoding="utf-8")
+
+    chunks = asyncio.run(collect(path, ["第一行\n", "第二行\n"]))
+
+    assert "".join(chunks) == "第一行\n第二行\n"
+
+
+def test_follow_file_from_start(tmp_path, watch_mode):
+    path = tmp_path / "install.log"
+    path.write_text("舊的內容\n", encoding="utf-8")
+
+    chunks = asyncio.run(collect(path, ["新的內容\n"], from_end=False))
+
+    assert "".join(chunks) == "舊的內容\n新的內容\n"
+
+
+def test_follow_file_holds_partial_lines(tmp_path, watch_mode):
+    path = tmp_path / "install.log"
+    path.touch()
+
+    chunks = asyncio.run(collect(path, ["hello\nwor", "ld\n", "tail without newline"]))
+
+    assert "".join(chunks) == "hello\nworld\ntail without newline"
+    # 未寫完的行不會被拆開產出；只有停止時才會把最後不完整的一行送出
+    assert all(chunk.endswith("\n") for chunk in chunks[:-1])
+    assert "wor" not in chunks
+    assert chunks[-1] == "tail without newline"
+
+
+def test_follow_file_yields_carriage_return_updates(tmp_path, watch_mode):
+    path = tmp_path / "install.log"
+    path.touch()
+
+    chunks = asyncio.run(collect(path, [progress(10) + "\r", progress(45) + "\r" + progress(90)[:20], progress(90)[20:] + "\r"]))
+
+    assert "".join(chunks) == progress(10) + "\r" + progress(45) + "\r" + progress(90) + "\r"
+    assert all(chunk.endswith("\r") for chunk in chunks)
+
+
+def test_follow_file_requires_existing_file(tmp_path):
+    async def run():
+        async for _ in follow_file(tmp_path / "missing.log", asyncio.Event()):
+            pass
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(run())
+
+
+def test_polling_watch_backs_off_when_idle():
+    watch = log_tail._PollingWatch(min_interval=0.05, max_interval=0.3)
+
+    for _ in range(5):
+        watch.got_data(False)
+    assert watch._interval == 0.3
+
+    watch.got_data(True)
+    assert watch._interval == 0.05
+
+
+def test_split_progress_keeps_only_latest_progress_line():
+    chunk = "Resolved 3 packages\r\n" + progress(10) + "\r" + progress(45) + "\r" + progress(90) + "\nInstalled numpy\n"
+
+    lines, last_progress = split_progress(chunk)
+
+    assert lines == ["Resolved 3 packages", "Installed numpy"]
+    assert last_progress == progress(90)
+
+
+def test_split_progress_without_progress_lines():
+    lines, last_progress = split_progress("  Collecting fastapi\n\n\rDownloading\r")
+
+    assert lines == ["Collecting fastapi", "Downloading"]
+    assert last_progress is None
+
+
+def test_split_progress_ignores_progress_text_inside_a_line():
+    line = "log: " + progress(10)
+
+    lines, last_progress = split_progress(line + "\n")
+
+    assert lines == [line]
+    assert last_progress is None
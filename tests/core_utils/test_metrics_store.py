@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+核心工具的效能指標倉庫測試：時間桶彙總、落地與保留期限
+"""
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root))
+
+from core_utils.metrics_store import HOST_SOURCE, MetricsStore
+
+KEEP_ALL = {1: None, 10: None}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "phoenix.db"
+    with sqlite3.connect(path) as conn:
+        MetricsStore.create_table(conn)
+    return path
+
+
+def make_store(db_path, retention=KEEP_ALL, **kwargs):
+    # persist_interval 設得很長，只在測試明確呼叫 flush 時落地
+    return MetricsStore(db_path, resolutions=(1, 10), persist_interval=3600, retention=retention, **kwargs)
+
+
+def rollups(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(
+            "SELECT resolution, bucket_start, source, metric, min_value, avg_value, max_value, samples "
+            "FROM perf_rollups ORDER BY resolution, bucket_start, source, metric"
+        ).fetchall()
+
+
+def test_only_completed_buckets_are_persisted(db_path):
+    store = make_store(db_path)
+    store.record(HOST_SOURCE, {"cpu": 10.0, "ram": None}, timestamp=1000.2)
+    store.record(HOST_SOURCE, {"cpu": 30.0}, timestamp=1000.7)
+    store.record(HOST_SOURCE, {"cpu": 50.0}, timestamp=1001.1)
+    store.record("quant", {"cpu": 5.0}, timestamp=1001.2)
+
+    store.flush()
+
+    # 1 秒的時間桶 1000 已結束；1001 與 10 秒的時間桶 1000 仍在進行中
+    assert rollups(db_path) == [(1, 1000.0, HOST_SOURCE, "cpu", 10.0, 20.0, 30.0, 2)]
+    assert [sample[0] for sample in store.recent(HOST_SOURCE)] == [1000.2, 1000.7, 1001.1]
+    assert store.recent(limit=1) == [(1001.2, "quant", {"cpu": 5.0})]
+
+
+def test_flush_with_open_buckets_is_overwritten_when_the_bucket_completes(db_path):
+    store = make_store(db_path)
+    store.record(HOST_SOURCE, {"cpu": 50.0}, timestamp=1001.1)
+
+    store.flush(include_open=True)
+    assert rollups(db_path) == [
+        (1, 1001.0, HOST_SOURCE, "cpu", 50.0, 50.0, 50.0, 1),
+        (10, 1000.0, HOST_SOURCE, "cpu", 50.0, 50.0, 50.0, 1),
+    ]
+
+    store.record(HOST_SOURCE, {"cpu": 70.0}, timestamp=1001.5)
+    store.record(HOST_SOURCE, {"cpu": 0.0}, timestamp=1010.0)
+    store.flush()
+
+    # 同一個時間桶只有一列，以結束時的完整值覆寫
+    assert rollups(db_path) == [
+        (1, 1001.0, HOST_SOURCE, "cpu", 50.0, 60.0, 70.0, 2),
+        (10, 1000.0, HOST_SOURCE, "cpu", 50.0, 60.0, 70.0, 2),
+    ]
+
+    store.close()
+    assert (1, 1010.0, HOST_SOURCE, "cpu", 0.0, 0.0, 0.0, 1) in rollups(db_path)
+    assert (10, 1010.0, HOST_SOURCE, "cpu", 0.0, 0.0, 0.0, 1) in rollups(db_path)
+
+
+def test_retention_is_applied_per_resolution(db_path):
+    store = make_store(db_path, retention={1: 60, 10: None})
+    now = float(int(time.time()))
+    store.record(HOST_SOURCE, {"cpu": 1.0}, timestamp=now - 300)
+    store.record(HOST_SOURCE, {"cpu": 2.0}, timestamp=now)
+
+    store.flush(include_open=True)
+
+    rows = [(resolution, bucket_start) for resolution, bucket_start, *_ in rollups(db_path)]
+    # 1 秒解析度只保留 60 秒內的資料；10 秒解析度不清除
+    assert (1, now - 300) not in rows
+    assert (1, now) in rows
+    assert (10, now - 300 - (now - 300) % 10) in rows
+    assert (10, now - now % 10) in rows
+
+
+def test_failed_write_keeps_completed_buckets_for_the_next_flush(tmp_path):
+    db_path = tmp_path / "phoenix.db"
+    sqlite3.connect(db_path).close()  # 還沒有 perf_rollups 表，寫入會失敗
+    store = make_store(db_path)
+    store.record(HOST_SOURCE, {"cpu": 10.0}, timestamp=1000.2)
+    store.record(HOST_SOURCE, {"cpu": 20.0}, timestamp=1001.2)
+
+    store.flush(include_open=True)
+    assert len(store._completed) == 1  # 只有已結束的時間桶被放回，進行中的時間桶不會重複
+
+    with sqlite3.connect(db_path) as conn:
+        MetricsStore.create_table(conn)
+    store.flush()
+
+    assert rollups(db_path) == [(1, 1000.0, HOST_SOURCE, "cpu", 10.0, 10.0, 10.0, 1)]
+    assert store._completed == []
+
+
+def test_record_persists_after_the_interval(db_path):
+    store = MetricsStore(db_path, resolutions=(1,), persist_interval=0, retention={1: None})
+    store.record(HOST_SOURCE, {"cpu": 10.0}, timestamp=1000.0)
+    store.record(HOST_SOURCE, {"cpu": 20.0}, timestamp=1001.0)
+
+    assert rollups(db_path) == [(1, 1000.0, HOST_SOURCE, "cpu", 10.0, 10.0, 10.0, 1)]
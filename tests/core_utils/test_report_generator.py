@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+核心工具的報告生成器測試：以 SQL 計算的統計與 Python 參考實作比對
+"""
+import json
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root))
+
+from core_utils.metrics_store import HOST_SOURCE, MetricsStore
+from core_utils.report_generator import PERCENTILES, ReportGenerator
+
+START = datetime(2024, 1, 1, 8, 0, 0)
+LANES = ["", "[quant]", "[transcriber]"]
+
+
+def fmt(moment: datetime) -> str:
+    return moment.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "phoenix.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("""
+        CREATE TABLE phoenix_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, level TEXT NOT NULL,
+            message TEXT NOT NULL, cpu_usage REAL, ram_usage REAL
+        )""")
+        MetricsStore.create_table(conn)
+    return path
+
+
+@pytest.fixture
+def generator(db_path, tmp_path):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"TIMEZONE": "Asia/Taipei"}), encoding="utf-8")
+    return ReportGenerator(db_path=db_path, config_path=config_path, output_dir=tmp_path / "reports")
+
+
+def seed_logs(db_path, rng: random.Random) -> list:
+    """寫入交錯的多泳道 STAGE 日誌與其他日誌，返回 [(timestamp, level, message)]。"""
+    logs, moment = [], START
+    for i in range(200):
+        moment += timedelta(milliseconds=rng.randint(1, 5000))
+        if rng.random() < 0.3:
+            lane = rng.choice(LANES)
+            logs.append((fmt(moment), "STAGE", f"{lane}階段 {i}"))
+        else:
+            logs.append((fmt(moment), rng.choice(["INFO", "INFO", "WARN", "ERROR"]), f"訊息 {i}"))
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("INSERT INTO phoenix_logs (timestamp, level, message) VALUES (?, ?, ?)", logs)
+    return logs
+
+
+def seed_rollups(db_path, rows):
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("INSERT INTO perf_rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def random_rollups(rng: random.Random, resolution: int, start: float, count: int, source=HOST_SOURCE,
+                   metric="cpu_percent") -> list:
+    rows = []
+    for i in range(count):
+        low, high = sorted(rng.uniform(0, 100) for _ in range(2))
+        rows.append((resolution, start + i * resolution, source, metric, low, rng.uniform(low, high), high,
+                     rng.randint(1, resolution)))
+    return rows
+
+
+def lane_of(message: str) -> str:
+    return message[1:message.index("]")] if message.startswith("[") else ""
+
+
+def seconds_between(a: str, b: str) -> float:
+    parse = lambda value: datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
+    return (parse(b) - parse(a)).total_seconds()
+
+
+def test_summary_and_stage_timings_match_reference(db_path, generator):
+    logs = seed_logs(db_path, random.Random(7))
+
+    with generator._connect() as conn:
+        generator._load_summary(conn)
+        timings = generator._stage_timings(conn)
+
+    end_time = logs[-1][0]
+    assert generator.start_time == logs[0][0] and generator.end_time == end_time
+    assert generator.total_duration_seconds == pytest.approx(seconds_between(logs[0][0], end_time), abs=1e-3)
+    expected_counts = {}
+    for _, level, _ in logs:
+        expected_counts[level] = expected_counts.get(level, 0) + 1
+    assert generator.level_counts == expected_counts
+
+    # 參考實作：每個階段持續到同一泳道的下一個階段，泳道最後一個階段持續到最後一筆日誌
+    stages = [(timestamp, message) for timestamp, level, message in logs if level == "STAGE"]
+    expected = []
+    for index, (timestamp, message) in enumerate(stages):
+        lane = lane_of(message)
+        following = [t for t, m in stages[index + 1:] if lane_of(m) == lane]
+        expected.append((lane, message, timestamp, seconds_between(timestamp, following[0] if following else end_time)))
+
+    assert [row[:3] for row in timings] == [row[:3] for row in expected]
+    assert [row[3] for row in timings] == pytest.approx([row[3] for row in expected], abs=1e-3)
+    assert {row[0] for row in timings} == {"", "quant", "transcriber"}
+
+
+def test_metric_summaries_are_weighted_by_samples(db_path, generator):
+    rng = random.Random(11)
+    host = random_rollups(rng, 60, 0.0, 50)
+    app = random_rollups(rng, 60, 0.0, 20, source="quant", metric="rss_mb")
+    fine = random_rollups(rng, 10, 0.0, 30)
+    seed_rollups(db_path, host + app + fine)
+
+    with generator._connect() as conn:
+        summaries = generator._metric_summaries(conn)
+
+    for key, rows in (((HOST_SOURCE, "cpu_percent"), host), (("quant", "rss_mb"), app)):
+        average, peak, lowest = summaries[key]
+        assert average == pytest.approx(sum(r[5] * r[7] for r in rows) / sum(r[7] for r in rows))
+        assert peak == max(r[6] for r in rows)
+        assert lowest == min(r[4] for r in rows)
+    assert set(summaries) == {(HOST_SOURCE, "cpu_percent"), ("quant", "rss_mb")}
+
+
+def test_percentile_resolution_picks_the_finest_complete_resolution(db_path, generator):
+    with generator._connect() as conn:
+        assert generator._percentile_resolution(conn) is None
+
+    rng = random.Random(3)
+    # 60 秒與 10 秒解析度從頭開始；1 秒解析度較早的資料已被保留期限清除
+    seed_rollups(db_path, random_rollups(rng, 60, 0.0, 20) + random_rollups(rng, 10, 30.0, 100)
+                 + random_rollups(rng, 1, 900.0, 100))
+    with generator._connect() as conn:
+        assert generator._percentile_resolution(conn) == 10
+
+    # 其他來源的資料不影響選擇
+    seed_rollups(db_path, random_rollups(rng, 1, 0.0, 5, source="quant"))
+    with generator._connect() as conn:
+        assert generator._percentile_resolution(conn) == 10
+
+    seed_rollups(db_path, random_rollups(rng, 1, 0.0, 5))
+    with generator._connect() as conn:
+        assert generator._percentile_resolution(conn) == 1
+
+
+def test_percentile_resolution_without_rollup_table(tmp_path, generator):
+    generator.db_path = tmp_path / "legacy.db"
+    sqlite3.connect(generator.db_path).close()
+    with generator._connect() as conn:
+        assert generator._percentile_resolution(conn) is None
+        assert generator._metric_summaries(conn) == {}
+
+
+@pytest.mark.parametrize("count", [1, 7, 100, 333])
+def test_percentiles_match_reference(db_path, generator, count):
+    rng = random.Random(count)
+    rows = random_rollups(rng, 10, 0.0, count)
+    seed_rollups(db_path, rows + random_rollups(rng, 60, 0.0, 5) + random_rollups(rng, 10, 0.0, 5, source="quant"))
+
+    with generator._connect() as conn:
+        percentiles = generator._percentiles(conn, 10, "cpu_percent")
+        assert generator._percentiles(conn, 10, "ram_percent") == {}
+
+    values = sorted(r[5] for r in rows)
+    assert percentiles == {p: values[min(count - 1, int(count * p / 100))] for p in PERCENTILES}
+
+
+def test_generate_all_reports_writes_the_statistics(db_path, generator):
+    seed_logs(db_path, random.Random(5))
+    rows = [(60, 0.0, HOST_SOURCE, "cpu_percent", 10.0, 20.0, 30.0, 1),
+            (60, 60.0, HOST_SOURCE, "cpu_percent", 30.0, 40.0, 90.0, 3)]
+    seed_rollups(db_path, rows)
+
+    paths = generator.generate_all_reports()
+
+    assert [path.name for path in paths] == ["綜合戰情簡報.md", "效能分析報告.md", "詳細日誌報告.md"]
+    summary = paths[0].read_text(encoding="utf-8")
+    assert "**平均 CPU 使用率:** 35.0%" in summary
+    assert "**峰值 CPU 使用率:** 90.0%" in summary
+    assert not list(generator.output_dir.glob("*.tmp"))
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+核心工具的資源取樣器測試：預留與准入控制
+"""
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root))
+
+from core_utils import resource_monitor
+from core_utils.resource_monitor import (
+    ResourceSampler, get_resource_sampler, is_resource_sufficient, start_resource_sampler, stop_resource_sampler,
+)
+
+MB = 1024 ** 2
+SETTINGS = {"resource_monitoring": {"memory_usage_threshold_percent": 75.0, "min_disk_space_mb": 512}}
+
+
+class FakeMachine:
+    """以可調整的數值取代 psutil 與 shutil.disk_usage。"""
+
+    def __init__(self, total_mb=1000.0, used_mb=500.0, disk_free_mb=10000.0):
+        self.total_mb = total_mb
+        self.used_mb = used_mb
+        self.disk_free_mb = disk_free_mb
+
+    def virtual_memory(self):
+        return SimpleNamespace(total=self.total_mb * MB, available=(self.total_mb - self.used_mb) * MB)
+
+    def cpu_percent(self, interval=None):
+        return 10.0
+
+    def disk_usage(self, path):
+        return SimpleNamespace(total=100000 * MB, used=(100000 - self.disk_free_mb) * MB, free=self.disk_free_mb * MB)
+
+
+@pytest.fixture
+def machine(monkeypatch):
+    fake = FakeMachine()
+    monkeypatch.setitem(sys.modules, "psutil", fake)
+    monkeypatch.setattr(resource_monitor.shutil, "disk_usage", fake.disk_usage)
+    return fake
+
+
+@pytest.fixture
+def sampler(machine):
+    """未啟動背景執行緒的取樣器；smoothing=1.0 讓每次取樣直接成為目前數值。"""
+    sampler = ResourceSampler(SETTINGS, interval=0.05, window_seconds=0.2, smoothing=1.0)
+    sampler._sample()
+    return sampler
+
+
+@pytest.fixture
+def no_shared_sampler(monkeypatch):
+    monkeypatch.setattr(resource_monitor, "_shared_sampler", None)
+    yield
+    stop_resource_sampler()
+
+
+def test_reservations_count_against_the_threshold(sampler):
+    first, _ = sampler.try_reserve("a", memory_mb=200)
+    assert first is not None
+
+    second, message = sampler.try_reserve("b", memory_mb=100)
+    assert second is None
+    assert "FAIL" in message
+
+    first.release()
+    second, _ = sampler.try_reserve("b", memory_mb=100)
+    assert second is not None
+
+
+def test_first_reservation_is_always_admitted(sampler):
+    assert sampler.can_admit(memory_mb=400)[0] is False
+
+    reservation, _ = sampler.try_reserve("large", memory_mb=400)
+
+    assert reservation is not None
+    assert sampler.try_reserve("small", memory_mb=1)[0] is None
+
+
+def test_memory_growth_consumes_outstanding_reservation(sampler, machine):
+    reservation, _ = sampler.try_reserve("model", memory_mb=200)
+    assert sampler.snapshot()["memory"]["reserved_mb"] == 200
+
+    machine.used_mb = 650
+    sampler._sample()
+
+    assert sampler.snapshot()["memory"]["reserved_mb"] == 50
+    assert sampler.can_admit(memory_mb=20)[0] is True
+    assert sampler.can_admit(memory_mb=100)[0] is False
+
+    reservation.release()
+    assert sampler.snapshot()["memory"]["reserved_mb"] == 0
+
+
+def test_disk_reservations(sampler, machine):
+    machine.disk_free_mb = 1000
+    sampler._sample()
+
+    first, _ = sampler.try_reserve("download", disk_mb=400)
+    assert first is not None
+    assert sampler.try_reserve("download-2", disk_mb=200)[0] is None
+    assert sampler.snapshot()["disk"]["reserved_mb"] == 400
+
+
+def test_reservation_context_manager_releases_once(sampler):
+    with sampler.try_reserve("a", memory_mb=200)[0] as reservation:
+        assert sampler.try_reserve("b", memory_mb=100)[0] is None
+    assert reservation.released
+    reservation.release()
+    assert sampler.try_reserve("b", memory_mb=100)[0] is not None
+
+
+def test_admit_waits_for_release(sampler):
+    first, _ = sampler.try_reserve("a", memory_mb=200)
+    threading.Timer(0.1, first.release).start()
+
+    started = time.monotonic()
+    second = sampler.admit("b", memory_mb=100, timeout=2)
+
+    assert second is not None
+    assert 0.05 < time.monotonic() - started < 2
+
+
+def test_admit_times_out(sampler):
+    sampler.try_reserve("a", memory_mb=200)
+
+    with pytest.raises(TimeoutError):
+        sampler.admit("b", memory_mb=100, timeout=0.1)
+
+
+def test_admit_async_times_out_and_succeeds_after_release(sampler):
+    first, _ = sampler.try_reserve("a", memory_mb=200)
+
+    async def run():
+        with pytest.raises(TimeoutError):
+            await sampler.admit_async("b", memory_mb=100, timeout=0.1)
+        asyncio.get_running_loop().call_later(0.1, first.release)
+        return await sampler.admit_async("b", memory_mb=100, timeout=2)
+
+    assert asyncio.run(run()) is not None
+
+
+def test_snapshot_smooths_samples_and_tracks_window_peak(machine):
+    sampler = ResourceSampler(SETTINGS, interval=1.0, window_seconds=10.0, smoothing=0.5)
+    sampler._sample()
+    machine.used_mb = 900
+    sampler._sample()
+    machine.used_mb = 500
+    sampler._sample()
+
+    memory = sampler.snapshot()["memory"]
+
+    assert memory["used_percent"] == 60.0
+    assert memory["window_peak_percent"] == 90.0
+
+
+def test_is_resource_sufficient_does_not_start_the_sampler(machine, no_shared_sampler, monkeypatch):
+    monkeypatch.setattr(resource_monitor, "get_system_resources", lambda: {
+        "memory": {"used_percent": 80.0}, "disk": {"free_mb": 10000.0},
+    })
+
+    sufficient, message = is_resource_sufficient(SETTINGS)
+
+    assert sufficient is False
+    assert "Memory: 80.0%" in message
+    assert get_resource_sampler() is None
+
+
+def test_is_resource_sufficient_uses_started_sampler(machine, no_shared_sampler):
+    sampler = start_resource_sampler(SETTINGS)
+    assert start_resource_sampler(SETTINGS) is sampler
+    assert get_resource_sampler() is sampler
+
+    sufficient, message = is_resource_sufficient(SETTINGS)
+    assert sufficient is True
+    assert "Memory: 50.0%" in message
+
+    stop_resource_sampler()
+    assert get_resource_sampler() is None
+    assert sampler._thread is None
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+核心工具的安全安裝器測試：批次模式的判斷、uv 命令組裝與逐一安裝的退回
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root))
+
+from core_utils import safe_installer
+from core_utils.safe_installer import build_install_command, should_batch_install
+
+SETTINGS = {"resource_monitoring": {"memory_usage_threshold_percent": 75.0, "min_disk_space_mb": 512}}
+
+
+def stub_resources(monkeypatch, used_percent=40.0, free_mb=10000.0):
+    resources = {"memory": {"used_percent": used_percent}, "disk": {"free_mb": free_mb}}
+    monkeypatch.setattr(safe_installer, "get_system_resources", lambda: resources)
+
+
+@pytest.mark.parametrize("used_percent, free_mb, expected", [
+    (40.0, 10000.0, True),
+    (59.9, 10000.0, True),
+    (60.0, 10000.0, False),  # 低於 75% 閾值，但吃掉了 15% 的保留空間
+    (40.0, 2048.0, False),   # 批次模式需要比一般閾值更多的磁碟空間
+    (40.0, 2049.0, True),
+])
+def test_should_batch_install_requires_headroom(monkeypatch, used_percent, free_mb, expected):
+    stub_resources(monkeypatch, used_percent, free_mb)
+    use_batch, message = should_batch_install(SETTINGS)
+    assert use_batch is expected
+    assert ("TIGHT" in message) is not expected
+
+
+def test_should_batch_install_honours_installer_settings(monkeypatch):
+    stub_resources(monkeypatch, used_percent=40.0, free_mb=3000.0)
+    settings = dict(SETTINGS, installer={"batch_memory_headroom_percent": 40.0})
+    assert should_batch_install(settings)[0] is False
+
+    settings = dict(SETTINGS, installer={"batch_min_disk_space_mb": 5000})
+    assert should_batch_install(settings)[0] is False
+
+    use_batch, message = should_batch_install(dict(SETTINGS, installer={"batch_install": False}))
+    assert use_batch is False and "停用" in message
+
+
+def test_build_install_command():
+    cache_dir = Path("cache")
+    base = ["uv", "pip", "install", "--python", "py", "--cache-dir", "cache"]
+    assert build_install_command("py", cache_dir, requirements_path="req.txt") == base + ["-r", "req.txt"]
+    assert build_install_command("py", cache_dir, packages=["a==1", "b"]) == base + ["a==1", "b"]
+    assert build_install_command("py", cache_dir, packages=["a"], extra_args=["--no-deps"]) == base + ["--no-deps", "a"]
+
+
+@pytest.fixture
+def installer(monkeypatch, tmp_path):
+    """把日誌、快取與資源檢查都導向測試環境，並記錄所有 uv 命令。"""
+    monkeypatch.setattr(safe_installer, "LOGS_DIR", tmp_path)
+    monkeypatch.delenv("UV_CACHE_DIR", raising=False)
+    settings = dict(SETTINGS, installer={"wheel_cache_dir": str(tmp_path / "cache")})
+    monkeypatch.setattr(safe_installer, "load_resource_settings", lambda: settings)
+    monkeypatch.setattr(safe_installer, "start_resource_sampler", lambda settings: None)
+    stub_resources(monkeypatch)
+
+    state = {"commands": [], "failing": set(), "checks": 0, "sufficient": True}
+
+    def fake_run(command, **kwargs):
+        state["commands"].append(command)
+        if state["failing"] & set(command):
+            raise subprocess.CalledProcessError(1, command, stderr="resolution failed")
+        return subprocess.CompletedProcess(command, 0, stdout="", stderr="")
+
+    def fake_check(settings):
+        state["checks"] += 1
+        return state["sufficient"], "stub"
+
+    monkeypatch.setattr(safe_installer.subprocess, "run", fake_run)
+    monkeypatch.setattr(safe_installer, "is_resource_sufficient", fake_check)
+
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("numpy==1.26.4  # 科學計算\n\npandas\n# 註解\nrequests\n", encoding="utf-8")
+    state["requirements"] = str(requirements)
+    return state
+
+
+def installed(commands):
+    """返回每個 uv 命令的安裝目標 (-r 檔案或套件名稱)。"""
+    return [command[command.index("--cache-dir") + 2:] for command in commands]
+
+
+def test_batch_install_runs_a_single_transaction(installer):
+    safe_installer.install_packages("quant", installer["requirements"], "py")
+
+    assert installed(installer["commands"]) == [["-r", installer["requirements"]]]
+    assert installer["checks"] == 0
+
+
+def test_tight_resources_install_one_by_one_with_checks(installer, monkeypatch):
+    stub_resources(monkeypatch, used_percent=70.0)
+
+    safe_installer.install_packages("quant", installer["requirements"], "py", extra_args=["--no-deps"])
+
+    assert installed(installer["commands"]) == [["--no-deps", "numpy==1.26.4"], ["--no-deps", "pandas"],
+                                                ["--no-deps", "requests"]]
+    assert installer["checks"] == 3
+
+
+def test_failed_batch_falls_back_to_per_package_install(installer):
+    installer["failing"] = {"-r"}
+
+    safe_installer.install_packages("quant", installer["requirements"], "py")
+
+    assert installed(installer["commands"]) == [["-r", installer["requirements"]], ["numpy==1.26.4"], ["pandas"],
+                                                ["requests"]]
+    assert installer["checks"] == 3
+
+
+def test_fallback_reports_the_failing_package(installer):
+    installer["failing"] = {"-r", "pandas"}
+
+    with pytest.raises(SystemExit, match="pandas"):
+        safe_installer.install_packages("quant", installer["requirements"], "py")
+
+    assert installed(installer["commands"])[1:] == [["numpy==1.26.4"], ["pandas"]]
+
+
+def test_fallback_stops_when_resources_run_out(installer):
+    installer["failing"] = {"-r"}
+    installer["sufficient"] = False
+
+    with pytest.raises(SystemExit, match="資源不足"):
+        safe_installer.install_packages("quant", installer["requirements"], "py")
+
+    assert len(installer["commands"]) == 1
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+啟動器的狀態 API 測試：StatusHub 的增量快取、long-poll 與 SSE 串流
+"""
+import asyncio
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root))
+
+import launch
+from launch import STATUS_HUB, StatusHub, get_status_api, stream_status_api
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = tmp_path / "phoenix.db"
+    monkeypatch.setattr(launch, "DB_FILE", path)
+    launch.setup_database()
+    return path
+
+
+def insert_logs(db_path: Path, count: int):
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO phoenix_logs (timestamp, level, message) VALUES (?, 'INFO', ?)",
+            [("2024-01-01 00:00:00.000", f"log {i}") for i in range(count)],
+        )
+
+
+def run_with_client(db_path: Path, scenario, max_cached_logs: int = 1000):
+    """建立 StatusHub 與狀態 API，並以測試客戶端執行 scenario(hub, client)。"""
+    async def run():
+        hub = StatusHub(db_path, max_cached_logs=max_cached_logs)
+        await hub.refresh()
+        app = web.Application()
+        app[STATUS_HUB] = hub
+        app.router.add_get("/api/v1/status", get_status_api)
+        app.router.add_get("/api/v1/status/stream", stream_status_api)
+        async with TestClient(TestServer(app)) as client:
+            return await scenario(hub, client)
+
+    return asyncio.run(run())
+
+
+async def read_events(response, count: int) -> list:
+    """從 SSE 回應讀取 count 個資料事件 (略過心跳)，返回 (id, payload)。"""
+    events, event_id = [], None
+    while len(events) < count:
+        line = (await asyncio.wait_for(response.content.readline(), timeout=5)).decode("utf-8").rstrip("\n")
+        if line.startswith("id: "):
+            event_id = int(line[4:])
+        elif line.startswith("data: "):
+            events.append((event_id, json.loads(line[6:])))
+    return events
+
+
+def test_long_poll_returns_when_new_logs_arrive(db_path):
+    insert_logs(db_path, 3)
+
+    async def scenario(hub, client):
+        assert hub.cursor == 3
+
+        # 沒有新日誌時等待到逾時，返回空的增量
+        empty = await (await client.get("/api/v1/status", params={"since": 3, "wait": 0.1})).json()
+        assert empty["logs"] == [] and empty["cursor"] == 3
+
+        async def write_later():
+            await asyncio.sleep(0.1)
+            insert_logs(db_path, 2)
+            await hub.refresh()
+
+        writer = asyncio.create_task(write_later())
+        started = asyncio.get_running_loop().time()
+        body = await (await client.get("/api/v1/status", params={"since": 3, "wait": 5})).json()
+        await writer
+        assert asyncio.get_running_loop().time() - started < 5
+        assert [log["id"] for log in body["logs"]] == [4, 5]
+        assert body["cursor"] == 5
+        assert body["status"]["id"] == 1
+
+    run_with_client(db_path, scenario)
+
+
+def test_since_older_than_the_cache_pages_forward_without_gaps(db_path):
+    insert_logs(db_path, 12)
+
+    async def scenario(hub, client):
+        # 初次讀取超過快取大小的日誌時也會讀完，快取只保留最新的幾筆
+        assert hub.cursor == 12
+        assert [log["id"] for log in hub.logs] == [8, 9, 10, 11, 12]
+
+        seen, since = [], 0
+        while True:
+            body = await (await client.get("/api/v1/status", params={"since": since})).json()
+            if not body["logs"]:
+                break
+            assert len(body["logs"]) <= 5
+            seen.extend(log["id"] for log in body["logs"])
+            since = body["cursor"]
+        assert seen == list(range(1, 13))
+        assert since == 12
+
+    run_with_client(db_path, scenario, max_cached_logs=5)
+
+
+def test_refresh_after_a_burst_larger_than_the_cache(db_path):
+    insert_logs(db_path, 2)
+
+    async def scenario(hub, client):
+        insert_logs(db_path, 9)
+        await hub.refresh()
+        assert hub.cursor == 11
+
+        body = await (await client.get("/api/v1/status", params={"since": 2})).json()
+        assert [log["id"] for log in body["logs"]] == [3, 4, 5, 6, 7]
+        body = await (await client.get("/api/v1/status", params={"since": body["cursor"]})).json()
+        assert [log["id"] for log in body["logs"]] == [8, 9, 10, 11]
+
+    run_with_client(db_path, scenario, max_cached_logs=5)
+
+
+def test_stream_catches_up_page_by_page_then_follows_changes(db_path):
+    insert_logs(db_path, 12)
+
+    async def scenario(hub, client):
+        async with client.get("/api/v1/status/stream", params={"since": 0}) as response:
+            assert response.headers["Content-Type"] == "text/event-stream"
+            events = await read_events(response, 3)
+            assert [event_id for event_id, _ in events] == [5, 10, 12]
+            assert [log["id"] for _, payload in events for log in payload["logs"]] == list(range(1, 13))
+
+            insert_logs(db_path, 1)
+            await hub.refresh()
+            [(event_id, payload)] = await read_events(response, 1)
+            assert event_id == 13
+            assert [log["message"] for log in payload["logs"]] == ["log 0"]
+
+    run_with_client(db_path, scenario, max_cached_logs=5)
+
+
+def test_stream_resumes_from_last_event_id(db_path):
+    insert_logs(db_path, 4)
+
+    async def scenario(hub, client):
+        headers = {"Last-Event-ID": "2"}
+        async with client.get("/api/v1/status/stream", params={"since": 0}, headers=headers) as response:
+            [(event_id, payload)] = await read_events(response, 1)
+        assert event_id == 4
+        assert [log["id"] for log in payload["logs"]] == [3, 4]
+
+        bad = await client.get("/api/v1/status/stream", params={"since": "abc"})
+        assert bad.status == 400
+
+    run_with_client(db_path, scenario)
+
+
+def test_status_rejects_negative_parameters(db_path):
+    async def scenario(hub, client):
+        response = await client.get("/api/v1/status", params={"since": -1})
+        assert response.status == 400
+
+    run_with_client(db_path, scenario)
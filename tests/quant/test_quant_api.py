@@ -3,8 +3,11 @@
 量化 App 的 API 測試
 """
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import pytest
 from fastapi.testclient import TestClient
 
 # --- 設置導入路徑 ---
@@ -15,9 +18,42 @@ sys.path.insert(0, str(project_root))
 
 from apps.quant.main import app
 
+from quant.logic import database, jobs
+
 # 使用 FastAPI 的測試客戶端
 client = TestClient(app)
 
+@pytest.fixture(autouse=True)
+def results_db(monkeypatch, tmp_path):
+    """
+    以暫存目錄中的資料庫取代全局的 db_manager，測試不會寫入工作目錄的 quant_app.db。
+    """
+    manager = database.DBManager(tmp_path / "results.db")
+    manager.initialize_tables()
+    monkeypatch.setattr(database, "db_manager", manager)
+    yield manager
+    manager.close()
+
+@pytest.fixture
+def job_manager(monkeypatch):
+    """
+    以執行緒池取代進程池的工作管理器。
+    這樣在測試中對業務邏輯的模擬 (mock) 才會作用在回測工作上。
+    """
+    manager = jobs.BacktestJobManager(max_workers=1, max_queued=1,
+                                      executor_factory=lambda workers: ThreadPoolExecutor(max_workers=workers))
+    monkeypatch.setattr(jobs, "job_manager", manager)
+    yield manager
+    manager.shutdown(wait=True)
+
+def submit_and_wait(manager, payload):
+    """提交回測工作並等待它完成，返回工作 ID"""
+    response = client.post("/v1/backtest", json=payload)
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert manager.get(job_id).wait(timeout=5)
+    return job_id
+
 def test_health_check():
     """
     測試 `/health` 端點是否正常工作。
@@ -34,7 +70,7 @@ def test_root_path():
     assert response.status_code == 200
     assert response.json() == {"message": "歡迎來到量化金融服務 API"}
 
-def test_perform_backtest_api(mocker):
+def test_perform_backtest_api(mocker, job_manager):
     """
     測試 /v1/backtest API 端點。
 
@@ -65,17 +101,19 @@ def test_perform_backtest_api(mocker):
         "start_date": "2023-01-01",
         "end_date": "2024-01-01"
     }
-    response = client.post("/v1/backtest", json=request_payload)
+    job_id = submit_and_wait(job_manager, request_payload)
 
     # 步驟 3: 斷言結果
-    # 驗證 API 是否返回 200 OK
+    # 驗證工作狀態為成功
+    assert client.get(f"/v1/backtest/jobs/{job_id}").json()["status"] == jobs.SUCCEEDED
+    # 驗證結果端點返回 200 OK，且回應就是我們模擬的結果
+    response = client.get(f"/v1/backtest/jobs/{job_id}/result")
     assert response.status_code == 200
-    # 驗證 API 的回應是否就是我們模擬的結果
     assert response.json() == mock_success_result
     # 驗證資料庫儲存函式是否被呼叫了一次
     mock_db_save.assert_called_once_with(mock_success_result)
 
-def test_perform_backtest_api_error(mocker):
+def test_perform_backtest_api_error(mocker, job_manager):
     """
     測試當業務邏輯層返回錯誤時，API 是否能正確處理。
     """
@@ -93,10 +131,100 @@ def test_perform_backtest_api_error(mocker):
         "start_date": "2023-01-01",
         "end_date": "2024-01-01"
     }
-    response = client.post("/v1/backtest", json=request_payload)
+    job_id = submit_and_wait(job_manager, request_payload)
+    response = client.get(f"/v1/backtest/jobs/{job_id}/result")
 
     # 步驟 3: 斷言結果
+    assert client.get(f"/v1/backtest/jobs/{job_id}").json()["status"] == jobs.FAILED
     # 驗證 API 是否返回 400 Bad Request
     assert response.status_code == 400
     # 驗證回應的詳細訊息是否就是我們模擬的錯誤訊息
     assert response.json() == {"detail": mock_error_result["error"]}
+
+def test_backtest_queue_limit(mocker, job_manager):
+    """
+    測試執行中與排隊中的工作達到上限時，新的提交會被拒絕 (429)，且未完成的工作返回 409。
+    """
+    release = threading.Event()
+    mocker.patch("quant.logic.analysis.run_simple_backtest",
+                 side_effect=lambda **kwargs: release.wait(5) and {"stock_id": kwargs["stock_id"]})
+    mocker.patch("quant.logic.database.db_manager.save_backtest_result")
+    payload = {"stock_id": "2330.TW", "start_date": "2023-01-01", "end_date": "2024-01-01"}
+
+    # max_workers=1 + max_queued=1：前兩個被接受，第三個被拒絕
+    first = client.post("/v1/backtest", json=payload).json()["job_id"]
+    assert client.post("/v1/backtest", json=payload).status_code == 202
+    assert client.post("/v1/backtest", json=payload).status_code == 429
+    assert client.get(f"/v1/backtest/jobs/{first}/result").status_code == 409
+
+    release.set()
+    assert job_manager.get(first).wait(timeout=5)
+    assert client.get(f"/v1/backtest/jobs/{first}/result").json() == {"stock_id": "2330.TW"}
+
+def test_unknown_backtest_job():
+    """
+    測試查詢不存在的工作時返回 404。
+    """
+    assert client.get("/v1/backtest/jobs/does-not-exist").status_code == 404
+
+def test_grid_backtest_api(mocker, job_manager):
+    """
+    測試 /v1/backtest/grid：網格回測以工作形式執行，結果不寫入資料庫。
+    """
+    mock_grid_result = {"combinations": 2, "results": [{"stock_id": "2330", "rank": 1}, {"stock_id": "2317", "rank": 2}]}
+    mock_grid = mocker.patch("quant.logic.analysis.run_grid_backtest", return_value=mock_grid_result)
+    mock_save = mocker.patch("quant.logic.database.db_manager.save_backtest_result")
+
+    payload = {"stock_ids": ["2330", "2317"], "start_date": "2023-01-01", "end_date": "2024-01-01",
+               "window_pairs": [[10, 30]]}
+    response = client.post("/v1/backtest/grid", json=payload)
+    assert response.status_code == 202
+    assert response.json()["kind"] == jobs.GRID
+    job_id = response.json()["job_id"]
+    assert job_manager.get(job_id).wait(timeout=5)
+
+    result = client.get(f"/v1/backtest/jobs/{job_id}/result")
+    assert result.status_code == 200
+    assert result.json() == mock_grid_result
+    assert mock_grid.call_args.kwargs["window_pairs"] == [(10, 30)]
+    mock_save.assert_not_called()
+
+def test_backtest_results_pagination(results_db):
+    """
+    測試 /v1/backtest/results 的游標分頁、篩選、排序與欄位選取。
+    """
+    manager = results_db
+    for i in range(25):
+        manager.save_backtest_result({
+            "stock_id": "2330" if i % 2 else "2317", "start_date": "2023-01-01", "end_date": "2024-01-01",
+            "initial_capital": 100000.0, "final_value": 100000.0 + i, "total_return_pct": float(i % 5),
+            "trade_count": i, "sharpe": None if i % 7 == 0 else i / 10,
+        })
+
+    # 依 Sharpe 由大到小逐頁讀取 (包含 NULL)，結果不重複、不遺漏
+    seen, cursor = [], None
+    while True:
+        params = {"sort_by": "sharpe", "limit": 4, "fields": "id,sharpe"}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/v1/backtest/results", params=params).json()
+        assert all(set(item) == {"id", "sharpe"} for item in page["items"])
+        seen.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == 25 and len({item["id"] for item in seen}) == 25
+    sharpes = [item["sharpe"] for item in seen if item["sharpe"] is not None]
+    assert sharpes == sorted(sharpes, reverse=True)
+    assert all(item["sharpe"] is None for item in seen[len(sharpes):])
+
+    # 篩選 + 由小到大排序
+    filtered = client.get("/v1/backtest/results", params={
+        "stock_id": "2330", "min_return": 3, "sort_by": "total_return_pct", "order": "asc",
+        "fields": "stock_id,total_return_pct"}).json()
+    returns = [item["total_return_pct"] for item in filtered["items"]]
+    assert returns == sorted(returns) and min(returns) >= 3
+    assert {item["stock_id"] for item in filtered["items"]} == {"2330"}
+
+    assert client.get("/v1/backtest/results", params={"fields": "password"}).status_code == 400
+    assert client.get("/v1/backtest/results", params={"cursor": "not-a-cursor"}).status_code == 400
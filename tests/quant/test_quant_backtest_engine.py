@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+量化 App 的網格回測引擎測試
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root / "apps"))
+
+from quant.logic import analysis
+
+
+def make_prices():
+    """兩檔股票的合成價格，第二檔較晚上市"""
+    rng = np.random.default_rng(42)
+    dates = pd.bdate_range("2023-01-02", periods=250)
+    prices = pd.DataFrame({
+        "AAA": 100 * np.exp(np.cumsum(rng.normal(0.001, 0.02, len(dates)))),
+        "BBB": 50 * np.exp(np.cumsum(rng.normal(0.0, 0.03, len(dates)))),
+    }, index=dates)
+    prices.iloc[:40, 1] = np.nan
+    return prices
+
+
+def naive_backtest(close: pd.Series, short: int, long: int, capital: float) -> dict:
+    """逐日迴圈的參考實作，用來驗證向量化結果"""
+    short_ma = close.rolling(short).mean()
+    long_ma = close.rolling(long).mean()
+    cash, shares, previous_signal, trades = capital, 0.0, 0, 0
+    for price, s, l in zip(close, short_ma, long_ma):
+        signal = int(not np.isnan(l) and s > l)
+        target = signal * capital / price if signal else 0.0
+        cash -= (target - shares) * price
+        shares = target
+        trades += signal != previous_signal
+        previous_signal = signal
+    return {"final_value": cash + shares * close.iloc[-1], "trade_count": trades}
+
+
+def test_grid_backtest_matches_naive_loop():
+    prices = make_prices()
+    loader = lambda stock_ids, start, end: (prices[list(stock_ids)], {})
+    window_pairs = [(5, 20), (10, 30)]
+    capitals = [100000.0, 250000.0]
+
+    result = analysis.run_grid_backtest(["AAA", "BBB"], "2023-01-01", "2023-12-31",
+                                        window_pairs=window_pairs, initial_capitals=capitals,
+                                        price_loader=loader)
+
+    assert result["combinations"] == 2 * 2 * 2
+    returns = [row["total_return_pct"] for row in result["results"]]
+    assert returns == sorted(returns, reverse=True)
+    assert [row["rank"] for row in result["results"]] == list(range(1, 9))
+
+    for row in result["results"]:
+        expected = naive_backtest(prices[row["stock_id"]].dropna(), row["short_window"],
+                                  row["long_window"], row["initial_capital"])
+        assert row["final_value"] == pytest.approx(expected["final_value"])
+        assert row["trade_count"] == expected["trade_count"]
+
+
+def test_grid_backtest_validation_and_top_n():
+    prices = make_prices()
+    loader = lambda stock_ids, start, end: (prices, {"CCC": "查無數據"})
+
+    invalid = analysis.run_grid_backtest(["AAA"], "2023-01-01", "2023-12-31",
+                                         window_pairs=[(30, 10)], price_loader=loader)
+    assert "error" in invalid
+
+    result = analysis.run_grid_backtest(["AAA", "BBB", "CCC"], "2023-01-01", "2023-12-31",
+                                        window_pairs=[(5, 20), (10, 30), (20, 60)],
+                                        rank_by="sharpe", top_n=3, price_loader=loader)
+    assert result["combinations"] == 6
+    assert len(result["results"]) == 3
+    assert result["errors"] == {"CCC": "查無數據"}
+    sharpes = [row["sharpe"] for row in result["results"]]
+    assert sharpes == sorted(sharpes, reverse=True)
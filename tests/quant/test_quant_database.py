@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+量化 App 的資料庫測試：背景寫入執行緒與平行讀寫
+"""
+import sqlite3
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root / "apps"))
+
+from quant.logic import database
+
+
+def make_result(i: int, stock_id="2330") -> dict:
+    return {
+        "stock_id": stock_id, "start_date": "2023-01-01", "end_date": "2024-01-01",
+        "initial_capital": 100000.0, "final_value": 100000.0 + i, "total_return_pct": float(i % 5),
+        "trade_count": i, "sharpe": i / 10,
+    }
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = database.DBManager(tmp_path / "results.db")
+    manager.initialize_tables()
+    yield manager
+    manager.close()
+
+
+def count_rows(manager) -> int:
+    return manager.conn.execute("SELECT COUNT(*) FROM backtest_results").fetchone()[0]
+
+
+def test_concurrent_saves_and_reads(manager):
+    writers, per_writer = 8, 25
+    stop_reading = threading.Event()
+    observed = []
+
+    def write(worker: int):
+        for i in range(per_writer):
+            manager.save_backtest_result(make_result(worker * per_writer + i, stock_id=str(worker)))
+
+    def read():
+        counts = []
+        while not stop_reading.is_set():
+            items, _ = manager.query_backtest_results(fields=["id"], limit=1000)
+            counts.append(len(items))
+        # 讀取不會被寫入阻塞，也不會看到還沒提交的資料
+        observed.append(counts)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    with ThreadPoolExecutor(max_workers=writers) as pool:
+        list(pool.map(write, range(writers)))
+    stop_reading.set()
+    for reader in readers:
+        reader.join(timeout=10)
+
+    assert count_rows(manager) == writers * per_writer
+    for counts in observed:
+        assert counts == sorted(counts)
+    for worker in range(writers):
+        items, _ = manager.query_backtest_results(stock_id=str(worker), limit=1000)
+        assert len(items) == per_writer
+
+
+def test_bad_row_does_not_fail_the_others(manager):
+    futures = manager.save_backtest_results(
+        [make_result(1), make_result(2, stock_id=None), make_result(3)], wait=False
+    )
+
+    assert futures[0].result(timeout=5) is None
+    assert isinstance(futures[1].exception(timeout=5), sqlite3.IntegrityError)
+    assert futures[2].result(timeout=5) is None
+    assert count_rows(manager) == 2
+    with pytest.raises(sqlite3.IntegrityError):
+        manager.save_backtest_result(make_result(4, stock_id=None))
+
+
+def test_failed_batch_falls_back_to_row_by_row(manager):
+    conn = manager._connect()
+    rows = [database._result_row(make_result(i, stock_id=None if i == 1 else "2330")) for i in range(3)]
+    batch = [(row, Future()) for row in rows]
+
+    database.DBManager._write_batch(conn, batch)
+
+    assert [future.exception() is None for _, future in batch] == [True, False, True]
+    assert count_rows(manager) == 2
+
+
+def test_writer_survives_unexpected_errors(manager, monkeypatch):
+    calls = []
+
+    def flaky_write_batch(conn, batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        database.DBManager._write_batch(conn, batch)
+
+    monkeypatch.setattr(manager, "_write_batch", flaky_write_batch)
+
+    with pytest.raises(RuntimeError):
+        manager.save_backtest_result(make_result(1))
+    writer = manager._writer
+    manager.save_backtest_result(make_result(2))
+
+    assert manager._writer is writer and writer.is_alive()
+    assert count_rows(manager) == 1
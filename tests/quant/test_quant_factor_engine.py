@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+量化 App 的增量因子引擎測試
+"""
+import pickle
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root / "apps"))
+
+from quant.logic import factor_engineering
+
+
+def make_prices(n=300, seed=7):
+    """含缺值、連續相同價格與負值區段的價格序列"""
+    rng = np.random.default_rng(seed)
+    prices = np.round(100 + np.cumsum(rng.normal(0, 1, n)), 2)
+    prices[[5, 77, 150]] = np.nan
+    prices[100:130] = prices[100]
+    prices[200:] -= 150
+    return prices
+
+
+def test_incremental_factors_match_batch_exactly():
+    prices = make_prices()
+    batch = factor_engineering.add_all_factors(pd.DataFrame({"close": prices}))
+
+    # 先以前 250 根 K 線建立狀態，存檔後再逐根更新其餘的 K 線
+    engine = factor_engineering.IncrementalFactorEngine()
+    history = engine.update_many("2330", prices[:250])
+    engine = pickle.loads(pickle.dumps(engine))
+    live = pd.DataFrame([engine.update("2330", price) for price in prices[250:]])
+    incremental = pd.concat([history, live], ignore_index=True)
+
+    for column in engine.factor_names:
+        assert np.array_equal(incremental[column].to_numpy(), batch[column].to_numpy(), equal_nan=True), column
+
+
+def test_symbols_keep_separate_state():
+    engine = factor_engineering.IncrementalFactorEngine(ma_windows=(3,), rsi_windows=())
+    engine.update_many("A", [1.0, 2.0, 3.0])
+    engine.update_many("B", [10.0, 20.0])
+    assert engine.update("A", 4.0) == {"MA_3": 3.0}
+    assert engine.update("B", 30.0) == {"MA_3": 20.0}
+    engine.reset("A")
+    assert engine.symbols() == ["B"]
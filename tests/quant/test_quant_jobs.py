@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+量化 App 的回測工作管理測試：工作進程意外終止後的恢復
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root / "apps"))
+
+from quant.logic import jobs
+
+
+def _crash(params: dict) -> dict:
+    """模擬工作進程被系統終止 (例如記憶體不足)。"""
+    os._exit(1)
+
+
+def _echo(params: dict) -> dict:
+    return params
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setitem(jobs._JOB_KINDS, "crash", (_crash, False))
+    monkeypatch.setitem(jobs._JOB_KINDS, "echo", (_echo, False))
+    manager = jobs.BacktestJobManager(max_workers=1, max_queued=4)
+    yield manager
+    manager.shutdown(wait=True)
+
+
+def test_crashed_worker_fails_affected_jobs_and_pool_is_recreated(manager):
+    crashed = manager.submit({}, kind="crash")
+    queued = manager.submit({"n": 1}, kind="echo")
+    broken = manager._executor
+
+    assert crashed.wait(timeout=30) and queued.wait(timeout=30)
+    for job in (crashed, queued):
+        assert job.status == jobs.FAILED
+        assert "意外終止" in job.error
+    assert manager._executor is None
+
+    job = manager.submit({"n": 2}, kind="echo")
+    assert job.wait(timeout=30)
+    assert job.status == jobs.SUCCEEDED and job.result == {"n": 2}
+    assert manager._executor is not broken
+
+
+def test_submit_replaces_a_pool_that_broke_before_any_job_reported(manager):
+    # 進程池已損壞，但還沒有經由 _on_done 回報的工作可以丟棄它
+    stale = jobs.ProcessPoolExecutor(max_workers=1)
+    assert isinstance(stale.submit(_crash, {}).exception(timeout=30), jobs.BrokenProcessPool)
+    manager._executor = stale
+
+    job = manager.submit({"n": 3}, kind="echo")
+
+    assert job.wait(timeout=30)
+    assert job.status == jobs.SUCCEEDED and job.result == {"n": 3}
+    assert manager._executor is not stale
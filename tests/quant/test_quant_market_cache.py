@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+量化 App 的市場數據快取測試
+"""
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root / "apps"))
+
+from quant.logic.market_cache import CacheMissError, MarketDataCache
+
+
+class StubSource:
+    """本機的假數據源：每個日曆日一筆收盤價，並記錄被查詢的區間"""
+
+    def __init__(self):
+        self.calls = []
+
+    def fetch(self, start_date, end_date):
+        self.calls.append((start_date, end_date))
+        dates = pd.date_range(start_date, end_date, freq="D")
+        return pd.DataFrame({"date": dates.strftime("%Y-%m-%d"), "close": range(len(dates))})
+
+
+def test_cache_fetches_only_missing_ranges(tmp_path):
+    cache = MarketDataCache(cache_dir=tmp_path)
+    source = StubSource()
+
+    first = cache.get("stub", "2330", "2023-01-01", "2023-01-31", source.fetch, date_column="date")
+    assert len(first) == 31
+
+    # 完全命中快取：不再呼叫數據源
+    again = cache.get("stub", "2330", "2023-01-10", "2023-01-20", source.fetch, date_column="date")
+    assert len(again) == 11
+    assert again["date"].iloc[0] == "2023-01-10"
+
+    # 往後延伸：只抓缺少的尾段
+    extended = cache.get("stub", "2330", "2023-01-01", "2023-02-10", source.fetch, date_column="date")
+    assert len(extended) == 41
+    assert extended["date"].is_monotonic_increasing
+    assert source.calls == [("2023-01-01", "2023-01-31"), ("2023-02-01", "2023-02-10")]
+
+    # 新的快取實例 (例如另一個進程) 直接讀取磁碟上的數據
+    reloaded = MarketDataCache(cache_dir=tmp_path)
+    assert len(reloaded.get("stub", "2330", "2023-01-05", "2023-02-05", source.fetch, date_column="date")) == 32
+    assert len(source.calls) == 2
+
+
+def test_offline_mode_uses_cache_only(tmp_path):
+    source = StubSource()
+    MarketDataCache(cache_dir=tmp_path).get("stub", "2330", "2023-01-01", "2023-01-31", source.fetch,
+                                           date_column="date")
+
+    offline = MarketDataCache(cache_dir=tmp_path, offline=True)
+    partial = offline.get("stub", "2330", "2023-01-15", "2023-03-01", source.fetch, date_column="date")
+    assert len(partial) == 17
+    assert len(source.calls) == 1
+
+    with pytest.raises(CacheMissError):
+        offline.get("stub", "2317", "2023-01-01", "2023-01-31", source.fetch, date_column="date")
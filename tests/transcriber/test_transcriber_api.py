@@ -28,6 +28,20 @@ from apps.transcriber.main import app
 # 使用 FastAPI 的測試客戶端
 client = TestClient(app)
 
+
+@pytest.fixture(autouse=True)
+def isolated_storage(monkeypatch, tmp_path):
+    """上傳檔案與任務資料庫都放在暫存目錄，測試不會在工作目錄留下檔案。"""
+    from transcriber import logic
+    from transcriber.job_queue import TranscriptionJobQueue
+
+    upload_directory = tmp_path / "uploads"
+    upload_directory.mkdir()
+    monkeypatch.setattr(logic, "UPLOAD_DIRECTORY", upload_directory)
+    monkeypatch.setattr(logic, "job_queue", TranscriptionJobQueue(tmp_path / "jobs.db"))
+    return upload_directory
+
+
 # --- 輔助函式 ---
 
 def poll_for_status(task_id: str, timeout: int = 10) -> dict:
@@ -182,3 +196,71 @@ def test_status_not_found():
     response = client.get(f"/status/{non_existent_task_id}")
     assert response.status_code == 404
     assert response.json() == {"detail": f"找不到任務 ID: {non_existent_task_id}"}
+
+
+def test_task_updates_report_reclaimed_chunks(monkeypatch, tmp_path):
+    """
+    測試區段被重新領取時，串流更新會回報該區段需要重設，重新轉寫的片段帶有新的領取次數。
+    """
+    from transcriber import logic
+    from transcriber.job_queue import TranscriptionJobQueue
+
+    queue = TranscriptionJobQueue(tmp_path / "jobs.db")
+    monkeypatch.setattr(logic, "job_queue", queue)
+    queue.enqueue("long", "long.wav", tmp_path / "long.wav")
+    queue.claim("w0")
+    queue.add_chunks("long", [(0.0, 60.0), (60.0, 120.0)])
+    queue.claim_chunk("w0")
+    queue.add_segment("long", 0, 0.0, 1.0, "first try")
+
+    first = logic.get_task_updates("long")
+    assert first["resets"] == []
+    assert [(seg["chunk"], seg["attempt"], seg["text"]) for seg in first["segments"]] == [(0, 1, "first try")]
+    last_id, sent = first["segments"][-1]["id"], {0: 1}
+
+    # 工作進程結束、區段被放回佇列：舊片段在重新領取前仍然有效
+    queue.requeue_in_flight(["w0"])
+    assert logic.get_task_updates("long", last_id, sent)["resets"] == []
+
+    # 重新領取時舊片段被丟棄：即使還沒有新片段，也要通知客戶端
+    queue.claim_chunk("w1")
+    assert logic.get_task_updates("long", last_id, sent)["resets"] == [0]
+    assert logic.get_task_updates("long", last_id, {})["resets"] == []
+
+    # 重新轉寫的片段帶有新的領取次數，客戶端未收到重設前也能由它判斷
+    queue.add_segment("long", 0, 0.0, 1.0, "second try")
+    updates = logic.get_task_updates("long", last_id, sent)
+    assert updates["resets"] == [0]
+    assert [(seg["chunk"], seg["attempt"], seg["text"]) for seg in updates["segments"]] == [(0, 2, "second try")]
+    assert logic.get_task_updates("long", last_id, {0: 2})["resets"] == []
+
+
+def test_stream_emits_chunk_reset_before_replacement_segments(monkeypatch):
+    """
+    測試 SSE 串流在重新轉寫的片段之前送出 chunk_reset 事件，並把已送出片段的領取次數傳回更新查詢。
+    """
+    import apps.transcriber.main as transcriber_main
+    from transcriber import logic
+
+    segment = {"chunk": 0, "start": 0.0, "end": 1.0}
+    responses = iter([
+        {"status": "processing", "resets": [], "segments": [{"id": 1, "attempt": 1, "text": "a", **segment}]},
+        {"status": "processing", "resets": [0], "segments": [{"id": 2, "attempt": 2, "text": "b", **segment}]},
+        {"status": "completed", "resets": [], "segments": [], "final": {"status": "completed"}},
+    ])
+    calls = []
+
+    def fake_updates(task_id, after_id=0, sent_attempts=None):
+        calls.append((after_id, sent_attempts))
+        return next(responses)
+
+    monkeypatch.setattr(logic, "get_task_updates", fake_updates)
+    monkeypatch.setattr(transcriber_main, "STREAM_POLL_SECONDS", 0)
+
+    response = client.get("/status/long/stream")
+
+    assert response.status_code == 200
+    events = [block.split("\n")[0] for block in response.text.strip().split("\n\n")]
+    assert events == ["event: segment", "event: chunk_reset", "event: segment", "event: status"]
+    assert 'data: {"chunk": 0}' in response.text
+    assert calls == [(0, None), (1, {0: 1}), (2, {0: 2})]
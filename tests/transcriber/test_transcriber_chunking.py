@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+語音轉寫 App 的長音訊分段測試
+"""
+import sys
+import wave
+from pathlib import Path
+
+import numpy as np
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root / "apps"))
+
+from transcriber.chunking import SAMPLE_RATE, WHOLE_FILE, plan_chunks, read_chunk
+
+
+def _write_wav(path: Path, samples: np.ndarray, rate: int, channels: int = 1):
+    data = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(np.repeat(data, channels).tobytes())
+
+
+def test_long_audio_is_cut_at_silences(tmp_path):
+    rate = 8000
+    # 每 10 秒的語音 (正弦波) 之後接 1 秒靜音，靜音分別從 10, 21, 32, ... 秒開始
+    speech = 0.5 * np.sin(2 * np.pi * 220 * np.arange(10 * rate) / rate)
+    block = np.concatenate([speech, np.zeros(rate)])
+    path = tmp_path / "long.wav"
+    _write_wav(path, np.tile(block, 12), rate, channels=2)
+
+    spans = plan_chunks(path, chunk_seconds=30, search_seconds=5)
+    assert len(spans) > 1
+    assert spans[0][0] == 0.0 and spans[-1][1] == 132.0
+    assert all(a[1] == b[0] for a, b in zip(spans, spans[1:]))
+    for _, end in spans[:-1]:
+        # 切點都落在靜音區間內
+        assert (end % 11) >= 10
+
+    # 只讀取一個區段，並重新取樣為 16 kHz
+    start, end = spans[1]
+    audio = read_chunk(path, start, end)
+    assert audio.dtype == np.float32
+    assert abs(len(audio) - (end - start) * SAMPLE_RATE) <= 2
+
+
+def test_cuts_stay_in_silence_when_frames_are_not_a_whole_number_of_samples(tmp_path):
+    # 22050 Hz 時 0.03 秒是 661.5 個樣本，音框實際只有 661 個樣本；
+    # 若以 FRAME_SECONDS 換算切點，15 分鐘後會偏移約 0.7 秒，落進語音中
+    rate = 22050
+    speech = (0.5 * np.sin(2 * np.pi * 220 * np.arange(5 * rate) / rate) * 32767).astype("<i2")
+    block = np.concatenate([speech, np.zeros(rate // 2, dtype="<i2")]).tobytes()
+    path = tmp_path / "long.wav"
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        for _ in range(180):
+            wav.writeframes(block)
+
+    spans = plan_chunks(path, chunk_seconds=60, search_seconds=5)
+    assert len(spans) > 10
+    for _, end in spans[:-1]:
+        # 靜音區間為每 5.5 秒中的最後 0.5 秒
+        assert (end % 5.5) >= 5.0, end
+
+
+def test_short_or_non_wav_files_are_not_split(tmp_path):
+    short = tmp_path / "short.wav"
+    _write_wav(short, np.zeros(SAMPLE_RATE * 5), SAMPLE_RATE)
+    assert plan_chunks(short) == WHOLE_FILE
+
+    mp3 = tmp_path / "audio.mp3"
+    mp3.write_bytes(b"ID3 not really an mp3")
+    assert plan_chunks(mp3) == WHOLE_FILE
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+語音轉寫 App 的工作佇列測試
+"""
+import queue
+import sys
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root / "apps"))
+
+from transcriber.job_queue import (COMPLETED, DUPLICATE, ERROR, MAX_REPLAYED_BROADCASTS, PROCESSING, QUEUED,
+                                   TranscriptionJobQueue, TranscriptionWorkerPool, run_worker)
+
+
+def test_jobs_are_claimed_once_and_processed(tmp_path):
+    queue = TranscriptionJobQueue(tmp_path / "jobs.db")
+    for i in range(20):
+        queue.enqueue(f"task-{i}", f"audio-{i}.wav", tmp_path / f"audio-{i}.wav")
+
+    processed, lock = [], threading.Lock()
+
+    def transcribe(job, emit):
+        with lock:
+            processed.append(job["id"])
+        if job["id"] == "task-3":
+            raise RuntimeError("無法解碼")
+        return f"text of {job['original_filename']}", "real"
+
+    # 多個工作執行緒同時領取：每筆工作只會被處理一次
+    stop_event = threading.Event()
+    workers = [threading.Thread(target=run_worker, args=(queue, f"w{i}", transcribe, stop_event),
+                                kwargs={"poll_interval": 0.01}) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    while queue.count(QUEUED) or queue.count(PROCESSING):
+        stop_event.wait(0.01)
+    stop_event.set()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(processed) == sorted(f"task-{i}" for i in range(20))
+    assert queue.count(COMPLETED) == 19
+    assert queue.get("task-0")["result"] == "text of audio-0.wav"
+    assert queue.get("task-3")["status"] == ERROR
+    assert queue.get("task-3")["error_message"] == "無法解碼"
+
+
+def test_in_flight_jobs_are_recovered(tmp_path):
+    queue = TranscriptionJobQueue(tmp_path / "jobs.db", max_attempts=2)
+    queue.enqueue("task-a", "a.wav", tmp_path / "a.wav")
+    queue.enqueue("task-b", "b.wav", tmp_path / "b.wav")
+    assert queue.claim("w0")["id"] == "task-a"
+    assert queue.claim("w1")["id"] == "task-b"
+
+    # 只恢復已結束的工作進程 (w0) 手上的工作
+    assert queue.requeue_in_flight(["w0"]) == 1
+    assert queue.get("task-a")["status"] == QUEUED
+    assert queue.get("task-b")["status"] == PROCESSING
+
+    # 服務重新啟動：所有處理中的工作都放回佇列；超過重試次數的標記為錯誤
+    assert queue.claim("w2")["id"] == "task-a"
+    assert queue.requeue_in_flight() == 1
+    assert queue.get("task-a")["status"] == ERROR
+    assert queue.get("task-b")["status"] == QUEUED
+
+
+def test_long_jobs_are_split_into_chunks_with_partial_segments(tmp_path):
+    queue = TranscriptionJobQueue(tmp_path / "jobs.db")
+    queue.enqueue("long", "long.wav", tmp_path / "long.wav")
+    spans = [(0.0, 60.0), (60.0, 118.5), (118.5, 150.0)]
+    seen = []
+
+    def transcribe(work, emit):
+        seen.append((work["chunk_index"], work["start_seconds"], work["end_seconds"]))
+        emit(work["start_seconds"], work["start_seconds"] + 1.0, f"part-{work['chunk_index']}")
+        # 區段還沒完成，片段就已經可以查詢
+        assert queue.get_segments("long")[-1]["text"] == f"part-{work['chunk_index']}"
+        assert queue.get("long")["status"] == PROCESSING
+        return f"text-{work['chunk_index']}", "real"
+
+    stop_event = threading.Event()
+    worker = threading.Thread(target=run_worker, args=(queue, "w0", transcribe, stop_event),
+                              kwargs={"poll_interval": 0.01, "plan": lambda job: spans})
+    worker.start()
+    while queue.get("long")["status"] != COMPLETED:
+        stop_event.wait(0.01)
+    stop_event.set()
+    worker.join()
+
+    assert seen == [(0, 0.0, 60.0), (1, 60.0, 118.5), (2, 118.5, 150.0)]
+    assert queue.get("long")["result"] == "text-0 text-1 text-2"
+    assert queue.chunk_progress("long") == (3, 3)
+    assert [seg["text"] for seg in queue.get_segments("long")] == ["part-0", "part-1", "part-2"]
+    assert [seg["id"] for seg in queue.get_segments("long", after_id=queue.get_segments("long")[0]["id"])] \
+        == [seg["id"] for seg in queue.get_segments("long")[1:]]
+
+
+def test_chunks_of_dead_workers_are_recovered(tmp_path):
+    queue = TranscriptionJobQueue(tmp_path / "jobs.db")
+    queue.enqueue("long", "long.wav", tmp_path / "long.wav")
+    queue.claim("w0")
+    queue.add_chunks("long", [(0.0, 60.0), (60.0, 120.0)])
+    first = queue.claim_chunk("w0")
+    queue.add_segment("long", first["chunk_index"], 0.0, 1.0, "half done")
+    assert queue.claim_chunk("w1")["chunk_index"] == 1
+
+    # w0 結束：只有它手上的區段被放回佇列，整筆工作仍在處理中；重新領取時丟棄上次留下的片段
+    assert queue.requeue_in_flight(["w0"]) == 1
+    assert queue.get("long")["status"] == PROCESSING
+    assert queue.claim_chunk("w2")["chunk_index"] == 0
+    assert queue.get_segments("long") == []
+    # 重新領取工作時不會重新規劃區段
+    assert queue.add_chunks("long", [(0.0, 150.0)]) == 2
+
+
+def test_duplicate_uploads_are_coalesced_and_cached(tmp_path):
+    queue = TranscriptionJobQueue(tmp_path / "jobs.db")
+    assert queue.submit("first", "a.wav", tmp_path / "a.wav", "hash-a:tiny:int8:5") == ("queued", None)
+    # 相同內容在處理中：附加到第一筆工作上，不會被工作進程領取
+    assert queue.submit("second", "copy.wav", tmp_path / "copy.wav", "hash-a:tiny:int8:5") == ("coalesced", "first")
+    assert queue.get("second")["status"] == DUPLICATE
+    assert queue.claim("w0")["id"] == "first"
+    assert queue.claim("w1") is None
+
+    queue.add_chunks("first", [(0.0, None)])
+    work = queue.claim_chunk("w0")
+    assert queue.complete_chunk(work["id"], work["chunk_index"], "hello", "real")
+    assert queue.get("second")["status"] == COMPLETED
+    assert queue.get("second")["result"] == "hello"
+
+    # 之後的相同內容直接從快取完成；不同的模型設定則是不同的鍵
+    assert queue.submit("third", "again.wav", tmp_path / "again.wav", "hash-a:tiny:int8:5") == ("cached", "first")
+    assert queue.get("third")["result"] == "hello"
+    assert queue.submit("fourth", "a.wav", tmp_path / "a.wav", "hash-a:base:int8:5") == ("queued", None)
+
+    # 來源工作失敗時，附加的提交也一併失敗
+    queue.submit("fifth", "a.wav", tmp_path / "a.wav", "hash-a:base:int8:5")
+    queue.fail("fourth", "無法解碼")
+    assert queue.get("fifth")["status"] == ERROR
+    assert queue.get("fifth")["error_message"] == "無法解碼"
+
+
+class FakeProcess:
+    """不真正啟動進程的假工作進程，只記錄收到的控制佇列。"""
+
+    def __init__(self, target, args, name, daemon):
+        self.control_queue = args[-1]
+
+    def start(self):
+        pass
+
+    def is_alive(self):
+        return True
+
+
+def drain(control_queue) -> list:
+    messages = []
+    while True:
+        try:
+            messages.append(control_queue.get_nowait())
+        except queue.Empty:
+            return messages
+
+
+def test_respawned_workers_replay_only_the_latest_broadcast_per_key(tmp_path):
+    pool = TranscriptionWorkerPool(tmp_path / "jobs.db", num_workers=1)
+    pool._ctx = SimpleNamespace(Queue=queue.Queue, Process=FakeProcess)
+    pool._spawn("worker-0")
+
+    for threads in (1, 2, 1):
+        settings = {"model_size": "tiny", "cpu_threads": threads}
+        assert pool.broadcast(("warmup", settings), replay_key=("warmup", "tiny", threads)) == 1
+    pool.broadcast(("ping", None))
+    # 已在執行的工作進程收到每一則訊息
+    assert len(drain(pool._controls["worker-0"])) == 4
+
+    # 重新啟動的工作進程只收到每個鍵最新的一則，依最後廣播的先後排列；不重播的訊息不會再送出
+    pool._spawn("worker-0")
+    assert drain(pool._controls["worker-0"]) == [
+        ("warmup", {"model_size": "tiny", "cpu_threads": 2}),
+        ("warmup", {"model_size": "tiny", "cpu_threads": 1}),
+    ]
+
+    for threads in range(MAX_REPLAYED_BROADCASTS + 5):
+        pool.broadcast(("warmup", threads), replay_key=("warmup", "base", threads))
+    assert len(pool._broadcasts) == MAX_REPLAYED_BROADCASTS
+    assert list(pool._broadcasts.values())[-1] == ("warmup", MAX_REPLAYED_BROADCASTS + 4)
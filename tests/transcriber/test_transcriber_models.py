@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+語音轉寫 App 的模型管理測試 (以假的 WhisperModel 取代 faster-whisper)
+"""
+import sys
+from pathlib import Path
+
+project_root = Path.cwd()
+sys.path.insert(0, str(project_root / "apps"))
+
+from transcriber import models
+from transcriber.models import ModelSettings, WhisperModelManager
+
+
+class FakeWhisperModel:
+    loads = []
+
+    def __init__(self, model_size, **kwargs):
+        FakeWhisperModel.loads.append((model_size, kwargs))
+        self.model_size = model_size
+
+
+def _fake_models(monkeypatch):
+    FakeWhisperModel.loads = []
+    monkeypatch.setattr(models, "WhisperModel", FakeWhisperModel)
+    monkeypatch.setattr(models, "_FASTER_WHISPER_AVAILABLE", True)
+
+
+def test_models_are_loaded_lazily_and_shared(monkeypatch):
+    _fake_models(monkeypatch)
+    manager = WhisperModelManager(storage_strategy="memory", max_models=2, memory_threshold_percent=101)
+    assert FakeWhisperModel.loads == []
+
+    tiny, base, small = ModelSettings("tiny"), ModelSettings("base"), ModelSettings("small")
+    with manager.use(tiny) as first:
+        with manager.use(tiny) as second:
+            assert first is second
+    manager.get(base)
+    assert [size for size, _ in FakeWhisperModel.loads] == ["tiny", "base"]
+
+    # 超過數量上限時淘汰最久未使用且閒置的模型；使用中的模型不會被淘汰
+    with manager.use(base):
+        manager.get(small)
+    assert [m["model_size"] for m in manager.loaded_models()] == ["base", "small"]
+
+
+def test_disk_strategy_releases_model_after_use(monkeypatch, tmp_path):
+    _fake_models(monkeypatch)
+    manager = WhisperModelManager(storage_strategy="disk", download_root=tmp_path / "models")
+    assert manager.warm_up(ModelSettings("tiny"))
+    assert manager.loaded_models() == []
+    with manager.use(ModelSettings("tiny")):
+        assert len(manager.loaded_models()) == 1
+    assert manager.loaded_models() == []
+    assert FakeWhisperModel.loads[0][1]["download_root"] == str(tmp_path / "models")